@@ -0,0 +1,194 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Benchmark the commands that talk to the Digital Ocean API, against a fake API server.
+
+For each size given with ``--records``, this serves that many A records (``--per-domain`` per
+domain) from ``digital_ocean_dynamic_dns.testing.fake_do``, with a throwaway database, and
+times:
+
+- manage: managing each domain and importing its existing A records, which points
+  them at the current IP;
+- list: listing each domain's A records, fetched again from the API (``--refresh``);
+- update-ips: pointing every A record at a new IP;
+- update-ips (unchanged): running update-ips again, with the IP unchanged.
+
+It reports the API requests issued (by route, with ``--verbose``) and the wall time of each.
+The client-side rate limiter is given an unlimited budget, so the times show the work done
+rather than the pacing to Digital Ocean's rate limits.
+
+Usage:
+    uv run python scripts/bench_api.py
+    uv run python scripts/bench_api.py --records 1000 --latency 0.05 --verbose
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from digital_ocean_dynamic_dns import constants, do_api, domains, ip, subdomains
+from digital_ocean_dynamic_dns.database import get_connection, get_read_only_connection
+from digital_ocean_dynamic_dns.ratelimit import RateLimiter, TokenBucket, save_rate_limiter
+from digital_ocean_dynamic_dns.testing.fake_do import FakeDigitalOcean
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+OLD_IP = "198.51.100.1"
+CURRENT_IP = "203.0.113.7"
+NEW_IP = "203.0.113.9"
+
+# Large enough that the client never waits for the rate limits.
+UNLIMITED = 1e12
+
+
+def forget_state() -> None:
+    """Close the database connections, and forget the API client and its rate limiter."""
+    for connection in (get_connection, get_read_only_connection):
+        if connection.cache_info().currsize:
+            connection().close()
+        connection.cache_clear()
+    do_api.get_rate_limiter.cache_clear()
+    do_api._get_client_for.cache_clear()  # noqa: SLF001
+
+
+def use_fresh_state(database_path: Path) -> None:
+    """Point do_ddns at an empty database with an unlimited rate limit budget."""
+    forget_state()
+    constants.database_path = database_path
+
+    now = time.time()
+    save_rate_limiter(
+        get_connection(),
+        RateLimiter(
+            buckets={
+                name: TokenBucket(UNLIMITED, window, UNLIMITED, now)
+                for name, window in (("hourly", 3600), ("minute", 60))
+            }
+        ),
+    )
+
+
+def measure(fake: FakeDigitalOcean, step: Callable[[], object]) -> tuple[int, float, str]:
+    """Run `step` quietly; return the API requests it issued, its wall time and its routes."""
+    fake.request_counts.clear()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        step()
+    elapsed = time.perf_counter() - started
+    routes = ", ".join(f"{n} {route}" for route, n in sorted(fake.request_counts.items()))
+    return fake.api_requests, elapsed, routes
+
+
+def add_a_records(fake: FakeDigitalOcean, records: int, per_domain: int) -> list[str]:
+    """Serve `records` A records pointing at OLD_IP, `per_domain` per domain.
+
+    Returns:
+        The names of the domains.
+    """
+    domain_names = [f"example-{n}.com" for n in range(-(-records // per_domain))]
+    for n, domain in enumerate(domain_names):
+        fake.add_domain(domain)
+        count = min(per_domain, records - n * per_domain)
+        fake.add_a_records(domain, ["@", *(f"host-{i}" for i in range(1, count))], OLD_IP)
+    return domain_names
+
+
+def run(records: int, per_domain: int, latency: float, concurrency: int, *, verbose: bool) -> None:
+    """Benchmark each command against `records` A records, and print a report."""
+    update_args = Namespace(
+        force=False,
+        concurrency=concurrency,
+        verify_interval=3600,
+        ip_quorum=1,
+        timings=False,
+        metrics_file=None,
+    )
+
+    with FakeDigitalOcean(latency=latency, public_ip=CURRENT_IP) as fake:
+        domain_names = add_a_records(fake, records, per_domain)
+        os.environ[do_api.API_BASE_URL_ENV_VAR] = fake.url
+        with contextlib.redirect_stdout(io.StringIO()):
+            ip.config_ip_server(fake.ip_url, "4")
+
+        def manage() -> None:
+            for domain in domain_names:
+                domains.manage_domain(domain)
+                domains.manage_all_existing_a_records(domain)
+
+        def list_records() -> None:
+            for domain in domain_names:
+                subdomains.list_sub_domains(domain, refresh=True)
+
+        def update_ips() -> None:
+            fake.public_ip = NEW_IP
+            subdomains.update_all_managed_subdomains(update_args)
+
+        def update_ips_unchanged() -> None:
+            subdomains.update_all_managed_subdomains(update_args)
+
+        print(f"{records} A records over {len(domain_names)} domains")
+        for name, step in (
+            ("manage", manage),
+            ("list", list_records),
+            ("update-ips", update_ips),
+            ("update-ips (unchanged)", update_ips_unchanged),
+        ):
+            requests, elapsed, routes = measure(fake, step)
+            print(f"  {name:<24} {requests:7d} requests {elapsed:9.2f} s")
+            if verbose and routes:
+                print(f"    {routes}")
+
+        if {record["data"] for record in fake.a_records(domain_names[-1])} != {NEW_IP}:
+            msg = "update-ips left A records pointing at an old IP"
+            raise RuntimeError(msg)
+
+
+def main() -> int:
+    """Run the benchmark and print a report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--records",
+        type=int,
+        nargs="+",
+        default=[10, 1_000, 10_000],
+        help="A records per run. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--per-domain", type=int, default=1_000, help="A records per domain. Default: %(default)s"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds the fake API takes to answer each request. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=constants.MAX_UPDATE_CONCURRENCY,
+        help="Parallel A record updates. Default: %(default)s",
+    )
+    parser.add_argument("--verbose", action="store_true", help="List the requests by route.")
+    args = parser.parse_args()
+
+    os.environ["DIGITALOCEAN_TOKEN"] = "bench-api-token"  # noqa: S105
+    with tempfile.TemporaryDirectory() as tmp:
+        for records in args.records:
+            use_fresh_state(Path(tmp) / f"do_ddns-{records}.db")
+            run(records, args.per_domain, args.latency, args.concurrency, verbose=args.verbose)
+        forget_state()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
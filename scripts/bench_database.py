@@ -0,0 +1,136 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Benchmark the SQLite schema against a large subdomains table.
+
+Builds an unversioned (pre-migrations) database with ``--rows`` subdomains spread over
+``--domains`` domains, times migrating it to the current schema, then times the lookups
+that manage, un-manage and update-ips run: once with the schema's indexes, and once with
+them dropped, to show what the indexes buy.
+
+Usage:
+    uv run python scripts/bench_database.py
+    uv run python scripts/bench_database.py --rows 1000000 --lookups 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from digital_ocean_dynamic_dns import database
+
+# The lookups run by the commands, keyed by a short description.
+LOOKUPS = {
+    "manage: is the subdomain managed?": (
+        "SELECT count(*) FROM subdomains WHERE main_id = :main_id AND name = :name and managed = 1"
+    ),
+    "un-manage: find the managed subdomain": (
+        "SELECT domain_record_id FROM subdomains "
+        "WHERE main_id = :main_id AND name = :name AND managed = 1"
+    ),
+}
+
+# Run once per update-ips invocation, so timed on its own.
+LOAD_MANAGED = (
+    "SELECT subdomains.domain_record_id, domains.name FROM subdomains "
+    "INNER JOIN domains on subdomains.main_id = domains.id "
+    "WHERE subdomains.managed = 1 "
+    "ORDER BY domains.name, subdomains.domain_record_id"
+)
+
+
+def create_legacy_database(database_path: Path, rows: int, domains: int) -> None:
+    """Create an unversioned database with text timestamps, as written before migrations."""
+    conn = sqlite3.connect(database_path)
+    database.MIGRATIONS[0](conn)
+    per_domain = rows // domains
+    with conn:
+        conn.executemany(
+            "INSERT INTO domains (id, name, cataloged) values (?, ?, '2024-03-01 12:30')",
+            [(domain_id, f"example-{domain_id}.com") for domain_id in range(1, domains + 1)],
+        )
+        conn.executemany(
+            "INSERT INTO subdomains "
+            "  (domain_record_id, main_id, name, current_ip4, cataloged, managed, last_checked) "
+            "values (?, ?, ?, '127.0.0.1', '2024-03-01 12:30', ?, '02-03-2024 08:15')",
+            [
+                (
+                    record_id,
+                    record_id // per_domain + 1,
+                    f"host-{record_id % per_domain}",
+                    # One in ten subdomains is managed.
+                    int(record_id % 10 == 0),
+                )
+                for record_id in range(rows)
+            ],
+        )
+    conn.close()
+
+
+def time_lookups(conn: sqlite3.Connection, lookups: int, domains: int, per_domain: int) -> None:
+    """Print the mean time of each lookup."""
+    rng = random.Random(0)  # noqa: S311
+    params = [
+        {"main_id": rng.randint(1, domains), "name": f"host-{rng.randrange(per_domain)}"}
+        for _ in range(lookups)
+    ]
+    for description, query in LOOKUPS.items():
+        started = time.perf_counter()
+        for param in params:
+            conn.execute(query, param).fetchall()
+        elapsed = time.perf_counter() - started
+        print(f"    {description:<40} {elapsed / lookups * 1e6:10.1f} us")
+
+    started = time.perf_counter()
+    managed = len(conn.execute(LOAD_MANAGED).fetchall())
+    elapsed = time.perf_counter() - started
+    print(f"    {f'update-ips: load {managed} managed':<40} {elapsed * 1e3:10.1f} ms")
+
+
+def main() -> int:
+    """Run the benchmark and print a report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, default=100_000, help="Subdomains. Default: %(default)s"
+    )
+    parser.add_argument("--domains", type=int, default=1_000, help="Default: %(default)s")
+    parser.add_argument(
+        "--lookups", type=int, default=2_000, help="Lookups timed per query. Default: %(default)s"
+    )
+    args = parser.parse_args()
+    per_domain = args.rows // args.domains
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = Path(tmp) / "do_ddns.db"
+        create_legacy_database(database_path, args.rows, args.domains)
+
+        started = time.perf_counter()
+        conn = database.connect_database(database_path)
+        elapsed = time.perf_counter() - started
+        print(f"{args.rows} subdomains over {args.domains} domains")
+        print(f"  migrate to schema version {len(database.MIGRATIONS)}: {elapsed:.2f} s")
+
+        print("  with indexes:")
+        time_lookups(conn, args.lookups, args.domains, per_domain)
+
+        indexes = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'subdomains' "
+            "AND sql IS NOT NULL"
+        ).fetchall()
+        with conn:
+            for index in indexes:
+                conn.execute(f"DROP INDEX {index['name']}")
+        print(f"  without indexes ({', '.join(index['name'] for index in indexes)}):")
+        time_lookups(conn, max(args.lookups // 20, 1), args.domains, per_domain)
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Measure do_ddns startup time per subcommand.
+
+For each subcommand this runs ``python -X importtime -m digital_ocean_dynamic_dns.ddns ...``
+against a throwaway data directory (so your real database and log are never touched), and
+reports the median wall time of the whole invocation, the total import time, and the
+slowest imports.
+
+The subcommands are chosen to work offline: they either only read local state or, like
+``update-ips`` against an empty database, stop before making any network request.
+
+Usage:
+    uv run python scripts/bench_startup.py
+    uv run python scripts/bench_startup.py --repeat 20 --top 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+
+SUBCOMMANDS: dict[str, list[str]] = {
+    "help": ["--help"],
+    "logs": ["logs"],
+    "ip-resolver-config": ["ip-resolver-config"],
+    "show-info": ["show-info"],
+    "update-ips": ["update-ips"],
+}
+
+# e.g. "import time:       814 |      37519 |   digital_ocean_dynamic_dns.ddns"
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$")
+
+# Imported by the interpreter itself before any of our code runs.
+_INTERPRETER_IMPORTS = {"site", "encodings"}
+
+
+@dataclass
+class Import:
+    """One module's line of ``-X importtime`` output."""
+
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> list[Import]:
+    """Parse the ``-X importtime`` lines out of a process's stderr."""
+    imports = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match is not None:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append(Import(name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return imports
+
+
+def run_once(argv: list[str], env: dict[str, str], *, importtime: bool) -> tuple[float, str]:
+    """Run do_ddns once; return its wall time in milliseconds and its stderr."""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-m", "digital_ocean_dynamic_dns.ddns", *argv]
+
+    started = time.perf_counter()
+    completed = subprocess.run(  # noqa: S603
+        command,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    return (time.perf_counter() - started) * 1000, completed.stderr
+
+
+def main() -> int:
+    """Run the benchmark and print a report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--repeat", type=int, default=10, help="Timed runs per subcommand. Default: %(default)s"
+    )
+    parser.add_argument(
+        "--top", type=int, default=5, help="Slowest imports to list. Default: %(default)s"
+    )
+    parser.add_argument(
+        "subcommands",
+        nargs="*",
+        default=list(SUBCOMMANDS),
+        metavar="SUBCOMMAND",
+        help=f"Subcommands to measure: {', '.join(SUBCOMMANDS)}. Default: all of them.",
+    )
+    args = parser.parse_args()
+    unknown = set(args.subcommands).difference(SUBCOMMANDS)
+    if unknown:
+        parser.error(f"unknown subcommands: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as data_home:
+        env = {**os.environ, "XDG_DATA_HOME": data_home}
+        env.pop("DIGITALOCEAN_TOKEN", None)
+
+        for name in args.subcommands:
+            argv = SUBCOMMANDS[name]
+            # Warm-up: creates the database and fills the OS file cache.
+            run_once(argv, env, importtime=False)
+            wall_ms = statistics.median(
+                run_once(argv, env, importtime=False)[0] for _ in range(args.repeat)
+            )
+            _, stderr = run_once(argv, env, importtime=True)
+
+            imports = parse_importtime(stderr)
+            top_level = [
+                imp for imp in imports if imp.depth == 0 and imp.name not in _INTERPRETER_IMPORTS
+            ]
+            import_ms = sum(imp.cumulative_us for imp in top_level) / 1000
+
+            print(f"do_ddns {' '.join(argv)}")
+            print(f"  wall time (median of {args.repeat}): {wall_ms:8.1f} ms")
+            print(f"  imports:                     {import_ms:8.1f} ms")
+            print(f"  modules imported:            {len(imports):8d}")
+            for imp in sorted(top_level, key=lambda imp: imp.cumulative_us, reverse=True)[
+                : args.top
+            ]:
+                print(f"    {imp.cumulative_us / 1000:8.1f} ms  {imp.name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,17 +3,32 @@
 
 """Digital Ocean Dynamic DNS."""
 
-from importlib.metadata import PackageNotFoundError, version
+from functools import cache
 
-# Single source of truth: the installed distribution's version (release-please bumps the
-# version in pyproject.toml, which is what the built/installed package metadata reflects), so
-# this never drifts the way a hand-edited constant would. The lookup name must stay equal to
-# the distribution's `name` in pyproject.toml (both are project_slug at generation time). Fall
-# back gracefully when the distribution isn't installed (a bare source checkout) so importing
-# the package never hard-fails.
-try:
-    __version__ = version("digital-ocean-dynamic-dns")
-# Hit on an uninstalled source checkout — or if the dist `name` was renamed away from this
-# lookup, in which case fix the name rather than relying on this sentinel.
-except PackageNotFoundError:  # pragma: no cover
-    __version__ = "0.0.0+unknown"
+
+@cache
+def _get_version() -> str:
+    # Importing importlib.metadata costs more than the rest of do_ddns startup combined, so
+    # the version is only looked up when something asks for __version__ (see __getattr__).
+    from importlib.metadata import PackageNotFoundError, version  # noqa: PLC0415
+
+    # Single source of truth: the installed distribution's version (release-please bumps the
+    # version in pyproject.toml, which is what the built/installed package metadata reflects),
+    # so this never drifts the way a hand-edited constant would. The lookup name must stay
+    # equal to the distribution's `name` in pyproject.toml (both are project_slug at generation
+    # time). Fall back gracefully when the distribution isn't installed (a bare source
+    # checkout) so importing the package never hard-fails.
+    try:
+        return version("digital-ocean-dynamic-dns")
+    # Hit on an uninstalled source checkout — or if the dist `name` was renamed away from this
+    # lookup, in which case fix the name rather than relying on this sentinel.
+    except PackageNotFoundError:  # pragma: no cover
+        return "0.0.0+unknown"
+
+
+def __getattr__(name: str) -> str:
+    """Look up ``__version__`` lazily (PEP 562)."""
+    if name == "__version__":
+        return _get_version()
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
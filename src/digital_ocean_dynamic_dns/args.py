@@ -6,11 +6,214 @@
 from __future__ import annotations
 
 import argparse
+import importlib
+import re
 import textwrap
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-from digital_ocean_dynamic_dns import info, ip, logs, manage, subdomains
+from . import constants
 
-from . import domains
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+def lazy_handler(module: str, handler: str) -> Callable[[argparse.Namespace], int | None]:
+    """Return a subcommand handler that imports its module only when the subcommand runs.
+
+    Building the parser then doesn't import every subcommand's module (and with them
+    requests, rich and the database), which keeps do_ddns startup fast.
+
+    Args:
+        module: The module of this package that defines the handler, e.g. "subdomains".
+        handler: The name of the handler function in `module`.
+    """
+
+    def run_handler(args: argparse.Namespace) -> int | None:
+        return getattr(importlib.import_module(f".{module}", __package__), handler)(args)
+
+    run_handler.__qualname__ = f"{module}.{handler}"
+    return run_handler
+
+
+def update_concurrency(value: str) -> int:
+    """Argparse type for --concurrency: an int between 1 and MAX_UPDATE_CONCURRENCY."""
+    try:
+        concurrency = int(value)
+    except ValueError:
+        msg = f"invalid int value: {value!r}"
+        raise argparse.ArgumentTypeError(msg) from None
+    if not 1 <= concurrency <= constants.MAX_UPDATE_CONCURRENCY:
+        msg = f"must be between 1 and {constants.MAX_UPDATE_CONCURRENCY}, got {concurrency}"
+        raise argparse.ArgumentTypeError(msg)
+    return concurrency
+
+
+def non_negative_seconds(value: str) -> int:
+    """Argparse type for a duration: a whole number of seconds, zero or more."""
+    try:
+        seconds = int(value)
+    except ValueError:
+        msg = f"invalid int value: {value!r}"
+        raise argparse.ArgumentTypeError(msg) from None
+    if seconds < 0:
+        msg = f"must be zero or more seconds, got {seconds}"
+        raise argparse.ArgumentTypeError(msg)
+    return seconds
+
+
+def positive_int(value: str) -> int:
+    """Argparse type for a count: an int, one or more."""
+    try:
+        count = int(value)
+    except ValueError:
+        msg = f"invalid int value: {value!r}"
+        raise argparse.ArgumentTypeError(msg) from None
+    if count < 1:
+        msg = f"must be one or more, got {count}"
+        raise argparse.ArgumentTypeError(msg)
+    return count
+
+
+def positive_seconds(value: str) -> int:
+    """Argparse type for an interval: a whole number of seconds, one or more."""
+    seconds = non_negative_seconds(value)
+    if seconds == 0:
+        msg = "must be one or more seconds, got 0"
+        raise argparse.ArgumentTypeError(msg)
+    return seconds
+
+
+_DURATION = re.compile(r"(\d+)([smhd])")
+_DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+
+def since_time(value: str) -> datetime:
+    """Argparse type for a point in time: a duration ago (e.g. 30m, 2h, 7d) or an ISO 8601 date.
+
+    A date or time without a UTC offset is taken as local time.
+    """
+    if match := _DURATION.fullmatch(value.strip()):
+        ago = timedelta(**{_DURATION_UNITS[match[2]]: int(match[1])})
+        return datetime.now(UTC) - ago
+    try:
+        since = datetime.fromisoformat(value)
+    except ValueError:
+        msg = f"expected a duration such as 30m, 2h or 7d, or an ISO 8601 date, got {value!r}"
+        raise argparse.ArgumentTypeError(msg) from None
+    return since.astimezone(UTC)
+
+
+def add_update_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments shared by the commands that run the update-ips pipeline."""
+    parser.add_argument(
+        "--concurrency",
+        help=(
+            "Number of A records to update in parallel "
+            f"(1-{constants.MAX_UPDATE_CONCURRENCY}). Default: %(default)s"
+        ),
+        type=update_concurrency,
+        default=1,
+    )
+    parser.add_argument(
+        "--verify-interval",
+        help=(
+            "Seconds for which an unchanged public IP is trusted without checking the A records "
+            "against the Digital Ocean API. 0 always checks. Default: %(default)s"
+        ),
+        type=non_negative_seconds,
+        default=3600,
+        metavar="SECONDS",
+    )
+    parser.add_argument(
+        "--ip-quorum",
+        help=(
+            "Number of IP resolvers that must agree on the public IP address "
+            "(capped at the number configured). Default: %(default)s"
+        ),
+        type=positive_int,
+        default=1,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--timings",
+        help=(
+            "Print how long the IP lookup, each kind of API request and the database writes "
+            "took (count, total, p50, p95 and max)."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help=(
+            "After each run, write its metrics for Prometheus to this file, "
+            "e.g. in node_exporter's textfile collector directory."
+        ),
+        type=Path,
+        default=None,
+        metavar="PATH",
+    )
+
+
+def configure_daemon_subparser(
+    subparsers: argparse._SubParsersAction[argparse.ArgumentParser],
+) -> None:
+    """Configure the daemon subparser."""
+    parser_daemon = subparsers.add_parser(
+        name="daemon",
+        help="Keep running, updating the IP addresses of the managed subdomains on an interval.",
+    )
+    parser_daemon.set_defaults(func=lazy_handler("daemon", "run_daemon"))
+    parser_daemon.add_argument(
+        "--interval",
+        help="Seconds between checks of the public IP address. Default: %(default)s",
+        type=positive_seconds,
+        default=constants.DAEMON_INTERVAL,
+        metavar="SECONDS",
+    )
+    parser_daemon.add_argument(
+        "--jitter",
+        help=(
+            "Randomly shift each check by up to this many seconds either way, "
+            "so that many hosts don't poll in lock-step. Default: %(default)s"
+        ),
+        type=non_negative_seconds,
+        default=constants.DAEMON_JITTER,
+        metavar="SECONDS",
+    )
+    parser_daemon.add_argument(
+        "--adaptive",
+        help=(
+            "Pick the time until each check from how often the public IP address has changed: "
+            "sooner after a change or a failed check, later while it is stable. "
+            "--interval is then only used until there is an IP history."
+        ),
+        action="store_true",
+    )
+    parser_daemon.add_argument(
+        "--min-interval",
+        help="The shortest time between checks with --adaptive. Default: %(default)s",
+        type=positive_seconds,
+        default=constants.DAEMON_MIN_INTERVAL,
+        metavar="SECONDS",
+    )
+    parser_daemon.add_argument(
+        "--max-interval",
+        help="The longest time between checks with --adaptive. Default: %(default)s",
+        type=positive_seconds,
+        default=constants.DAEMON_MAX_INTERVAL,
+        metavar="SECONDS",
+    )
+    parser_daemon.add_argument(
+        "--watch-netlink",
+        help=(
+            "Also check as soon as an IPv4 address of this host changes, as announced by "
+            "Linux's netlink. Checks on the interval go on as a fallback."
+        ),
+        action="store_true",
+    )
+    add_update_arguments(parser_daemon)
 
 
 def configure_ip_lookup_subparser(
@@ -21,14 +224,30 @@ def configure_ip_lookup_subparser(
         name="ip-resolver-config",
         help=("Update the service/server used to lookup your public IP address."),
     )
-    parser_ip_server.set_defaults(func=ip.view_or_update_ip_server)
+    parser_ip_server.set_defaults(func=lazy_handler("ip", "view_or_update_ip_server"))
     parser_ip_server.add_argument(
         "--url",
         help=(
-            "The URL of the server to use for obtaining your current IP address. "
-            "NOTE: Expects the servers response to a GET request to have a .text response. "
-            "Example: https://api.ipify.org"
+            "The URL of the server to use for obtaining your current IP address: "
+            "an HTTP(S) URL answering a GET request with the address as plain text, e.g. "
+            "https://api.ipify.org, or dns://SERVER[:PORT]/NAME[?type=A|TXT] to ask a DNS "
+            "server for a 'whoami' name, e.g. dns://resolver1.opendns.com/myip.opendns.com"
+        ),
+    )
+    parser_ip_server.add_argument(
+        "--add-url",
+        help=(
+            "Add another server to look up your IP address from; can be repeated. "
+            "Resolvers are raced, fastest healthy resolver first."
         ),
+        action="append",
+        metavar="URL",
+    )
+    parser_ip_server.add_argument(
+        "--remove-url",
+        help="Stop looking up your IP address from this server; can be repeated.",
+        action="append",
+        metavar="URL",
     )
     parser_ip_server.add_argument(
         "--ip-mode",
@@ -46,7 +265,7 @@ def configure_manage_subparser(
         name="manage",
         help="Configure domains and subdomains to be managed by digital-ocean-dynamic-dns",
     )
-    parser_manage.set_defaults(func=manage.martial_manage)
+    parser_manage.set_defaults(func=lazy_handler("manage", "martial_manage"))
     parser_manage.add_argument(
         "domain",
         help=(
@@ -67,6 +286,14 @@ def configure_manage_subparser(
         help="List the current subdomains (A records) for `domain`",
         action="store_true",
     )
+    parser_manage.add_argument(
+        "--refresh",
+        help=(
+            "With --list: fetch the A records from Digital Ocean "
+            "instead of the local mirror (see do_ddns sync)."
+        ),
+        action="store_true",
+    )
 
 
 def configure_un_manage_subparser(
@@ -77,7 +304,7 @@ def configure_un_manage_subparser(
         name="un-manage",
         help="Stop digital-ocean-dynamic-dns from managing the specified domains and subdomains.",
     )
-    parser.set_defaults(func=manage.martial_un_manage)
+    parser.set_defaults(func=lazy_handler("manage", "martial_un_manage"))
     parser.add_argument(
         "domain",
         help=(
@@ -98,6 +325,71 @@ def configure_un_manage_subparser(
         help="List the current subdomains (A records) for `domain`",
         action="store_true",
     )
+    parser.add_argument(
+        "--refresh",
+        help=(
+            "With --list: fetch the A records from Digital Ocean "
+            "instead of the local mirror (see do_ddns sync)."
+        ),
+        action="store_true",
+    )
+
+
+def configure_sync_subparser(
+    subparsers: argparse._SubParsersAction[argparse.ArgumentParser],
+) -> None:
+    """Configure the sync subparser."""
+    parser_sync = subparsers.add_parser(
+        name="sync",
+        help=(
+            "Refresh the local mirror of your domains and of the A records of the managed "
+            "domains, which listing commands read from."
+        ),
+    )
+    parser_sync.set_defaults(func=lazy_handler("mirror", "sync"))
+
+
+def configure_history_subparser(
+    subparsers: argparse._SubParsersAction[argparse.ArgumentParser],
+) -> None:
+    """Configure the history subparser."""
+    parser_history = subparsers.add_parser(
+        name="history",
+        help="Show the public IP addresses observed by update-ips, and when they changed.",
+    )
+    parser_history.set_defaults(func=lazy_handler("history", "show_history"))
+    parser_history.add_argument(
+        "--since",
+        help="Only show the addresses seen since TIME: a duration ago (e.g. 7d) or an ISO date.",
+        type=since_time,
+        default=None,
+        metavar="TIME",
+    )
+    parser_history.add_argument(
+        "--until",
+        help="Only show the addresses seen until TIME: a duration ago (e.g. 1d) or an ISO date.",
+        type=since_time,
+        default=None,
+        metavar="TIME",
+    )
+    parser_history.add_argument(
+        "--compact",
+        help=(
+            "First collapse the runs of identical observations older than --keep seconds "
+            "into one row each."
+        ),
+        action="store_true",
+    )
+    parser_history.add_argument(
+        "--keep",
+        help=(
+            "With --compact, the seconds of most recent observations to keep one row each. "
+            "update-ips compacts with the default as it goes. Default: %(default)s"
+        ),
+        type=non_negative_seconds,
+        default=constants.HISTORY_KEEP,
+        metavar="SECONDS",
+    )
 
 
 def configure_show_info_subparser(
@@ -109,7 +401,7 @@ def configure_show_info_subparser(
         help="Show information about do_ddns, including current configuration and version.",
     )
 
-    parser_show_info.set_defaults(func=info.show_current_info)
+    parser_show_info.set_defaults(func=lazy_handler("info", "show_current_info"))
     parser_show_info.add_argument(
         "--show-api-key",
         help="Display the unmasked API key in output.",
@@ -121,7 +413,48 @@ def configure_show_info_subparser(
         "domains",
         help="Show info for domains associated with this account.",
     )
-    parser_show_info_domains.set_defaults(func=domains.show_all_domains)
+    parser_show_info_domains.set_defaults(func=lazy_handler("domains", "show_all_domains"))
+    parser_show_info_domains.add_argument(
+        "--refresh",
+        help="Fetch the domains from Digital Ocean instead of the local mirror.",
+        action="store_true",
+    )
+
+
+def add_profiling_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the global options that profile whichever subcommand runs (see profiling)."""
+    group = parser.add_argument_group(
+        "profiling", "Diagnose slow or memory hungry runs. Give these before the subcommand."
+    )
+    group.add_argument(
+        "--profile",
+        help="Profile the subcommand with cProfile, save the profile to PATH and print a summary.",
+        type=Path,
+        default=None,
+        metavar="PATH",
+    )
+    group.add_argument(
+        "--trace-malloc",
+        help="Trace the subcommand's memory allocations and print the top allocation sites.",
+        action="store_true",
+    )
+    group.add_argument(
+        "--trace-events",
+        help=(
+            "Save the subcommand's timed operations (API requests, IP lookup, database writes) "
+            "as a Chrome trace to PATH, for chrome://tracing or ui.perfetto.dev."
+        ),
+        type=Path,
+        default=None,
+        metavar="PATH",
+    )
+    group.add_argument(
+        "--top",
+        help="Entries in the --profile and --trace-malloc summaries. Default: %(default)s",
+        type=positive_int,
+        default=20,
+        metavar="N",
+    )
 
 
 def setup_argparse() -> argparse.ArgumentParser:
@@ -139,12 +472,13 @@ def setup_argparse() -> argparse.ArgumentParser:
         ).strip(),
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
+    add_profiling_arguments(parser)
     subparsers = parser.add_subparsers(dest="subparser_name")
     parser_update_ips = subparsers.add_parser(
         name="update-ips",
         help=("Update the IP addresses for the subdomains that are configured."),
     )
-    parser_update_ips.set_defaults(func=subdomains.update_all_managed_subdomains)
+    parser_update_ips.set_defaults(func=lazy_handler("subdomains", "update_all_managed_subdomains"))
 
     parser_update_ips.add_argument(
         "-f",
@@ -153,16 +487,53 @@ def setup_argparse() -> argparse.ArgumentParser:
         action=argparse.BooleanOptionalAction,
         default=False,
     )
+    add_update_arguments(parser_update_ips)
 
     parser_logs = subparsers.add_parser(
         name="logs",
         help=("Print the logs."),
     )
-    parser_logs.set_defaults(func=logs.show_log)
+    parser_logs.set_defaults(func=lazy_handler("logs", "show_log"))
+    parser_logs.add_argument(
+        "--since",
+        help=(
+            "Only print entries logged since TIME: a duration ago (e.g. 30m, 2h, 7d) "
+            "or an ISO 8601 date or time, e.g. 2024-05-01 or 2024-05-01T12:00."
+        ),
+        type=since_time,
+        default=None,
+        metavar="TIME",
+    )
+    parser_logs.add_argument(
+        "--domain",
+        help="Only print the events about the A records of DOMAIN, e.g. updates.",
+        default=None,
+    )
+    parser_logs.add_argument(
+        "--tail",
+        help="Only print the last N entries.",
+        type=positive_int,
+        default=None,
+        metavar="N",
+    )
+    parser_logs.add_argument(
+        "-f",
+        "--follow",
+        help="Keep printing entries as they are logged, until interrupted.",
+        action="store_true",
+    )
+    parser_logs.add_argument(
+        "--json",
+        help="Print the entries as logged, one JSON object per line, with their event fields.",
+        action="store_true",
+    )
 
+    configure_daemon_subparser(subparsers)
     configure_ip_lookup_subparser(subparsers)
     configure_manage_subparser(subparsers)
     configure_un_manage_subparser(subparsers)
     configure_show_info_subparser(subparsers)
+    configure_sync_subparser(subparsers)
+    configure_history_subparser(subparsers)
 
     return parser
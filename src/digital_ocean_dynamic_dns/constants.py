@@ -44,3 +44,32 @@ app_data_home.mkdir(parents=True, exist_ok=True)
 
 database_path = app_data_home.joinpath("do_ddns.db")
 logfile = app_data_home.joinpath("do_ddns.log")
+
+# Defaults shared by the CLI parser and the modules that implement the subcommands. They live
+# here so that building the parser doesn't import those modules (see args.lazy_handler).
+
+# Upper bound on keep-alive connections held open to the Digital Ocean API by one client,
+# and so on the number of A records update-ips updates in parallel.
+DEFAULT_POOL_MAXSIZE = 10
+MAX_UPDATE_CONCURRENCY = DEFAULT_POOL_MAXSIZE
+
+# Seconds between the daemon's checks of the public IP, and the random shift of each check.
+DAEMON_INTERVAL = 300
+DAEMON_JITTER = 30
+# The bounds, in seconds, of the intervals picked by the daemon's --adaptive (see schedule).
+DAEMON_MIN_INTERVAL = 60
+DAEMON_MAX_INTERVAL = 3600
+
+# Seconds of observations of the public IP that update-ips keeps one row each in ip_history;
+# older runs of identical observations are collapsed into one row (see history).
+HISTORY_KEEP = 7 * 24 * 3600
+
+# Rotation of the log file (see events.configure_logging). Each can be overridden by the
+# environment variable in the comment above it.
+# DO_DDNS_LOG_MAX_BYTES: the size at which the log file is rotated; 0 to never rotate by size.
+LOG_MAX_BYTES = 10 * 1024 * 1024
+# DO_DDNS_LOG_MAX_AGE: seconds after its first entry that the log file is rotated; 0 to never
+# rotate by age.
+LOG_MAX_AGE = 0
+# DO_DDNS_LOG_BACKUPS: the rotated, gzipped log files kept; older ones are deleted.
+LOG_BACKUPS = 5
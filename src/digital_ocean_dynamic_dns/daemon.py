@@ -0,0 +1,239 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Long-running daemon that keeps the managed A records up to date.
+
+Unlike running ``do_ddns update-ips`` from cron, the daemon pays for interpreter startup,
+imports and the database connections once, and reuses its pooled HTTP connections to the
+Digital Ocean API and the IP resolver between checks.
+
+With ``--adaptive`` the time until each check is picked from the history of the public IP
+(see schedule) rather than fixed. With ``--watch-netlink`` the daemon also checks as soon as
+one of the host's addresses changes (see netlink).
+"""
+
+import logging
+import math
+import random
+import signal
+import socket
+import threading
+import time
+from argparse import Namespace
+from types import FrameType
+
+import requests
+from rich.console import Console
+
+from . import constants, do_api, netlink, schedule, subdomains
+from .database import get_connection
+from .ip import NoIPResolverServerError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = constants.DAEMON_INTERVAL
+DEFAULT_JITTER = constants.DAEMON_JITTER
+
+
+def _next_delay(interval: int, jitter: int, bounds: tuple[float, float] = (0.0, math.inf)) -> float:
+    """Seconds until the next check: `interval`, give or take up to `jitter` seconds.
+
+    The delay is kept within `bounds`, (shortest, longest).
+    """
+    # Jitter keeps many daemons (or a restarted one) from polling in lock-step.
+    delay = interval + random.uniform(-jitter, jitter)  # noqa: S311
+    shortest, longest = bounds
+    return min(max(delay, shortest, 0.0), longest)
+
+
+def _adaptive_interval(args: Namespace, *, last_check_ok: bool) -> int:
+    """Decide the interval until the next check with schedule.next_check, and log it.
+
+    An error deciding (e.g. "database is locked" saving the decision) is logged, and the
+    next check is after ``min_interval``, as after a failed check.
+    """
+    try:
+        decision = schedule.next_check(
+            get_connection(),
+            last_check_ok=last_check_ok,
+            min_interval=args.min_interval,
+            max_interval=args.max_interval,
+            default_interval=args.interval,
+        )
+    except Exception as e:
+        msg = (
+            f"{time.strftime('%Y-%m-%d %H:%M')} - Error : can't decide the next check "
+            f"({e!r}), checking again in {args.min_interval}s"
+        )
+        Console().print(msg, markup=False, highlight=False)
+        logger.exception(msg)
+        return args.min_interval
+    logger.info(
+        "%s - Info : next check in %ss: %s",
+        time.strftime("%Y-%m-%d %H:%M"),
+        decision.interval,
+        decision.reason,
+    )
+    return decision.interval
+
+
+def _save_rate_limit_budget() -> None:
+    """Share the rate limit budget with any do_ddns command run alongside the daemon."""
+    try:
+        do_api.save_rate_limit_budget()
+    except Exception:
+        # E.g. "database is locked": the budget is saved again after the next check.
+        logger.exception(
+            "%s - Error : can't save the rate limit budget", time.strftime("%Y-%m-%d %H:%M")
+        )
+
+
+def _check_once(args: Namespace) -> bool:
+    """Run the update-ips pipeline once, logging any error rather than stopping the daemon.
+
+    Errors a later check may not hit (e.g. the IP resolver is unreachable) are logged in one
+    line; any other error (e.g. "database is locked" while a do_ddns command holds the write
+    lock) with its traceback. Only KeyboardInterrupt and SystemExit propagate.
+
+    Returns:
+        Whether the check succeeded, every stale A record included.
+    """
+    try:
+        return subdomains.update_all_managed_subdomains(args) == 0
+    except (
+        requests.RequestException,
+        NoIPResolverServerError,
+        subdomains.NoManagedSubdomainsError,
+    ) as e:
+        msg = f"{time.strftime('%Y-%m-%d %H:%M')} - Error : check failed: {e}"
+        Console().print(msg, markup=False, highlight=False)
+        logger.error(msg)  # noqa: TRY400
+        return False
+    except Exception as e:
+        msg = f"{time.strftime('%Y-%m-%d %H:%M')} - Error : check failed unexpectedly: {e!r}"
+        Console().print(msg, markup=False, highlight=False)
+        logger.exception(msg)
+        return False
+    finally:
+        _save_rate_limit_budget()
+
+
+def _open_watcher() -> socket.socket | None:
+    """Open the netlink socket of --watch-netlink, or return None if the host can't."""
+    try:
+        return netlink.open_socket()
+    except OSError as e:
+        msg = (
+            f"{time.strftime('%Y-%m-%d %H:%M')} - Warning : can't watch for address changes "
+            f"({e}), checking on the interval only"
+        )
+        Console().print(msg, markup=False, highlight=False)
+        logger.warning(msg)
+        return None
+
+
+def _wait(
+    stop: threading.Event, delay: float, watcher: socket.socket | None, wake: socket.socket | None
+) -> None:
+    """Wait `delay` seconds, or until a signal sets `stop` or the watched addresses change."""
+    if watcher is None or wake is None:
+        # Returns early as soon as a signal sets `stop`.
+        stop.wait(delay)
+        return
+    changes = netlink.wait_for_changes(watcher, delay, wake=wake)
+    if changes:
+        described = ", ".join(
+            f"{change.address} {'added to' if change.added else 'removed from'} "
+            f"{change.label or f'interface {change.interface_index}'}"
+            for change in changes
+        )
+        logger.info(
+            "%s - Info : address change (%s), checking now",
+            time.strftime("%Y-%m-%d %H:%M"),
+            described,
+        )
+
+
+def run_daemon(args: Namespace) -> int:
+    """Check the public IP every ``interval`` seconds until SIGTERM or SIGINT.
+
+    Each check runs the update-ips pipeline in this process. A check that fails, for any
+    reason, is logged and retried on the next check.
+
+    With ``adaptive``, the interval after each check is decided by schedule.next_check,
+    between ``min_interval`` and ``max_interval``. With ``watch_netlink``, a change of the
+    host's IPv4 addresses cuts the interval short.
+
+    Args:
+        args: Parsed CLI arguments; expects ``interval``, ``jitter``, ``min_interval`` and
+            ``max_interval`` int attributes (seconds), ``adaptive`` and ``watch_netlink``
+            boolean attributes, plus the ``concurrency``, ``verify_interval``, ``ip_quorum``,
+            ``timings`` and ``metrics_file`` attributes of update-ips.
+
+    Returns:
+        The exit status: 0 after a graceful shutdown, 1 if the interval bounds are invalid.
+    """
+    interval: int = args.interval
+    jitter: int = args.jitter
+    if args.adaptive and args.min_interval > args.max_interval:
+        Console().print(
+            f"Error : --min-interval ({args.min_interval}s) is longer than "
+            f"--max-interval ({args.max_interval}s)."
+        )
+        return 1
+    update_args = Namespace(
+        force=False,
+        concurrency=args.concurrency,
+        verify_interval=args.verify_interval,
+        ip_quorum=args.ip_quorum,
+        timings=args.timings,
+        metrics_file=args.metrics_file,
+    )
+
+    stop = threading.Event()
+    watcher = _open_watcher() if args.watch_netlink else None
+    # Written to by the signal handler, so that waiting on the watcher stops too.
+    wake, wake_writer = socket.socketpair() if watcher is not None else (None, None)
+
+    def handle_signal(signum: int, _frame: FrameType | None) -> None:
+        logger.info(
+            "%s - Info : received %s, stopping",
+            time.strftime("%Y-%m-%d %H:%M"),
+            signal.Signals(signum).name,
+        )
+        stop.set()
+        if wake_writer is not None:
+            wake_writer.send(b"\0")
+
+    previous_handlers = {
+        signum: signal.signal(signum, handle_signal) for signum in (signal.SIGTERM, signal.SIGINT)
+    }
+    try:
+        every = (
+            f"between {args.min_interval}s and {args.max_interval}s apart"
+            if args.adaptive
+            else f"every {interval}s"
+        )
+        msg = f"{time.strftime('%Y-%m-%d %H:%M')} - Info : daemon started, checking {every}"
+        Console().print(msg)
+        logger.info(msg)
+        while not stop.is_set():
+            ok = _check_once(update_args)
+            if args.adaptive:
+                wait = _adaptive_interval(args, last_check_ok=ok)
+                # Jitter doesn't take the wait past the bounds.
+                delay = _next_delay(wait, jitter, (args.min_interval, args.max_interval))
+            else:
+                delay = _next_delay(interval, jitter)
+            _wait(stop, delay, watcher, wake)
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        for sock in (watcher, wake, wake_writer):
+            if sock is not None:
+                sock.close()
+
+    msg = time.strftime("%Y-%m-%d %H:%M") + " - Info : daemon stopped"
+    Console().print(msg)
+    logger.info(msg)
+    return 0
@@ -1,70 +1,412 @@
 # SPDX-FileCopyrightText: © 2023 Tyler Nivin
 # SPDX-License-Identifier: MIT
 
-"""Database connection and schema initialization for Digital Ocean Dynamic DNS."""
+"""Database connection and schema migrations for Digital Ocean Dynamic DNS.
+
+The schema is versioned with ``PRAGMA user_version``: a database at version N has had the
+first N entries of MIGRATIONS applied. Opening a database applies any missing migrations,
+each in its own transaction, so existing databases are upgraded in place.
+
+Timestamps are stored as integer epoch seconds (NULL when there is no timestamp yet).
+
+Several do_ddns processes may share the database, e.g. a cron-driven ``update-ips`` and an
+interactive ``manage``. The database is kept in WAL mode so readers never block the writer
+(nor it them), and a connection waits up to BUSY_TIMEOUT seconds for another process's write
+to finish instead of failing with ``database is locked``.
+"""
 
 import logging
 import sqlite3
 import time
+from collections.abc import Callable
+from functools import cache
 from pathlib import Path
 from sqlite3 import Error
 
 from rich import print as rprint
 
+from . import constants
+
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for another connection's write lock before giving up.
+BUSY_TIMEOUT = 10.0
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    """Version 1: the schema as it was before it was versioned.
+
+    Tables are created only if missing, so unversioned databases are adopted as-is.
+    """
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS ipservers (
+            id integer NOT NULL PRIMARY KEY,
+            URL text NOT NULL UNIQUE,
+            ip_version text NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS ip_resolver_stats (
+            url text PRIMARY KEY,
+            successes integer NOT NULL,
+            failures integer NOT NULL,
+            consecutive_failures integer NOT NULL,
+            latency_ms real NULL,
+            last_error text NULL,
+            updated_at integer NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS domains (
+            id integer PRIMARY KEY,
+            name text NOT NULL UNIQUE,
+            cataloged text NOT NULL,
+            managed integer default 1,
+            last_managed text default 'N/A'
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS subdomains (
+            domain_record_id integer PRIMARY KEY,
+            main_id integer NOT NULL REFERENCES domains (id) ON DELETE RESTRICT,
+            name text NOT NULL,
+            current_ip4 text NOT NULL,
+            current_ip6 text NULL,
+            cataloged text NOT NULL,
+            managed integer default 1,
+            last_checked text default 'N/A',
+            last_updated text default 'N/A'
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS pending_updates (
+            domain_record_id integer PRIMARY KEY
+                REFERENCES subdomains (domain_record_id) ON DELETE CASCADE,
+            attempts integer NOT NULL,
+            last_error text NOT NULL,
+            first_failed integer NOT NULL,
+            last_failed integer NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS update_state (
+            id integer PRIMARY KEY CHECK (id = 1),
+            last_ip4 text NOT NULL,
+            last_verified integer NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            name text PRIMARY KEY,
+            capacity real NOT NULL,
+            window_seconds real NOT NULL,
+            tokens real NOT NULL,
+            updated_at real NOT NULL
+        )"""
+    )
+
+
+def _legacy_timestamp_to_epoch(column: str) -> str:
+    """SQL converting a pre-version 2 text timestamp `column` to epoch seconds.
+
+    The text timestamps are in local time, as either "%Y-%m-%d %H:%M" or "%d-%m-%Y %H:%M";
+    anything else (e.g. the 'N/A' column default) becomes NULL. The conversion is done by
+    SQLite itself ('utc' converts from local time), which keeps migrating large tables fast.
+    """
+    digits = "[0-9]"
+    return (
+        "CASE "
+        f"WHEN {column} GLOB '{digits * 4}-{digits * 2}-{digits * 2} {digits * 2}:{digits * 2}' "
+        f"  THEN CAST(strftime('%s', {column}, 'utc') AS integer) "
+        f"WHEN {column} GLOB '{digits * 2}-{digits * 2}-{digits * 4} {digits * 2}:{digits * 2}' "
+        f"  THEN CAST(strftime('%s', substr({column}, 7, 4) || '-' || substr({column}, 4, 2) "
+        f"    || '-' || substr({column}, 1, 2) || substr({column}, 11), 'utc') AS integer) "
+        "END"
+    )
+
+
+def _epoch_timestamps_and_indexes(conn: sqlite3.Connection) -> None:
+    """Version 2: integer epoch timestamps, and indexes for the subdomain lookups.
+
+    SQLite can't change a column's type in place, so domains and subdomains are rebuilt.
+    """
+    conn.execute(
+        """CREATE TABLE domains_v2 (
+            id integer PRIMARY KEY,
+            name text NOT NULL UNIQUE,
+            cataloged integer NOT NULL,
+            managed integer NOT NULL default 1,
+            last_managed integer NULL
+        )"""
+    )
+    conn.execute(
+        "INSERT INTO domains_v2 (id, name, cataloged, managed, last_managed) "  # noqa: S608
+        "SELECT "
+        "  id, "
+        "  name, "
+        f"  COALESCE({_legacy_timestamp_to_epoch('cataloged')}, 0), "
+        "  COALESCE(managed, 1), "
+        f"  {_legacy_timestamp_to_epoch('last_managed')} "
+        "FROM domains"
+    )
+    conn.execute("DROP TABLE domains")
+    conn.execute("ALTER TABLE domains_v2 RENAME TO domains")
+
+    conn.execute(
+        """CREATE TABLE subdomains_v2 (
+            domain_record_id integer PRIMARY KEY,
+            main_id integer NOT NULL REFERENCES domains (id) ON DELETE RESTRICT,
+            name text NOT NULL,
+            current_ip4 text NOT NULL,
+            current_ip6 text NULL,
+            cataloged integer NOT NULL,
+            managed integer NOT NULL default 1,
+            last_checked integer NULL,
+            last_updated integer NULL
+        )"""
+    )
+    conn.execute(
+        "INSERT INTO subdomains_v2 ("  # noqa: S608
+        "  domain_record_id, main_id, name, current_ip4, current_ip6, cataloged, managed,"
+        "  last_checked, last_updated"
+        ") "
+        "SELECT "
+        "  domain_record_id, "
+        "  main_id, "
+        "  name, "
+        "  current_ip4, "
+        "  current_ip6, "
+        f"  COALESCE({_legacy_timestamp_to_epoch('cataloged')}, 0), "
+        "  COALESCE(managed, 1), "
+        f"  {_legacy_timestamp_to_epoch('last_checked')}, "
+        f"  {_legacy_timestamp_to_epoch('last_updated')} "
+        "FROM subdomains"
+    )
+    conn.execute("DROP TABLE subdomains")
+    conn.execute("ALTER TABLE subdomains_v2 RENAME TO subdomains")
+
+    # manage / un-manage look subdomains up by domain and name.
+    conn.execute("CREATE INDEX subdomains_main_id_name ON subdomains (main_id, name)")
+    # update-ips only reads the managed subdomains.
+    conn.execute("CREATE INDEX subdomains_managed ON subdomains (managed, main_id)")
+
+
+def _remote_mirror(conn: sqlite3.Connection) -> None:
+    """Version 3: a local mirror of the domains and A records last seen on Digital Ocean."""
+    conn.execute(
+        """CREATE TABLE remote_domains (
+            name text NOT NULL PRIMARY KEY,
+            ttl integer NULL,
+            fetched_at integer NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE remote_records (
+            domain_record_id integer NOT NULL PRIMARY KEY,
+            domain text NOT NULL,
+            name text NOT NULL,
+            data text NOT NULL,
+            ttl integer NULL,
+            fetched_at integer NOT NULL
+        )"""
+    )
+    conn.execute("CREATE INDEX remote_records_domain ON remote_records (domain, name)")
+    # When each mirrored listing was last fetched, by its API path; a listing that was
+    # fetched but came back empty is told apart from one that was never fetched.
+    conn.execute(
+        """CREATE TABLE remote_listings (
+            path text NOT NULL PRIMARY KEY,
+            fetched_at integer NOT NULL
+        )"""
+    )
+
+
+def _runs(conn: sqlite3.Connection) -> None:
+    """Version 4: each update-ips run, and how long each of its operations took."""
+    conn.execute(
+        """CREATE TABLE runs (
+            id integer PRIMARY KEY,
+            command text NOT NULL,
+            started_at integer NOT NULL,
+            duration_ms real NOT NULL,
+            exit_status integer NULL
+        )"""
+    )
+    conn.execute("CREATE INDEX runs_command_started_at ON runs (command, started_at)")
+    conn.execute(
+        """CREATE TABLE run_timings (
+            run_id integer NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+            operation text NOT NULL,
+            count integer NOT NULL,
+            total_ms real NOT NULL,
+            p50_ms real NOT NULL,
+            p95_ms real NOT NULL,
+            max_ms real NOT NULL,
+            PRIMARY KEY (run_id, operation)
+        )"""
+    )
+
+
+def _ip_history(conn: sqlite3.Connection) -> None:
+    """Version 5: each public IP address observed by update-ips (see history)."""
+    conn.execute(
+        """CREATE TABLE ip_history (
+            id integer PRIMARY KEY,
+            ip4 text NOT NULL,
+            first_seen integer NOT NULL,
+            last_seen integer NOT NULL,
+            observations integer NOT NULL,
+            records_updated integer NOT NULL,
+            records_failed integer NOT NULL,
+            propagated_at integer NULL
+        )"""
+    )
+    # history filters on a time range; compaction reads the oldest observations.
+    conn.execute("CREATE INDEX ip_history_first_seen ON ip_history (first_seen)")
+    conn.execute("CREATE INDEX ip_history_last_seen ON ip_history (last_seen)")
+
+
+def _schedule_state(conn: sqlite3.Connection) -> None:
+    """Version 6: the daemon's last decision of when to check the public IP (see schedule)."""
+    conn.execute(
+        """CREATE TABLE schedule_state (
+            id integer PRIMARY KEY CHECK (id = 1),
+            decided_at integer NOT NULL,
+            interval integer NOT NULL,
+            reason text NOT NULL
+        )"""
+    )
+
 
-def connect_database(database_path: Path) -> sqlite3.Connection:
-    """Connect to the SQLite database and initialize the schema.
+# Append only: never edit or reorder a migration that has been released.
+MIGRATIONS: list[Callable[[sqlite3.Connection], None]] = [
+    _create_schema,
+    _epoch_timestamps_and_indexes,
+    _remote_mirror,
+    _runs,
+    _ip_history,
+    _schedule_state,
+]
+
+
+def migrate(conn: sqlite3.Connection) -> None:
+    """Apply the migrations the database is missing, each in its own transaction.
+
+    Raises:
+        RuntimeError: The database was created by a newer version of do_ddns.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > len(MIGRATIONS):
+        msg = (
+            f"The database schema (version {version}) is newer than this version of do_ddns "
+            f"supports (version {len(MIGRATIONS)}). Upgrade do_ddns."
+        )
+        raise RuntimeError(msg)
+
+    for new_version, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        # Explicit BEGIN: sqlite3 doesn't open a transaction for DDL statements on its own.
+        # IMMEDIATE also keeps a concurrent do_ddns from migrating the database twice.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read the version under the lock, in case another process just migrated.
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= new_version:
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {new_version}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        logger.info(
+            "%s - Info : database migrated to schema version %s",
+            time.strftime("%Y-%m-%d %H:%M"),
+            new_version,
+        )
+
+
+def format_timestamp(timestamp: int | None) -> str:
+    """Format an epoch timestamp from the database for display, in local time."""
+    if timestamp is None:
+        return "N/A"
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+
+
+def _configure_for_writing(conn: sqlite3.Connection) -> None:
+    """Put the database in WAL mode, with the synchronous level WAL is safe with."""
+    # The journal mode is stored in the database file, so this only changes anything
+    # the first time. Readers then see the last committed state without blocking the writer.
+    conn.execute("PRAGMA journal_mode = WAL")
+    # In WAL mode NORMAL can only lose the last transactions on power loss; it never
+    # corrupts the database, and saves an fsync per commit.
+    conn.execute("PRAGMA synchronous = NORMAL")
+
+
+def connect_database(database_path: Path, *, read_only: bool = False) -> sqlite3.Connection:
+    """Connect to the SQLite database and migrate it to the current schema.
 
     Args:
         database_path: Path to the SQLite database file.
+        read_only: Open the database read-only, for commands that only display state.
+            A database that doesn't exist yet, or needs migrating, is first created or
+            migrated by a short-lived read-write connection.
 
     Returns:
-        An open SQLite connection with the schema initialized.
+        An open SQLite connection with the schema up to date.
 
     Raises:
         Error: If the database connection fails.
     """
+    if read_only and not database_path.exists():
+        connect_database(database_path).close()
+
     conn = None
 
     try:
-        conn = sqlite3.connect(database_path)
+        if read_only:
+            conn = sqlite3.connect(
+                f"{database_path.resolve().as_uri()}?mode=ro", uri=True, timeout=BUSY_TIMEOUT
+            )
+        else:
+            # IMMEDIATE: writes take the write lock when their transaction begins,
+            # so a busy database is waited on rather than failing part-way through.
+            conn = sqlite3.connect(database_path, timeout=BUSY_TIMEOUT, isolation_level="IMMEDIATE")
+            _configure_for_writing(conn)
         conn.row_factory = sqlite3.Row
     except Error as e:
         logger.exception("Error at %s", time.strftime("%Y-%m-%d %H:%M"))
         rprint(e)
+        if conn is not None:
+            conn.close()
         raise
-    else:
-        c = conn.cursor()
-        c.execute(
-            """CREATE TABLE IF NOT EXISTS ipservers (
-                id integer NOT NULL PRIMARY KEY,
-                URL text NOT NULL UNIQUE,
-                ip_version text NOT NULL
-            )"""
-        )
-        c.execute(
-            """CREATE TABLE IF NOT EXISTS domains (
-                id integer PRIMARY KEY,
-                name text NOT NULL UNIQUE,
-                cataloged text NOT NULL,
-                managed integer default 1,
-                last_managed text default 'N/A'
-            )"""
-        )
-        c.execute(
-            """CREATE TABLE IF NOT EXISTS subdomains (
-                domain_record_id integer PRIMARY KEY,
-                main_id integer NOT NULL REFERENCES domains (id) ON DELETE RESTRICT,
-                name text NOT NULL,
-                current_ip4 text NOT NULL,
-                current_ip6 text NULL,
-                cataloged text NOT NULL,
-                managed integer default 1,
-                last_checked text default 'N/A',
-                last_updated text default 'N/A'
-            )"""
-        )
 
-        return conn
+    if not read_only:
+        migrate(conn)
+        # Only once migrated: with foreign keys enforced, the tables migrations rebuild
+        # (DROP TABLE) would take the rows referencing them along.
+        conn.execute("PRAGMA foreign_keys = ON")
+    elif conn.execute("PRAGMA user_version").fetchone()[0] != len(MIGRATIONS):
+        conn.close()
+        connect_database(database_path).close()
+        return connect_database(database_path, read_only=True)
+    return conn
+
+
+@cache
+def get_connection() -> sqlite3.Connection:
+    """Return the connection to the application database shared by the whole process.
+
+    The database is opened, and the schema initialized, on first use;
+    commands that never touch the database don't pay for either.
+    """
+    return connect_database(constants.database_path)
+
+
+@cache
+def get_read_only_connection() -> sqlite3.Connection:
+    """Return a read-only connection to the application database, shared by the whole process.
+
+    For commands that only display state, e.g. show-info: they can't take the write lock,
+    so they never hold up an update-ips running at the same time.
+    """
+    return connect_database(constants.database_path, read_only=True)
@@ -3,19 +3,38 @@
 
 """Entry point for the digital-ocean-dynamic-dns CLI."""
 
-import logging
+import contextlib
+import sys
 
 from . import constants
 from .args import setup_argparse
+from .events import configure_logging
 
-logging.basicConfig(filename=constants.logfile, level=logging.INFO, format="%(message)s")
+configure_logging(constants.logfile)
 
 
 def run() -> None:
     """Parse CLI arguments and dispatch to the appropriate subcommand handler."""
     parser = setup_argparse()
     args = parser.parse_args()
-    args.func(args)
+    if args.profile is not None or args.trace_malloc or args.trace_events is not None:
+        # Only imported when asked for: cProfile and tracemalloc aren't free to import.
+        from .profiling import profiling_hooks  # noqa: PLC0415
+
+        hooks = profiling_hooks(args)
+    else:
+        hooks = contextlib.nullcontext()
+    try:
+        # Handlers may return a non-zero exit status, e.g. when some updates failed.
+        with hooks:
+            status = args.func(args)
+    finally:
+        # Only commands that talked to the API import do_api; nothing to save otherwise.
+        do_api = sys.modules.get(f"{__package__}.do_api")
+        if do_api is not None:
+            do_api.save_rate_limit_budget()
+    if status:
+        sys.exit(status)
 
 
 if __name__ == "__main__":
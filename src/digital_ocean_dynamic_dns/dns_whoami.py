@@ -0,0 +1,238 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Public IP lookup over DNS: one UDP query for a "whoami" name.
+
+Some DNS servers answer a special name with the address the query came from, e.g.:
+
+- OpenDNS: ``dns://resolver1.opendns.com/myip.opendns.com``, an A record;
+- Google: ``dns://ns1.google.com/o-o.myaddr.l.google.com?type=TXT``, a TXT record.
+
+An IP resolver URL of the form ``dns://SERVER[:PORT]/NAME[?type=A|TXT]`` is looked up that
+way rather than over HTTPS: one UDP packet each way, with no TCP or TLS handshake. A query
+that gets no answer within QUERY_TIMEOUT seconds is sent again, up to QUERY_ATTEMPTS times.
+
+The client implements only what these lookups need (RFC 1035): one question, A and TXT
+answers, and name compression. A truncated answer is an error rather than retried over TCP;
+whoami answers fit in a packet many times over.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import secrets
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from functools import cache
+from urllib.parse import parse_qs, urlsplit
+
+DNS_PORT = 53
+# Seconds to wait for an answer before sending the query again.
+QUERY_TIMEOUT = 1.0
+# The times a query is sent before giving up.
+QUERY_ATTEMPTS = 3
+# The largest answer read; a DNS message over UDP is at most 512 bytes without EDNS.
+MAX_MESSAGE_SIZE = 4096
+
+TYPE_A = 1
+TYPE_TXT = 16
+CLASS_IN = 1
+RECORD_TYPES = {"A": TYPE_A, "TXT": TYPE_TXT}
+
+# The header: ID, flags, then the counts of questions, answers, authority and additional records.
+HEADER = struct.Struct("!HHHHHH")
+# After the name of a question: its type and class.
+QUESTION = struct.Struct("!HH")
+# After the name of a resource record: its type, class, TTL and data length.
+RECORD = struct.Struct("!HHIH")
+FLAG_RESPONSE = 0x8000
+FLAG_TRUNCATED = 0x0200
+FLAG_RECURSION_DESIRED = 0x0100
+RCODE_MASK = 0x000F
+# The top two bits of a label's length byte, set when it is a pointer to the rest of the name.
+POINTER_MASK = 0xC0
+RCODES = {1: "FORMERR", 2: "SERVFAIL", 3: "NXDOMAIN", 4: "NOTIMP", 5: "REFUSED"}
+
+
+class DNSQueryError(Exception):
+    """Raised when a DNS server doesn't answer a whoami query with an IPv4 address."""
+
+
+@dataclass(frozen=True)
+class WhoamiQuery:
+    """A whoami query, as given by a ``dns://`` IP resolver URL."""
+
+    server: str
+    port: int
+    name: str
+    record_type: int
+
+
+def parse_dns_url(url: str) -> WhoamiQuery:
+    """Return the query of the IP resolver URL ``dns://SERVER[:PORT]/NAME[?type=A|TXT]``.
+
+    Raises:
+        ValueError: `url` isn't such a URL.
+    """
+    parts = urlsplit(url)
+    name = parts.path.strip("/")
+    type_name = parse_qs(parts.query).get("type", ["A"])[-1].upper()
+    if parts.scheme != "dns" or not parts.hostname or not name or type_name not in RECORD_TYPES:
+        msg = f"expected dns://SERVER[:PORT]/NAME[?type=A|TXT], got {url}"
+        raise ValueError(msg)
+    return WhoamiQuery(parts.hostname, parts.port or DNS_PORT, name, RECORD_TYPES[type_name])
+
+
+def encode_query(query_id: int, name: str, record_type: int) -> bytes:
+    """Return the DNS message asking for the `record_type` records of `name`.
+
+    Raises:
+        ValueError: `name` isn't a valid DNS name.
+    """
+    encoded = b""
+    for label in name.rstrip(".").split("."):
+        data = label.encode("ascii")
+        if not 0 < len(data) < 64:  # noqa: PLR2004
+            msg = f"invalid DNS name: {name}"
+            raise ValueError(msg)
+        encoded += bytes([len(data)]) + data
+    return (
+        HEADER.pack(query_id, FLAG_RECURSION_DESIRED, 1, 0, 0, 0)
+        + encoded
+        + b"\0"
+        + QUESTION.pack(record_type, CLASS_IN)
+    )
+
+
+def _skip_name(message: bytes, offset: int) -> int:
+    """Return the offset just past the name at `offset`, compressed or not."""
+    while offset < len(message):
+        length = message[offset]
+        if length & POINTER_MASK == POINTER_MASK:
+            # A pointer to the rest of the name, elsewhere in the message.
+            return offset + 2
+        if length == 0:
+            return offset + 1
+        offset += 1 + length
+    msg = "truncated DNS answer"
+    raise DNSQueryError(msg)
+
+
+def decode_answer(message: bytes, record_type: int) -> list[bytes]:
+    """Return the data of the `record_type` records answered in `message`.
+
+    Raises:
+        DNSQueryError: `message` is an error, truncated or malformed.
+    """
+    try:
+        _, flags, questions, answers, _, _ = HEADER.unpack_from(message)
+        if not flags & FLAG_RESPONSE:
+            msg = "not a DNS answer"
+            raise DNSQueryError(msg)
+        if flags & FLAG_TRUNCATED:
+            msg = "truncated DNS answer"
+            raise DNSQueryError(msg)
+        if rcode := flags & RCODE_MASK:
+            msg = f"DNS error {RCODES.get(rcode, rcode)}"
+            raise DNSQueryError(msg)
+        offset = HEADER.size
+        for _ in range(questions):
+            offset = _skip_name(message, offset) + QUESTION.size
+        records = []
+        for _ in range(answers):
+            offset = _skip_name(message, offset)
+            kind, record_class, _ttl, length = RECORD.unpack_from(message, offset)
+            offset += RECORD.size
+            data = message[offset : offset + length]
+            if len(data) != length:
+                msg = "truncated DNS answer"
+                raise DNSQueryError(msg)
+            offset += length
+            if kind == record_type and record_class == CLASS_IN:
+                records.append(data)
+    except struct.error as e:
+        msg = f"malformed DNS answer: {e}"
+        raise DNSQueryError(msg) from e
+    return records
+
+
+def _txt_strings(data: bytes) -> list[str]:
+    """Return the strings of a TXT record's data, each prefixed with its length."""
+    strings = []
+    offset = 0
+    while offset < len(data):
+        length = data[offset]
+        strings.append(data[offset + 1 : offset + 1 + length].decode("ascii", errors="replace"))
+        offset += 1 + length
+    return strings
+
+
+def _ipv4_address(records: list[bytes], record_type: int) -> str:
+    """Return the first IPv4 address in the answered records.
+
+    Raises:
+        DNSQueryError: There is none.
+    """
+    for data in records:
+        if record_type == TYPE_A and len(data) == 4:  # noqa: PLR2004
+            return str(ipaddress.IPv4Address(data))
+        if record_type == TYPE_TXT:
+            # Google's answer may also hold e.g. "edns0-client-subnet 198.51.100.0/24".
+            for text in _txt_strings(data):
+                try:
+                    return str(ipaddress.IPv4Address(text))
+                except ValueError:
+                    continue
+    msg = "no IPv4 address in the DNS answer"
+    raise DNSQueryError(msg)
+
+
+@cache
+def _server_address(server: str, port: int) -> tuple[str, int]:
+    """Return the IPv4 socket address of `server`, looked up once per process."""
+    try:
+        address_info = socket.getaddrinfo(server, port, socket.AF_INET, socket.SOCK_DGRAM)
+    except OSError as e:
+        msg = f"can't look up the DNS server {server}: {e}"
+        raise DNSQueryError(msg) from e
+    return address_info[0][4][:2]
+
+
+def query_public_ip(url: str) -> str:
+    """Ask the DNS server of the IP resolver URL `url` for our public IPv4 address.
+
+    Raises:
+        ValueError: `url` isn't a ``dns://`` IP resolver URL.
+        DNSQueryError: The server didn't answer with an IPv4 address.
+    """
+    query = parse_dns_url(url)
+    address = _server_address(query.server, query.port)
+    # A random ID makes it harder to slip in a forged answer.
+    query_id = secrets.randbelow(0x10000)
+    packet = encode_query(query_id, query.name, query.record_type)
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            # Connected, so that only the server's datagrams are received.
+            sock.connect(address)
+            for _ in range(QUERY_ATTEMPTS):
+                sock.send(packet)
+                deadline = time.monotonic() + QUERY_TIMEOUT
+                while (remaining := deadline - time.monotonic()) > 0:
+                    sock.settimeout(remaining)
+                    try:
+                        message = sock.recv(MAX_MESSAGE_SIZE)
+                    except TimeoutError:
+                        break
+                    # Skip anything that isn't an answer to this query.
+                    if message[:2] != query_id.to_bytes(2, "big"):
+                        continue
+                    records = decode_answer(message, query.record_type)
+                    return _ipv4_address(records, query.record_type)
+    except OSError as e:
+        # E.g. ICMP port unreachable, reported on a connected socket.
+        msg = f"DNS query to {query.server} failed: {e}"
+        raise DNSQueryError(msg) from e
+    msg = f"no answer from {query.server} after {QUERY_ATTEMPTS} attempts"
+    raise DNSQueryError(msg)
@@ -4,129 +4,383 @@
 """Digital Ocean API helpers for managing DNS A records."""
 
 import logging
+import math
+import os
+import re
 import time
 from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
 from http import HTTPStatus
 from string import ascii_letters, digits
 from typing import Any
+from urllib.parse import parse_qs, urlsplit
 
 import requests
 from more_itertools import countable
+from requests.adapters import HTTPAdapter
 from rich import print as rprint
 
+from . import constants
 from .api_key_helpers import get_api
+from .database import get_connection
 from .exceptions import NonSimpleDomainNameError
+from .ratelimit import RateLimiter, load_rate_limiter, save_rate_limiter
+from .timings import get_timings
 
 logger = logging.getLogger(__name__)
 
 
-def get_a_records(domain: str) -> Generator[dict[str, Any], None, None]:
-    """Retrieve A records for `domain` from Digital Ocean."""
-    apikey = get_api()
-    page_results_limit = 20
-
-    headers = {
-        "Authorization": "Bearer " + apikey,
-        "Content-Type": "application/json",
-    }
-    response = requests.get(
-        f"https://api.digitalocean.com/v2/domains/{domain}/records",
-        headers=headers,
-        timeout=45,
-        params={"type": "A", "per_page": page_results_limit},
-    )
-    response.raise_for_status()
-    response_data = response.json()
-    domain_records = countable(response_data["domain_records"])
-
-    yield from domain_records
-    page = 1
-    while domain_records.items_seen == page_results_limit:
-        page += 1
-        response = requests.get(
-            f"https://api.digitalocean.com/v2/domains/{domain}/records",
-            headers=headers,
+API_BASE_URL = "https://api.digitalocean.com/v2"
+
+# Points do_ddns at another API server, e.g. testing.fake_do for load tests and benchmarks.
+API_BASE_URL_ENV_VAR = "DIGITALOCEAN_API_URL"
+
+DEFAULT_POOL_MAXSIZE = constants.DEFAULT_POOL_MAXSIZE
+
+# The largest page the API will return for listing endpoints.
+MAX_PER_PAGE = 200
+
+# The page size of listing endpoints, from 1 to MAX_PER_PAGE (the default).
+PER_PAGE_ENV_VAR = "DO_DDNS_PER_PAGE"
+
+
+def check_simple_domain_names(*names: str) -> None:
+    """Raise NonSimpleDomainNameError if any of `names` is not in simple form.
+
+    i.e. ascii_letters + "." + digits + "-" + "@"
+    """
+    if any(set(name).difference(ascii_letters + "." + digits + "-" + "@") for name in names):
+        rprint("[red]Error:[/red] Give the domain name in simple form e.g. [b]test.domain.com[/b]")
+        msg = "Error: Give the domain name in simple form e.g. test.domain.com"
+        raise NonSimpleDomainNameError(msg)
+
+
+class DigitalOceanClient:
+    """Client for the Digital Ocean DNS API.
+
+    Owns a keep-alive `requests.Session` so that consecutive calls reuse pooled
+    TCP+TLS connections to the API instead of opening a new one per request.
+    The authentication headers are built once, when the client is created.
+    """
+
+    # Rate limited (HTTP 429) requests are retried at most this many times,
+    # and only when the API asks us to wait no longer than max_retry_wait seconds.
+    max_retries = 3
+    max_retry_wait = 60.0
+
+    def __init__(
+        self,
+        apikey: str,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        rate_limiter: RateLimiter | None = None,
+        per_page: int = MAX_PER_PAGE,
+        base_url: str = API_BASE_URL,
+    ) -> None:
+        """Create a client authenticated with `apikey`.
+
+        Args:
+            apikey: The Digital Ocean API token.
+            pool_maxsize: Maximum number of connections kept alive to the API.
+                Also bounds how many pages of a listing are fetched at once.
+            rate_limiter: Paces requests to the API's rate limits. Default: a fresh budget.
+            per_page: Page size for listing endpoints; at most MAX_PER_PAGE.
+            base_url: The root of the API, without a trailing slash.
+
+        Raises:
+            ValueError: If per_page is not between 1 and MAX_PER_PAGE.
+        """
+        if not 1 <= per_page <= MAX_PER_PAGE:
+            msg = f"per_page must be between 1 and {MAX_PER_PAGE}, got {per_page}"
+            raise ValueError(msg)
+        self.apikey = apikey
+        self.base_url = base_url
+        self.per_page = per_page
+        self.pool_maxsize = pool_maxsize
+        self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self.session = requests.Session()
+        self.session.headers.update(
+            {
+                "Authorization": "Bearer " + apikey,
+                "Content-Type": "application/json",
+            }
+        )
+        self.session.mount(
+            f"{urlsplit(base_url).scheme}://",
+            HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize),
+        )
+
+    def close(self) -> None:
+        """Close all pooled connections held by this client."""
+        self.session.close()
+
+    def _operation(self, method: str, url: str) -> str:
+        """Name a request for its timings, e.g. "api GET /domains/{domain}/records"."""
+        path = urlsplit(url).path.removeprefix(urlsplit(self.base_url).path).rstrip("/")
+        path = re.sub(r"(?<=/domains/)[^/]+", "{domain}", path)
+        path = re.sub(r"(?<=/records/)[^/]+", "{id}", path)
+        return f"api {method} {path}"
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> requests.Response:  # noqa: ANN401
+        """Send a request, pacing it to the rate limits and retrying when rate limited.
+
+        Each attempt is timed, and its status counted (see timings), without the time spent
+        waiting for the rate limits.
+        The final response is returned as-is; callers decide how to handle error statuses.
+        """
+        operation = self._operation(method, url)
+        timings = get_timings()
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            with timings.measure(operation):
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.RequestException:
+                    timings.record_status(operation, "error")
+                    raise
+            timings.record_status(operation, str(response.status_code))
+            self.rate_limiter.update(response.headers)
+            if response.status_code != HTTPStatus.TOO_MANY_REQUESTS or attempt == self.max_retries:
+                break
+
+            delay = self.rate_limiter.retry_delay(response.headers)
+            if delay is None or delay > self.max_retry_wait:
+                break
+            logger.warning(
+                "%s - Warning : rate limited by the Digital Ocean API; retrying in %.1fs",
+                time.strftime("%Y-%m-%d %H:%M"),
+                delay,
+            )
+            time.sleep(delay)
+        return response
+
+    def _get_page(self, url: str, params: dict[str, Any]) -> dict[str, Any]:
+        """Fetch one page of a paginated listing endpoint."""
+        response = self._request(
+            "GET",
+            url,
             timeout=45,
-            params={"type": "A", "per_page": page_results_limit, "page": page},
+            params={**params, "per_page": self.per_page},
         )
         response.raise_for_status()
-        response_data = response.json()
-        domain_records = countable(response_data["domain_records"])
-        yield from domain_records
+        return response.json()
+
+    def _last_page(self, response_data: dict[str, Any]) -> int | None:
+        """Return the number of the last page of a listing, if the response tells us.
+
+        A ``links.pages.last`` URL without a valid ``page`` parameter is ignored, in favor of
+        ``meta.total``.
+        """
+        last_page_url = response_data.get("links", {}).get("pages", {}).get("last")
+        if last_page_url is not None:
+            last_page = parse_qs(urlsplit(last_page_url).query).get("page", [""])[0]
+            try:
+                return int(last_page)
+            except ValueError:
+                pass
+        total = response_data.get("meta", {}).get("total")
+        if total is not None:
+            return max(math.ceil(total / self.per_page), 1)
+        return None
+
+    def _paginate(
+        self, url: str, key: str, params: dict[str, Any]
+    ) -> Generator[dict[str, Any], None, None]:
+        """Yield every item under `key` from a paginated listing endpoint.
+
+        Once the first page says how many pages there are, the remaining pages
+        are fetched concurrently and yielded in page order.
+        """
+        response_data = self._get_page(url, params)
+        items = countable(response_data[key])
+        yield from items
+
+        last_page = self._last_page(response_data)
+        if last_page is None:
+            # No pagination metadata; walk the pages until a short one appears.
+            page = 1
+            while items.items_seen == self.per_page:
+                page += 1
+                items = countable(self._get_page(url, {**params, "page": page})[key])
+                yield from items
+            return
+
+        remaining_pages = range(2, last_page + 1)
+        if not remaining_pages:
+            return
+        executor = ThreadPoolExecutor(max_workers=min(self.pool_maxsize, len(remaining_pages)))
+        try:
+            pages = executor.map(
+                lambda page: self._get_page(url, {**params, "page": page}),
+                remaining_pages,
+            )
+            for page_data in pages:
+                yield from page_data[key]
+        finally:
+            # Don't fetch pages nobody will read if the caller stops early.
+            executor.shutdown(cancel_futures=True)
+
+    def get_a_records(self, domain: str) -> Generator[dict[str, Any], None, None]:
+        """Retrieve A records for `domain` from Digital Ocean."""
+        yield from self._paginate(
+            f"{self.base_url}/domains/{domain}/records",
+            "domain_records",
+            {"type": "A"},
+        )
 
+    def get_a_record_by_name(
+        self, subdomain: str, domain: str
+    ) -> Generator[dict[str, Any], None, None]:
+        """Retrieve a potentially existing A record by its name."""
+        yield from self._paginate(
+            f"{self.base_url}/domains/{domain}/records",
+            "domain_records",
+            {"name": f"{subdomain}.{domain}", "type": "A"},
+        )
 
-def get_a_record_by_name(subdomain: str, domain: str) -> Generator[dict[str, Any], None, None]:
-    """Retrieve a potentially existing A record by its name."""
-    apikey = get_api()
-    page_results_limit = 20
-
-    headers = {
-        "Authorization": "Bearer " + apikey,
-        "Content-Type": "application/json",
-    }
-    response = requests.get(
-        f"https://api.digitalocean.com/v2/domains/{domain}/records",
-        headers=headers,
-        timeout=45,
-        params={"name": f"{subdomain}.{domain}", "type": "A", "per_page": page_results_limit},
-    )
-    response.raise_for_status()
-    response_data = response.json()
-    domain_records = countable(response_data["domain_records"])
-
-    yield from domain_records
-    page = 1
-    while domain_records.items_seen == page_results_limit:
-        page += 1
-        response = requests.get(
-            f"https://api.digitalocean.com/v2/domains/{domain}/records",
-            headers=headers,
+    def get_a_record(self, domain_record_id: str, domain: str) -> dict[str, Any]:
+        """Return the A record for `subdomain`."""
+        response = self._request(
+            "GET",
+            f"{self.base_url}/domains/{domain}/records/{domain_record_id}",
             timeout=45,
-            params={
-                "name": f"{subdomain}.{domain}",
-                "type": "A",
-                "per_page": page_results_limit,
-                "page": page,
-            },
         )
         response.raise_for_status()
+        return response.json()["domain_record"]
+
+    def update_a_record(
+        self, domain_record_id: str, domain: str, new_ip_address: str
+    ) -> dict[str, Any]:
+        """Update an existing A record."""
+        data = {"type": "A", "data": new_ip_address}
+        response = self._request(
+            "PATCH",
+            f"{self.base_url}/domains/{domain}/records/{domain_record_id}",
+            json=data,
+            timeout=45,
+        )
+        response.raise_for_status()
+        return response.json()["domain_record"]
+
+    def create_a_record(self, subdomain: str, domain: str, ip4_address: str) -> str:
+        """Create an A record for subdomain.
+
+        This function will _not_ manage the state of the local database.
+
+        Returns:
+            (str): The domain record id returned from the Digital Ocean API.
+        """
+        check_simple_domain_names(domain, subdomain)
+
+        # Handle e.g. subdomain = "@.example.com", domain="example.com"
+        subdomain = subdomain.removesuffix("." + domain)
+
+        data = {"name": subdomain, "data": ip4_address, "type": "A", "ttl": 3600}
+        response = self._request(
+            "POST",
+            f"{self.base_url}/domains/{domain}/records",
+            json=data,
+            timeout=60,
+        )
+        response.raise_for_status()
+
+        rprint(f"An A record for {subdomain}.{domain} has been added.")
+        logger.info(
+            "%s - Info : subdomain %s.%s added", time.strftime("%Y-%m-%d %H:%M"), subdomain, domain
+        )
         response_data = response.json()
-        domain_records = countable(response_data["domain_records"])
-        yield from domain_records
+        return response_data["domain_record"]["id"]
+
+    def verify_domain_is_registered(self, domain: str) -> None:
+        """Verify that the user-supplied `domain` is registered for the authenticated account."""
+        response = self._request(
+            "GET",
+            f"{self.base_url}/domains/{domain}",
+            timeout=45,
+        )
+        if response.status_code == HTTPStatus.OK:
+            return
+        if response.status_code == HTTPStatus.NOT_FOUND:
+            # Print an additional helpful message specifically for 404.
+            rprint(f"Domain {domain} was not found associated with this digital ocean account.")
+
+        response.raise_for_status()
+
+    def get_all_domains(self) -> Generator[dict[str, str], None, None]:
+        """Return all domains associated with this account."""
+        yield from self._paginate(f"{self.base_url}/domains/", "domains", {})
+
+
+@cache
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter, restored from the database on first use."""
+    return load_rate_limiter(get_connection())
+
+
+def save_rate_limit_budget() -> None:
+    """Persist the rate limit budget so the next invocation (e.g. cron tick) shares it.
+
+    A no-op when no API request was made by this process.
+    """
+    if get_rate_limiter.cache_info().currsize:
+        save_rate_limiter(get_connection(), get_rate_limiter())
+
+
+def _per_page() -> int:
+    """Return the page size set by PER_PAGE_ENV_VAR, or MAX_PER_PAGE if unset or invalid."""
+    value = os.environ.get(PER_PAGE_ENV_VAR)
+    if value is None:
+        return MAX_PER_PAGE
+    try:
+        per_page = int(value)
+    except ValueError:
+        per_page = 0
+    if not 1 <= per_page <= MAX_PER_PAGE:
+        rprint(
+            f"[yellow]Warning:[/yellow] Ignoring {PER_PAGE_ENV_VAR}={value!r}: "
+            f"not a whole number from 1 to {MAX_PER_PAGE}."
+        )
+        return MAX_PER_PAGE
+    return per_page
+
+
+@cache
+def _get_client_for(apikey: str) -> DigitalOceanClient:
+    return DigitalOceanClient(
+        apikey,
+        rate_limiter=get_rate_limiter(),
+        base_url=os.environ.get(API_BASE_URL_ENV_VAR, API_BASE_URL),
+        per_page=_per_page(),
+    )
+
+
+def get_client() -> DigitalOceanClient:
+    """Return the shared client for the configured API key.
+
+    The client (and its connection pool) is created on first use and reused by
+    every subsequent call in this process.
+    """
+    return _get_client_for(get_api())
+
+
+def get_a_records(domain: str) -> Generator[dict[str, Any], None, None]:
+    """Retrieve A records for `domain` from Digital Ocean."""
+    yield from get_client().get_a_records(domain)
+
+
+def get_a_record_by_name(subdomain: str, domain: str) -> Generator[dict[str, Any], None, None]:
+    """Retrieve a potentially existing A record by its name."""
+    yield from get_client().get_a_record_by_name(subdomain, domain)
 
 
 def get_a_record(domain_record_id: str, domain: str) -> dict[str, Any]:
     """Return the A record for `subdomain`."""
-    apikey = get_api()
-    headers = {
-        "Authorization": "Bearer " + apikey,
-        "Content-Type": "application/json",
-    }
-    response = requests.get(
-        f"https://api.digitalocean.com/v2/domains/{domain}/records/{domain_record_id}",
-        headers=headers,
-        timeout=45,
-    )
-    response.raise_for_status()
-    return response.json()["domain_record"]
+    return get_client().get_a_record(domain_record_id, domain)
 
 
 def update_a_record(domain_record_id: str, domain: str, new_ip_address: str) -> dict[str, Any]:
     """Update an existing A record."""
-    apikey = get_api()
-    headers = {
-        "Authorization": "Bearer " + apikey,
-        "Content-Type": "application/json",
-    }
-    data = {"type": "A", "data": new_ip_address}
-    response = requests.patch(
-        f"https://api.digitalocean.com/v2/domains/{domain}/records/{domain_record_id}",
-        headers=headers,
-        json=data,
-        timeout=45,
-    )
-    response.raise_for_status()
-    return response.json()["domain_record"]
+    return get_client().update_a_record(domain_record_id, domain, new_ip_address)
 
 
 def create_a_record(subdomain: str, domain: str, ip4_address: str) -> str:
@@ -137,92 +391,16 @@ def create_a_record(subdomain: str, domain: str, ip4_address: str) -> str:
     Returns:
         (str): The domain record id returned from the Digital Ocean API.
     """
-    if set(domain).difference(ascii_letters + "." + digits + "-" + "@") or set(
-        subdomain
-    ).difference(ascii_letters + "." + digits + "-" + "@"):
-        rprint("[red]Error:[/red] Give the domain name in simple form e.g. [b]test.domain.com[/b]")
-        msg = "Error: Give the domain name in simple form e.g. test.domain.com"
-        raise NonSimpleDomainNameError(msg)
-
-    apikey = get_api()
-
-    # Handle e.g. subdomain = "@.example.com", domain="example.com"
-    subdomain = subdomain.removesuffix("." + domain)
-
-    data = {"name": subdomain, "data": ip4_address, "type": "A", "ttl": 3600}
-    headers = {
-        "Authorization": "Bearer " + apikey,
-        "Content-Type": "application/json",
-    }
-    response = requests.post(
-        "https://api.digitalocean.com/v2/domains/" + domain + "/records",
-        json=data,
-        headers=headers,
-        timeout=60,
-    )
-    response.raise_for_status()
-
-    rprint(f"An A record for {subdomain}.{domain} has been added.")
-    logger.info(
-        "%s - Info : subdomain %s.%s added", time.strftime("%Y-%m-%d %H:%M"), subdomain, domain
-    )
-    response_data = response.json()
-    return response_data["domain_record"]["id"]
+    # Reject malformed names before an API key is required.
+    check_simple_domain_names(domain, subdomain)
+    return get_client().create_a_record(subdomain, domain, ip4_address)
 
 
 def verify_domain_is_registered(domain: str) -> None:
     """Verify that the user-supplied `domain` is registered for the authenticated account."""
-    apikey = get_api()
-    headers = {
-        "Authorization": "Bearer " + apikey,
-        "Content-Type": "application/json",
-    }
-    response = requests.get(
-        "https://api.digitalocean.com/v2/domains/" + domain,
-        headers=headers,
-        timeout=45,
-    )
-    if response.status_code == HTTPStatus.OK:
-        return
-    if response.status_code == HTTPStatus.NOT_FOUND:
-        # Print an additional helpful message specifically for 404.
-        rprint(f"Domain {domain} was not found associated with this digital ocean account.")
-
-    response.raise_for_status()
+    get_client().verify_domain_is_registered(domain)
 
 
 def get_all_domains() -> Generator[dict[str, str], None, None]:
     """Return all domains associated with this account."""
-    apikey = get_api()
-
-    page_results_limit = 20
-
-    headers = {
-        "Authorization": "Bearer " + apikey,
-        "Content-Type": "application/json",
-    }
-    response = requests.get(
-        "https://api.digitalocean.com/v2/domains/",
-        headers=headers,
-        timeout=45,
-        params={"per_page": page_results_limit},
-    )
-    response.raise_for_status()
-
-    response_data = response.json()
-    domains = countable(response_data["domains"])
-    yield from domains
-
-    page = 1
-    while domains.items_seen == page_results_limit:
-        page += 1
-        response = requests.get(
-            "https://api.digitalocean.com/v2/domains/",
-            headers=headers,
-            timeout=45,
-            params={"per_page": page_results_limit, "page": page},
-        )
-        response.raise_for_status()
-        response_data = response.json()
-        domains = countable(response_data["domains"])
-        yield from domains
+    yield from get_client().get_all_domains()
@@ -3,24 +3,22 @@
 
 """Domain management functions for digital-ocean-dynamic-dns."""
 
-import datetime as dt
 import logging
+import time
 from argparse import Namespace
 
-from more_itertools import peekable
 from rich import print as rprint
 
-from . import constants, do_api
-from .database import connect_database
-from .subdomains import manage_subdomain
+from . import do_api, mirror
+from .database import format_timestamp, get_connection, get_read_only_connection
+from .subdomains import manage_a_records
 
 logger = logging.getLogger(__name__)
 
-conn = connect_database(constants.database_path)
-
 
 def manage_domain(domain: str) -> None:
     """Ensure <domain> is a registered domain for this account and mark as managed."""
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT COUNT(*) FROM domains WHERE name = ? and managed = 1", (domain,))
     count = cursor.fetchone()[0]
@@ -30,7 +28,7 @@ def manage_domain(domain: str) -> None:
 
     do_api.verify_domain_is_registered(domain)
 
-    update_datetime = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+    update_datetime = int(time.time())
     with conn:
         conn.execute(
             "INSERT INTO domains(name, cataloged, last_managed) "
@@ -43,7 +41,7 @@ def manage_domain(domain: str) -> None:
             },
         )
         rprint(f"The domain [b]{domain}[/b] has been added to the DB")
-        logger.info("%s - Info : Domain %s added", update_datetime, domain)
+        logger.info("%s - Info : Domain %s added", time.strftime("%Y-%m-%d %H:%M"), domain)
 
 
 def manage_all_existing_a_records(domain: str) -> None:
@@ -52,17 +50,17 @@ def manage_all_existing_a_records(domain: str) -> None:
     Used to import existing externally created A records into digital-ocean-dynamic-dns.
     Upon subsequent runs of `do_ddns update` these A records will be automatically handled.
     """
-    existing_a_records = do_api.get_a_records(domain)
-
-    for record in existing_a_records:
-        manage_subdomain(subdomain=record["name"], domain=domain)
+    # One listing for the whole domain; the records are reused rather than fetched again.
+    manage_a_records(domain, mirror.save_a_records(domain, do_api.get_a_records(domain)))
 
 
 def un_manage_domain(domain: str) -> None:
-    """Mark the domain as unmanaged.
+    """Mark the domain, and its subdomains, as unmanaged.
 
-    Will not remove or deregister the associated domain.
+    Will not remove or deregister the associated domain. Queued retries of its A records
+    are dropped.
     """
+    conn = get_connection()
     cursor = conn.cursor()
     row = cursor.execute(
         "select id from domains where name = ? and managed = 1", (domain,)
@@ -73,6 +71,13 @@ def un_manage_domain(domain: str) -> None:
     domain_id = row["id"]
 
     with conn:
+        # Un-managed A records are no longer retried by update-ips.
+        conn.execute(
+            "DELETE FROM pending_updates WHERE domain_record_id IN ("
+            "  SELECT domain_record_id FROM subdomains WHERE main_id = :domain_id"
+            ")",
+            {"domain_id": domain_id},
+        )
         subs_res = conn.execute(
             "UPDATE subdomains SET managed = 0 WHERE main_id = :domain_id and managed = 1",
             {"domain_id": domain_id},
@@ -86,17 +91,18 @@ def un_manage_domain(domain: str) -> None:
         )
 
 
-def show_all_domains(_: Namespace) -> None:
+def show_all_domains(args: Namespace) -> None:
     """Show information for domains associated with this Digital Ocean account.
 
     Args:
-        _ (Namespace): Parsed CLI args. Not used here.
-            Must be passed to this function because of how function martialing works.
+        args (Namespace): Parsed CLI args; expects a ``refresh`` boolean attribute
+            (fetch the domains from Digital Ocean rather than the local mirror).
     """
+    conn = get_read_only_connection()
     cursor = conn.cursor()
-    domains = peekable(do_api.get_all_domains())
+    domains, fetched_at = mirror.get_domains(refresh=args.refresh)
 
-    if domains.peek(None) is None:
+    if not domains:
         rprint("No domains associated with this Digital Ocean account!")
         return
 
@@ -109,3 +115,4 @@ def show_all_domains(_: Namespace) -> None:
             rprint("Name : [bold]" + k["name"] + " [*][/bold]")
         else:
             rprint("Name : " + k["name"])
+    rprint(f"As of {format_timestamp(fetched_at)}. Use --refresh to fetch them again.")
@@ -0,0 +1,157 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""The log file's format: one JSON object per line.
+
+Each line holds the record's time (``ts``, ISO 8601 in UTC), level, logger and message.
+Records about an A record carry structured fields too, passed as the ``event`` extra, e.g.::
+
+    logger.info(msg, extra={"event": {"domain": "example.com", "record_id": 1234}})
+
+The update-ips pipeline logs one such event per A record it updates or fails to update,
+with the fields listed in EVENT_FIELDS. ``do_ddns logs`` filters on them (see logs).
+
+The log file is rotated once it reaches a size or an age, and the rotated files are gzipped
+(``do_ddns.log.1.gz`` being the newest), keeping a set number of them; see the LOG_*
+constants. Records are written by a background thread, through a queue, so that a slow disk
+(or gzipping a rotated file) never holds up the update path.
+
+ddns imports this module at startup, so it only imports the standard library.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import time
+from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+
+from . import constants
+
+# The fields of the events logged about an A record by update-ips.
+EVENT_FIELDS = ("domain", "record_id", "old_ip", "new_ip", "duration_ms", "outcome", "error")
+
+# The keys JSONLinesFormatter writes for every record. An event field with one of these names
+# is left out of the line rather than overwriting, e.g., the record's own message.
+_RESERVED = {"ts", "level", "logger", "message", "exc"}
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """Formats each log record as one line of JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Return `record` as a JSON object, with its event fields if it has any."""
+        entry: dict[str, object] = {
+            "ts": datetime.fromtimestamp(record.created, UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if isinstance(event, dict):
+            entry.update((key, value) for key, value in event.items() if key not in _RESERVED)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        # default=str: an event field that isn't JSON serializable (e.g. an exception) is
+        # logged as its string rather than losing the whole record.
+        return json.dumps(entry, default=str)
+
+
+def rotated_name(name: str) -> str:
+    """Return the name of a rotated log file, e.g. do_ddns.log.1.gz for do_ddns.log.1."""
+    return name + ".gz"
+
+
+def gzip_rotated(source: str, dest: str) -> None:
+    """Gzip the log file `source` to the rotated log file `dest`, then delete `source`."""
+    # Only needed when rotating, so not imported at startup.
+    import gzip  # noqa: PLC0415
+
+    with Path(source).open("rb") as log_file, gzip.open(dest, "wb") as rotated:
+        shutil.copyfileobj(log_file, rotated)
+    Path(source).unlink()
+
+
+class LogFileHandler(RotatingFileHandler):
+    """Rotates the log file by size, like RotatingFileHandler, and by age.
+
+    The age of the log file is from its first entry, so that it survives restarts.
+    """
+
+    def __init__(self, filename: Path, max_bytes: int, max_age: int, backup_count: int) -> None:
+        """Append to `filename`, rotating it at `max_bytes` or `max_age` seconds; 0 for never.
+
+        Keeps `backup_count` rotated log files.
+        """
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.namer = rotated_name
+        self.rotator = gzip_rotated
+        self.max_age = max_age
+        self.started_at = self._first_entry_time() or time.time()
+
+    def _first_entry_time(self) -> float | None:
+        try:
+            with Path(self.baseFilename).open("rb") as log_file:
+                first_entry = json.loads(log_file.readline())
+            return datetime.fromisoformat(first_entry["ts"]).timestamp()
+        except (OSError, ValueError, TypeError, KeyError):
+            # Empty, or written before the log was JSON.
+            return None
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:  # noqa: N802
+        """Whether the log file must be rotated before writing `record`."""
+        if self.max_age and record.created - self.started_at >= self.max_age:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:  # noqa: N802
+        """Rotate the log file, gzipping it, and start a new one."""
+        super().doRollover()
+        self.started_at = time.time()
+
+
+def _setting(name: str, default: int) -> int:
+    """Return the non-negative int in the environment variable `name`, or `default`."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        setting = int(value)
+    except ValueError:
+        setting = -1
+    if setting < 0:
+        sys.stderr.write(f"Ignoring {name}={value!r}: not a whole number, 0 or more.\n")
+        return default
+    return setting
+
+
+def configure_logging(logfile: Path) -> None:
+    """Log INFO and above to `logfile`, as JSON lines written by a background thread.
+
+    The log file is rotated as set by the LOG_* constants, or their environment variables.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        # Already configured, as logging.basicConfig would have it.
+        return
+    file_handler = LogFileHandler(
+        logfile,
+        max_bytes=_setting("DO_DDNS_LOG_MAX_BYTES", constants.LOG_MAX_BYTES),
+        max_age=_setting("DO_DDNS_LOG_MAX_AGE", constants.LOG_MAX_AGE),
+        backup_count=_setting("DO_DDNS_LOG_BACKUPS", constants.LOG_BACKUPS),
+    )
+    # QueueHandler formats each record before queueing it (formatting it with its message
+    # and traceback), so the JSON is made here and the file handler writes it as is.
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.setFormatter(JSONLinesFormatter())
+    listener = QueueListener(queue_handler.queue, file_handler)
+    root.addHandler(queue_handler)
+    root.setLevel(logging.INFO)
+    listener.start()
+    # Writes the records still queued before exiting.
+    atexit.register(listener.stop)
@@ -0,0 +1,223 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""The history of the public IP address, as observed by update-ips.
+
+Each update-ips run appends an observation to the ``ip_history`` table: the public IP
+address it found, when, how many A records it updated or failed to update, and whether every
+managed A record then pointed at the address (``propagated_at``).
+
+Compaction collapses runs of identical observations into one row, from the first time the
+address was seen to the last, so the table grows with the number of IP changes rather than
+of runs. update-ips compacts the observations older than HISTORY_KEEP seconds as it goes;
+``do_ddns history --compact`` compacts on demand, e.g. everything with ``--keep 0``.
+
+``do_ddns history`` shows the addresses held over a time range, collapsing runs of identical
+observations whether compacted or not, with how long each was held and how long the host
+went between the last observation of the old address and the first of the new one.
+"""
+
+from __future__ import annotations
+
+import statistics
+import time
+from typing import TYPE_CHECKING
+
+from rich.console import Console
+from rich.table import Table
+
+from .database import format_timestamp, get_connection, get_read_only_connection
+
+if TYPE_CHECKING:
+    import sqlite3
+    from argparse import Namespace
+    from collections.abc import Iterable
+
+
+def record_observation(  # noqa: PLR0913
+    conn: sqlite3.Connection,
+    ip4: str,
+    observed_at: int,
+    *,
+    records_updated: int,
+    records_failed: int,
+    propagated: bool,
+) -> None:
+    """Append an observation of the public IP address. Runs in the caller's transaction.
+
+    Args:
+        conn: The read-write database connection.
+        ip4: The public IP address.
+        observed_at: When it was observed, in seconds since the epoch.
+        records_updated: The A records updated to `ip4`.
+        records_failed: The A records that could not be checked or updated.
+        propagated: Whether every managed A record points at `ip4`.
+    """
+    conn.execute(
+        "INSERT INTO ip_history(ip4, first_seen, last_seen, observations, records_updated,"
+        "  records_failed, propagated_at) "
+        "values(:ip4, :observed_at, :observed_at, 1, :records_updated, :records_failed,"
+        "  :propagated_at)",
+        {
+            "ip4": ip4,
+            "observed_at": observed_at,
+            "records_updated": records_updated,
+            "records_failed": records_failed,
+            "propagated_at": observed_at if propagated else None,
+        },
+    )
+
+
+def _merge(stretch: dict, row: sqlite3.Row | dict) -> None:
+    """Extend `stretch`, the observations of an IP address, with the later `row` of it."""
+    stretch["last_seen"] = max(stretch["last_seen"], row["last_seen"])
+    for column in ("observations", "records_updated", "records_failed"):
+        stretch[column] += row[column]
+    if stretch["propagated_at"] is None:
+        stretch["propagated_at"] = row["propagated_at"]
+
+
+def compact(conn: sqlite3.Connection, keep: int, now: int) -> tuple[int, int]:
+    """Collapse the runs of identical observations older than `keep` seconds into one row.
+
+    Runs in the caller's transaction.
+
+    Returns:
+        The number of rows the observations were in, and the number they are in now.
+    """
+    rows = conn.execute(
+        "SELECT * FROM ip_history WHERE last_seen < :cutoff ORDER BY first_seen, id",
+        {"cutoff": now - keep},
+    ).fetchall()
+    merged: list[dict] = []
+    removed: list[int] = []
+    for row in rows:
+        if merged and merged[-1]["ip4"] == row["ip4"]:
+            _merge(merged[-1], row)
+            merged[-1]["merged"] = True
+            removed.append(row["id"])
+        else:
+            merged.append({**dict(row), "merged": False})
+
+    conn.executemany(
+        "UPDATE ip_history SET "
+        "  last_seen = :last_seen, "
+        "  observations = :observations, "
+        "  records_updated = :records_updated, "
+        "  records_failed = :records_failed, "
+        "  propagated_at = :propagated_at "
+        "WHERE id = :id",
+        [row for row in merged if row["merged"]],
+    )
+    conn.executemany("DELETE FROM ip_history WHERE id = ?", [(row_id,) for row_id in removed])
+    return len(rows), len(merged)
+
+
+def format_duration(seconds: float | None) -> str:
+    """Format a number of seconds for display, e.g. 2d 3h, 5m 10s."""
+    if seconds is None:
+        return "N/A"
+    seconds = int(seconds)
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60), ("s", 1)):
+        count, seconds = divmod(seconds, size)
+        if count or (unit == "s" and not parts):
+            parts.append(f"{count}{unit}")
+    return " ".join(parts[:2])
+
+
+def _stretches(rows: Iterable[sqlite3.Row]) -> list[dict]:
+    """Collapse consecutive observations of the same IP address into one stretch each."""
+    stretches: list[dict] = []
+    for row in rows:
+        if stretches and stretches[-1]["ip4"] == row["ip4"]:
+            _merge(stretches[-1], row)
+        else:
+            stretches.append(dict(row))
+    return stretches
+
+
+def show_history(args: Namespace) -> int:
+    """Show the public IP addresses observed by update-ips over a time range.
+
+    Args:
+        args: Parsed CLI arguments; expects ``since`` and ``until`` datetime attributes
+            (or None), a ``compact`` boolean attribute (compact the history first) and
+            a ``keep`` int attribute (seconds of observations compaction leaves alone).
+
+    Returns:
+        The exit status: 0.
+    """
+    console = Console()
+    if args.compact:
+        conn = get_connection()
+        with conn:
+            before, after = compact(conn, args.keep, int(time.time()))
+        console.print(f"Compacted {before} rows of observations into {after}.")
+
+    since = args.since.timestamp() if args.since is not None else 0
+    until = args.until.timestamp() if args.until is not None else time.time()
+    conn = get_read_only_connection()
+    stretches = _stretches(
+        conn.execute(
+            "SELECT * FROM ip_history "
+            "WHERE last_seen >= :since AND first_seen <= :until "
+            "ORDER BY first_seen, id",
+            {"since": since, "until": until},
+        )
+    )
+    if not stretches:
+        console.print("No public IP addresses observed in that time range.")
+        return 0
+
+    # The observation before the range, for how long the first change in it went unseen.
+    previous = conn.execute(
+        "SELECT ip4, last_seen FROM ip_history WHERE first_seen < :first "
+        "ORDER BY first_seen DESC, id DESC LIMIT 1",
+        {"first": stretches[0]["first_seen"]},
+    ).fetchone()
+
+    table = Table(title="Public IP address history", highlight=True)
+    table.add_column("IPv4 Address")
+    table.add_column("First Seen")
+    table.add_column("Last Seen")
+    table.add_column("Held For", justify="right")
+    table.add_column("Change Unseen For", justify="right")
+    table.add_column("Propagated After", justify="right")
+    table.add_column("Observations", justify="right")
+    table.add_column("Records Updated", justify="right")
+    table.add_column("Records Failed", justify="right")
+
+    # The time between each change and the next.
+    held_for = []
+    for n, stretch in enumerate(stretches):
+        before = stretches[n - 1] if n else previous
+        unseen_for = (
+            stretch["first_seen"] - before["last_seen"]
+            if before is not None and before["ip4"] != stretch["ip4"]
+            else None
+        )
+        next_stretch = stretches[n + 1] if n + 1 < len(stretches) else None
+        if next_stretch is not None:
+            held_for.append(next_stretch["first_seen"] - stretch["first_seen"])
+        propagated_at = stretch["propagated_at"]
+        table.add_row(
+            stretch["ip4"],
+            format_timestamp(stretch["first_seen"]),
+            format_timestamp(stretch["last_seen"]),
+            format_duration(stretch["last_seen"] - stretch["first_seen"]),
+            format_duration(unseen_for),
+            format_duration(
+                None if propagated_at is None else propagated_at - stretch["first_seen"]
+            ),
+            str(stretch["observations"]),
+            str(stretch["records_updated"]),
+            str(stretch["records_failed"]),
+        )
+    if held_for:
+        table.caption = (
+            f"{len(held_for)} IP address changes, "
+            f"{format_duration(statistics.median(held_for))} apart on median."
+        )
+    console.print(table)
+    return 0
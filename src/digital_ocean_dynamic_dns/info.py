@@ -3,20 +3,21 @@
 
 """Display current configuration info for do_ddns."""
 
+import time
 from argparse import Namespace
 
 from rich.console import Console
 from rich.table import Table
 
-from . import __version__, constants
+from . import __version__, constants, schedule
 from .api_key_helpers import NoAPIKeyError, get_api
-from .database import connect_database
-
-conn = connect_database(constants.database_path)
+from .database import format_timestamp, get_read_only_connection
+from .history import format_duration
 
 
 def show_current_info(args: Namespace) -> None:
     """Display a summary table of the current do_ddns configuration."""
+    conn = get_read_only_connection()
     console = Console()
     grid = Table(
         title="[b]do_ddns[/b] - an open-source dynamic DNS solution for DigitalOcean.",
@@ -39,8 +40,8 @@ def show_current_info(args: Namespace) -> None:
             api = "[green]Configured[/green]"
 
     cursor = conn.cursor()
-    row = cursor.execute("SELECT URL FROM ipservers where ip_version = '4'").fetchone()
-    ip4server = "[red]None Configured[/red]" if row is None else row["URL"]
+    rows = cursor.execute("SELECT URL FROM ipservers where ip_version = '4' ORDER BY id").fetchall()
+    ip4server = ", ".join(row["URL"] for row in rows) or "[red]None Configured[/red]"
 
     cursor.execute("SELECT COUNT(*) FROM domains")
     topdomains = cursor.fetchone()[0]
@@ -52,5 +53,26 @@ def show_current_info(args: Namespace) -> None:
     grid.add_row("Log file", f"{constants.logfile}")
     grid.add_row("Domains", f"{topdomains}")
     grid.add_row('Sub-domains ("A" records)', f"{subdomains}")
+    decision = schedule.last_decision(conn)
+    if decision is not None:
+        grid.add_row(
+            "Next daemon check",
+            f"{format_timestamp(decision.next_check_at)}, "
+            f"{format_duration(decision.interval)} after the last ({decision.reason})",
+        )
+    else:
+        # The daemon hasn't run with --adaptive: what it would pick, with the default bounds.
+        decision = schedule.plan(
+            conn,
+            int(time.time()),
+            last_check_ok=True,
+            min_interval=constants.DAEMON_MIN_INTERVAL,
+            max_interval=constants.DAEMON_MAX_INTERVAL,
+            default_interval=constants.DAEMON_INTERVAL,
+        )
+        grid.add_row(
+            "Suggested check interval",
+            f"{format_duration(decision.interval)} ({decision.reason})",
+        )
     grid.add_row("App version", f"{__version__} (https://github.com/nivintw/ddns)")
     console.print(grid)
@@ -1,21 +1,38 @@
 # SPDX-FileCopyrightText: © 2023 Tyler Nivin
 # SPDX-License-Identifier: MIT
 
-"""IP resolver server configuration and public IP lookup utilities."""
+"""IP resolver server configuration and public IP lookup utilities.
 
+An IP resolver is either an HTTP(S) URL, answering a GET with our IP address as plain text,
+or a ``dns://`` URL, asking a DNS server for a "whoami" name (see dns_whoami).
+"""
+
+import ipaddress
 import logging
+import threading
 import time
 from argparse import Namespace
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from functools import cache
 
 import requests
 from rich import print as rprint
 
-from . import constants
-from .database import connect_database
+from . import dns_whoami
+from .database import get_connection
+from .dns_whoami import DNSQueryError
+from .timings import timed
 
-conn = connect_database(constants.database_path)
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for the fastest resolver before also asking the next one.
+HEDGE_DELAY = 0.5
+# Seconds before a single resolver request is abandoned.
+RESOLVER_TIMEOUT = 10
+# Weight of the newest sample in each resolver's moving average latency.
+LATENCY_SMOOTHING = 0.3
+
 
 class NoIPResolverServerError(Exception):
     """Raised when there are no IP Resolver servers configured."""
@@ -25,35 +42,72 @@ class IPv6NotSupportedError(Exception):
     """Raised when the user attempts to configure IPv6."""
 
 
+class IPResolutionError(requests.RequestException):
+    """Raised when the IP resolvers don't agree on a valid public IP address."""
+
+
 def view_or_update_ip_server(args: Namespace) -> None:
     """UX function: View or update IP server settings.
 
-    Note: Currently, we only support one ip server, and only IPv4.
+    Note: Currently, we only support IPv4.
     """
+    conn = get_connection()
     ipserver = args.url
     ip_type = args.ip_mode
     if ipserver is not None:
         config_ip_server(ipserver, ip_type)
+    for url in args.add_url or []:
+        add_ip_server(url, ip_type)
+    for url in args.remove_url or []:
+        remove_ip_server(url)
 
-    cursor = conn.cursor()
-    row = cursor.execute("SELECT * FROM ipservers").fetchone()
-    ip4server = "[red]None Configured[/red]" if row is None else row["URL"]
+    rows = conn.execute(
+        "SELECT ipservers.URL, stats.successes, stats.failures, stats.latency_ms "
+        "FROM ipservers "
+        "LEFT JOIN ip_resolver_stats AS stats ON stats.url = ipservers.URL "
+        "WHERE ipservers.ip_version = '4' "
+        "ORDER BY ipservers.id"
+    ).fetchall()
     rprint("==== Upstream IP Address Resolver Servers ====")
-    rprint(f"IP v4 resolver 	: [b]{ip4server}[/b]")
+    if not rows:
+        rprint("IP v4 resolver \t: [b][red]None Configured[/red][/b]")
+    for row in rows:
+        stats = ""
+        if row["successes"] is not None:
+            latency = "n/a" if row["latency_ms"] is None else f"{row['latency_ms']:.0f} ms"
+            stats = f" (avg {latency}, {row['successes']} ok, {row['failures']} failed)"
+        rprint(f"IP v4 resolver \t: [b]{row['URL']}[/b]{stats}")
+
+
+def _check_ip_server(ipserver: str) -> None:
+    """Check that the ``dns://`` IP resolver URL `ipserver` is well formed.
+
+    Raises:
+        ValueError: It isn't.
+    """
+    if ipserver.startswith("dns:"):
+        try:
+            dns_whoami.parse_dns_url(ipserver)
+        except ValueError as e:
+            rprint(f"[red]Error:[/red] {e}")
+            raise
 
 
 def config_ip_server(ipserver: str, ip_type: str) -> None:
-    """Configure the server to use to retrieve our IP address.
+    """Configure the primary server to use to retrieve our IP address.
 
-    Right now, only one upstream IP resolver is supported.
+    Replaces the primary resolver; resolvers added with add_ip_server are kept.
     Current Limitations:
         1. Only IPv4 is supported.
-        2. The code is written to support only one row/ip server configuration.
-        3. The code can "store" an IPv6 server address,
+        2. The code can "store" an IPv6 server address,
             but the other code will not _use_ this server to perform a lookup.
     """
+    conn = get_connection()
     cursor = conn.cursor()
+    _check_ip_server(ipserver)
     if ip_type == "4":
+        # Don't keep a second row for the URL if it was already an additional resolver.
+        cursor.execute("DELETE FROM ipservers WHERE URL = :url AND id != 1", {"url": ipserver})
         cursor.execute(
             "INSERT INTO ipservers "
             "(id, URL, ip_version) "
@@ -69,27 +123,218 @@ def config_ip_server(ipserver: str, ip_type: str) -> None:
         raise IPv6NotSupportedError
 
 
-def get_ip() -> str:
+def add_ip_server(ipserver: str, ip_type: str) -> None:
+    """Add a server to the resolvers that are asked for our IP address.
+
+    Raises:
+        IPv6NotSupportedError: `ip_type` is not "4".
+        ValueError: `ipserver` is a malformed ``dns://`` URL.
+    """
+    conn = get_connection()
+    if ip_type != "4":
+        rprint("IPv6 is not currently supported.")
+        raise IPv6NotSupportedError
+    _check_ip_server(ipserver)
+    with conn:
+        conn.execute(
+            "INSERT INTO ipservers (URL, ip_version) values (:url, '4') "
+            "ON CONFLICT(URL) DO NOTHING",
+            {"url": ipserver},
+        )
+    rprint(f"IP resolver ({ipserver}) added for ipv{ip_type}.")
+
+
+def remove_ip_server(ipserver: str) -> None:
+    """Stop asking `ipserver` for our IP address."""
+    conn = get_connection()
+    with conn:
+        removed = conn.execute("DELETE FROM ipservers WHERE URL = :url", {"url": ipserver})
+        conn.execute("DELETE FROM ip_resolver_stats WHERE url = :url", {"url": ipserver})
+    if removed.rowcount:
+        rprint(f"IP resolver ({ipserver}) removed.")
+    else:
+        rprint(f"IP resolver ({ipserver}) is not configured.")
+
+
+@cache
+def _get_session() -> requests.Session:
+    """Return the session used for IP lookups, so repeated lookups reuse a connection."""
+    return requests.Session()
+
+
+def _ranked_ip_servers() -> list[str]:
+    """Return the IPv4 resolver URLs, the fastest healthy resolver first.
+
+    Resolvers whose last request failed go last; untried resolvers are tried early
+    so that their latency gets measured.
+    """
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT ipservers.URL FROM ipservers "
+        "LEFT JOIN ip_resolver_stats AS stats ON stats.url = ipservers.URL "
+        "WHERE ipservers.ip_version = '4' "
+        "ORDER BY "
+        "  COALESCE(stats.consecutive_failures, 0) > 0, "
+        "  COALESCE(stats.latency_ms, 0), "
+        "  ipservers.id"
+    ).fetchall()
+    return [row["URL"] for row in rows]
+
+
+def _query_ip_server(server: str) -> tuple[str, float]:
+    """Ask `server` for our public IPv4 address.
+
+    Returns:
+        The IP address and the request latency in milliseconds.
+
+    Raises:
+        requests.RequestException: The HTTP request failed.
+        DNSQueryError: The DNS query failed.
+        ValueError: The response is not an IPv4 address.
+    """
+    started = time.perf_counter()
+    if server.startswith("dns:"):
+        answer = dns_whoami.query_public_ip(server)
+    else:
+        response = _get_session().get(server, timeout=RESOLVER_TIMEOUT)
+        response.raise_for_status()
+        answer = response.text.strip()
+    latency_ms = (time.perf_counter() - started) * 1000
+    # Never push whatever a misbehaving resolver returned into DNS.
+    address = ipaddress.ip_address(answer)
+    if address.version != 4:  # noqa: PLR2004
+        msg = f"expected an IPv4 address, got {address}"
+        raise ValueError(msg)
+    return str(address), latency_ms
+
+
+def _ask_in_background(server: str) -> Future[tuple[str, float]]:
+    """Start asking `server` for our public IPv4 address; return the future answer.
+
+    The request runs on a daemon thread. Unlike an executor's threads, those aren't joined at
+    exit: a resolver still answering once the lookup is settled can't hold up the end of a
+    one-shot update-ips by up to RESOLVER_TIMEOUT seconds.
+    """
+    future: Future[tuple[str, float]] = Future()
+    future.set_running_or_notify_cancel()
+
+    def ask() -> None:
+        try:
+            future.set_result(_query_ip_server(server))
+        # Raised to get_ip by the future, which handles what a failed resolver may raise.
+        except Exception as e:  # noqa: BLE001
+            future.set_exception(e)
+
+    threading.Thread(target=ask, name=f"ip-resolver {server}", daemon=True).start()
+    return future
+
+
+@timed("db.record_ip_server_results")
+def _record_ip_server_results(
+    latencies: dict[str, float],
+    errors: dict[str, Exception],
+) -> None:
+    """Update the latency and error counters of the resolvers that answered."""
+    conn = get_connection()
+    now = int(time.time())
+    with conn:
+        conn.executemany(
+            "INSERT INTO ip_resolver_stats"
+            "  (url, successes, failures, consecutive_failures, latency_ms, last_error,"
+            "   updated_at) "
+            "values (:url, 1, 0, 0, :latency_ms, NULL, :now) "
+            "ON CONFLICT(url) DO UPDATE SET "
+            "  successes = successes + 1, "
+            "  consecutive_failures = 0, "
+            "  latency_ms = CASE WHEN latency_ms IS NULL THEN :latency_ms "
+            "    ELSE latency_ms + :smoothing * (:latency_ms - latency_ms) END, "
+            "  updated_at = :now",
+            [
+                {"url": url, "latency_ms": latency_ms, "now": now, "smoothing": LATENCY_SMOOTHING}
+                for url, latency_ms in latencies.items()
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO ip_resolver_stats"
+            "  (url, successes, failures, consecutive_failures, latency_ms, last_error,"
+            "   updated_at) "
+            "values (:url, 0, 1, 1, NULL, :error, :now) "
+            "ON CONFLICT(url) DO UPDATE SET "
+            "  failures = failures + 1, "
+            "  consecutive_failures = consecutive_failures + 1, "
+            "  last_error = :error, "
+            "  updated_at = :now",
+            [{"url": url, "error": str(error), "now": now} for url, error in errors.items()],
+        )
+
+
+@timed("ip.get_ip")
+def get_ip(quorum: int = 1) -> str:
     """Retrieve the host's public IP address.
 
+    The configured resolvers are raced, fastest healthy resolver first: the next resolver
+    is only asked once HEDGE_DELAY seconds pass without an answer, or a resolver fails.
+    Answers that don't parse as an IPv4 address count as failures.
+
     Requires that an IP Resolver server has been configured.
 
+    Args:
+        quorum: How many resolvers must agree on the IP address.
+            Capped at the number of configured resolvers.
+
     Raises:
         NoIPResolverServerError: No upstream IP Resolver server configured. Add one.
-        Exception: Any exception raised while trying to resolve the public IP address of the host.
+        IPResolutionError: Fewer than `quorum` resolvers agreed on a valid IP address.
     """
-    cursor = conn.cursor()
-    row = cursor.execute("SELECT URL from ipservers where ip_version = '4'").fetchone()
-    if row is None:
+    servers = _ranked_ip_servers()
+    if not servers:
         msg = "Please configure an IP resolver server."
         raise NoIPResolverServerError(msg)
+    quorum = min(quorum, len(servers))
+
+    votes: Counter[str] = Counter()
+    latencies: dict[str, float] = {}
+    errors: dict[str, Exception] = {}
+    remaining_servers = iter(servers)
+    in_flight: dict[Future[tuple[str, float]], str] = {}
+
+    def ask_next_server() -> None:
+        server = next(remaining_servers, None)
+        if server is not None:
+            in_flight[_ask_in_background(server)] = server
 
-    server = row["URL"]
     try:
-        response = requests.get(server, timeout=60)
-        response.raise_for_status()
-    except Exception:
-        logger.exception("%s - Error", time.strftime("%Y-%m-%d %H:%M"))
-        raise
-    else:
-        return response.text
+        for _ in range(quorum):
+            ask_next_server()
+        while in_flight:
+            done, _ = wait(in_flight, timeout=HEDGE_DELAY, return_when=FIRST_COMPLETED)
+            for future in done:
+                server = in_flight.pop(future)
+                try:
+                    address, latencies[server] = future.result()
+                except (requests.RequestException, DNSQueryError, ValueError) as e:
+                    errors[server] = e
+                    logger.warning(
+                        "%s - Warning : IP resolver %s failed: %s",
+                        time.strftime("%Y-%m-%d %H:%M"),
+                        server,
+                        e,
+                    )
+                    continue
+                votes[address] += 1
+                if votes[address] >= quorum:
+                    return address
+            # Either nobody answered within the hedge delay, or an answer didn't settle it.
+            ask_next_server()
+    finally:
+        # Stragglers are left to finish, or time out, in the background: a slow resolver
+        # must not hold up the update.
+        _record_ip_server_results(latencies, errors)
+
+    msg = f"No {quorum} IP resolver(s) agreed on a valid IP address: " + "; ".join(
+        f"{server}: {error}" for server, error in errors.items()
+    )
+    if votes:
+        msg += f"; answers: {dict(votes)}"
+    logger.error("%s - Error : %s", time.strftime("%Y-%m-%d %H:%M"), msg)
+    raise IPResolutionError(msg)
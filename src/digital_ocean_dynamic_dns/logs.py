@@ -1,22 +1,277 @@
 # SPDX-FileCopyrightText: © 2023 Tyler Nivin
 # SPDX-License-Identifier: MIT
 
-"""Utilities for displaying the DDNS update log file."""
+"""Utilities for displaying the DDNS update log file.
 
-from argparse import Namespace
+The log file is JSON lines (see events), and grows by a line or more per update-ips run, so
+it is never loaded whole: entries are filtered as they are read, ``--tail`` reads the file
+backwards from its end, and ``--follow`` polls for the lines appended since.
 
-from rich import print as rprint
+The rotated, gzipped log files are read too, oldest first, but only those that can hold
+entries since ``--since``, or the last ``--tail`` entries. A gzipped file can't be read
+backwards, so for ``--tail`` only its last matching entries are kept as it is read.
+
+Lines written before the log was JSON are printed as-is, but never match ``--since`` or
+``--domain``.
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, BinaryIO
 
 from . import constants
 
+if TYPE_CHECKING:
+    from argparse import Namespace
+    from collections.abc import Generator
+    from pathlib import Path
+
+# An entry of the log file, as logged by events.JSONLinesFormatter.
+type Entry = dict[str, Any]
+
+# Bytes read at a time when reading the log file backwards.
+READ_BLOCK_SIZE = 64 * 1024
+
+# Seconds between checks for new lines with --follow.
+FOLLOW_POLL_INTERVAL = 0.5
+
+
+def _rotated_log_files() -> list[Path]:
+    """Return the rotated log files, the oldest first (e.g. do_ddns.log.2.gz, do_ddns.log.1.gz)."""
+    prefix = constants.logfile.name + "."
+    rotated = []
+    for path in constants.logfile.parent.glob(prefix + "*"):
+        number = path.name.removeprefix(prefix).removesuffix(".gz")
+        if number.isdigit():
+            rotated.append((int(number), path))
+    return [path for _, path in sorted(rotated, reverse=True)]
+
+
+def _open_log_file(path: Path) -> BinaryIO:
+    """Open a log file, or a rotated, gzipped one, for reading."""
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    return path.open("rb")
+
+
+def _reverse_lines(log_file: BinaryIO) -> Generator[bytes, None, None]:
+    """Yield the lines of `log_file`, without their line endings, from the last to the first."""
+    position = log_file.seek(0, io.SEEK_END)
+    # The start of the line that continues into the blocks read so far.
+    partial = b""
+    while position > 0:
+        size = min(READ_BLOCK_SIZE, position)
+        position -= size
+        log_file.seek(position)
+        lines = (log_file.read(size) + partial).split(b"\n")
+        partial = lines.pop(0)
+        yield from (line for line in reversed(lines) if line)
+    if partial:
+        yield partial
+
+
+class _EntryFilter:
+    """Decides which lines of the log file to print, and how."""
+
+    def __init__(self, args: Namespace) -> None:
+        self.since: datetime | None = args.since
+        self.domain: str | None = args.domain.lower() if args.domain else None
+        self.as_json: bool = args.json
+
+    @property
+    def filtering(self) -> bool:
+        return self.since is not None or self.domain is not None
+
+    def parse(self, line: bytes) -> Entry | None:
+        """Return the entry logged on `line`, or None if it isn't JSON (an older plain line)."""
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        return entry if isinstance(entry, dict) else None
+
+    def logged_at(self, entry: Entry | None) -> datetime | None:
+        if entry is None:
+            return None
+        try:
+            return datetime.fromisoformat(entry["ts"])
+        except (TypeError, KeyError, ValueError):
+            return None
+
+    def before_since(self, entry: Entry | None) -> bool:
+        """Whether `entry` was logged before --since."""
+        logged_at = self.logged_at(entry)
+        return self.since is not None and logged_at is not None and logged_at < self.since
+
+    def matches(self, entry: Entry | None) -> bool:
+        if not self.filtering:
+            return True
+        if entry is None:
+            return False
+        if self.since is not None:
+            logged_at = self.logged_at(entry)
+            if logged_at is None or logged_at < self.since:
+                return False
+        return self.domain is None or str(entry.get("domain", "")).lower() == self.domain
+
+    def format(self, line: bytes, entry: Entry | None) -> str:
+        text = line.decode("utf-8", errors="replace").rstrip("\r\n")
+        if self.as_json or entry is None:
+            return text + "\n"
+        text = str(entry.get("message", ""))
+        if "exc" in entry:
+            text += "\n" + str(entry["exc"])
+        return text + "\n"
+
+    def write(self, line: bytes) -> None:
+        """Print `line` if it matches the filters."""
+        entry = self.parse(line)
+        if self.matches(entry):
+            sys.stdout.write(self.format(line, entry))
+
+
+def _first_entry(path: Path, entries: _EntryFilter) -> Entry | None:
+    with _open_log_file(path) as log_file:
+        return entries.parse(log_file.readline())
+
+
+def _log_files_since(rotated: list[Path], entries: _EntryFilter) -> list[Path]:
+    """Return the rotated log files that may hold entries since --since, the oldest first.
+
+    Each file holds the entries from its first one to the first one of the next newer file.
+    """
+    if entries.since is None:
+        return rotated
+    since: list[Path] = []
+    for path in reversed([*rotated, constants.logfile]):
+        if path != constants.logfile:
+            since.append(path)
+        if entries.before_since(_first_entry(path, entries)):
+            break
+    return since[::-1]
+
+
+def _tail_of_rotated(
+    path: Path, entries: _EntryFilter, count: int
+) -> tuple[deque[tuple[bytes, Entry | None]], Entry | None]:
+    """Read the rotated log file `path` through, keeping its last `count` matching lines.
+
+    Returns:
+        The (line, entry) of those lines, and the file's first entry.
+    """
+    tail: deque[tuple[bytes, Entry | None]] = deque(maxlen=count)
+    first_entry = None
+    with _open_log_file(path) as rotated_file:
+        for n, line in enumerate(rotated_file):
+            entry = entries.parse(line)
+            if n == 0:
+                first_entry = entry
+            if entries.matches(entry):
+                tail.append((line, entry))
+    return tail, first_entry
+
+
+def _write_tail(log_file: BinaryIO, rotated: list[Path], entries: _EntryFilter, count: int) -> None:
+    """Print the last `count` matching lines of the log, leaving `log_file` at its end.
+
+    Args:
+        log_file: The log file.
+        rotated: The rotated log files, the oldest first.
+        entries: The filters.
+        count: The number of lines to print.
+    """
+    # The newest first.
+    tail: list[tuple[bytes, Entry | None]] = []
+    for line in _reverse_lines(log_file):
+        entry = entries.parse(line)
+        if entries.before_since(entry):
+            # The log is in time order: every line before this one is older still.
+            rotated = []
+            break
+        if entries.matches(entry):
+            tail.append((line, entry))
+            if len(tail) == count:
+                break
+    log_file.seek(0, io.SEEK_END)
+
+    for path in reversed(rotated):
+        if len(tail) == count:
+            break
+        older, first_entry = _tail_of_rotated(path, entries, count - len(tail))
+        tail.extend(reversed(older))
+        if entries.before_since(first_entry):
+            break
+
+    sys.stdout.writelines(entries.format(line, entry) for line, entry in reversed(tail))
+
+
+def _is_rotated(log_file: BinaryIO) -> bool:
+    """Whether the log file was rotated since `log_file` was opened."""
+    try:
+        return constants.logfile.stat().st_ino != os.fstat(log_file.fileno()).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _follow(log_file: BinaryIO, entries: _EntryFilter) -> None:
+    """Print the matching lines appended to `log_file`, until interrupted.
+
+    Once `log_file` is rotated, and all of it read, follows the new log file.
+    """
+    partial = b""
+    try:
+        while True:
+            chunk = log_file.readline()
+            if not chunk:
+                if _is_rotated(log_file):
+                    log_file.close()
+                    log_file = constants.logfile.open("rb")
+                    continue
+                sys.stdout.flush()
+                time.sleep(FOLLOW_POLL_INTERVAL)
+                continue
+            partial += chunk
+            # Wait for the rest of a line that is still being written.
+            if partial.endswith(b"\n"):
+                entries.write(partial)
+                partial = b""
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log_file.close()
+
 
-def show_log(_args: Namespace) -> None:
+def show_log(args: Namespace) -> None:
     """Display the content of the log file.
 
     Args:
-        _args: Parsed command-line arguments. Unused; kept for API consistency
-            with other subcommand handlers.
+        args: Parsed command-line arguments; expects a ``since`` datetime attribute
+            (or None), a ``domain`` str attribute (or None), a ``tail`` int attribute
+            (or None), and ``follow`` and ``json`` boolean attributes.
     """
-    with constants.logfile.open() as log_file:
-        content = log_file.read()
-        rprint(content)
+    entries = _EntryFilter(args)
+    with constants.logfile.open("rb") as log_file:
+        rotated = _rotated_log_files()
+        if args.tail is not None:
+            _write_tail(log_file, rotated, entries, args.tail)
+        else:
+            for path in _log_files_since(rotated, entries):
+                with _open_log_file(path) as rotated_file:
+                    for line in rotated_file:
+                        entries.write(line)
+            for line in log_file:
+                if args.follow and not line.endswith(b"\n"):
+                    # Still being written; printed whole by _follow.
+                    log_file.seek(-len(line), io.SEEK_CUR)
+                    break
+                entries.write(line)
+        if args.follow:
+            _follow(log_file, entries)
@@ -5,10 +5,7 @@
 
 from argparse import Namespace
 
-from . import constants, domains, subdomains
-from .database import connect_database
-
-conn = connect_database(constants.database_path)
+from . import domains, subdomains
 
 
 def martial_manage(args: Namespace) -> None:
@@ -17,7 +14,7 @@ def martial_manage(args: Namespace) -> None:
     domains.manage_domain(args.domain)
 
     if args.list:
-        subdomains.list_sub_domains(args.domain)
+        subdomains.list_sub_domains(args.domain, refresh=args.refresh)
     elif args.subdomain is None:
         # usage do_ddns manage example.com
         # I.e. importing all existing A records for example.com.
@@ -31,7 +28,7 @@ def martial_manage(args: Namespace) -> None:
 def martial_un_manage(args: Namespace) -> None:
     """Marshaling function un-manage subparser."""
     if args.list:
-        subdomains.list_sub_domains(args.domain)
+        subdomains.list_sub_domains(args.domain, refresh=args.refresh)
     elif args.subdomain is None:
         # usage do_ddns un-manage example.com
         domains.un_manage_domain(domain=args.domain)
@@ -0,0 +1,229 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Prometheus metrics for node_exporter's textfile collector.
+
+With ``--metrics-file PATH``, each update-ips run (and each daemon check) writes its metrics
+to PATH in the Prometheus text format: how long the run took and whether it succeeded, the
+API requests by endpoint and status and their latency, the IP resolvers' latency, the A
+records checked, updated and failed, the current IP and when a run last succeeded.
+
+The file is replaced atomically, so the collector never reads a partly written file.
+Ref: https://github.com/prometheus/node_exporter#textfile-collector
+"""
+
+from __future__ import annotations
+
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from rich.console import Console
+
+if TYPE_CHECKING:
+    import sqlite3
+
+    from .timings import Timings
+
+logger = logging.getLogger(__name__)
+
+# The quantiles of the API request latency summaries.
+QUANTILES = {"0.5": "p50", "0.95": "p95"}
+
+# Operations named by timings for the API requests, e.g. "api GET /domains/{domain}/records".
+_API_PREFIX = "api "
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class _Exposition:
+    """Builds a file in the Prometheus text format, one metric family at a time."""
+
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+
+    def family(self, name: str, metric_type: str, help_text: str) -> None:
+        self.lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+
+    def sample(self, name: str, value: float, **labels: str) -> None:
+        label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+        self.lines.append(
+            f"{name}{{{label_text}}} {_format_value(value)}"
+            if label_text
+            else f"{name} {_format_value(value)}"
+        )
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def _add_api_metrics(exposition: _Exposition, timings: Timings) -> None:
+    exposition.family(
+        "do_ddns_api_requests",
+        "gauge",
+        "Digital Ocean API requests made by the last run, by endpoint and HTTP status.",
+    )
+    for (operation, status), count in sorted(timings.statuses().items()):
+        exposition.sample(
+            "do_ddns_api_requests",
+            count,
+            endpoint=operation.removeprefix(_API_PREFIX),
+            status=status,
+        )
+
+    exposition.family(
+        "do_ddns_api_request_duration_seconds",
+        "summary",
+        "Latency of the Digital Ocean API requests made by the last run, by endpoint.",
+    )
+    for op in timings.stats():
+        if not op.operation.startswith(_API_PREFIX):
+            continue
+        endpoint = op.operation.removeprefix(_API_PREFIX)
+        for quantile, attribute in QUANTILES.items():
+            exposition.sample(
+                "do_ddns_api_request_duration_seconds",
+                getattr(op, attribute),
+                endpoint=endpoint,
+                quantile=quantile,
+            )
+        exposition.sample("do_ddns_api_request_duration_seconds_sum", op.total, endpoint=endpoint)
+        exposition.sample("do_ddns_api_request_duration_seconds_count", op.count, endpoint=endpoint)
+
+
+def _add_ip_metrics(exposition: _Exposition, conn: sqlite3.Connection, timings: Timings) -> None:
+    ip_lookup = next((op for op in timings.stats() if op.operation == "ip.get_ip"), None)
+    if ip_lookup is not None:
+        exposition.family(
+            "do_ddns_ip_lookup_duration_seconds",
+            "gauge",
+            "How long the last run took to look up the public IP address.",
+        )
+        exposition.sample("do_ddns_ip_lookup_duration_seconds", ip_lookup.total)
+
+    resolvers = conn.execute(
+        "SELECT url, consecutive_failures, latency_ms FROM ip_resolver_stats ORDER BY url"
+    ).fetchall()
+    exposition.family(
+        "do_ddns_ip_resolver_latency_seconds",
+        "gauge",
+        "Moving average latency of each IP resolver.",
+    )
+    for resolver in resolvers:
+        if resolver["latency_ms"] is not None:
+            exposition.sample(
+                "do_ddns_ip_resolver_latency_seconds",
+                resolver["latency_ms"] / 1000,
+                url=resolver["url"],
+            )
+    exposition.family(
+        "do_ddns_ip_resolver_consecutive_failures",
+        "gauge",
+        "Requests to each IP resolver that failed in a row.",
+    )
+    for resolver in resolvers:
+        exposition.sample(
+            "do_ddns_ip_resolver_consecutive_failures",
+            resolver["consecutive_failures"],
+            url=resolver["url"],
+        )
+
+    if timings.public_ip is not None:
+        exposition.family(
+            "do_ddns_current_ip_info", "gauge", "The public IP address found by the last run."
+        )
+        exposition.sample("do_ddns_current_ip_info", 1, ip=timings.public_ip)
+
+
+def render_metrics(conn: sqlite3.Connection, timings: Timings, exit_status: int | None) -> str:
+    """Return the metrics of the last update-ips run in the Prometheus text format.
+
+    Args:
+        conn: The database connection, with the run already saved (see timings.save_run).
+        timings: The timings collected over the run.
+        exit_status: The run's exit status, or None if it stopped on an unexpected error.
+    """
+    exposition = _Exposition()
+    exposition.family(
+        "do_ddns_run_duration_seconds", "gauge", "How long the last update-ips run took."
+    )
+    exposition.sample("do_ddns_run_duration_seconds", timings.elapsed)
+    exposition.family(
+        "do_ddns_run_timestamp_seconds", "gauge", "When the last update-ips run started."
+    )
+    exposition.sample("do_ddns_run_timestamp_seconds", timings.started_at)
+    exposition.family(
+        "do_ddns_run_success", "gauge", "1 if the last update-ips run succeeded, 0 otherwise."
+    )
+    exposition.sample("do_ddns_run_success", int(exit_status == 0))
+
+    last_success = conn.execute(
+        "SELECT max(started_at + duration_ms / 1000.0) FROM runs "
+        "WHERE command = 'update-ips' AND exit_status = 0"
+    ).fetchone()[0]
+    if last_success is not None:
+        exposition.family(
+            "do_ddns_last_success_timestamp_seconds",
+            "gauge",
+            "When the last successful update-ips run finished.",
+        )
+        exposition.sample("do_ddns_last_success_timestamp_seconds", last_success)
+
+    counts = timings.counts()
+    exposition.family(
+        "do_ddns_a_records",
+        "gauge",
+        "Managed A records checked, updated and failed by the last run.",
+    )
+    for outcome in ("checked", "updated", "failed"):
+        exposition.sample(
+            "do_ddns_a_records", counts.get(f"a_records_{outcome}", 0), outcome=outcome
+        )
+
+    _add_api_metrics(exposition, timings)
+    _add_ip_metrics(exposition, conn, timings)
+    return exposition.text()
+
+
+def write_textfile(
+    path: Path, conn: sqlite3.Connection, timings: Timings, exit_status: int | None
+) -> None:
+    """Atomically replace the file at `path` with the metrics of the last update-ips run.
+
+    A file that can't be written is reported, but doesn't fail the run.
+
+    Args:
+        path: The ``.prom`` file, in the textfile collector's directory.
+        conn: The database connection, with the run already saved (see timings.save_run).
+        timings: The timings collected over the run.
+        exit_status: The run's exit status, or None if it stopped on an unexpected error.
+    """
+    text = render_metrics(conn, timings, exit_status)
+    try:
+        # In the same directory, so that replacing the file is an atomic rename. The collector
+        # ignores the temporary file: it only reads files ending in .prom.
+        with tempfile.NamedTemporaryFile(
+            "w", dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False
+        ) as file:
+            temporary_path = Path(file.name)
+            file.write(text)
+        try:
+            # node_exporter usually runs as another user.
+            temporary_path.chmod(0o644)
+            temporary_path.replace(path)
+        except OSError:
+            temporary_path.unlink(missing_ok=True)
+            raise
+    except OSError as e:
+        msg = f"{time.strftime('%Y-%m-%d %H:%M')} - Error : could not write metrics to {path}: {e}"
+        Console().print(msg, markup=False, highlight=False)
+        logger.error(msg)  # noqa: TRY400
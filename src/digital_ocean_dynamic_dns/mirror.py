@@ -0,0 +1,205 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Local mirror of the domains and A records last seen on Digital Ocean.
+
+Listing commands read the mirror instead of the Digital Ocean API, and only go remote
+when asked to (``--refresh``) or when a listing has never been fetched. The mirror is
+refreshed by ``do_ddns sync``, and by ``update-ips`` (and so the daemon) whenever it
+lists a domain's A records.
+"""
+
+import logging
+import time
+from argparse import Namespace
+from collections.abc import Iterable
+from typing import Any
+
+from rich.console import Console
+
+from . import do_api
+from .database import get_connection, get_read_only_connection
+
+logger = logging.getLogger(__name__)
+
+# Mirrored listings are keyed by their Digital Ocean API path.
+DOMAINS_PATH = "/domains"
+
+
+def _records_path(domain: str) -> str:
+    return f"/domains/{domain}/records"
+
+
+def _fetched_at(path: str) -> int | None:
+    """Return when the listing at `path` was last mirrored, or None if it never was."""
+    conn = get_read_only_connection()
+    row = conn.execute("SELECT fetched_at FROM remote_listings WHERE path = ?", (path,)).fetchone()
+    return None if row is None else row["fetched_at"]
+
+
+def _record_listing_fetched(path: str, fetched_at: int) -> None:
+    """Note that the listing at `path` was mirrored. Runs in the caller's transaction."""
+    get_connection().execute(
+        "INSERT INTO remote_listings(path, fetched_at) values(:path, :fetched_at) "
+        "ON CONFLICT(path) DO UPDATE SET fetched_at = :fetched_at",
+        {"path": path, "fetched_at": fetched_at},
+    )
+
+
+def save_domains(domains: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Replace the mirrored domains of this account with `domains`.
+
+    Args:
+        domains: Every domain of the account, as listed by the Digital Ocean API.
+
+    Returns:
+        `domains`, as a list.
+    """
+    conn = get_connection()
+    domains = list(domains)
+    now = int(time.time())
+    with conn:
+        conn.execute("DELETE FROM remote_domains")
+        conn.executemany(
+            "INSERT INTO remote_domains(name, ttl, fetched_at) values(:name, :ttl, :fetched_at)",
+            [
+                {"name": domain["name"], "ttl": domain.get("ttl"), "fetched_at": now}
+                for domain in domains
+            ],
+        )
+        _record_listing_fetched(DOMAINS_PATH, now)
+    return domains
+
+
+def save_a_records(domain: str, a_records: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Replace the mirrored A records of `domain` with `a_records`.
+
+    Args:
+        domain: The name of the Domain registered with Digital Ocean.
+        a_records: Every A record of `domain`, as listed by the Digital Ocean API.
+
+    Returns:
+        `a_records`, as a list.
+    """
+    a_records = list(a_records)
+    with get_connection():
+        replace_a_records(domain, a_records, int(time.time()))
+    return a_records
+
+
+def replace_a_records(domain: str, a_records: list[dict[str, Any]], fetched_at: int) -> None:
+    """Replace the mirrored A records of `domain`. Runs in the caller's transaction."""
+    conn = get_connection()
+    conn.execute("DELETE FROM remote_records WHERE domain = ?", (domain,))
+    conn.executemany(
+        "INSERT INTO remote_records(domain_record_id, domain, name, data, ttl, fetched_at) "
+        "values(:id, :domain, :name, :data, :ttl, :fetched_at)",
+        [
+            {
+                "id": record["id"],
+                "domain": domain,
+                "name": record["name"],
+                "data": record["data"],
+                "ttl": record.get("ttl"),
+                "fetched_at": fetched_at,
+            }
+            for record in a_records
+        ],
+    )
+    _record_listing_fetched(_records_path(domain), fetched_at)
+
+
+def save_a_record(domain: str, a_record: dict[str, Any]) -> None:
+    """Mirror a single A record of `domain`, e.g. one just created.
+
+    Runs in the caller's transaction.
+    """
+    get_connection().execute(
+        "INSERT INTO remote_records(domain_record_id, domain, name, data, ttl, fetched_at) "
+        "values(:id, :domain, :name, :data, :ttl, :fetched_at) "
+        "ON CONFLICT(domain_record_id) DO UPDATE SET "
+        "  name = :name, data = :data, ttl = :ttl, fetched_at = :fetched_at",
+        {
+            "id": a_record["id"],
+            "domain": domain,
+            "name": a_record["name"],
+            "data": a_record["data"],
+            "ttl": a_record.get("ttl"),
+            "fetched_at": int(time.time()),
+        },
+    )
+
+
+def set_a_records_data(domain_record_ids: Iterable[int], data: str) -> None:
+    """Note that the A records with `domain_record_ids` now point at `data`.
+
+    Runs in the caller's transaction.
+    """
+    get_connection().executemany(
+        "UPDATE remote_records SET data = :data WHERE domain_record_id = :domain_record_id",
+        [
+            {"data": data, "domain_record_id": domain_record_id}
+            for domain_record_id in domain_record_ids
+        ],
+    )
+
+
+def get_domains(*, refresh: bool = False) -> tuple[list[dict[str, Any]], int]:
+    """Return the domains of this account, and when they were fetched from Digital Ocean.
+
+    Args:
+        refresh: Fetch the domains from Digital Ocean even if they are mirrored.
+    """
+    fetched_at = _fetched_at(DOMAINS_PATH)
+    if refresh or fetched_at is None:
+        return save_domains(do_api.get_all_domains()), int(time.time())
+
+    rows = get_read_only_connection().execute("SELECT name, ttl FROM remote_domains ORDER BY name")
+    return [dict(row) for row in rows], fetched_at
+
+
+def get_a_records(domain: str, *, refresh: bool = False) -> tuple[list[dict[str, Any]], int]:
+    """Return the A records of `domain`, and when they were fetched from Digital Ocean.
+
+    Args:
+        domain: The name of the Domain registered with Digital Ocean.
+        refresh: Fetch the A records from Digital Ocean even if they are mirrored.
+    """
+    fetched_at = _fetched_at(_records_path(domain))
+    if refresh or fetched_at is None:
+        return save_a_records(domain, do_api.get_a_records(domain)), int(time.time())
+
+    rows = get_read_only_connection().execute(
+        "SELECT domain_record_id as id, 'A' as type, name, data, ttl FROM remote_records "
+        "WHERE domain = ? ORDER BY domain_record_id",
+        (domain,),
+    )
+    return [dict(row) for row in rows], fetched_at
+
+
+def sync(_: Namespace) -> int:
+    """Refresh the mirror: the account's domains, and the A records of each managed domain.
+
+    Args:
+        _ (Namespace): Parsed CLI args. Not used here.
+            Must be passed to this function because of how function martialing works.
+
+    Returns:
+        The exit status: 0 on success.
+    """
+    domains = save_domains(do_api.get_all_domains())
+    conn = get_connection()
+    managed_domains = [
+        row["name"] for row in conn.execute("SELECT name FROM domains WHERE managed = 1")
+    ]
+    a_records = sum(
+        len(save_a_records(domain, do_api.get_a_records(domain))) for domain in managed_domains
+    )
+
+    msg = (
+        f"{time.strftime('%Y-%m-%d %H:%M')} - Info : Synced {len(domains)} domains, "
+        f"and {a_records} A records of {len(managed_domains)} managed domains"
+    )
+    Console().print(msg)
+    logger.info(msg)
+    return 0
@@ -0,0 +1,187 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Watch the host's IPv4 addresses change, through Linux's rtnetlink.
+
+On a host whose public address is configured on one of its interfaces, the kernel announces
+each address added (RTM_NEWADDR) or removed (RTM_DELADDR) to the sockets subscribed to the
+RTMGRP_IPV4_IFADDR group. ``daemon --watch-netlink`` waits on such a socket between its checks,
+and checks as soon as a global address changes, rather than at the next interval.
+
+The changes only decide when to check: the check then finds the public IP as usual, from the
+IP resolvers, since an address on an interface may well be behind NAT.
+
+Ref: https://man7.org/linux/man-pages/man7/rtnetlink.7.html
+"""
+
+from __future__ import annotations
+
+import errno
+import ipaddress
+import logging
+import select
+import socket
+import struct
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# From linux/rtnetlink.h.
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTMGRP_IPV4_IFADDR = 0x10
+# From linux/if_addr.h.
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+# From linux/rtnetlink.h: an address reachable from anywhere, as opposed to e.g. link-local.
+RT_SCOPE_UNIVERSE = 0
+
+# struct nlmsghdr: length, type, flags, sequence number, port ID; in host byte order.
+NLMSG_HEADER = struct.Struct("=IHHII")
+# struct ifaddrmsg: family, prefix length, flags, scope, interface index.
+IFADDRMSG = struct.Struct("=BBBBI")
+# struct rtattr: length, type.
+RTATTR = struct.Struct("=HH")
+
+# Bytes read from the socket at a time; netlink messages are sent in batches of up to a page.
+RECV_SIZE = 64 * 1024
+# Seconds to wait for more messages after one arrives: an address being replaced is announced
+# as a removal then an addition, which one check should follow.
+SETTLE_TIME = 0.05
+
+
+@dataclass(frozen=True)
+class AddressChange:
+    """An IPv4 address added to or removed from one of the host's interfaces."""
+
+    added: bool
+    interface_index: int
+    address: str
+    label: str | None
+
+
+def _align(length: int) -> int:
+    """Round `length` up to the 4-byte alignment of netlink messages and attributes."""
+    return (length + 3) & ~3
+
+
+def _attributes(data: bytes) -> dict[int, bytes]:
+    """Return the payload of each rtattr in `data`, by type."""
+    attributes = {}
+    offset = 0
+    while offset + RTATTR.size <= len(data):
+        length, kind = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attributes[kind] = data[offset + RTATTR.size : offset + length]
+        offset += _align(length)
+    return attributes
+
+
+def parse_address_changes(data: bytes) -> list[AddressChange]:
+    """Return the global IPv4 address changes announced in `data`, a batch of netlink messages.
+
+    Other messages, and changes to addresses of a narrower scope (e.g. link-local), are skipped.
+    """
+    changes = []
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, kind, _flags, _seq, _port_id = NLMSG_HEADER.unpack_from(data, offset)
+        if length < NLMSG_HEADER.size:
+            break
+        payload = data[offset + NLMSG_HEADER.size : offset + length]
+        offset += _align(length)
+        if kind not in {RTM_NEWADDR, RTM_DELADDR} or len(payload) < IFADDRMSG.size:
+            continue
+        family, _prefix_length, _flags, scope, index = IFADDRMSG.unpack_from(payload)
+        if family != socket.AF_INET or scope != RT_SCOPE_UNIVERSE:
+            continue
+        attributes = _attributes(payload[IFADDRMSG.size :])
+        # IFA_LOCAL is the interface's own address; IFA_ADDRESS is the peer's on a
+        # point-to-point link, and the same as IFA_LOCAL otherwise.
+        address = attributes.get(IFA_LOCAL, attributes.get(IFA_ADDRESS))
+        if address is None or len(address) != 4:  # noqa: PLR2004
+            continue
+        label = attributes.get(IFA_LABEL)
+        changes.append(
+            AddressChange(
+                added=kind == RTM_NEWADDR,
+                interface_index=index,
+                address=str(ipaddress.IPv4Address(address)),
+                label=label.rstrip(b"\0").decode(errors="replace") if label else None,
+            )
+        )
+    return changes
+
+
+def open_socket() -> socket.socket:
+    """Open a netlink socket subscribed to the changes of the host's IPv4 addresses.
+
+    Raises:
+        OSError: The host doesn't support netlink, e.g. it isn't Linux.
+    """
+    if not hasattr(socket, "AF_NETLINK"):
+        raise OSError(errno.EAFNOSUPPORT, "netlink is only supported on Linux")
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    try:
+        sock.bind((0, RTMGRP_IPV4_IFADDR))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _receive(sock: socket.socket) -> list[AddressChange] | None:
+    """Read one batch of messages from `sock`; None if the kernel dropped some."""
+    try:
+        data = sock.recv(RECV_SIZE)
+    except OSError as e:
+        # The socket's receive buffer overflowed: the lost messages may have been changes.
+        if e.errno == errno.ENOBUFS:
+            return None
+        raise
+    return parse_address_changes(data)
+
+
+def wait_for_changes(
+    sock: socket.socket, timeout: float, wake: socket.socket | None = None
+) -> list[AddressChange] | None:
+    """Wait up to `timeout` seconds for global IPv4 addresses to change.
+
+    Args:
+        sock: The socket from open_socket.
+        timeout: The longest wait, in seconds.
+        wake: A socket that ends the wait early once readable, e.g. written to by a signal
+            handler. What was written to it is read.
+
+    Returns:
+        The changes, an empty list if the kernel dropped messages that may have been changes,
+        or None if there were none before the timeout or the wake-up.
+    """
+    deadline = time.monotonic() + timeout
+    readers = [sock] if wake is None else [sock, wake]
+    while (remaining := deadline - time.monotonic()) > 0:
+        readable, _, _ = select.select(readers, [], [], remaining)
+        if wake is not None and wake in readable:
+            wake.recv(RECV_SIZE)
+            return None
+        if not readable:
+            return None
+        changes: list[AddressChange] | None = []
+        # Collect the rest of the burst, so that it triggers one check.
+        while readable:
+            received = _receive(sock)
+            changes = None if received is None or changes is None else changes + received
+            readable, _, _ = select.select([sock], [], [], SETTLE_TIME)
+        if changes is None:
+            logger.warning(
+                "%s - Warning : netlink messages were dropped, checking in case an address changed",
+                time.strftime("%Y-%m-%d %H:%M"),
+            )
+            return []
+        if changes:
+            return changes
+        # Only changes to other addresses, e.g. link-local ones: keep waiting.
+    return None
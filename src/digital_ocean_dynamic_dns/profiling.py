@@ -0,0 +1,168 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Profiling hooks around a subcommand, enabled by do_ddns's global options.
+
+- ``--profile PATH`` runs the subcommand under cProfile, saves the profile to PATH (for
+  ``python -m pstats``, snakeviz and the like) and prints the functions that took the most
+  cumulative time.
+- ``--trace-malloc`` traces the memory allocations of the subcommand and prints the lines
+  that allocated the most memory still held at the end, along with the peak.
+- ``--trace-events PATH`` saves the operations timed by the timings module (API requests,
+  the IP lookup, database writes), and the subcommand itself, as a Chrome trace to PATH, for
+  chrome://tracing or https://ui.perfetto.dev.
+
+``--top N`` sets how many entries the summaries print. They go to stderr, leaving the
+subcommand's own output alone.
+
+ddns only imports this module when one of the options is given.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from typing import TYPE_CHECKING
+
+from rich.console import Console
+
+from .timings import get_timings
+
+if TYPE_CHECKING:
+    import argparse
+    from collections.abc import Generator
+    from pathlib import Path
+
+    from .timings import TraceSpan
+
+# Frames kept per allocation traced by --trace-malloc; enough to see past the standard library.
+TRACEMALLOC_FRAMES = 5
+
+
+def _stderr() -> Console:
+    # Soft wrapped, so that long paths stay on one line.
+    return Console(stderr=True, soft_wrap=True)
+
+
+@contextmanager
+def profile(path: Path, top: int) -> Generator[None, None, None]:
+    """Profile the body of the with statement, saving the profile to `path`.
+
+    Then print the `top` functions with the most cumulative time.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        console = _stderr()
+        console.print(summary.getvalue().strip("\n"), markup=False, highlight=False)
+        console.print(f"Profile saved to {path}", markup=False, highlight=False)
+
+
+@contextmanager
+def trace_malloc(top: int) -> Generator[None, None, None]:
+    """Trace the memory allocations of the body of the with statement.
+
+    Then print the peak, and the `top` lines that allocated the most memory still held.
+    """
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    try:
+        yield
+    finally:
+        # Leave out the allocations of tracemalloc itself, and of --profile.
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(inclusive=False, filename_pattern=module.__file__)
+                for module in (tracemalloc, cProfile, pstats)
+            ]
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        console = _stderr()
+        console.print(
+            f"Memory allocated: {current / 1024:.1f} KiB held at exit, {peak / 1024:.1f} KiB peak",
+            highlight=False,
+        )
+        console.print(f"Top {top} allocation sites:", highlight=False)
+        for n, stat in enumerate(snapshot.statistics("lineno")[:top], start=1):
+            console.print(f"#{n}: {stat}", markup=False, highlight=False)
+
+
+def chrome_trace(spans: list[TraceSpan], origin: float) -> dict[str, object]:
+    """Return `spans` as a Chrome trace, with timestamps in µs since `origin`.
+
+    Ref: https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+    """
+    pid = os.getpid()
+    events: list[dict[str, object]] = [
+        {
+            "name": span.operation,
+            # E.g. "api", "ip" or "db", for filtering in the viewer.
+            "cat": span.operation.split(" ", 1)[0].split(".", 1)[0],
+            "ph": "X",
+            "ts": (span.start - origin) * 1e6,
+            "dur": (span.end - span.start) * 1e6,
+            "pid": pid,
+            "tid": span.thread_id,
+        }
+        for span in spans
+    ]
+    thread_names = {span.thread_id: span.thread_name for span in spans}
+    events += [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": name}}
+        for thread_id, name in thread_names.items()
+    ]
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+@contextmanager
+def trace_events(path: Path, command: str) -> Generator[None, None, None]:
+    """Save the operations timed in the body of the with statement as a Chrome trace to `path`.
+
+    The body itself is one more span, named `command`.
+    """
+    timings = get_timings()
+    timings.start_tracing()
+    started = time.perf_counter()
+    try:
+        with timings.measure(command):
+            yield
+    finally:
+        spans = timings.stop_tracing()
+        trace = chrome_trace(spans, started)
+        try:
+            path.write_text(json.dumps(trace))
+        except OSError as e:
+            _stderr().print(
+                f"Error : could not write the trace to {path}: {e}", markup=False, highlight=False
+            )
+        else:
+            _stderr().print(
+                f"Trace of {len(spans)} operations saved to {path}", markup=False, highlight=False
+            )
+
+
+@contextmanager
+def profiling_hooks(args: argparse.Namespace) -> Generator[None, None, None]:
+    """Apply the profiling hooks requested by do_ddns's global options around the body."""
+    with ExitStack() as stack:
+        if args.trace_events is not None:
+            stack.enter_context(trace_events(args.trace_events, f"do_ddns {args.subparser_name}"))
+        if args.trace_malloc:
+            stack.enter_context(trace_malloc(args.top))
+        # Innermost, so that it profiles the subcommand rather than the other hooks.
+        if args.profile is not None:
+            stack.enter_context(profile(args.profile, args.top))
+        yield
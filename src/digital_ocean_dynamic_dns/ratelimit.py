@@ -0,0 +1,168 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Client-side pacing for the Digital Ocean API rate limits.
+
+Digital Ocean allows 5,000 requests per hour and 250 requests per minute per account,
+and reports the hourly budget on every response via the ``ratelimit-*`` headers.
+Ref: https://docs.digitalocean.com/reference/api/#rate-limit
+"""
+
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+HOURLY_LIMIT = 5000
+MINUTE_LIMIT = 250
+
+
+@dataclass
+class TokenBucket:
+    """A token bucket that refills `capacity` tokens evenly over `window` seconds."""
+
+    capacity: float
+    window: float
+    tokens: float
+    updated_at: float
+
+    def refill(self, now: float) -> None:
+        """Add the tokens accrued since the bucket was last updated."""
+        elapsed = max(now - self.updated_at, 0.0)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity / self.window)
+        self.updated_at = now
+
+    def reserve(self, now: float) -> float:
+        """Take one token, returning how long to wait before it may be spent.
+
+        The balance may go negative; that debt is what paces concurrent callers.
+        """
+        self.refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens * self.window / self.capacity
+
+
+class RateLimiter:
+    """Paces API requests to stay within the hourly and per-minute rate limits.
+
+    The hourly bucket is re-synchronized from the ``ratelimit-*`` headers on every response,
+    so the budget reflects requests made by any client using the same account.
+    Thread-safe; one limiter is shared by all requests made by a client.
+    """
+
+    def __init__(
+        self,
+        buckets: Mapping[str, TokenBucket] | None = None,
+        clock: Callable[[], float] | None = None,
+        sleep: Callable[[float], None] | None = None,
+    ) -> None:
+        """Create a rate limiter.
+
+        Args:
+            buckets: Previously saved buckets, keyed by name ("hourly", "minute").
+                Any bucket not given starts full.
+            clock: Returns the current time in epoch seconds. Default: time.time.
+            sleep: Blocks for the given number of seconds. Default: time.sleep.
+        """
+        self._clock = time.time if clock is None else clock
+        self._sleep = time.sleep if sleep is None else sleep
+        self._lock = threading.Lock()
+
+        now = self._clock()
+        self.buckets = {
+            "hourly": TokenBucket(HOURLY_LIMIT, 3600, HOURLY_LIMIT, now),
+            "minute": TokenBucket(MINUTE_LIMIT, 60, MINUTE_LIMIT, now),
+        }
+        self.buckets.update(buckets or {})
+
+    def acquire(self) -> None:
+        """Block until a request may be sent without exceeding either rate limit."""
+        with self._lock:
+            now = self._clock()
+            wait = max(bucket.reserve(now) for bucket in self.buckets.values())
+        if wait > 0:
+            self._sleep(wait)
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """Synchronize the hourly budget with the ``ratelimit-*`` response headers."""
+        try:
+            limit = int(headers["ratelimit-limit"])
+            remaining = int(headers["ratelimit-remaining"])
+        except (KeyError, ValueError):
+            return
+
+        with self._lock:
+            hourly = self.buckets["hourly"]
+            hourly.refill(self._clock())
+            hourly.capacity = limit
+            hourly.tokens = min(hourly.tokens, remaining)
+
+    def retry_delay(self, headers: Mapping[str, str]) -> float | None:
+        """Return how long to wait before retrying a rate limited (HTTP 429) request.
+
+        Prefers the Retry-After header (either delta-seconds or an HTTP-date),
+        falling back to the ``ratelimit-reset`` time. Malformed headers are ignored.
+        Returns None when the response gives no indication of when to retry.
+        """
+        now = self._clock()
+        retry_after = headers.get("Retry-After")
+        if retry_after is not None:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                pass
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - now, 0.0)
+            except (ValueError, TypeError):
+                pass
+
+        try:
+            return max(float(headers["ratelimit-reset"]) - now, 0.0)
+        except (KeyError, ValueError, TypeError):
+            return None
+
+
+def load_rate_limiter(conn: sqlite3.Connection) -> RateLimiter:
+    """Restore a rate limiter from the budget saved by a previous invocation."""
+    rows = conn.execute(
+        "SELECT name, capacity, window_seconds, tokens, updated_at FROM rate_limit_buckets"
+    ).fetchall()
+    return RateLimiter(
+        buckets={
+            row["name"]: TokenBucket(
+                capacity=row["capacity"],
+                window=row["window_seconds"],
+                tokens=row["tokens"],
+                updated_at=row["updated_at"],
+            )
+            for row in rows
+        }
+    )
+
+
+def save_rate_limiter(conn: sqlite3.Connection, rate_limiter: RateLimiter) -> None:
+    """Save the rate limiter's budget so the next invocation shares it."""
+    with conn:
+        conn.executemany(
+            "INSERT INTO rate_limit_buckets(name, capacity, window_seconds, tokens, updated_at) "
+            "values(:name, :capacity, :window_seconds, :tokens, :updated_at) "
+            "ON CONFLICT(name) DO UPDATE SET "
+            "  capacity = :capacity, "
+            "  window_seconds = :window_seconds, "
+            "  tokens = :tokens, "
+            "  updated_at = :updated_at",
+            [
+                {
+                    "name": name,
+                    "capacity": bucket.capacity,
+                    "window_seconds": bucket.window,
+                    "tokens": bucket.tokens,
+                    "updated_at": bucket.updated_at,
+                }
+                for name, bucket in rate_limiter.buckets.items()
+            ],
+        )
@@ -0,0 +1,194 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Adaptive polling: when ``daemon --adaptive`` checks the public IP next.
+
+The next check is chosen from the history of the public IP (see history):
+
+- right after a failed check (e.g. an IP resolver error, or A records that couldn't be
+  updated), the daemon checks again after the minimum interval;
+- otherwise the interval grows with the time the IP has been stable, a STABILITY_DIVISOR-th
+  of it: a minute when the IP changed ten minutes ago, an hour when it changed ten hours ago;
+- and, once the history holds a few changes, it is kept to a RATE_DIVISOR-th of the median
+  time between them, so a host whose IP changes often is checked often;
+
+always between the minimum and maximum intervals. Each decision of the daemon is saved to the
+``schedule_state`` table, which show-info displays.
+"""
+
+from __future__ import annotations
+
+import itertools
+import statistics
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from .history import format_duration
+
+if TYPE_CHECKING:
+    import sqlite3
+
+# The interval is the time the IP has been stable divided by this.
+STABILITY_DIVISOR = 10
+# The interval is at most the median time between IP changes divided by this.
+RATE_DIVISOR = 20
+# The changes needed for a median time between them.
+MIN_CHANGES_FOR_RATE = 2
+# Seconds of history the change rate is estimated from.
+RATE_WINDOW = 90 * 24 * 3600
+
+
+@dataclass(frozen=True)
+class Decision:
+    """When to check the public IP next, and why."""
+
+    decided_at: int
+    interval: int
+    reason: str
+
+    @property
+    def next_check_at(self) -> int:
+        """When the next check is due, in seconds since the epoch."""
+        return self.decided_at + self.interval
+
+
+def decide(  # noqa: PLR0913
+    now: int,
+    *,
+    last_check_ok: bool,
+    stable_since: int | None,
+    change_gaps: list[int],
+    min_interval: int,
+    max_interval: int,
+    default_interval: int,
+) -> Decision:
+    """Return when to check the public IP next.
+
+    Args:
+        now: The time of the decision, in seconds since the epoch.
+        last_check_ok: Whether the last check succeeded.
+        stable_since: When the current IP was first seen after a change, or first seen at
+            all; None without any history.
+        change_gaps: The seconds between consecutive IP changes, the oldest first.
+        min_interval: The shortest interval, in seconds.
+        max_interval: The longest interval, in seconds.
+        default_interval: The interval without any history, in seconds.
+    """
+    if not last_check_ok:
+        return Decision(now, min_interval, "the last check failed")
+    if stable_since is None:
+        interval = default_interval
+        reasons = ["no IP history yet"]
+    else:
+        stable_for = now - stable_since
+        interval = stable_for // STABILITY_DIVISOR
+        reasons = [f"IP stable for {format_duration(stable_for)}"]
+        if len(change_gaps) >= MIN_CHANGES_FOR_RATE:
+            median_gap = statistics.median(change_gaps)
+            reasons.append(f"changes every {format_duration(median_gap)} on median")
+            interval = min(interval, int(median_gap // RATE_DIVISOR))
+
+    if interval <= min_interval:
+        interval = min_interval
+        reasons.append("at the minimum interval")
+    elif interval >= max_interval:
+        interval = max_interval
+        reasons.append("at the maximum interval")
+    return Decision(now, interval, "; ".join(reasons))
+
+
+def plan(  # noqa: PLR0913
+    conn: sqlite3.Connection,
+    now: int,
+    *,
+    last_check_ok: bool,
+    min_interval: int,
+    max_interval: int,
+    default_interval: int,
+) -> Decision:
+    """Decide when to check the public IP next from its history in the database.
+
+    Args:
+        conn: A database connection, read-only or not.
+        now: The time of the decision, in seconds since the epoch.
+        last_check_ok: Whether the last check succeeded.
+        min_interval: The shortest interval, in seconds.
+        max_interval: The longest interval, in seconds.
+        default_interval: The interval without any history, in seconds.
+    """
+    # When each IP was first seen after a different one, over the window. Runs of identical
+    # observations may or may not be compacted, so lag() compares each row with the one before.
+    changes = [
+        row["first_seen"]
+        for row in conn.execute(
+            "SELECT first_seen FROM ("
+            "  SELECT first_seen, ip4, lag(ip4) OVER (ORDER BY first_seen, id) AS previous_ip4 "
+            "  FROM ip_history WHERE last_seen >= :window_start"
+            ") WHERE previous_ip4 != ip4",
+            {"window_start": now - RATE_WINDOW},
+        )
+    ]
+    if changes:
+        stable_since = changes[-1]
+    else:
+        stable_since = conn.execute("SELECT min(first_seen) FROM ip_history").fetchone()[0]
+    return decide(
+        now,
+        last_check_ok=last_check_ok,
+        stable_since=stable_since,
+        change_gaps=[later - earlier for earlier, later in itertools.pairwise(changes)],
+        min_interval=min_interval,
+        max_interval=max_interval,
+        default_interval=default_interval,
+    )
+
+
+def next_check(
+    conn: sqlite3.Connection,
+    *,
+    last_check_ok: bool,
+    min_interval: int,
+    max_interval: int,
+    default_interval: int,
+) -> Decision:
+    """Decide when to check the public IP next, as plan does, and save the decision.
+
+    Args:
+        conn: The read-write database connection.
+        last_check_ok: Whether the last check succeeded.
+        min_interval: The shortest interval, in seconds.
+        max_interval: The longest interval, in seconds.
+        default_interval: The interval without any history, in seconds.
+    """
+    decision = plan(
+        conn,
+        int(time.time()),
+        last_check_ok=last_check_ok,
+        min_interval=min_interval,
+        max_interval=max_interval,
+        default_interval=default_interval,
+    )
+    with conn:
+        conn.execute(
+            "INSERT INTO schedule_state(id, decided_at, interval, reason) "
+            "values(1, :decided_at, :interval, :reason) "
+            "ON CONFLICT(id) DO UPDATE SET "
+            "  decided_at = :decided_at, "
+            "  interval = :interval, "
+            "  reason = :reason",
+            {
+                "decided_at": decision.decided_at,
+                "interval": decision.interval,
+                "reason": decision.reason,
+            },
+        )
+    return decision
+
+
+def last_decision(conn: sqlite3.Connection) -> Decision | None:
+    """Return the last decision saved by next_check, or None if there is none."""
+    row = conn.execute("SELECT decided_at, interval, reason FROM schedule_state").fetchone()
+    if row is None:
+        return None
+    return Decision(row["decided_at"], row["interval"], row["reason"])
@@ -3,23 +3,92 @@
 
 """Subdomain management for digital-ocean-dynamic-dns."""
 
+import json
 import logging
+import random
 import time
 from argparse import Namespace
-from datetime import UTC, datetime
+from collections import defaultdict
+from collections.abc import Callable, Generator, Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from http import HTTPStatus
 from string import ascii_letters, digits
+from typing import Any
 
+import requests
 from more_itertools import peekable
 from rich.console import Console
 from rich.table import Table
 
-from . import constants, do_api
-from .database import connect_database
+from . import constants, do_api, history, metrics, mirror
+from .database import format_timestamp, get_connection, get_read_only_connection
 from .exceptions import NonSimpleDomainNameError
 from .ip import get_ip
+from .timings import Timings, get_timings, save_run, timed, timings_table
 
 logger = logging.getLogger(__name__)
 
+# Parallel A record updates are capped by the connections the shared API client keeps alive.
+MAX_UPDATE_CONCURRENCY = constants.MAX_UPDATE_CONCURRENCY
+
+# Each A record gets this many attempts per update-ips run, for transient API errors;
+# retries back off exponentially (with jitter) from RETRY_BASE_DELAY up to RETRY_MAX_DELAY.
+UPDATE_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+
+# Start managing an A record, cataloging its subdomain if it is new.
+_MANAGE_SUBDOMAIN_SQL = (
+    "INSERT INTO subdomains("
+    "   domain_record_id,"
+    "   main_id,"
+    "   name,"
+    "   current_ip4,"
+    "   cataloged,"
+    "   last_checked,"
+    "   last_updated"
+    ") values("
+    "   :domain_record_id,"
+    "   :main_id,"
+    "   :name,"
+    "   :current_ip4,"
+    "   :cataloged,"
+    "   :last_checked,"
+    "   :last_updated"
+    ") ON CONFLICT(domain_record_id) DO UPDATE SET "
+    "    managed = 1, "
+    "    last_checked = :last_checked, "
+    "    last_updated = :last_updated "
+)
+
+# For manage_a_records: an A record listed, and maybe updated, in bulk. Re-managing a record
+# keeps its last update time unless it was updated now.
+_MANAGE_A_RECORD_SQL = (
+    "INSERT INTO subdomains("
+    "   domain_record_id,"
+    "   main_id,"
+    "   name,"
+    "   current_ip4,"
+    "   cataloged,"
+    "   last_checked,"
+    "   last_updated"
+    ") values("
+    "   :domain_record_id,"
+    "   :main_id,"
+    "   :name,"
+    "   :current_ip4,"
+    "   :cataloged,"
+    "   :last_checked,"
+    "   :last_updated"
+    ") ON CONFLICT(domain_record_id) DO UPDATE SET "
+    "    managed = 1, "
+    "    current_ip4 = :current_ip4, "
+    "    last_checked = :last_checked, "
+    "    last_updated = COALESCE(:last_updated, last_updated) "
+)
+
 
 class NoManagedSubdomainsError(Exception):
     """updated_all_managed_subdomains was called and there are no configured subdomains."""
@@ -34,19 +103,19 @@ class TopDomainNotManagedError(Exception):
     """
 
 
-conn = connect_database(constants.database_path)
-
-
-def list_sub_domains(domain: str) -> None:
+def list_sub_domains(domain: str, *, refresh: bool = False) -> None:
     """List managed and unmanaged A records for a domain.
 
     Args:
         domain: The top-level domain name registered with Digital Ocean.
+        refresh: Fetch the A records from Digital Ocean rather than the local mirror.
     """
+    conn = get_read_only_connection()
     cursor = conn.cursor()
     console = Console()
 
-    domain_a_records = {x["name"]: x for x in do_api.get_a_records(domain)}
+    a_records, fetched_at = mirror.get_a_records(domain, refresh=refresh)
+    domain_a_records = {x["name"]: x for x in a_records}
 
     row = cursor.execute("SELECT id FROM domains WHERE name = ?", (domain,)).fetchone()
     if row is None:
@@ -88,9 +157,9 @@ def list_sub_domains(domain: str) -> None:
                 row["name"],
                 str(row["domain_record_id"]),
                 row["current_ip4"],
-                row["cataloged"],
-                row["last_checked"],
-                row["last_updated"],
+                format_timestamp(row["cataloged"]),
+                format_timestamp(row["last_checked"]),
+                format_timestamp(row["last_updated"]),
             )
 
         console.print(table)
@@ -113,6 +182,32 @@ def list_sub_domains(domain: str) -> None:
         console.print(table)
     else:
         console.print(f"No unmanaged A records for [b]{domain}[/b]")
+    console.print(
+        f"A records as of {format_timestamp(fetched_at)}. Use --refresh to fetch them again."
+    )
+
+
+def _get_managed_domain_id(domain: str) -> int:
+    """Return the id of the managed top domain `domain`.
+
+    Raises:
+        TopDomainNotManagedError: `domain` is not managed.
+    """
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT id FROM domains WHERE name = ? and managed = 1",
+        (domain,),
+    ).fetchone()
+    if row is None:
+        Console().print(
+            f"[red]Error:[/red] [bold]{domain}[/bold] is not a managed domain. "
+            "We do [bold]not[/bold] expect users to ever be exposed to this error. "
+            "If you see this in the console while using digital-ocean-dynamic-dns please"
+            " open an issue on the repository."
+        )
+        msg = f"domain {domain} not found in local database."
+        raise TopDomainNotManagedError(msg)
+    return row["id"]
 
 
 def manage_subdomain(subdomain: str, domain: str) -> None:
@@ -126,6 +221,7 @@ def manage_subdomain(subdomain: str, domain: str) -> None:
         The name of the Domain registered with Digital Ocean.
 
     """
+    conn = get_connection()
     console = Console()
     if set(subdomain).difference(ascii_letters + "." + digits + "-" + "@"):
         console.print(
@@ -138,21 +234,7 @@ def manage_subdomain(subdomain: str, domain: str) -> None:
     subdomain = subdomain.removesuffix("." + domain)
 
     cursor = conn.cursor()
-    row = cursor.execute(
-        "SELECT id FROM domains WHERE name = ? and managed = 1",
-        (domain,),
-    ).fetchone()
-
-    if row is None:
-        console.print(
-            f"[red]Error:[/red] [bold]{domain}[/bold] is not a managed domain. "
-            "We do [bold]not[/bold] expect users to ever be exposed to this error. "
-            "If you see this in the console while using digital-ocean-dynamic-dns please"
-            " open an issue on the repository."
-        )
-        msg = f"domain {domain} not found in local database."
-        raise TopDomainNotManagedError(msg)
-    domain_id = row["id"]
+    domain_id = _get_managed_domain_id(domain)
 
     cursor.execute(
         "SELECT count(*) FROM subdomains WHERE main_id = ? AND name = ? and managed = 1",
@@ -183,31 +265,14 @@ def manage_subdomain(subdomain: str, domain: str) -> None:
             domain=domain,
             new_ip_address=ip,
         )
+        ttl = domain_record.get("ttl")
     else:
         domain_record_id = do_api.create_a_record(subdomain, domain, ip)
+        ttl = None
 
-    now = datetime.now(tz=UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+    now = int(time.time())
     cursor.execute(
-        "INSERT INTO subdomains("
-        "   domain_record_id,"
-        "   main_id,"
-        "   name,"
-        "   current_ip4,"
-        "   cataloged,"
-        "   last_checked,"
-        "   last_updated"
-        ") values("
-        "   :domain_record_id,"
-        "   :main_id,"
-        "   :name,"
-        "   :current_ip4,"
-        "   :cataloged,"
-        "   :last_checked,"
-        "   :last_updated"
-        ") ON CONFLICT(domain_record_id) DO UPDATE SET "
-        "    managed = 1, "
-        "    last_checked = :last_checked, "
-        "    last_updated = :last_updated ",
+        _MANAGE_SUBDOMAIN_SQL,
         {
             "domain_record_id": domain_record_id,
             "main_id": domain_id,
@@ -218,6 +283,12 @@ def manage_subdomain(subdomain: str, domain: str) -> None:
             "last_updated": now,
         },
     )
+    mirror.save_a_record(
+        domain, {"id": domain_record_id, "name": subdomain, "data": ip, "ttl": ttl}
+    )
+    # The IP may have changed since the last verified update-ips run;
+    # make the next run verify every A record, including this one, against the API.
+    cursor.execute("DELETE FROM update_state")
     conn.commit()
     console.print(
         f"The A record for the subdomain {subdomain} for domain {domain} is now"
@@ -225,6 +296,107 @@ def manage_subdomain(subdomain: str, domain: str) -> None:
     )
 
 
+def manage_a_records(
+    domain: str,
+    a_records: Iterable[dict[str, Any]],
+    concurrency: int = MAX_UPDATE_CONCURRENCY,
+) -> None:
+    """Begin managing existing A records of `domain` in bulk.
+
+    Unlike calling manage_subdomain once per A record, the public IP is resolved once and
+    the A records already fetched are reused: only those that don't point at the public IP
+    are PATCHed, on a bounded worker pool, and all subdomains are cataloged in a single
+    transaction.
+
+    A records that fail to update are still managed, and queued to be retried first by the
+    next update-ips run. A records whose name is not in simple form are skipped, as are
+    A records already managed; of several A records with the same name, the first is managed.
+
+    Args:
+        domain: The name of the Domain registered with Digital Ocean.
+        a_records: A records of `domain`, as returned by the Digital Ocean API.
+        concurrency: The maximum number of A records updated in parallel.
+
+    Raises:
+        TopDomainNotManagedError: `domain` is not managed.
+    """
+    conn = get_connection()
+    console = Console()
+    domain_id = _get_managed_domain_id(domain)
+
+    already_managed = {
+        row["name"]
+        for row in conn.execute(
+            "SELECT name FROM subdomains WHERE main_id = ? and managed = 1", (domain_id,)
+        )
+    }
+    records_by_name: dict[str, dict[str, Any]] = {}
+    listed_managed: set[str] = set()
+    for record in a_records:
+        name = record["name"]
+        if name in already_managed:
+            listed_managed.add(name)
+        elif set(name).difference(ascii_letters + "." + digits + "-" + "@"):
+            console.print(
+                f"[yellow]Warning:[/yellow] Skipping [bold]{name}[/bold]: "
+                "only names in simple form can be managed."
+            )
+        else:
+            records_by_name.setdefault(name, record)
+
+    if listed_managed:
+        console.print(f"{len(listed_managed)} A records for {domain} are already managed.")
+    if not records_by_name:
+        return
+
+    ip = get_ip()
+    failures: dict[int, Exception] = {}
+    stale_records = [
+        (record["id"], domain, record["data"])
+        for record in records_by_name.values()
+        if record["data"] != ip
+    ]
+    updated_records = set(_update_a_records(stale_records, ip, concurrency, failures, {}))
+
+    now = int(time.time())
+    with conn:
+        conn.executemany(
+            _MANAGE_A_RECORD_SQL,
+            [
+                {
+                    "domain_record_id": record["id"],
+                    "main_id": domain_id,
+                    "name": name,
+                    "current_ip4": record["data"] if record["id"] in failures else ip,
+                    "cataloged": now,
+                    "last_checked": now,
+                    "last_updated": now if record["id"] in updated_records else None,
+                }
+                for name, record in records_by_name.items()
+            ],
+        )
+        _queue_pending_updates(failures, now)
+        mirror.set_a_records_data(updated_records, ip)
+        # The IP may have changed since the last verified update-ips run;
+        # make the next run verify every A record, including these, against the API.
+        conn.execute("DELETE FROM update_state")
+
+    msg = (
+        f"{time.strftime('%Y-%m-%d %H:%M')} - Info : {len(records_by_name)} A records for "
+        f"{domain} are now managed ({len(updated_records)} updated to {ip})"
+    )
+    console.print(msg, markup=False, highlight=False)
+    logger.info(msg)
+    for domain_record_id, error in failures.items():
+        msg = (
+            f"{time.strftime('%Y-%m-%d %H:%M')} - Error : "
+            f"A record {domain_record_id} could not be updated: {error}. "
+            "It will be retried first by the next update-ips run."
+        )
+        console.print(msg, markup=False, highlight=False)
+        logger.error(msg)
+
+
 def un_manage_subdomain(subdomain: str, domain: str) -> None:
     """Stop managing `subdomain` via digital-ocean-dynamic-dns.
 
@@ -236,8 +408,9 @@ def un_manage_subdomain(subdomain: str, domain: str) -> None:
         The name of the Domain registered with Digital Ocean.
 
     Will not delete `subdomain` from the database.
-    Marks `subdomain` as un-managed in the database.
+    Marks `subdomain` as un-managed in the database, and drops its queued retry, if any.
     """
+    conn = get_connection()
     console = Console()
     if set(subdomain).difference(ascii_letters + "." + digits + "-" + "@"):
         console.print(
@@ -283,26 +456,42 @@ def un_manage_subdomain(subdomain: str, domain: str) -> None:
                 "domain_record_id": domain_record_id,
             },
         )
+        conn.execute(
+            "DELETE FROM pending_updates WHERE domain_record_id = :domain_record_id",
+            {"domain_record_id": domain_record_id},
+        )
         console.print(
             f"The A record for the subdomain {subdomain} for domain {domain} is "
             " no longer being managed by digital-ocean-dynamic-dns!"
         )
 
 
-def update_all_managed_subdomains(args: Namespace) -> None:
-    """Update all managed subdomains to the current public IP address.
-
-    Args:
-        args: Parsed CLI arguments; expects a ``force`` boolean attribute.
-    """
-    force: bool = args.force
-    console = Console()
+@timed("db.load_managed_a_records")
+def _load_managed_a_records() -> dict[str, list[int]]:
+    """Return the domain record ids of all managed A records, grouped by domain name.
 
-    cursor = conn.cursor()
+    A records that failed to update on a previous run (see pending_updates) come first.
 
-    rows = cursor.execute("SELECT domain_record_id FROM subdomains where managed = 1").fetchall()
+    Raises:
+        NoManagedSubdomainsError: There are no managed subdomains.
+    """
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT "
+        "  subdomains.domain_record_id as domain_record_id, "
+        "  domains.name as domain_name "
+        "FROM subdomains "
+        "INNER JOIN domains on subdomains.main_id = domains.id "
+        "LEFT JOIN pending_updates "
+        "  on subdomains.domain_record_id = pending_updates.domain_record_id "
+        "WHERE subdomains.managed = 1 "
+        "ORDER BY "
+        "  pending_updates.domain_record_id IS NULL, "
+        "  domains.name, "
+        "  subdomains.domain_record_id"
+    ).fetchall()
     if not rows:
-        console.print(
+        Console().print(
             "[red]Error: [/red]There are no dynamic domains active."
             " Start by adding a new domain with [i]do_ddns manage[/i]."
             " E.g. [i]do_ddns manage example.com --subdomain test[/i]."
@@ -313,63 +502,446 @@ def update_all_managed_subdomains(args: Namespace) -> None:
         )
         raise NoManagedSubdomainsError(msg)
 
-    now = datetime.now(tz=UTC).astimezone().strftime("%d-%m-%Y %H:%M")
-    current_ip = get_ip()
-    updated = None
-
-    for subdomain_row in rows:
-        domain_record_id = subdomain_row["domain_record_id"]
-        domain_info = cursor.execute(
-            "SELECT name "
-            "FROM domains "
-            "WHERE id = (SELECT main_id from subdomains WHERE domain_record_id = ?)",
-            (domain_record_id,),
-        ).fetchone()
-        domain_name = str(domain_info["name"])
-
-        # Check DO API to see if an update is required
-        domain_record = do_api.get_a_record(
-            domain_record_id=domain_record_id,
-            domain=domain_name,
+    managed_records_by_domain: dict[str, list[int]] = defaultdict(list)
+    for row in rows:
+        managed_records_by_domain[row["domain_name"]].append(row["domain_record_id"])
+    return managed_records_by_domain
+
+
+def _is_verified_ip(current_ip: str, verify_interval: int) -> bool:
+    """Whether the last fully verified run pushed `current_ip` within `verify_interval` seconds.
+
+    Never true while managed A records from a previous run are waiting to be retried.
+    """
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT last_ip4, last_verified FROM update_state "
+        "WHERE id = 1 AND NOT EXISTS ("
+        "  SELECT 1 FROM pending_updates "
+        "  INNER JOIN subdomains "
+        "    on pending_updates.domain_record_id = subdomains.domain_record_id "
+        "  WHERE subdomains.managed = 1"
+        ")"
+    ).fetchone()
+    return (
+        row is not None
+        and row["last_ip4"] == current_ip
+        and time.time() - row["last_verified"] < verify_interval
+    )
+
+
+def _is_transient(error: requests.RequestException) -> bool:
+    """Whether `error` may succeed if the request is retried."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return (
+            error.response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+            or error.response.status_code == HTTPStatus.TOO_MANY_REQUESTS
         )
-        remote_ip4 = domain_record["data"]
+    return isinstance(error, requests.ConnectionError | requests.Timeout)
+
 
-        if remote_ip4 != current_ip or force is True:
-            updated = True
-            domain_record = do_api.update_a_record(
+def _call_with_retries[T](call: Callable[[], T]) -> T:
+    """Call `call`, retrying transient API errors with jittered exponential backoff.
+
+    Raises:
+        requests.RequestException: The last error, once it is not transient
+            or UPDATE_ATTEMPTS attempts have failed.
+    """
+    for attempt in range(UPDATE_ATTEMPTS):
+        try:
+            return call()
+        except requests.RequestException as e:
+            if attempt == UPDATE_ATTEMPTS - 1 or not _is_transient(e):
+                raise
+            # "Full jitter" keeps parallel retries from hitting the API in lock-step.
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))  # noqa: S311
+            logger.warning(
+                "%s - Warning : %s; retrying in %.1fs", time.strftime("%Y-%m-%d %H:%M"), e, delay
+            )
+            time.sleep(delay)
+    raise AssertionError  # pragma: no cover; the loop always returns or raises.
+
+
+def _find_stale_a_records(
+    managed_records_by_domain: dict[str, list[int]],
+    current_ip: str,
+    failures: dict[int, Exception],
+    listings: dict[str, list[dict[str, Any]]],
+    *,
+    force: bool,
+) -> tuple[list[int], list[tuple[int, str, str]]]:
+    """Compare the managed A records with Digital Ocean.
+
+    A records that can't be compared are added to `failures`, keyed by domain record id.
+    The A records listed for each domain are added to `listings`, keyed by domain name.
+
+    Returns:
+        The domain record ids that are current, and the (domain record id, domain name,
+            IP address) of the A records that need to be updated.
+    """
+    current_records: list[int] = []
+    stale_records: list[tuple[int, str, str]] = []
+
+    for domain_name, domain_record_ids in managed_records_by_domain.items():
+        # One paginated listing per domain, rather than one GET per managed A record.
+        try:
+            listings[domain_name] = _call_with_retries(
+                lambda domain_name=domain_name: list(do_api.get_a_records(domain_name))
+            )
+        except requests.RequestException as e:
+            failures.update(dict.fromkeys(domain_record_ids, e))
+            continue
+
+        remote_ip4s = {record["id"]: record["data"] for record in listings[domain_name]}
+        for domain_record_id in domain_record_ids:
+            remote_ip4 = remote_ip4s.get(domain_record_id)
+            if remote_ip4 is None:
+                # Not in the listing for its domain (e.g. deleted outside of do_ddns).
+                # Fall back to a direct lookup so the API error is reported.
+                try:
+                    remote_ip4 = _call_with_retries(
+                        partial(
+                            do_api.get_a_record,
+                            domain_record_id=domain_record_id,
+                            domain=domain_name,
+                        )
+                    )["data"]
+                except requests.RequestException as e:
+                    failures[domain_record_id] = e
+                    continue
+
+            if remote_ip4 != current_ip or force is True:
+                stale_records.append((domain_record_id, domain_name, remote_ip4))
+            else:
+                current_records.append(domain_record_id)
+
+    return current_records, stale_records
+
+
+def _update_a_record(
+    domain_record_id: int, domain_name: str, current_ip: str, durations: dict[int, float]
+) -> None:
+    """PATCH an A record, with retries, noting how long it took in `durations`."""
+    started = time.perf_counter()
+    try:
+        _call_with_retries(
+            partial(
+                do_api.update_a_record,
                 domain_record_id=domain_record_id,
                 domain=domain_name,
                 new_ip_address=current_ip,
             )
+        )
+    finally:
+        durations[domain_record_id] = time.perf_counter() - started
+
+
+def _update_a_records(
+    stale_records: list[tuple[int, str, str]],
+    current_ip: str,
+    concurrency: int,
+    failures: dict[int, Exception],
+    durations: dict[int, float],
+) -> Generator[int, None, None]:
+    """PATCH the stale A records on a bounded worker pool.
+
+    Yields the domain record id of each A record as soon as its update completes.
+    A records that fail to update are added to `failures`, keyed by domain record id.
+    How long each update took, retries included, is added to `durations`.
+
+    NOTE: only the API calls run on the workers; the sqlite connection is not
+      shareable across threads, so callers do the bookkeeping on their own thread.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending_updates = {
+            executor.submit(
+                _update_a_record, domain_record_id, domain_name, current_ip, durations
+            ): domain_record_id
+            for domain_record_id, domain_name, _ in stale_records
+        }
+        for future in as_completed(pending_updates):
+            error = future.exception()
+            if isinstance(error, requests.RequestException):
+                failures[pending_updates[future]] = error
+            elif error is not None:
+                raise error
+            else:
+                yield pending_updates[future]
+
+
+def _queue_pending_updates(failures: dict[int, Exception], failed_at: int) -> None:
+    """Queue the A records in `failures` to be retried first by the next update-ips run.
+
+    Runs in the caller's transaction.
+    """
+    get_connection().executemany(
+        "INSERT INTO pending_updates(domain_record_id, attempts, last_error, first_failed,"
+        "  last_failed) "
+        "values(:domain_record_id, 1, :last_error, :failed_at, :failed_at) "
+        "ON CONFLICT(domain_record_id) DO UPDATE SET "
+        "  attempts = attempts + 1, "
+        "  last_error = :last_error, "
+        "  last_failed = :failed_at",
+        [
+            {
+                "domain_record_id": domain_record_id,
+                "last_error": str(error),
+                "failed_at": failed_at,
+            }
+            for domain_record_id, error in failures.items()
+        ],
+    )
+
+
+def _observe_ip(current_ip: str, now: int, *, updated: int, failed: int) -> None:
+    """Append the run's public IP address to the history, and compact the older observations.
+
+    Runs in the caller's transaction.
+    """
+    conn = get_connection()
+    history.record_observation(
+        conn,
+        current_ip,
+        now,
+        records_updated=updated,
+        records_failed=failed,
+        propagated=not failed,
+    )
+    history.compact(conn, constants.HISTORY_KEEP, now)
 
-            cursor.execute(
-                "UPDATE subdomains "
-                "SET "
-                "  current_ip4 = :current_ip, "
-                "  last_updated = :now, "
-                "  last_checked = :now "
-                "WHERE domain_record_id = :domain_record_id",
+
+@timed("db.record_update_run")
+def _record_update_run(
+    current_ip: str,
+    current_records: list[int],
+    updated_records: list[int],
+    failures: dict[int, Exception],
+    listings: dict[str, list[dict[str, Any]]],
+) -> None:
+    """Write the bookkeeping for an update-ips run in a single transaction.
+
+    Args:
+        current_ip: The public IP address pushed by this run.
+        current_records: Domain record ids found to already be current.
+        updated_records: Domain record ids updated to `current_ip`.
+        failures: Errors for the domain record ids that could not be checked or updated.
+            These are queued in pending_updates to be retried first on the next run.
+        listings: The A records listed for each domain, to refresh the local mirror with.
+    """
+    conn = get_connection()
+    now = int(time.time())
+    with conn:
+        conn.execute(
+            "UPDATE subdomains "
+            "SET last_checked = :now "
+            "WHERE domain_record_id IN (SELECT value FROM json_each(:domain_record_ids))",
+            {"now": now, "domain_record_ids": json.dumps(current_records)},
+        )
+        conn.executemany(
+            "UPDATE subdomains "
+            "SET "
+            "  current_ip4 = :current_ip, "
+            "  last_updated = :now, "
+            "  last_checked = :now "
+            "WHERE domain_record_id = :domain_record_id",
+            [
                 {
                     "current_ip": current_ip,
                     "now": now,
                     "domain_record_id": domain_record_id,
-                },
-            )
-
-            conn.commit()
+                }
+                for domain_record_id in updated_records
+            ],
+        )
+        conn.execute(
+            "DELETE FROM pending_updates "
+            "WHERE domain_record_id IN (SELECT value FROM json_each(:domain_record_ids))",
+            {"domain_record_ids": json.dumps(current_records + updated_records)},
+        )
+        _queue_pending_updates(failures, now)
+        for domain_name, a_records in listings.items():
+            mirror.replace_a_records(domain_name, a_records, now)
+        mirror.set_a_records_data(updated_records, current_ip)
+        _observe_ip(current_ip, now, updated=len(updated_records), failed=len(failures))
+        if failures:
+            # Some A records may not point at current_ip; the next run must check them all.
+            conn.execute("DELETE FROM update_state")
         else:
-            cursor.execute(
-                "UPDATE subdomains "
-                "SET last_checked=:now "
-                "WHERE domain_record_id = :domain_record_id",
-                {
-                    "now": now,
-                    "domain_record_id": domain_record_id,
-                },
+            conn.execute(
+                "INSERT INTO update_state(id, last_ip4, last_verified) "
+                "values(1, :current_ip, :verified) "
+                "ON CONFLICT(id) DO UPDATE SET "
+                "  last_ip4 = :current_ip, "
+                "  last_verified = :verified",
+                {"current_ip": current_ip, "verified": now},
             )
-            conn.commit()
 
-    if updated is None:
+
+def _log_a_record_events(  # noqa: PLR0913
+    managed_records_by_domain: dict[str, list[int]],
+    stale_records: list[tuple[int, str, str]],
+    current_ip: str,
+    *,
+    updated_records: list[int],
+    failures: dict[int, Exception],
+    durations: dict[int, float],
+) -> None:
+    """Log an event for each A record updated, and print and log each failure (see events)."""
+    old_ips = {domain_record_id: old_ip for domain_record_id, _, old_ip in stale_records}
+    domain_names = {
+        domain_record_id: domain_name
+        for domain_name, domain_record_ids in managed_records_by_domain.items()
+        for domain_record_id in domain_record_ids
+    }
+
+    def event(domain_record_id: int, outcome: str, error: Exception | None = None) -> dict:
+        duration = durations.get(domain_record_id)
+        return {
+            "domain": domain_names[domain_record_id],
+            "record_id": domain_record_id,
+            "old_ip": old_ips.get(domain_record_id),
+            "new_ip": current_ip,
+            "duration_ms": None if duration is None else round(duration * 1000, 1),
+            "outcome": outcome,
+            "error": None if error is None else str(error),
+        }
+
+    for domain_record_id in updated_records:
+        logger.info(
+            "%s - Info : A record %s of %s updated from %s to %s",
+            time.strftime("%Y-%m-%d %H:%M"),
+            domain_record_id,
+            domain_names[domain_record_id],
+            old_ips[domain_record_id],
+            current_ip,
+            extra={"event": event(domain_record_id, "updated")},
+        )
+    for domain_record_id, error in failures.items():
+        msg = (
+            f"{time.strftime('%Y-%m-%d %H:%M')} - Error : "
+            f"A record {domain_record_id} could not be updated: {error}"
+        )
+        Console().print(msg, markup=False, highlight=False)
+        logger.error(msg, extra={"event": event(domain_record_id, "failed", error)})
+
+
+def update_all_managed_subdomains(args: Namespace) -> int:
+    """Update all managed subdomains to the current public IP address.
+
+    When the public IP matches the IP pushed by the last fully verified run, and that
+    run was less than ``verify_interval`` seconds ago, no Digital Ocean API calls are made.
+
+    A records are checked and updated independently: transient API errors are retried
+    with backoff, and A records that still fail are queued to be retried first on the
+    next run instead of stopping this one.
+
+    The run, and how long its IP lookup, API requests and database writes took, are
+    appended to the runs table, and exported for Prometheus if asked to (see metrics).
+
+    Args:
+        args: Parsed CLI arguments; expects a ``force`` boolean attribute,
+            a ``concurrency`` int attribute (the number of parallel A record updates),
+            a ``verify_interval`` int attribute (seconds), an ``ip_quorum`` int attribute
+            (the number of IP resolvers that must agree), a ``timings`` boolean attribute
+            (print the timings of the run) and a ``metrics_file`` Path attribute (where to
+            write the run's Prometheus metrics, or None).
+
+    Returns:
+        The exit status: 0 on success, 1 if any A record could not be checked or updated.
+    """
+    timings = get_timings()
+    timings.clear()
+    # None if the run stops on an unexpected error.
+    status = None
+    try:
+        status = _update_all_managed_subdomains(args)
+        return status
+    finally:
+        _record_run(args, timings, status)
+
+
+def _record_run(args: Namespace, timings: Timings, status: int | None) -> None:
+    """Save the run, export its metrics and print its timings, as asked for by `args`.
+
+    These are side effects for observing runs: an error in one of them is logged as a warning,
+    and never changes the outcome of the run. The metrics come from the saved run, so a run that
+    couldn't be saved isn't exported either.
+    """
+    try:
+        conn = get_connection()
+        save_run(conn, "update-ips", timings, status)
+        if args.metrics_file is not None:
+            metrics.write_textfile(args.metrics_file, conn, timings, status)
+    except Exception as e:
+        msg = f"{time.strftime('%Y-%m-%d %H:%M')} - Warning : could not record the run: {e}"
+        Console().print(msg, markup=False, highlight=False)
+        logger.warning(msg, exc_info=True)
+    if args.timings:
+        Console().print(timings_table(timings))
+
+
+def _update_all_managed_subdomains(args: Namespace) -> int:
+    """Run the update-ips pipeline; see update_all_managed_subdomains."""
+    force: bool = args.force
+    concurrency: int = args.concurrency
+    verify_interval: int = args.verify_interval
+    ip_quorum: int = args.ip_quorum
+    console = Console()
+
+    timings = get_timings()
+
+    managed_records_by_domain = _load_managed_a_records()
+    current_ip = get_ip(quorum=ip_quorum)
+    timings.public_ip = current_ip
+
+    if force is False and _is_verified_ip(current_ip, verify_interval):
+        with get_connection():
+            _observe_ip(current_ip, int(time.time()), updated=0, failed=0)
+        msg = time.strftime("%Y-%m-%d %H:%M") + " - Info : No updates necessary (IP unchanged)"
+        console.print(msg)
+        logger.info(msg)
+        return 0
+
+    failures: dict[int, Exception] = {}
+    listings: dict[str, list[dict[str, Any]]] = {}
+    current_records, stale_records = _find_stale_a_records(
+        managed_records_by_domain, current_ip, failures, listings, force=force
+    )
+
+    updated_records: list[int] = []
+    durations: dict[int, float] = {}
+    try:
+        updated_records.extend(
+            _update_a_records(stale_records, current_ip, concurrency, failures, durations)
+        )
+    finally:
+        # Includes the A records updated before any unexpected error.
+        _record_update_run(current_ip, current_records, updated_records, failures, listings)
+        timings.count("a_records_checked", len(current_records) + len(stale_records))
+        timings.count("a_records_updated", len(updated_records))
+        timings.count("a_records_failed", len(failures))
+
+    _log_a_record_events(
+        managed_records_by_domain,
+        stale_records,
+        current_ip,
+        updated_records=updated_records,
+        failures=failures,
+        durations=durations,
+    )
+
+    if failures:
+        msg = (
+            f"{time.strftime('%Y-%m-%d %H:%M')} - Error : "
+            f"{len(failures)} of {sum(map(len, managed_records_by_domain.values()))} A records "
+            f"could not be updated ({len(updated_records)} updated). "
+            "They will be retried first on the next run."
+        )
+        console.print(msg, markup=False, highlight=False)
+        logger.error(msg)
+        return 1
+
+    if not updated_records:
         msg = time.strftime("%Y-%m-%d %H:%M") + " - Info : No updates necessary"
         console.print(msg)
         logger.info(msg)
@@ -380,3 +952,4 @@ def update_all_managed_subdomains(args: Namespace) -> None:
         )
         console.print(msg)
         logger.info(msg)
+    return 0
@@ -0,0 +1,4 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Test doubles for exercising do_ddns without the real Digital Ocean API."""
@@ -0,0 +1,133 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""A local stand-in for the DNS servers asked by ``dns://`` IP resolvers.
+
+`FakeDNSServer` answers every A or TXT query on a local UDP port with `public_ip`, the way
+OpenDNS answers myip.opendns.com and Google o-o.myaddr.l.google.com::
+
+    with FakeDNSServer(public_ip="203.0.113.5") as fake:
+        ip.add_ip_server(fake.url("myip.opendns.com"), "4")
+
+Lost packets, error codes, truncated answers and the TXT strings around the address can be
+set up per server. Every query received is recorded in `queries`, as its (name, type).
+"""
+
+import socket
+import struct
+import threading
+from types import TracebackType
+from typing import Self
+
+from digital_ocean_dynamic_dns.dns_whoami import (
+    CLASS_IN,
+    FLAG_RESPONSE,
+    FLAG_TRUNCATED,
+    HEADER,
+    QUESTION,
+    RECORD,
+    TYPE_A,
+    TYPE_TXT,
+)
+
+# Seconds between checks for close() while waiting for a query.
+_POLL_INTERVAL = 0.05
+# A pointer to the name of the question, right after the header.
+_QUESTION_NAME_POINTER = 0xC000 | HEADER.size
+
+
+class FakeDNSServer:
+    """Answers DNS queries for any name with `public_ip`, from a local UDP port."""
+
+    def __init__(self, public_ip: str = "203.0.113.5") -> None:
+        """Bind a UDP port on localhost; start() answers the queries sent to it."""
+        self.public_ip = public_ip
+        # Queries to leave unanswered, as if the query or its answer was lost.
+        self.drop = 0
+        # The response code of the answers, e.g. 3 for NXDOMAIN.
+        self.rcode = 0
+        self.truncated = False
+        # TXT strings answered before the address.
+        self.txt_prefix: list[str] = []
+        self.queries: list[tuple[str, int]] = []
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.settimeout(_POLL_INTERVAL)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name="fake-dns", daemon=True)
+
+    @property
+    def port(self) -> int:
+        """The UDP port the server listens on."""
+        return self._sock.getsockname()[1]
+
+    def url(self, name: str = "myip.opendns.com", record_type: str = "A") -> str:
+        """Return the ``dns://`` IP resolver URL asking this server for `name`."""
+        return f"dns://127.0.0.1:{self.port}/{name}?type={record_type}"
+
+    def _answer_data(self, record_type: int) -> bytes:
+        if record_type == TYPE_A:
+            return socket.inet_aton(self.public_ip)
+        strings = [*self.txt_prefix, self.public_ip]
+        return b"".join(bytes([len(text)]) + text.encode() for text in strings)
+
+    def _response(self, query: bytes) -> bytes:
+        """Return the answer to `query`."""
+        query_id, flags, _, _, _, _ = HEADER.unpack_from(query)
+        labels = []
+        offset = HEADER.size
+        while length := query[offset]:
+            labels.append(query[offset + 1 : offset + 1 + length].decode())
+            offset += 1 + length
+        question_end = offset + 1 + QUESTION.size
+        record_type, _ = QUESTION.unpack_from(query, offset + 1)
+        self.queries.append((".".join(labels), record_type))
+
+        flags |= FLAG_RESPONSE | self.rcode | (FLAG_TRUNCATED if self.truncated else 0)
+        answers = b""
+        if not self.rcode and record_type in {TYPE_A, TYPE_TXT}:
+            data = self._answer_data(record_type)
+            answers = (
+                struct.pack("!H", _QUESTION_NAME_POINTER)
+                + RECORD.pack(record_type, CLASS_IN, 0, len(data))
+                + data
+            )
+        header = HEADER.pack(query_id, flags, 1, 1 if answers else 0, 0, 0)
+        return header + query[HEADER.size : question_end] + answers
+
+    def _serve(self) -> None:
+        while not self._stop.is_set():
+            try:
+                query, client = self._sock.recvfrom(512)
+            except TimeoutError:
+                continue
+            response = self._response(query)
+            if self.drop:
+                self.drop -= 1
+                continue
+            self._sock.sendto(response, client)
+
+    def start(self) -> Self:
+        """Start answering queries, from a background thread."""
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        """Stop answering queries, and close the port."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._sock.close()
+
+    def __enter__(self) -> Self:
+        """Start answering queries."""
+        return self.start()
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Stop answering queries."""
+        self.close()
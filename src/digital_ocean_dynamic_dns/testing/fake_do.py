@@ -0,0 +1,453 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""An in-process stand-in for the Digital Ocean DNS API.
+
+`FakeDigitalOcean` serves the endpoints do_api uses from a local HTTP server, so that
+update-ips, manage and the listing commands can be load tested and benchmarked against
+thousands of domains and A records without an account or network access::
+
+    with FakeDigitalOcean(latency=0.05) as fake:
+        fake.add_domain("example.com")
+        fake.add_a_records("example.com", ["@", "www"], "198.51.100.1")
+        client = DigitalOceanClient("token", base_url=fake.url)
+
+Point the whole CLI at it with the ``DIGITALOCEAN_API_URL`` environment variable, and at
+its ``/ip`` endpoint (which answers with `public_ip`) as the IP resolver.
+
+Supported: listing domains and A records (paginated like the real API, including the
+``type`` and ``name`` filters), looking up a domain, and getting, creating (POST) and
+updating (PATCH) A records. Latency, rate limiting (HTTP 429 with the ``ratelimit-*``
+and ``Retry-After`` headers) and failures can be configured or injected per request.
+Every request is counted by method and route in `request_counts`.
+"""
+
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from collections.abc import Iterable
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from types import TracebackType
+from typing import Any, Self
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+# The page size the real API uses when none is asked for, and the largest it allows.
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 200
+
+# Route templates, as counted in FakeDigitalOcean.request_counts, and their patterns.
+_ROUTES = {
+    "/v2/domains": re.compile(r"/v2/domains/?"),
+    "/v2/domains/{domain}": re.compile(r"/v2/domains/(?P<domain>[^/]+)"),
+    "/v2/domains/{domain}/records": re.compile(r"/v2/domains/(?P<domain>[^/]+)/records/?"),
+    "/v2/domains/{domain}/records/{id}": re.compile(
+        r"/v2/domains/(?P<domain>[^/]+)/records/(?P<id>\d+)"
+    ),
+    "/ip": re.compile(r"/ip"),
+}
+
+
+_NOT_FOUND = "The resource you were accessing could not be found."
+
+
+def _match_route(path: str) -> tuple[str | None, dict[str, str]]:
+    """Return the route template matching `path` and its parameters, or (None, {})."""
+    for route, pattern in _ROUTES.items():
+        match = pattern.fullmatch(path)
+        if match is not None:
+            return route, match.groupdict()
+    return None, {}
+
+
+class _Response:
+    """A status, JSON body and extra headers to send back."""
+
+    def __init__(
+        self,
+        status: HTTPStatus,
+        body: dict[str, Any] | str | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+def _error(status: HTTPStatus, message: str) -> _Response:
+    """Return an error response shaped like the real API's."""
+    return _Response(status, {"id": status.phrase.lower().replace(" ", "_"), "message": message})
+
+
+class FakeDigitalOcean:
+    """A local HTTP server that behaves like the Digital Ocean DNS API.
+
+    Thread-safe: requests are served concurrently, one thread per connection.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        latency: float = 0.0,
+        rate_limit: int | None = None,
+        rate_limit_window: float = 3600.0,
+        error_rate: float = 0.0,
+        public_ip: str = "203.0.113.7",
+        seed: int = 0,
+    ) -> None:
+        """Create (but don't start) the server.
+
+        Args:
+            latency: Seconds each API request takes to be answered.
+            rate_limit: Requests allowed per `rate_limit_window`; further requests are
+                answered with HTTP 429 until the window ends. Default: no rate limit,
+                and no ``ratelimit-*`` headers.
+            rate_limit_window: Length in seconds of a rate limit window.
+            error_rate: Fraction (0-1) of API requests answered with HTTP 500.
+            public_ip: The address the ``/ip`` endpoint answers with.
+            seed: Seeds the choice of the requests that fail at `error_rate`.
+        """
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.error_rate = error_rate
+        self.public_ip = public_ip
+        self.request_counts: Counter[str] = Counter()
+
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)  # noqa: S311
+        self._domains: dict[str, dict[str, Any]] = {}
+        self._records: dict[str, dict[int, dict[str, Any]]] = {}
+        self._record_ids = count(1)
+        self._injected_failures: deque[_Response] = deque()
+        self._window_started = time.time()
+        self._window_requests = 0
+
+        self._server = _Server(self)
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """The API root to give DigitalOceanClient as its base_url."""
+        return f"http://127.0.0.1:{self._server.server_port}/v2"
+
+    @property
+    def ip_url(self) -> str:
+        """The URL of an IP resolver answering with `public_ip`."""
+        return f"http://127.0.0.1:{self._server.server_port}/ip"
+
+    @property
+    def api_requests(self) -> int:
+        """The number of API requests served, i.e. excluding the IP resolver."""
+        return sum(n for route, n in self.request_counts.items() if not route.endswith(" /ip"))
+
+    def start(self) -> Self:
+        """Start serving requests in a background thread."""
+        # A short poll interval, so that close() returns promptly.
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        """Stop serving requests and release the port."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> Self:
+        """Start the server."""
+        return self.start()
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Stop the server."""
+        self.close()
+
+    def add_domain(self, name: str, ttl: int = 1800) -> None:
+        """Register the domain `name` with the account."""
+        with self._lock:
+            self._domains[name] = {"name": name, "ttl": ttl, "zone_file": ""}
+            self._records.setdefault(name, {})
+
+    def add_a_records(
+        self, domain: str, names: Iterable[str], data: str, ttl: int = 3600
+    ) -> list[dict[str, Any]]:
+        """Create an A record pointing at `data` for each of `names` under `domain`.
+
+        Returns:
+            The A records created, as the API would list them.
+        """
+        with self._lock:
+            return [self._create_record(domain, "A", name, data, ttl) for name in names]
+
+    def a_records(self, domain: str) -> list[dict[str, Any]]:
+        """Return a copy of every A record of `domain`."""
+        with self._lock:
+            return [
+                dict(record) for record in self._records[domain].values() if record["type"] == "A"
+            ]
+
+    def fail_next(
+        self,
+        status: HTTPStatus = HTTPStatus.INTERNAL_SERVER_ERROR,
+        count: int = 1,
+        retry_after: float | None = None,
+    ) -> None:
+        """Answer the next `count` API requests with `status`, whatever they ask for.
+
+        Args:
+            status: The HTTP status to answer with.
+            count: The number of requests to fail.
+            retry_after: Sent as the Retry-After header, e.g. with HTTP 429.
+        """
+        headers = {} if retry_after is None else {"Retry-After": f"{retry_after:g}"}
+        failures = [
+            _Response(
+                status,
+                {"id": "injected", "message": f"Injected {status.value} {status.phrase}"},
+                dict(headers),
+            )
+            for _ in range(count)
+        ]
+        with self._lock:
+            self._injected_failures.extend(failures)
+
+    def _create_record(
+        self, domain: str, record_type: str, name: str, data: str, ttl: int
+    ) -> dict[str, Any]:
+        """Add a record to `domain`. The caller holds the lock."""
+        record = {
+            "id": next(self._record_ids),
+            "type": record_type,
+            "name": name,
+            "data": data,
+            "priority": None,
+            "port": None,
+            "ttl": ttl,
+            "weight": None,
+            "flags": None,
+            "tag": None,
+        }
+        self._records[domain][record["id"]] = record
+        return dict(record)
+
+    def _rate_limit_headers(self) -> tuple[bool, dict[str, str]]:
+        """Spend one request of the rate limit budget. The caller holds the lock.
+
+        Returns:
+            Whether the request is allowed, and the ``ratelimit-*`` headers to send.
+        """
+        if self.rate_limit is None:
+            return True, {}
+        now = time.time()
+        if now - self._window_started >= self.rate_limit_window:
+            self._window_started = now
+            self._window_requests = 0
+        reset = self._window_started + self.rate_limit_window
+        allowed = self._window_requests < self.rate_limit
+        self._window_requests += allowed
+        headers = {
+            "ratelimit-limit": str(self.rate_limit),
+            "ratelimit-remaining": str(self.rate_limit - self._window_requests),
+            "ratelimit-reset": str(math.ceil(reset)),
+        }
+        if not allowed:
+            headers["Retry-After"] = str(max(math.ceil(reset - now), 1))
+        return allowed, headers
+
+    def handle(
+        self, method: str, path: str, query: dict[str, list[str]], body: dict[str, Any] | None
+    ) -> _Response:
+        """Answer one request, applying the configured latency, rate limit and failures."""
+        route, params = _match_route(path)
+        if route is None:
+            with self._lock:
+                self.request_counts[f"{method} {path}"] += 1
+            return _error(HTTPStatus.NOT_FOUND, _NOT_FOUND)
+
+        with self._lock:
+            self.request_counts[f"{method} {route}"] += 1
+        if route == "/ip":
+            return _Response(HTTPStatus.OK, self.public_ip)
+
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            allowed, headers = self._rate_limit_headers()
+            if not allowed:
+                response = _error(HTTPStatus.TOO_MANY_REQUESTS, "API Rate limit exceeded.")
+            elif self._injected_failures:
+                response = self._injected_failures.popleft()
+            elif self.error_rate and self._random.random() < self.error_rate:
+                response = _error(HTTPStatus.INTERNAL_SERVER_ERROR, "Server Error")
+            else:
+                response = self._route(method, route, params, query, body)
+        response.headers = {**headers, **response.headers}
+        return response
+
+    def _route(  # noqa: PLR0911
+        self,
+        method: str,
+        route: str,
+        params: dict[str, str],
+        query: dict[str, list[str]],
+        body: dict[str, Any] | None,
+    ) -> _Response:
+        """Answer an API request. The caller holds the lock."""
+        domain = params.get("domain")
+        if domain is not None and domain not in self._domains:
+            return _error(HTTPStatus.NOT_FOUND, _NOT_FOUND)
+
+        match method, route:
+            case "GET", "/v2/domains":
+                return self._page("/v2/domains", "domains", list(self._domains.values()), query)
+            case "GET", "/v2/domains/{domain}":
+                return _Response(HTTPStatus.OK, {"domain": self._domains[domain]})
+            case "GET", "/v2/domains/{domain}/records":
+                return self._list_records(domain, query)
+            case "POST", "/v2/domains/{domain}/records":
+                return self._post_record(domain, body)
+            case "GET", "/v2/domains/{domain}/records/{id}":
+                record = self._records[domain].get(int(params["id"]))
+                if record is None:
+                    return _error(HTTPStatus.NOT_FOUND, _NOT_FOUND)
+                return _Response(HTTPStatus.OK, {"domain_record": record})
+            case "PATCH", "/v2/domains/{domain}/records/{id}":
+                return self._patch_record(domain, int(params["id"]), body)
+        return _error(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not allowed on {route}")
+
+    def _list_records(self, domain: str, query: dict[str, list[str]]) -> _Response:
+        records = list(self._records[domain].values())
+        if "type" in query:
+            records = [record for record in records if record["type"] == query["type"][0]]
+        if "name" in query:
+            # Filtered by the fully qualified name; "@" records have the domain's name.
+            name = query["name"][0].removesuffix(domain).removesuffix(".") or "@"
+            records = [record for record in records if record["name"] in {name, f"{name}."}]
+        return self._page(
+            f"/v2/domains/{domain}/records",
+            "domain_records",
+            records,
+            query,
+            filters={key: values[0] for key, values in query.items() if key in {"type", "name"}},
+        )
+
+    def _post_record(self, domain: str, body: dict[str, Any] | None) -> _Response:
+        if body is None or not {"type", "name", "data"} <= body.keys():
+            return _error(HTTPStatus.UNPROCESSABLE_ENTITY, "type, name and data are required")
+        record = self._create_record(
+            domain, body["type"], body["name"], body["data"], body.get("ttl", 1800)
+        )
+        return _Response(HTTPStatus.CREATED, {"domain_record": record})
+
+    def _patch_record(
+        self, domain: str, domain_record_id: int, body: dict[str, Any] | None
+    ) -> _Response:
+        record = self._records[domain].get(domain_record_id)
+        if record is None:
+            return _error(HTTPStatus.NOT_FOUND, _NOT_FOUND)
+        if body is None:
+            return _error(HTTPStatus.UNPROCESSABLE_ENTITY, "A JSON body is required")
+        if body.get("type", record["type"]) != record["type"]:
+            return _error(HTTPStatus.UNPROCESSABLE_ENTITY, "The record type can't be changed")
+        record.update({key: body[key] for key in ("name", "data", "ttl") if key in body})
+        return _Response(HTTPStatus.OK, {"domain_record": dict(record)})
+
+    def _page(
+        self,
+        path: str,
+        key: str,
+        items: list[dict[str, Any]],
+        query: dict[str, list[str]],
+        filters: dict[str, str] | None = None,
+    ) -> _Response:
+        """Return one page of `items`, with the real API's ``links`` and ``meta``."""
+        try:
+            page = max(int(query.get("page", ["1"])[0]), 1)
+            per_page = min(max(int(query.get("per_page", [DEFAULT_PER_PAGE])[0]), 1), MAX_PER_PAGE)
+        except ValueError:
+            return _error(HTTPStatus.BAD_REQUEST, "page and per_page must be integers")
+        last_page = max(math.ceil(len(items) / per_page), 1)
+
+        def page_url(number: int) -> str:
+            params = {**(filters or {}), "page": number, "per_page": per_page}
+            return f"{self.url.removesuffix('/v2')}{path}?{urlencode(params)}"
+
+        pages = {}
+        if page > 1:
+            pages |= {"first": page_url(1), "prev": page_url(page - 1)}
+        if page < last_page:
+            pages |= {"next": page_url(page + 1), "last": page_url(last_page)}
+        start = (page - 1) * per_page
+        return _Response(
+            HTTPStatus.OK,
+            {
+                key: [dict(item) for item in items[start : start + per_page]],
+                "links": {"pages": pages} if pages else {},
+                "meta": {"total": len(items)},
+            },
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Hands each request to the FakeDigitalOcean owning the server."""
+
+    # Keep-alive, as do_api pools its connections.
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def _dispatch(self) -> None:
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+
+        fake = self.server.fake
+        if url.path != "/ip" and not self.headers.get("Authorization", "").startswith("Bearer "):
+            response = _error(HTTPStatus.UNAUTHORIZED, "Unable to authenticate you")
+        else:
+            try:
+                body = json.loads(raw_body) if raw_body else None
+            except json.JSONDecodeError:
+                response = _error(HTTPStatus.BAD_REQUEST, "The request body is not valid JSON")
+            else:
+                response = fake.handle(self.command, url.path, parse_qs(url.query), body)
+
+        if isinstance(response.body, str):
+            payload, content_type = response.body.encode(), "text/plain"
+        else:
+            payload, content_type = json.dumps(response.body).encode(), "application/json"
+        self.send_response(response.status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PATCH = _dispatch  # noqa: N815
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002, ANN401
+        """Don't log every request to stderr."""
+
+
+class _Server(ThreadingHTTPServer):
+    """Serves one FakeDigitalOcean on a free local port, one thread per connection."""
+
+    daemon_threads = True
+
+    def __init__(self, fake: FakeDigitalOcean) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.fake = fake
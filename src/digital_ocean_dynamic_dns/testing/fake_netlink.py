@@ -0,0 +1,103 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""A stand-in for the rtnetlink socket watched by ``daemon --watch-netlink``.
+
+`FakeNetlink` is a pair of connected datagram sockets: `socket` takes the place of the one
+netlink.open_socket returns, and each address added or removed is sent to it as the message
+the kernel would send::
+
+    with FakeNetlink() as fake:
+        mocker.patch.object(netlink, "open_socket", return_value=fake.socket)
+        fake.add_address("203.0.113.5", label="eth0")
+
+The messages can also be built on their own, e.g. for netlink.parse_address_changes, with
+address_message and netlink_message.
+"""
+
+import socket
+from ipaddress import IPv4Address
+from types import TracebackType
+from typing import Self
+
+from digital_ocean_dynamic_dns.netlink import (
+    IFA_ADDRESS,
+    IFA_LABEL,
+    IFA_LOCAL,
+    IFADDRMSG,
+    NLMSG_HEADER,
+    RT_SCOPE_UNIVERSE,
+    RTATTR,
+    RTM_DELADDR,
+    RTM_NEWADDR,
+)
+
+
+def rtattr(kind: int, data: bytes) -> bytes:
+    """Return an rtattr of `kind` holding `data`, padded to the netlink alignment."""
+    attribute = RTATTR.pack(RTATTR.size + len(data), kind) + data
+    return attribute.ljust((len(attribute) + 3) & ~3, b"\0")
+
+
+def netlink_message(kind: int, payload: bytes) -> bytes:
+    """Return a netlink message of `kind` holding `payload`."""
+    return NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload), kind, 0, 0, 0) + payload
+
+
+def address_message(
+    address: str,
+    *,
+    added: bool = True,
+    scope: int = RT_SCOPE_UNIVERSE,
+    interface_index: int = 2,
+    label: str | None = "eth0",
+) -> bytes:
+    """Return the RTM_NEWADDR, or RTM_DELADDR, message the kernel sends for an IPv4 address."""
+    packed = IPv4Address(address).packed
+    attributes = rtattr(IFA_ADDRESS, packed) + rtattr(IFA_LOCAL, packed)
+    if label is not None:
+        attributes += rtattr(IFA_LABEL, label.encode() + b"\0")
+    payload = IFADDRMSG.pack(socket.AF_INET, 24, 0, scope, interface_index) + attributes
+    return netlink_message(RTM_NEWADDR if added else RTM_DELADDR, payload)
+
+
+class FakeNetlink:
+    """Sends the messages of the kernel about address changes to `socket`."""
+
+    def __init__(self) -> None:
+        """Create the pair of sockets."""
+        self.socket, self._kernel = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def send(self, *messages: bytes) -> None:
+        """Send `messages` to `socket`, as one batch."""
+        self._kernel.send(b"".join(messages))
+
+    def add_address(self, address: str, *, interface_index: int = 2, label: str = "eth0") -> None:
+        """Announce `address` added to the interface `interface_index`, named `label`."""
+        self.send(address_message(address, interface_index=interface_index, label=label))
+
+    def remove_address(
+        self, address: str, *, interface_index: int = 2, label: str = "eth0"
+    ) -> None:
+        """Announce `address` removed from the interface `interface_index`, named `label`."""
+        self.send(
+            address_message(address, added=False, interface_index=interface_index, label=label)
+        )
+
+    def close(self) -> None:
+        """Close both sockets."""
+        self.socket.close()
+        self._kernel.close()
+
+    def __enter__(self) -> Self:
+        """Return self."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close both sockets."""
+        self.close()
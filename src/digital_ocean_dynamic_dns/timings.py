@@ -0,0 +1,252 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Per-operation timings of the update-ips pipeline.
+
+The IP lookup, every request to the Digital Ocean API and the database writes record how
+long they took in the process-wide `Timings` (see get_timings). Recording a sample costs
+a clock read and a list append, so it is always on: each update-ips run saves the count,
+total and p50/p95/max latency of each operation to the ``runs`` and ``run_timings`` tables,
+and ``update-ips --timings`` also prints them.
+
+Alongside the timings, a run counts the HTTP status of each API request and its own totals
+(e.g. A records updated), which the metrics module exports.
+
+While tracing (see Timings.start_tracing), each timed operation is also kept as a span, with
+when it started and on which thread, for ``do_ddns --trace-events`` (see the profiling module).
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import cache, wraps
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import sqlite3
+    from collections.abc import Callable, Generator
+
+    from rich.table import Table
+
+
+@dataclass(frozen=True)
+class OperationStats:
+    """The latency of one operation over a run, in seconds."""
+
+    operation: str
+    count: int
+    total: float
+    p50: float
+    p95: float
+    max: float
+
+
+@dataclass(frozen=True)
+class TraceSpan:
+    """One timed operation, with its start and end in `time.perf_counter` seconds."""
+
+    operation: str
+    start: float
+    end: float
+    thread_id: int
+    thread_name: str
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """Return the nearest-rank percentile of the sorted, non-empty `samples`."""
+    return samples[max(math.ceil(fraction * len(samples)), 1) - 1]
+
+
+class Timings:
+    """Collects how long each operation took over a run.
+
+    Thread-safe; the A records are checked and updated from a worker pool.
+    """
+
+    def __init__(self) -> None:
+        """Start collecting for a run beginning now."""
+        self._lock = threading.Lock()
+        self._samples: defaultdict[str, list[float]] = defaultdict(list)
+        self._statuses: Counter[tuple[str, str]] = Counter()
+        self._counts: Counter[str] = Counter()
+        # The spans traced since start_tracing, or None when not tracing. Unlike the samples,
+        # they outlive clear(): a trace covers every run of the daemon.
+        self._spans: list[TraceSpan] | None = None
+        # The public IP address the run found, once it has looked it up.
+        self.public_ip: str | None = None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+
+    def clear(self) -> None:
+        """Forget everything collected, and start collecting for a run beginning now."""
+        with self._lock:
+            self._samples.clear()
+            self._statuses.clear()
+            self._counts.clear()
+            self.public_ip = None
+            self.started_at = time.time()
+            self._started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the run began."""
+        return time.perf_counter() - self._started
+
+    def record(self, operation: str, seconds: float) -> None:
+        """Note that `operation` took `seconds`."""
+        with self._lock:
+            self._samples[operation].append(seconds)
+
+    def record_status(self, operation: str, status: str) -> None:
+        """Count one response to `operation`, e.g. "200", or "error" when there was none."""
+        with self._lock:
+            self._statuses[operation, status] += 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        """Add `n` to the run's total of `name`, e.g. "a_records_updated"."""
+        with self._lock:
+            self._counts[name] += n
+
+    def start_tracing(self) -> None:
+        """Keep each operation timed from now on as a span, until stop_tracing."""
+        with self._lock:
+            self._spans = []
+
+    def stop_tracing(self) -> list[TraceSpan]:
+        """Stop tracing; return the spans traced since start_tracing, in the order they ended."""
+        with self._lock:
+            spans, self._spans = self._spans or [], None
+        return spans
+
+    def statuses(self) -> dict[tuple[str, str], int]:
+        """Return the number of responses to each operation, by (operation, status)."""
+        with self._lock:
+            return dict(self._statuses)
+
+    def counts(self) -> dict[str, int]:
+        """Return the run's totals, by name."""
+        with self._lock:
+            return dict(self._counts)
+
+    @contextmanager
+    def measure(self, operation: str) -> Generator[None, None, None]:
+        """Time the body of the with statement as one sample of `operation`.
+
+        Failed attempts are timed too: a slow error is still time spent.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ended = time.perf_counter()
+            self.record(operation, ended - started)
+            if self._spans is not None:
+                thread = threading.current_thread()
+                span = TraceSpan(operation, started, ended, thread.ident or 0, thread.name)
+                with self._lock:
+                    if self._spans is not None:
+                        self._spans.append(span)
+
+    def stats(self) -> list[OperationStats]:
+        """Return the latency of each operation, the most time consuming first."""
+        with self._lock:
+            samples = {operation: sorted(times) for operation, times in self._samples.items()}
+        stats = [
+            OperationStats(
+                operation=operation,
+                count=len(times),
+                total=math.fsum(times),
+                p50=percentile(times, 0.5),
+                p95=percentile(times, 0.95),
+                max=times[-1],
+            )
+            for operation, times in samples.items()
+        ]
+        return sorted(stats, key=lambda op: op.total, reverse=True)
+
+
+@cache
+def get_timings() -> Timings:
+    """Return the timings shared by the whole process."""
+    return Timings()
+
+
+def timed[**P, T](operation: str) -> Callable[[Callable[P, T]], Callable[P, T]]:
+    """Decorate a function so that each call is timed as a sample of `operation`."""
+
+    def decorator(function: Callable[P, T]) -> Callable[P, T]:
+        @wraps(function)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            with get_timings().measure(operation):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def save_run(
+    conn: sqlite3.Connection, command: str, timings: Timings, exit_status: int | None
+) -> None:
+    """Append a run of `command`, and the timings of its operations, to the database.
+
+    Args:
+        conn: The read-write database connection.
+        command: The subcommand that ran, e.g. "update-ips".
+        timings: The timings collected over the run.
+        exit_status: The run's exit status, or None if it stopped on an unexpected error.
+    """
+    with conn:
+        run_id = conn.execute(
+            "INSERT INTO runs(command, started_at, duration_ms, exit_status) "
+            "values(:command, :started_at, :duration_ms, :exit_status)",
+            {
+                "command": command,
+                "started_at": int(timings.started_at),
+                "duration_ms": timings.elapsed * 1000,
+                "exit_status": exit_status,
+            },
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO run_timings(run_id, operation, count, total_ms, p50_ms, p95_ms, max_ms) "
+            "values(:run_id, :operation, :count, :total_ms, :p50_ms, :p95_ms, :max_ms)",
+            [
+                {
+                    "run_id": run_id,
+                    "operation": op.operation,
+                    "count": op.count,
+                    "total_ms": op.total * 1000,
+                    "p50_ms": op.p50 * 1000,
+                    "p95_ms": op.p95 * 1000,
+                    "max_ms": op.max * 1000,
+                }
+                for op in timings.stats()
+            ],
+        )
+
+
+def timings_table(timings: Timings) -> Table:
+    """Return the timings of a run as a table, in milliseconds."""
+    # Only --timings needs rich's tables; ip-resolver-config imports this module too.
+    from rich.table import Table  # noqa: PLC0415
+
+    table = Table(
+        title="Timings",
+        caption=f"The run took {timings.elapsed * 1000:.1f} ms",
+        highlight=True,
+    )
+    table.add_column("Operation")
+    for column in ("Count", "Total (ms)", "p50 (ms)", "p95 (ms)", "Max (ms)"):
+        table.add_column(column, justify="right")
+    for op in timings.stats():
+        table.add_row(
+            op.operation,
+            str(op.count),
+            *(f"{seconds * 1000:.1f}" for seconds in (op.total, op.p50, op.p95, op.max)),
+        )
+    return table
@@ -11,8 +11,9 @@ import pytest
 import pytest_mock
 import responses
 
-from digital_ocean_dynamic_dns import domains, ip, manage, subdomains
-from digital_ocean_dynamic_dns.database import connect_database
+from digital_ocean_dynamic_dns import constants, do_api, ip
+from digital_ocean_dynamic_dns.database import get_connection, get_read_only_connection
+from digital_ocean_dynamic_dns.testing.fake_do import FakeDigitalOcean
 
 
 @pytest.fixture
@@ -33,22 +34,24 @@ def temp_database_path(tmp_path: Path) -> Path:
 def mock_db_for_test(
     temp_database_path: Path,
     mocker: pytest_mock.MockerFixture,
-) -> sqlite3.Connection:
-    """Mock connection object to have a per-test connection / database.
+) -> Generator[sqlite3.Connection, None, None]:
+    """Point the shared connection at a per-test database.
 
     Ensures isolation of the database state between tests.
 
-    In this module we have to mock out the conn objects everywhere they are created
-      in order to ensure all modules/functions are using the same databases.
-
+    Every module gets its connection from database.get_connection, so pointing the
+      database path at a temporary file (and forgetting the cached connections) is enough.
     """
-    test_specific_conn = connect_database(temp_database_path)
-    mocker.patch.object(domains, "conn", test_specific_conn)
-    mocker.patch.object(subdomains, "conn", test_specific_conn)
-    mocker.patch.object(ip, "conn", test_specific_conn)
-    mocker.patch.object(manage, "conn", test_specific_conn)
-
-    return test_specific_conn
+    mocker.patch.object(constants, "database_path", temp_database_path)
+    get_connection.cache_clear()
+    get_read_only_connection.cache_clear()
+    test_specific_conn = get_connection()
+    yield test_specific_conn
+    if get_read_only_connection.cache_info().currsize:
+        get_read_only_connection().close()
+    get_read_only_connection.cache_clear()
+    get_connection.cache_clear()
+    test_specific_conn.close()
 
 
 @pytest.fixture
@@ -76,3 +79,35 @@ def preload_api_key(
 def clear_local_env_var_for_test(monkeypatch: pytest.MonkeyPatch) -> None:
     """Ensure that the tests aren't infected by local env vars."""
     monkeypatch.delenv("DIGITALOCEAN_TOKEN", raising=False)
+    monkeypatch.delenv(do_api.PER_PAGE_ENV_VAR, raising=False)
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_do_api_client() -> Generator[None, None, None]:
+    """Ensure each test starts without a cached, shared Digital Ocean API client."""
+    do_api._get_client_for.cache_clear()  # noqa: SLF001
+    do_api.get_rate_limiter.cache_clear()
+    yield
+    do_api._get_client_for.cache_clear()  # noqa: SLF001
+    do_api.get_rate_limiter.cache_clear()
+
+
+@pytest.fixture
+def fake() -> Generator[FakeDigitalOcean, None, None]:
+    """Serve a fake API with one domain of three A records."""
+    with FakeDigitalOcean() as fake:
+        fake.add_domain("example.com")
+        fake.add_a_records("example.com", ["@", "www", "blog"], "198.51.100.1")
+        yield fake
+
+
+@pytest.fixture
+def cli_on_fake(
+    fake: FakeDigitalOcean,
+    preload_api_key: str,  # noqa: ARG001
+    monkeypatch: pytest.MonkeyPatch,
+) -> FakeDigitalOcean:
+    """Point the whole CLI, IP resolution included, at the fake API."""
+    monkeypatch.setenv(do_api.API_BASE_URL_ENV_VAR, fake.url)
+    ip.config_ip_server(fake.ip_url, "4")
+    return fake
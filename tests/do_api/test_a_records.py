@@ -17,7 +17,7 @@ class TestGetARecords:
     """We can retrieve all A records for the provided domain."""
 
     # Constants common to get_a_records()
-    PAGE_RESULTS_LIMIT = 20
+    PAGE_RESULTS_LIMIT = 200
 
     def test_single_page(
         self,
@@ -194,7 +194,7 @@ class TestGetARecordsByName:
     """
 
     # Constants common to get_a_record_by_name()
-    PAGE_RESULTS_LIMIT = 20
+    PAGE_RESULTS_LIMIT = 200
 
     def test_single_page(
         self,
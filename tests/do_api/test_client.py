@@ -0,0 +1,313 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the pooled DigitalOceanClient and the shared client accessor."""
+
+from sqlite3 import Connection
+from typing import Any, Literal
+
+import pytest
+import requests
+from pytest_mock import MockerFixture
+from requests.adapters import HTTPAdapter
+from responses import RequestsMock, matchers
+
+from digital_ocean_dynamic_dns import do_api
+
+
+class TestDigitalOceanClient:
+    """The client owns a pooled session with pre-built auth headers."""
+
+    def test_session_headers_built_once(self) -> None:
+        """Authentication headers live on the session, not on each request."""
+        client = do_api.DigitalOceanClient("sentinel-api-key")  # pragma: allowlist secret
+
+        assert client.session.headers["Authorization"] == "Bearer sentinel-api-key"
+        assert client.session.headers["Content-Type"] == "application/json"
+
+    def test_sized_connection_pool(self) -> None:
+        """The https adapter is sized by pool_maxsize."""
+        expected_pool_maxsize = 4
+        client = do_api.DigitalOceanClient(
+            "sentinel-api-key",  # pragma: allowlist secret
+            pool_maxsize=expected_pool_maxsize,
+        )
+
+        adapter = client.session.get_adapter(do_api.API_BASE_URL)
+        assert isinstance(adapter, HTTPAdapter)
+        assert adapter._pool_maxsize == expected_pool_maxsize  # noqa: SLF001
+
+    def test_session_reused_across_calls(
+        self,
+        mocked_responses: RequestsMock,
+        preload_api_key: Literal["sentinel-api-key"],
+    ) -> None:
+        """Module-level helpers all go through the same shared client session."""
+        expected_domain = "example.com"
+        mocked_responses.get(
+            url=f"https://api.digitalocean.com/v2/domains/{expected_domain}",
+            match=[matchers.header_matcher({"Authorization": "Bearer " + preload_api_key})],
+        )
+        mocked_responses.get(
+            url=f"https://api.digitalocean.com/v2/domains/{expected_domain}/records/1",
+            json={"domain_record": {"id": 1}},
+        )
+
+        do_api.verify_domain_is_registered(expected_domain)
+        first_client = do_api.get_client()
+        do_api.get_a_record("1", expected_domain)
+
+        assert do_api.get_client() is first_client
+
+
+class TestGetClient:
+    """The shared client tracks the configured API key."""
+
+    def test_new_client_for_new_api_key(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """Changing DIGITALOCEAN_TOKEN yields a client with the new credentials."""
+        monkeypatch.setenv("DIGITALOCEAN_TOKEN", "first-api-key")  # pragma: allowlist secret
+        first_client = do_api.get_client()
+        assert do_api.get_client() is first_client
+
+        monkeypatch.setenv("DIGITALOCEAN_TOKEN", "second-api-key")  # pragma: allowlist secret
+        second_client = do_api.get_client()
+
+        assert second_client is not first_client
+        assert second_client.session.headers["Authorization"] == "Bearer second-api-key"
+
+
+@pytest.mark.usefixtures("preload_api_key")
+class TestRateLimitedRequests:
+    """Rate limited (HTTP 429) requests are retried when the API says when to."""
+
+    def test_retry_after(
+        self,
+        mocked_responses: RequestsMock,
+        mocker: MockerFixture,
+    ) -> None:
+        """Sleep for Retry-After seconds, then retry."""
+        expected_domain = "example.com"
+        url = f"https://api.digitalocean.com/v2/domains/{expected_domain}/records/1"
+        mocked_sleep = mocker.patch.object(do_api.time, "sleep", autospec=True)
+        mocked_responses.get(url=url, status=429, headers={"Retry-After": "2"})
+        mocked_responses.get(url=url, json={"domain_record": {"id": 1}})
+
+        domain_record = do_api.get_a_record("1", expected_domain)
+
+        assert domain_record == {"id": 1}
+        mocked_sleep.assert_called_once_with(2.0)
+        assert len(mocked_responses.calls) == 2  # noqa: PLR2004
+
+    def test_retry_wait_too_long(
+        self,
+        mocked_responses: RequestsMock,
+        mocker: MockerFixture,
+    ) -> None:
+        """Give up immediately when asked to wait longer than max_retry_wait."""
+        expected_domain = "example.com"
+        mocked_sleep = mocker.patch.object(do_api.time, "sleep", autospec=True)
+        mocked_responses.get(
+            url=f"https://api.digitalocean.com/v2/domains/{expected_domain}/records/1",
+            status=429,
+            headers={"Retry-After": str(do_api.DigitalOceanClient.max_retry_wait + 1)},
+        )
+
+        with pytest.raises(requests.HTTPError, match=r"429"):
+            do_api.get_a_record("1", expected_domain)
+
+        mocked_sleep.assert_not_called()
+
+    def test_retries_exhausted(
+        self,
+        mocked_responses: RequestsMock,
+        mocker: MockerFixture,
+    ) -> None:
+        """Raise once max_retries retries have also been rate limited."""
+        expected_domain = "example.com"
+        mocked_sleep = mocker.patch.object(do_api.time, "sleep", autospec=True)
+        mocked_responses.get(
+            url=f"https://api.digitalocean.com/v2/domains/{expected_domain}/records/1",
+            status=429,
+            headers={"Retry-After": "1"},
+        )
+
+        with pytest.raises(requests.HTTPError, match=r"429"):
+            do_api.get_a_record("1", expected_domain)
+
+        assert mocked_sleep.call_count == do_api.DigitalOceanClient.max_retries
+        assert len(mocked_responses.calls) == do_api.DigitalOceanClient.max_retries + 1
+
+
+@pytest.mark.usefixtures("preload_api_key")
+def test_rate_limit_budget_saved(
+    mocked_responses: RequestsMock,
+    mock_db_for_test: Connection,
+) -> None:
+    """The budget reported by the API is saved for the next invocation."""
+    do_api.save_rate_limit_budget()
+    # Nothing to save before any request was made.
+    assert mock_db_for_test.execute("select * from rate_limit_buckets").fetchall() == []
+
+    expected_domain = "example.com"
+    mocked_responses.get(
+        url=f"https://api.digitalocean.com/v2/domains/{expected_domain}/records/1",
+        json={"domain_record": {"id": 1}},
+        headers={"ratelimit-limit": "5000", "ratelimit-remaining": "4321"},
+    )
+    do_api.get_a_record("1", expected_domain)
+    do_api.save_rate_limit_budget()
+
+    row = mock_db_for_test.execute(
+        "select tokens from rate_limit_buckets where name = 'hourly'"
+    ).fetchone()
+    assert row["tokens"] == 4321  # noqa: PLR2004
+
+
+@pytest.mark.usefixtures("preload_api_key")
+class TestPagination:
+    """Listing endpoints fetch the remaining pages concurrently once the page count is known."""
+
+    DOMAIN = "example.com"
+    URL = f"https://api.digitalocean.com/v2/domains/{DOMAIN}/records"
+
+    @staticmethod
+    def records(first_id: int, count: int) -> list[dict[str, int]]:
+        """Build `count` distinct domain records."""
+        return [{"id": x} for x in range(first_id, first_id + count)]
+
+    def test_invalid_per_page(self) -> None:
+        """per_page is bounded by the API maximum."""
+        with pytest.raises(ValueError, match=r"per_page"):
+            do_api.DigitalOceanClient(
+                "sentinel-api-key",  # pragma: allowlist secret
+                per_page=do_api.MAX_PER_PAGE + 1,
+            )
+
+    def test_last_page_from_links(self, mocked_responses: RequestsMock) -> None:
+        """links.pages.last determines which pages to fetch; pages are yielded in order."""
+        per_page = 2
+        client = do_api.DigitalOceanClient(
+            "sentinel-api-key",  # pragma: allowlist secret
+            per_page=per_page,
+        )
+        for page in (1, 2, 3):
+            params = {"type": "A", "per_page": per_page}
+            if page > 1:
+                params["page"] = page
+            mocked_responses.get(
+                url=self.URL,
+                match=[matchers.query_param_matcher(params)],
+                json={
+                    "domain_records": self.records((page - 1) * per_page, per_page),
+                    "links": {"pages": {"last": f"{self.URL}?page=3&per_page={per_page}"}},
+                },
+            )
+
+        domain_records = list(client.get_a_records(self.DOMAIN))
+
+        assert domain_records == self.records(0, 3 * per_page)
+
+    def test_single_page_total(self, mocked_responses: RequestsMock) -> None:
+        """A full first page is the only page when meta.total says so."""
+        per_page = 2
+        client = do_api.DigitalOceanClient(
+            "sentinel-api-key",  # pragma: allowlist secret
+            per_page=per_page,
+        )
+        mocked_responses.get(
+            url=self.URL,
+            match=[matchers.query_param_matcher({"type": "A", "per_page": per_page})],
+            json={"domain_records": self.records(0, per_page), "meta": {"total": per_page}},
+        )
+
+        assert list(client.get_a_records(self.DOMAIN)) == self.records(0, per_page)
+
+    def test_no_pagination_metadata(self, mocked_responses: RequestsMock) -> None:
+        """Without links/meta, pages are walked until a short page appears."""
+        per_page = 2
+        client = do_api.DigitalOceanClient(
+            "sentinel-api-key",  # pragma: allowlist secret
+            per_page=per_page,
+        )
+        mocked_responses.get(
+            url=self.URL,
+            match=[matchers.query_param_matcher({"type": "A", "per_page": per_page})],
+            json={"domain_records": self.records(0, per_page)},
+        )
+        mocked_responses.get(
+            url=self.URL,
+            match=[matchers.query_param_matcher({"type": "A", "per_page": per_page, "page": 2})],
+            json={"domain_records": self.records(per_page, 1)},
+        )
+
+        assert list(client.get_a_records(self.DOMAIN)) == self.records(0, per_page + 1)
+
+    @pytest.mark.parametrize(
+        "meta",
+        [
+            pytest.param({"meta": {"total": 5}}, id="meta-total"),
+            pytest.param({}, id="sequential-walk"),
+        ],
+    )
+    @pytest.mark.parametrize("last", ["?per_page=2", "?page=last&per_page=2"])
+    def test_last_page_url_without_page(
+        self, mocked_responses: RequestsMock, meta: dict[str, Any], last: str
+    ) -> None:
+        """A links.pages.last URL without a page number falls back to meta, then to a walk."""
+        per_page = 2
+        client = do_api.DigitalOceanClient(
+            "sentinel-api-key",  # pragma: allowlist secret
+            per_page=per_page,
+        )
+        for page, count in ((1, per_page), (2, per_page), (3, 1)):
+            params = {"type": "A", "per_page": per_page}
+            if page > 1:
+                params["page"] = page
+            mocked_responses.get(
+                url=self.URL,
+                match=[matchers.query_param_matcher(params)],
+                json={
+                    "domain_records": self.records((page - 1) * per_page, count),
+                    "links": {"pages": {"last": f"{self.URL}{last}"}},
+                    **meta,
+                },
+            )
+
+        assert list(client.get_a_records(self.DOMAIN)) == self.records(0, 2 * per_page + 1)
+
+    def mock_listing(self, mocked_responses: RequestsMock, per_page: int) -> None:
+        """Answer a listing of the A records of DOMAIN asked for `per_page` at a time."""
+        mocked_responses.get(
+            url=self.URL,
+            match=[matchers.query_param_matcher({"type": "A", "per_page": per_page})],
+            json={"domain_records": self.records(0, 1), "meta": {"total": 1}},
+        )
+
+    @pytest.mark.usefixtures("mock_db_for_test")
+    def test_per_page_setting(
+        self, mocked_responses: RequestsMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """DO_DDNS_PER_PAGE sets the page size of the shared client."""
+        monkeypatch.setenv(do_api.PER_PAGE_ENV_VAR, "50")
+        self.mock_listing(mocked_responses, 50)
+
+        assert list(do_api.get_a_records(self.DOMAIN)) == self.records(0, 1)
+
+    @pytest.mark.parametrize("setting", ["0", "201", "many"])
+    @pytest.mark.usefixtures("mock_db_for_test")
+    def test_invalid_per_page_setting(
+        self,
+        mocked_responses: RequestsMock,
+        monkeypatch: pytest.MonkeyPatch,
+        capsys: pytest.CaptureFixture[str],
+        setting: str,
+    ) -> None:
+        """A page size that isn't from 1 to MAX_PER_PAGE is ignored with a warning."""
+        monkeypatch.setenv(do_api.PER_PAGE_ENV_VAR, setting)
+        self.mock_listing(mocked_responses, do_api.MAX_PER_PAGE)
+
+        assert list(do_api.get_a_records(self.DOMAIN)) == self.records(0, 1)
+        assert f"Ignoring {do_api.PER_PAGE_ENV_VAR}" in capsys.readouterr().out
@@ -17,7 +17,7 @@ class TestGetAllDomains:
     """Retrieve all domains associated with an account."""
 
     # Constants common to get_all_domains()
-    PAGE_RESULTS_LIMIT = 20
+    PAGE_RESULTS_LIMIT = 200
 
     def test_no_upstream_domains(
         self,
@@ -3,9 +3,8 @@
 
 """Tests for domain management functions."""
 
-import datetime as dt
+import time
 from sqlite3 import Connection
-from unittest.mock import call
 
 import pytest
 from pytest_mock import MockerFixture
@@ -47,16 +46,9 @@ class TestManageDomain:
             row = cursor.fetchone()
             assert row["name"] == expected_new_domain
             assert row["id"] == 1
-            now = dt.datetime.now(tz=dt.UTC).astimezone()
-            local_tz = now.tzinfo
-            assert (
-                dt.datetime.strptime(row["cataloged"], "%Y-%m-%d %H:%M").replace(tzinfo=local_tz)
-                <= now
-            )
-            assert (
-                dt.datetime.strptime(row["last_managed"], "%Y-%m-%d %H:%M").replace(tzinfo=local_tz)
-                <= now
-            )
+            now = int(time.time())
+            assert row["cataloged"] <= now
+            assert row["last_managed"] <= now
 
         # Validate: Ensure user was informed.
         captured_output = capsys.readouterr()
@@ -84,7 +76,7 @@ class TestManageDomain:
         # Arrange: inject the domain directly into the table before
         # calling the function under test.
         with mock_db_for_test:
-            update_datetime = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+            update_datetime = int(time.time())
             mock_db_for_test.execute(
                 "INSERT INTO domains(name, cataloged, last_managed) "
                 " values(:name, :cataloged, :last_managed)",
@@ -130,15 +122,10 @@ def test_manage_all_existing_a_records(
     mocked_get_a_records = mocker.patch.object(domains.do_api, "get_a_records", autospec=True)
     mocked_get_a_records.return_value = existing_a_records
 
-    mocked_managed_subdomain = mocker.patch.object(domains, "manage_subdomain", autospec=True)
+    mocked_manage_a_records = mocker.patch.object(domains, "manage_a_records", autospec=True)
 
     domains.manage_all_existing_a_records(expected_domain)
 
+    # One listing, handed over as-is; no lookups per A record.
     mocked_get_a_records.assert_called_once_with(expected_domain)
-
-    if not existing_a_records:
-        mocked_managed_subdomain.assert_not_called()
-    else:
-        mocked_managed_subdomain.assert_has_calls(
-            [call(subdomain=x["name"], domain=expected_domain) for x in existing_a_records]
-        )
+    mocked_manage_a_records.assert_called_once_with(expected_domain, existing_a_records)
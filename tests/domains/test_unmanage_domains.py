@@ -3,7 +3,7 @@
 
 """Tests for the un_manage_domain function."""
 
-import datetime as dt
+import time
 from sqlite3 import Connection
 
 import pytest
@@ -59,7 +59,7 @@ class TestUnManageDomain:
         # Arrange: inject the domain directly into the table before
         # calling the function under test.
         with mock_db_for_test:
-            update_datetime = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+            update_datetime = int(time.time())
             mock_db_for_test.execute(
                 "INSERT INTO domains(name, cataloged, last_managed) "
                 " values(:name, :cataloged, :last_managed)",
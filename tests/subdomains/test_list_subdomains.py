@@ -3,7 +3,7 @@
 
 """Tests for listing subdomains / A records via the subdomains module."""
 
-from datetime import UTC, datetime
+import time
 from sqlite3 import Connection
 from typing import Literal
 
@@ -18,7 +18,7 @@ from digital_ocean_dynamic_dns import subdomains
 # Fixtures all tests in this module will use.
 pytestmark = pytest.mark.usefixtures("mock_db_for_test", "mocked_responses")
 
-PAGE_RESULTS_LIMIT = 20
+PAGE_RESULTS_LIMIT = 200
 
 
 def test_domain_not_registered(
@@ -219,7 +219,7 @@ class TestManagedDomain:
             top_domain_id = mock_db_for_test.execute(
                 "select id from domains where name = ?", (added_top_domain,)
             ).fetchone()["id"]
-            now = datetime.now(tz=UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+            now = int(time.time())
             mock_db_for_test.execute(
                 "INSERT INTO subdomains("
                 "   domain_record_id,"
@@ -325,7 +325,7 @@ class TestManagedDomain:
             top_domain_id = mock_db_for_test.execute(
                 "select id from domains where name = ?", (added_top_domain,)
             ).fetchone()["id"]
-            now = datetime.now(tz=UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+            now = int(time.time())
             for domain_record in expected_domain_records:
                 mock_db_for_test.execute(
                     "INSERT INTO subdomains("
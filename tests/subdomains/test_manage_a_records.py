@@ -0,0 +1,202 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for managing existing A records in bulk."""
+
+import time
+from sqlite3 import Connection
+from unittest.mock import MagicMock, call
+
+import pytest
+import requests
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import subdomains
+from digital_ocean_dynamic_dns.subdomains import do_api
+
+pytestmark = pytest.mark.usefixtures("mocked_responses")
+
+CURRENT_IP = "203.0.113.7"
+OLD_IP = "198.51.100.1"
+
+
+@pytest.fixture
+def mocked_get_ip(mocker: MockerFixture) -> MagicMock:
+    """Mock the public IP lookup."""
+    mocked_get_ip = mocker.patch.object(subdomains, "get_ip", autospec=True)
+    mocked_get_ip.return_value = CURRENT_IP
+    return mocked_get_ip
+
+
+@pytest.fixture
+def mocked_api(mocker: MockerFixture) -> dict[str, MagicMock]:
+    """Mock the per-record Digital Ocean API calls."""
+    return {
+        name: mocker.patch.object(do_api, name, autospec=True)
+        for name in ("update_a_record", "get_a_record_by_name", "create_a_record")
+    }
+
+
+def a_record(domain_record_id: int, name: str, data: str) -> dict[str, object]:
+    """Return an A record as listed by the Digital Ocean API."""
+    return {"id": domain_record_id, "type": "A", "name": name, "data": data, "ttl": 3600}
+
+
+def managed_subdomains(conn: Connection) -> dict[str, tuple[int, str]]:
+    """Return the (domain record id, current IP) of each managed subdomain, by name."""
+    return {
+        row["name"]: (row["domain_record_id"], row["current_ip4"])
+        for row in conn.execute("SELECT * FROM subdomains WHERE managed = 1")
+    }
+
+
+@pytest.mark.usefixtures("added_top_domain")
+def test_bulk_import(
+    mocked_get_ip: MagicMock,
+    mocked_api: dict[str, MagicMock],
+    mock_db_for_test: Connection,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """The IP is resolved once, and only the A records not pointing at it are PATCHed."""
+    a_records = [
+        a_record(1, "@", CURRENT_IP),
+        a_record(2, "www", OLD_IP),
+        a_record(3, "blog", OLD_IP),
+        # A second A record with a name already seen is left alone.
+        a_record(4, "www", OLD_IP),
+        # Not in simple form.
+        a_record(5, "*", OLD_IP),
+    ]
+
+    subdomains.manage_a_records("example.com", a_records)
+
+    mocked_get_ip.assert_called_once_with()
+    mocked_api["update_a_record"].assert_has_calls(
+        [
+            call(domain_record_id=2, domain="example.com", new_ip_address=CURRENT_IP),
+            call(domain_record_id=3, domain="example.com", new_ip_address=CURRENT_IP),
+        ],
+        any_order=True,
+    )
+    assert mocked_api["update_a_record"].call_count == 2  # noqa: PLR2004
+    mocked_api["get_a_record_by_name"].assert_not_called()
+    mocked_api["create_a_record"].assert_not_called()
+
+    assert managed_subdomains(mock_db_for_test) == {
+        "@": (1, CURRENT_IP),
+        "www": (2, CURRENT_IP),
+        "blog": (3, CURRENT_IP),
+    }
+    row = mock_db_for_test.execute("SELECT * FROM subdomains WHERE domain_record_id = 1").fetchone()
+    assert row["last_checked"] <= int(time.time())
+    # Already pointing at the IP, so not updated.
+    assert row["last_updated"] is None
+
+    output = " ".join(capsys.readouterr().out.split())
+    assert "Skipping *" in output
+    assert "3 A records for example.com are now managed (2 updated" in output
+
+
+@pytest.mark.usefixtures("added_top_domain")
+def test_already_managed_skipped(
+    mocked_get_ip: MagicMock,
+    mocked_api: dict[str, MagicMock],
+    mock_db_for_test: Connection,
+) -> None:
+    """Importing the same A records again is a no-op, without resolving the IP."""
+    a_records = [a_record(1, "@", OLD_IP), a_record(2, "www", OLD_IP)]
+    subdomains.manage_a_records("example.com", a_records)
+    mocked_get_ip.reset_mock()
+    mocked_api["update_a_record"].reset_mock()
+
+    subdomains.manage_a_records("example.com", a_records)
+
+    mocked_get_ip.assert_not_called()
+    mocked_api["update_a_record"].assert_not_called()
+    assert len(managed_subdomains(mock_db_for_test)) == 2  # noqa: PLR2004
+
+
+@pytest.mark.usefixtures("added_top_domain", "mocked_get_ip")
+def test_failed_update_queued(
+    mocked_api: dict[str, MagicMock],
+    mock_db_for_test: Connection,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """An A record that fails to update is still managed, and queued for update-ips."""
+
+    def update_a_record(domain_record_id: int, **_: str) -> None:
+        if domain_record_id == 2:  # noqa: PLR2004
+            msg = "422 Unprocessable Entity"
+            raise requests.HTTPError(msg)
+
+    mocked_api["update_a_record"].side_effect = update_a_record
+
+    subdomains.manage_a_records(
+        "example.com", [a_record(1, "@", OLD_IP), a_record(2, "www", OLD_IP)]
+    )
+
+    assert managed_subdomains(mock_db_for_test) == {
+        "@": (1, CURRENT_IP),
+        "www": (2, OLD_IP),
+    }
+    pending = mock_db_for_test.execute("SELECT * FROM pending_updates").fetchall()
+    assert [(row["domain_record_id"], row["last_error"]) for row in pending] == [
+        (2, "422 Unprocessable Entity")
+    ]
+    assert "A record 2 could not be updated" in capsys.readouterr().out
+
+
+def test_top_domain_not_managed(mocked_get_ip: MagicMock) -> None:
+    """The top domain must be managed first."""
+    with pytest.raises(subdomains.TopDomainNotManagedError):
+        subdomains.manage_a_records("example.com", [a_record(1, "@", OLD_IP)])
+
+    mocked_get_ip.assert_not_called()
+
+
+@pytest.mark.usefixtures("added_top_domain", "mocked_get_ip")
+@pytest.mark.parametrize(
+    ("listed_ip", "updated"),
+    [
+        pytest.param(CURRENT_IP, False, id="ip-unchanged"),
+        pytest.param(OLD_IP, True, id="ip-updated"),
+    ],
+)
+def test_remanaged(
+    mocked_api: dict[str, MagicMock],
+    mock_db_for_test: Connection,
+    listed_ip: str,
+    *,
+    updated: bool,
+) -> None:
+    """A record managed again keeps its last update time, unless updated now, and its new IP."""
+    subdomains.manage_a_records("example.com", [a_record(1, "@", OLD_IP)])
+    mock_db_for_test.execute(
+        "UPDATE subdomains SET managed = 0, current_ip4 = ?, last_updated = 1234", (OLD_IP,)
+    )
+    mock_db_for_test.commit()
+    mocked_api["update_a_record"].reset_mock()
+
+    subdomains.manage_a_records("example.com", [a_record(1, "@", listed_ip)])
+
+    assert mocked_api["update_a_record"].called is updated
+    assert managed_subdomains(mock_db_for_test) == {"@": (1, CURRENT_IP)}
+    row = mock_db_for_test.execute("SELECT * FROM subdomains WHERE domain_record_id = 1").fetchone()
+    assert (row["last_updated"] != 1234) is updated  # noqa: PLR2004
+
+
+@pytest.mark.usefixtures("added_top_domain", "mocked_get_ip", "mocked_api")
+def test_already_managed_counted_from_listing(capsys: pytest.CaptureFixture[str]) -> None:
+    """Only the A records listed that are already managed are counted as such."""
+    subdomains.manage_a_records(
+        "example.com", [a_record(1, "@", CURRENT_IP), a_record(2, "www", CURRENT_IP)]
+    )
+    capsys.readouterr()
+
+    subdomains.manage_a_records(
+        "example.com", [a_record(1, "@", CURRENT_IP), a_record(3, "blog", CURRENT_IP)]
+    )
+
+    output = " ".join(capsys.readouterr().out.split())
+    assert "1 A records for example.com are already managed." in output
+    assert "1 A records for example.com are now managed" in output
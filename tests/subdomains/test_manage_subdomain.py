@@ -3,7 +3,7 @@
 
 """Tests for the manage_subdomain functionality."""
 
-import datetime as dt
+import time
 from sqlite3 import Connection
 
 import pytest
@@ -111,7 +111,7 @@ def test_side_effects(
     # Arrange: Insert expected_domain into the db
     # as a managed domain.
     with mock_db_for_test:
-        update_datetime = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+        update_datetime = int(time.time())
         mock_db_for_test.execute(
             "INSERT INTO domains(name, cataloged, last_managed) "
             " values(:name, :cataloged, :last_managed)",
@@ -154,10 +154,10 @@ def test_side_effects(
     # Validate: inserted values.
     assert row["current_ip4"] == expected_ip4_address
     assert row["domain_record_id"] == expected_domain_record_id
-    _now_str = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
-    assert row["cataloged"] <= _now_str
-    assert row["last_checked"] <= _now_str
-    assert row["last_updated"] <= _now_str
+    _now = int(time.time())
+    assert row["cataloged"] <= _now
+    assert row["last_checked"] <= _now
+    assert row["last_updated"] <= _now
     assert row["main_id"] == 1  # expected id from domains.id
 
     # Validate user output
@@ -228,7 +228,7 @@ def test_claim_existing_a_record(
     # Arrange: Insert expected_domain into the db
     # as a managed domain.
     with mock_db_for_test:
-        update_datetime = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+        update_datetime = int(time.time())
         mock_db_for_test.execute(
             "INSERT INTO domains(name, cataloged, last_managed) "
             " values(:name, :cataloged, :last_managed)",
@@ -275,10 +275,10 @@ def test_claim_existing_a_record(
     # Validate: inserted values.
     assert row["current_ip4"] == expected_ip4_address
     assert row["domain_record_id"] == expected_domain_record_id
-    _now_str = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
-    assert row["cataloged"] <= _now_str
-    assert row["last_checked"] <= _now_str
-    assert row["last_updated"] <= _now_str
+    _now = int(time.time())
+    assert row["cataloged"] <= _now
+    assert row["last_checked"] <= _now
+    assert row["last_updated"] <= _now
     assert row["main_id"] == 1  # expected id from domains.id
 
     # Validate user output
@@ -318,7 +318,7 @@ def test_subdomain_already_managed(
     )
 
     with mock_db_for_test:
-        update_datetime = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+        update_datetime = int(time.time())
         # Arrange: Insert expected_domain into the db
         # as a managed domain.
         mock_db_for_test.execute(
@@ -330,7 +330,7 @@ def test_subdomain_already_managed(
                 "last_managed": update_datetime,
             },
         )
-        now = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+        now = int(time.time())
         # Arrange: Insert expected_subdomain into the db
         # as a managed subdomain.
         mock_db_for_test.execute(
@@ -3,7 +3,7 @@
 
 """Tests for the un_manage_subdomain function."""
 
-import datetime as dt
+import time
 from sqlite3 import Connection
 
 import pytest
@@ -72,7 +72,7 @@ def test_side_effects(
     # Arrange: Insert expected_domain into the db
     # as a managed domain.
     with mock_db_for_test:
-        update_datetime = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+        update_datetime = int(time.time())
         mock_db_for_test.execute(
             "INSERT INTO domains(name, cataloged, last_managed) "
             " values(:name, :cataloged, :last_managed)",
@@ -138,10 +138,10 @@ def test_side_effects(
     # Validate: inserted values.
     assert row["current_ip4"] == expected_ip4_address
     assert row["domain_record_id"] == expected_domain_record_id
-    now = dt.datetime.now(tz=dt.UTC).astimezone()
-    assert dt.datetime.strptime(row["cataloged"], "%Y-%m-%d %H:%M").astimezone() <= now
-    assert dt.datetime.strptime(row["last_checked"], "%Y-%m-%d %H:%M").astimezone() <= now
-    assert dt.datetime.strptime(row["last_updated"], "%Y-%m-%d %H:%M").astimezone() <= now
+    now = int(time.time())
+    assert row["cataloged"] <= now
+    assert row["last_checked"] <= now
+    assert row["last_updated"] <= now
     assert row["main_id"] == 1  # expected id from domains.id
     assert row["managed"] == 0
 
@@ -178,7 +178,7 @@ def test_subdomain_not_managed(
     expected_ip4_address = "127.0.0.1"
 
     with mock_db_for_test:
-        update_datetime = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+        update_datetime = int(time.time())
         # Arrange: Insert expected_domain into the db
         # as a managed domain.
         mock_db_for_test.execute(
@@ -190,7 +190,7 @@ def test_subdomain_not_managed(
                 "last_managed": update_datetime,
             },
         )
-        now = dt.datetime.now(tz=dt.UTC).astimezone().strftime("%Y-%m-%d %H:%M")
+        now = int(time.time())
         # Arrange: Insert expected_subdomain into the db
         # as an un-managed subdomain.
         mock_db_for_test.execute(
@@ -3,13 +3,15 @@
 
 """Tests for updating A records for all managed subdomains."""
 
+import threading
 from sqlite3 import Connection
-from unittest.mock import call
+from unittest.mock import MagicMock, call
 
 import pytest
+import requests
 from pytest_mock import MockerFixture
 
-from digital_ocean_dynamic_dns import args, ip, subdomains
+from digital_ocean_dynamic_dns import args, domains, ip, subdomains
 
 # Fixtures all tests in this module will use.
 pytestmark = pytest.mark.usefixtures("mock_db_for_test")
@@ -127,26 +129,28 @@ class TestUpdateAllManagedSubdomains:
             "update_a_record",
             autospec=True,
         )
-        # Arrange (3): Mock the get_a_record method
+        # Arrange (3): Mock the get_a_records method
         # so we can configure it's return values.
         # NOTE: This is how we create the situation under test.
         # i.e. this is what determines the IPs are current and don't need updating.
 
         # We expect this because all subdomains are marked as unmanaged.
-        mocked_get_a_record = mocker.patch.object(
+        mocked_get_a_records = mocker.patch.object(
             subdomains.do_api,
-            "get_a_record",
+            "get_a_records",
             autospec=True,
         )
-        mocked_get_a_record.side_effect = [
+        mocked_get_a_records.return_value = [
             {
                 "id": expected_domain_record_ids[0],
                 "type": "A",
+                "name": "@",
                 "data": expected_ip_address,
             },
             {
                 "id": expected_domain_record_ids[1],
                 "type": "A",
+                "name": "support",
                 "data": expected_ip_address,
             },
         ]
@@ -161,19 +165,9 @@ class TestUpdateAllManagedSubdomains:
         # Validate: Reported "No updates necessary"
         assert "No updates necessary" in cap_errout.out
 
-        # Validate that calls were made to check the current A record values.
-        mocked_get_a_record.assert_has_calls(
-            [
-                call(
-                    domain_record_id=expected_domain_record_ids[0],
-                    domain=added_top_domain,
-                ),
-                call(
-                    domain_record_id=expected_domain_record_ids[1],
-                    domain=added_top_domain,
-                ),
-            ]
-        )
+        # Validate: the current A record values were checked with a single listing
+        # for the domain, rather than one lookup per managed A record.
+        mocked_get_a_records.assert_called_once_with(added_top_domain)
         # Validate: update_a_record function was not called.
         mocked_update_a_record.assert_not_called()
 
@@ -229,26 +223,28 @@ class TestUpdateAllManagedSubdomains:
             "update_a_record",
             autospec=True,
         )
-        # Arrange (3): Mock the get_a_record method
+        # Arrange (3): Mock the get_a_records method
         # so we can configure it's return values.
         # NOTE: This is how we create the situation under test.
         # i.e. this is what determines that one of the IP addresses needs
         #   to be updated.
 
-        mocked_get_a_record = mocker.patch.object(
+        mocked_get_a_records = mocker.patch.object(
             subdomains.do_api,
-            "get_a_record",
+            "get_a_records",
             autospec=True,
         )
-        mocked_get_a_record.side_effect = [
+        mocked_get_a_records.return_value = [
             {
                 "id": expected_domain_record_ids[0],
                 "type": "A",
+                "name": "@",
                 "data": expected_ip_address,
             },
             {
                 "id": expected_domain_record_ids[1],
                 "type": "A",
+                "name": "support",
                 # NOTE: data is intentionally stale (differs from expected_ip_address)
                 "data": "127.0.0.2",
             },
@@ -264,19 +260,9 @@ class TestUpdateAllManagedSubdomains:
         # Validate: Reported "Updates done."
         assert "Updates done." in cap_errout.out
 
-        # Validate that calls were made to check the current A record values.
-        mocked_get_a_record.assert_has_calls(
-            [
-                call(
-                    domain_record_id=expected_domain_record_ids[0],
-                    domain=added_top_domain,
-                ),
-                call(
-                    domain_record_id=expected_domain_record_ids[1],
-                    domain=added_top_domain,
-                ),
-            ]
-        )
+        # Validate: the current A record values were checked with a single listing
+        # for the domain, rather than one lookup per managed A record.
+        mocked_get_a_records.assert_called_once_with(added_top_domain)
         # Validate: update_a_record function was called once for
         # the second subdomain
         mocked_update_a_record.assert_called_once_with(
@@ -355,27 +341,29 @@ class TestUpdateAllManagedSubdomains:
             "update_a_record",
             autospec=True,
         )
-        # Arrange (3): Mock the get_a_record method
+        # Arrange (3): Mock the get_a_records method
         # so we can configure it's return values.
         # NOTE: This is how we create the situation under test.
         # i.e. this is what determines that all of the IP addresses need
         #   to be updated.
 
-        mocked_get_a_record = mocker.patch.object(
+        mocked_get_a_records = mocker.patch.object(
             subdomains.do_api,
-            "get_a_record",
+            "get_a_records",
             autospec=True,
         )
-        mocked_get_a_record.side_effect = [
+        mocked_get_a_records.return_value = [
             {
                 "id": expected_domain_record_ids[0],
                 "type": "A",
+                "name": "@",
                 # NOTE: data is intentionally stale (differs from expected_ip_address)
                 "data": "127.0.0.2",
             },
             {
                 "id": expected_domain_record_ids[1],
                 "type": "A",
+                "name": "support",
                 # NOTE: data is intentionally stale (differs from expected_ip_address)
                 "data": "127.0.0.2",
             },
@@ -391,19 +379,9 @@ class TestUpdateAllManagedSubdomains:
         # Validate: Reported "Updates done."
         assert "Updates done." in cap_errout.out
 
-        # Validate that calls were made to check the current A record values.
-        mocked_get_a_record.assert_has_calls(
-            [
-                call(
-                    domain_record_id=expected_domain_record_ids[0],
-                    domain=added_top_domain,
-                ),
-                call(
-                    domain_record_id=expected_domain_record_ids[1],
-                    domain=added_top_domain,
-                ),
-            ]
-        )
+        # Validate: the current A record values were checked with a single listing
+        # for the domain, rather than one lookup per managed A record.
+        mocked_get_a_records.assert_called_once_with(added_top_domain)
         # Validate: update_a_record function was called for
         # both subdomains
         mocked_update_a_record.assert_has_calls(
@@ -480,25 +458,27 @@ class TestUpdateAllManagedSubdomains:
             "update_a_record",
             autospec=True,
         )
-        # Arrange (3): Mock the get_a_record method
+        # Arrange (3): Mock the get_a_records method
         # so we can configure it's return values.
         # NOTE: This is how we create the situation under test.
         # i.e. this is what determines the IPs are current and don't need updating.
 
-        mocked_get_a_record = mocker.patch.object(
+        mocked_get_a_records = mocker.patch.object(
             subdomains.do_api,
-            "get_a_record",
+            "get_a_records",
             autospec=True,
         )
-        mocked_get_a_record.side_effect = [
+        mocked_get_a_records.return_value = [
             {
                 "id": expected_domain_record_ids[0],
                 "type": "A",
+                "name": "@",
                 "data": expected_ip_address,
             },
             {
                 "id": expected_domain_record_ids[1],
                 "type": "A",
+                "name": "support",
                 "data": expected_ip_address,
             },
         ]
@@ -515,19 +495,9 @@ class TestUpdateAllManagedSubdomains:
         # Validate: Reported "Updates done."
         assert "Updates done." in cap_errout.out
 
-        # Validate that calls were made to check the current A record values.
-        mocked_get_a_record.assert_has_calls(
-            [
-                call(
-                    domain_record_id=expected_domain_record_ids[0],
-                    domain=added_top_domain,
-                ),
-                call(
-                    domain_record_id=expected_domain_record_ids[1],
-                    domain=added_top_domain,
-                ),
-            ]
-        )
+        # Validate: the current A record values were checked with a single listing
+        # for the domain, rather than one lookup per managed A record.
+        mocked_get_a_records.assert_called_once_with(added_top_domain)
 
         # Validate: update_a_record function was called for
         # both subdomains
@@ -551,3 +521,597 @@ class TestUpdateAllManagedSubdomains:
         assert len(rows) != 0
         for subdomain in rows:
             assert subdomain["current_ip4"] == expected_ip_address
+
+    def test_one_listing_per_domain(
+        self,
+        added_top_domain: str,
+        mock_db_for_test: Connection,
+        mocker: MockerFixture,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """Managed A records are grouped by domain; each domain is listed exactly once."""
+        # Arrange (1): Manage a second top domain alongside added_top_domain.
+        # NOTE: inserted directly; added_top_domain already mocks verify_domain_is_registered.
+        second_top_domain = "example.org"
+        with mock_db_for_test:
+            mock_db_for_test.execute(
+                "INSERT INTO domains(name, cataloged) values(?, 0)", (second_top_domain,)
+            )
+
+        # Arrange (2): Two subdomains for each top domain.
+        expected_ip_address = "127.0.0.1"
+        managed_a_records = {
+            (added_top_domain, "@"): 10_001,
+            (added_top_domain, "support"): 10_002,
+            (second_top_domain, "@"): 20_001,
+            (second_top_domain, "support"): 20_002,
+        }
+        mocked_create_a_record = mocker.patch.object(
+            subdomains.do_api, "create_a_record", autospec=True
+        )
+        mocked_create_a_record.side_effect = list(managed_a_records.values())
+        mocker.patch.object(
+            subdomains.do_api, "get_a_record_by_name", autospec=True
+        ).return_value = []
+        mocked_get_ip = mocker.patch.object(subdomains, "get_ip", autospec=True)
+        mocked_get_ip.side_effect = [
+            *["127.0.0.2"] * len(managed_a_records),  # initial IP values; manage subdomains.
+            expected_ip_address,  # Update all managed subdomains get_ip() call.
+        ]
+        for subdomain, domain in ((k[1], k[0]) for k in managed_a_records):
+            subdomains.manage_subdomain(subdomain, domain)
+
+        # Arrange (3): Only 20_002 is stale remotely.
+        remote_a_records = {
+            added_top_domain: [
+                {"id": 10_001, "type": "A", "name": "www", "data": expected_ip_address},
+                {"id": 10_002, "type": "A", "name": "www", "data": expected_ip_address},
+                # Unmanaged A records in the same domain are ignored.
+                {"id": 10_003, "type": "A", "name": "www", "data": "127.0.0.3"},
+            ],
+            second_top_domain: [
+                {"id": 20_001, "type": "A", "name": "www", "data": expected_ip_address},
+                {"id": 20_002, "type": "A", "name": "www", "data": "127.0.0.2"},
+            ],
+        }
+        mocked_get_a_records = mocker.patch.object(
+            subdomains.do_api, "get_a_records", autospec=True
+        )
+        mocked_get_a_records.side_effect = lambda domain: remote_a_records[domain]
+        mocked_get_a_record = mocker.patch.object(subdomains.do_api, "get_a_record", autospec=True)
+        mocked_update_a_record = mocker.patch.object(
+            subdomains.do_api, "update_a_record", autospec=True
+        )
+
+        parser = args.setup_argparse()
+        test_args = parser.parse_args(args=["update-ips"])
+        test_args.func(test_args)
+
+        assert "Updates done." in capsys.readouterr().out
+
+        # Validate: one listing per domain, no per-record lookups.
+        assert mocked_get_a_records.call_count == len(remote_a_records)
+        mocked_get_a_records.assert_has_calls(
+            [call(added_top_domain), call(second_top_domain)], any_order=True
+        )
+        mocked_get_a_record.assert_not_called()
+
+        # Validate: only the stale A record was updated.
+        mocked_update_a_record.assert_called_once_with(
+            domain_record_id=20_002,
+            domain=second_top_domain,
+            new_ip_address=expected_ip_address,
+        )
+        row = mock_db_for_test.execute(
+            "select current_ip4 from subdomains where domain_record_id = 20002"
+        ).fetchone()
+        assert row["current_ip4"] == expected_ip_address
+
+    def test_a_record_missing_from_listing(
+        self,
+        added_top_domain: str,
+        mocker: MockerFixture,
+    ) -> None:
+        """A managed A record absent from its domain's listing is looked up directly."""
+        expected_domain_record_id = 10_001
+        expected_ip_address = "127.0.0.1"
+
+        mocker.patch.object(
+            subdomains.do_api, "create_a_record", autospec=True
+        ).return_value = expected_domain_record_id
+        mocker.patch.object(
+            subdomains.do_api, "get_a_record_by_name", autospec=True
+        ).return_value = []
+        mocker.patch.object(subdomains, "get_ip", autospec=True).return_value = expected_ip_address
+        subdomains.manage_subdomain("@", added_top_domain)
+
+        mocker.patch.object(subdomains.do_api, "get_a_records", autospec=True).return_value = []
+        mocked_get_a_record = mocker.patch.object(subdomains.do_api, "get_a_record", autospec=True)
+        mocked_get_a_record.side_effect = requests.HTTPError("404 Client Error: Not Found")
+
+        parser = args.setup_argparse()
+        test_args = parser.parse_args(args=["update-ips"])
+        assert test_args.func(test_args) == 1
+
+        mocked_get_a_record.assert_called_once_with(
+            domain_record_id=expected_domain_record_id,
+            domain=added_top_domain,
+        )
+
+    def test_concurrent_updates(
+        self,
+        added_top_domain: str,
+        mock_db_for_test: Connection,
+        mocker: MockerFixture,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """With --concurrency N, up to N A record updates are in flight at once."""
+        expected_concurrency = 2
+        expected_domain_record_ids = [10_001, 10_002, 10_003, 10_004]
+        expected_ip_address = "127.0.0.1"
+
+        mocked_create_a_record = mocker.patch.object(
+            subdomains.do_api, "create_a_record", autospec=True
+        )
+        mocked_create_a_record.side_effect = expected_domain_record_ids
+        mocker.patch.object(
+            subdomains.do_api, "get_a_record_by_name", autospec=True
+        ).return_value = []
+        mocker.patch.object(subdomains, "get_ip", autospec=True).side_effect = [
+            *["127.0.0.2"] * len(expected_domain_record_ids),  # manage subdomains.
+            expected_ip_address,  # Update all managed subdomains get_ip() call.
+        ]
+        for subdomain in ("@", "support", "www", "blog"):
+            subdomains.manage_subdomain(subdomain, added_top_domain)
+
+        mocker.patch.object(subdomains.do_api, "get_a_records", autospec=True).return_value = [
+            {"id": x, "type": "A", "name": "www", "data": "127.0.0.2"}
+            for x in expected_domain_record_ids
+        ]
+
+        # NOTE: each update blocks until `expected_concurrency` updates are in flight.
+        # Run serially, the first update would never get past the barrier.
+        barrier = threading.Barrier(expected_concurrency, timeout=5)
+        mocked_update_a_record = mocker.patch.object(
+            subdomains.do_api, "update_a_record", autospec=True
+        )
+        mocked_update_a_record.side_effect = lambda **_: barrier.wait()
+
+        parser = args.setup_argparse()
+        test_args = parser.parse_args(
+            args=["update-ips", "--concurrency", str(expected_concurrency)]
+        )
+        test_args.func(test_args)
+
+        assert "Updates done." in capsys.readouterr().out
+        mocked_update_a_record.assert_has_calls(
+            [
+                call(
+                    domain_record_id=x,
+                    domain=added_top_domain,
+                    new_ip_address=expected_ip_address,
+                )
+                for x in expected_domain_record_ids
+            ],
+            any_order=True,
+        )
+        rows = mock_db_for_test.execute("select current_ip4 from subdomains").fetchall()
+        assert [x["current_ip4"] for x in rows] == [expected_ip_address] * len(
+            expected_domain_record_ids
+        )
+
+
+@pytest.mark.parametrize(
+    "concurrency",
+    ["0", str(subdomains.MAX_UPDATE_CONCURRENCY + 1), "many"],
+)
+def test_invalid_concurrency(concurrency: str) -> None:
+    """--concurrency must be an int within the bounds of the worker pool."""
+    parser = args.setup_argparse()
+    with pytest.raises(SystemExit):
+        parser.parse_args(args=["update-ips", "--concurrency", concurrency])
+
+
+def test_default_concurrency() -> None:
+    """A records are updated one at a time unless --concurrency is given."""
+    parser = args.setup_argparse()
+    test_args = parser.parse_args(args=["update-ips"])
+    assert test_args.concurrency == 1
+
+
+class TestVerifiedRunFastPath:
+    """An unchanged public IP is trusted for --verify-interval seconds after a verified run."""
+
+    DOMAIN_RECORD_ID = 10_001
+    IP_ADDRESS = "127.0.0.1"
+
+    @pytest.fixture
+    def mocked_get_a_records(
+        self,
+        added_top_domain: str,
+        mocker: MockerFixture,
+    ) -> MagicMock:
+        """Manage one subdomain whose remote A record is current; return the listing mock."""
+        mocker.patch.object(
+            subdomains.do_api, "create_a_record", autospec=True
+        ).return_value = self.DOMAIN_RECORD_ID
+        mocker.patch.object(
+            subdomains.do_api, "get_a_record_by_name", autospec=True
+        ).return_value = []
+        mocker.patch.object(subdomains, "get_ip", autospec=True).return_value = self.IP_ADDRESS
+        subdomains.manage_subdomain("@", added_top_domain)
+
+        mocked_get_a_records = mocker.patch.object(
+            subdomains.do_api, "get_a_records", autospec=True
+        )
+        mocked_get_a_records.return_value = [
+            {"id": self.DOMAIN_RECORD_ID, "type": "A", "name": "@", "data": self.IP_ADDRESS}
+        ]
+        return mocked_get_a_records
+
+    @staticmethod
+    def run_update_ips(*cli_args: str) -> None:
+        """Run do_ddns update-ips with `cli_args`."""
+        parser = args.setup_argparse()
+        test_args = parser.parse_args(args=["update-ips", *cli_args])
+        test_args.func(test_args)
+
+    def test_unchanged_ip_skips_api(
+        self,
+        mocked_get_a_records: MagicMock,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """The second run with the same IP makes no API calls."""
+        self.run_update_ips()
+        self.run_update_ips()
+
+        mocked_get_a_records.assert_called_once()
+        assert "No updates necessary (IP unchanged)" in capsys.readouterr().out
+
+    def test_changed_ip_verifies(
+        self,
+        mocked_get_a_records: MagicMock,
+        mocker: MockerFixture,
+    ) -> None:
+        """A new public IP always triggers a full check."""
+        mocker.patch.object(subdomains.do_api, "update_a_record", autospec=True)
+
+        self.run_update_ips()
+        subdomains.get_ip.return_value = "127.0.0.2"  # type: ignore[attr-defined]
+        self.run_update_ips()
+
+        assert mocked_get_a_records.call_count == 2  # noqa: PLR2004
+
+    @pytest.mark.parametrize(
+        "second_run_args",
+        [
+            pytest.param(["--verify-interval", "0"], id="interval-elapsed"),
+            pytest.param(["--force"], id="force"),
+        ],
+    )
+    def test_verify_anyway(
+        self,
+        mocked_get_a_records: MagicMock,
+        mocker: MockerFixture,
+        second_run_args: list[str],
+    ) -> None:
+        """The A records are checked once the interval has elapsed, or with --force."""
+        mocker.patch.object(subdomains.do_api, "update_a_record", autospec=True)
+
+        self.run_update_ips()
+        self.run_update_ips(*second_run_args)
+
+        assert mocked_get_a_records.call_count == 2  # noqa: PLR2004
+
+    def test_newly_managed_subdomain_verifies(
+        self,
+        added_top_domain: str,
+        mocked_get_a_records: MagicMock,
+        mock_db_for_test: Connection,
+    ) -> None:
+        """Managing another subdomain makes the next run check the A records."""
+        self.run_update_ips()
+        assert mock_db_for_test.execute("select * from update_state").fetchone() is not None
+
+        subdomains.do_api.create_a_record.return_value = self.DOMAIN_RECORD_ID + 1  # type: ignore[attr-defined]
+        subdomains.manage_subdomain("support", added_top_domain)
+        assert mock_db_for_test.execute("select * from update_state").fetchone() is None
+
+        mocked_get_a_records.return_value.append(
+            {
+                "id": self.DOMAIN_RECORD_ID + 1,
+                "type": "A",
+                "name": "support",
+                "data": self.IP_ADDRESS,
+            }
+        )
+        self.run_update_ips()
+        assert mocked_get_a_records.call_count == 2  # noqa: PLR2004
+
+
+class TestUpdateBookkeeping:
+    """The local bookkeeping for an update-ips run is written in one transaction."""
+
+    DOMAIN_RECORD_IDS = (10_001, 10_002, 10_003)
+    IP_ADDRESS = "127.0.0.1"
+
+    @pytest.fixture(autouse=True)
+    def managed_subdomains(
+        self,
+        added_top_domain: str,
+        mocker: MockerFixture,
+    ) -> None:
+        """Manage three subdomains; the first is current remotely, the others are stale."""
+        mocker.patch.object(
+            subdomains.do_api, "create_a_record", autospec=True
+        ).side_effect = self.DOMAIN_RECORD_IDS
+        mocker.patch.object(
+            subdomains.do_api, "get_a_record_by_name", autospec=True
+        ).return_value = []
+        mocked_get_ip = mocker.patch.object(subdomains, "get_ip", autospec=True)
+        mocked_get_ip.return_value = "127.0.0.2"
+        for subdomain in ("@", "support", "www"):
+            subdomains.manage_subdomain(subdomain, added_top_domain)
+        mocked_get_ip.return_value = self.IP_ADDRESS
+
+        mocker.patch.object(subdomains.do_api, "get_a_records", autospec=True).return_value = [
+            {"id": self.DOMAIN_RECORD_IDS[0], "type": "A", "name": "@", "data": self.IP_ADDRESS},
+            {"id": self.DOMAIN_RECORD_IDS[1], "type": "A", "name": "support", "data": "127.0.0.2"},
+            {"id": self.DOMAIN_RECORD_IDS[2], "type": "A", "name": "www", "data": "127.0.0.2"},
+        ]
+
+    def test_single_commit(
+        self,
+        mock_db_for_test: Connection,
+        mocker: MockerFixture,
+    ) -> None:
+        """One COMMIT for the whole run's bookkeeping, no matter how many A records were checked.
+
+        The run's timings are appended to the runs table in a second one.
+        """
+        mocker.patch.object(subdomains.do_api, "update_a_record", autospec=True)
+        statements: list[str] = []
+        mock_db_for_test.set_trace_callback(statements.append)
+
+        parser = args.setup_argparse()
+        test_args = parser.parse_args(args=["update-ips"])
+        test_args.func(test_args)
+        mock_db_for_test.set_trace_callback(None)
+
+        assert statements.count("COMMIT") == 2  # noqa: PLR2004
+        rows = mock_db_for_test.execute("select current_ip4 from subdomains").fetchall()
+        assert [x["current_ip4"] for x in rows] == ["127.0.0.2", self.IP_ADDRESS, self.IP_ADDRESS]
+
+    def test_mirror_refreshed(
+        self,
+        added_top_domain: str,
+        mocker: MockerFixture,
+    ) -> None:
+        """The listing is mirrored, with the A records this run updated pointing at the IP."""
+        mocker.patch.object(subdomains.do_api, "update_a_record", autospec=True)
+        parser = args.setup_argparse()
+        test_args = parser.parse_args(args=["update-ips"])
+        test_args.func(test_args)
+
+        a_records = subdomains.mirror.get_a_records(added_top_domain)[0]
+
+        subdomains.do_api.get_a_records.assert_called_once_with(added_top_domain)  # type: ignore[attr-defined]
+        assert {record["id"]: record["data"] for record in a_records} == dict.fromkeys(
+            self.DOMAIN_RECORD_IDS, self.IP_ADDRESS
+        )
+
+    def test_partial_failure(
+        self,
+        mock_db_for_test: Connection,
+        mocker: MockerFixture,
+    ) -> None:
+        """A records updated before a failure are still recorded; the run isn't verified."""
+        mocked_update_a_record = mocker.patch.object(
+            subdomains.do_api, "update_a_record", autospec=True
+        )
+        mocked_update_a_record.side_effect = [None, requests.HTTPError("500 Server Error")]
+
+        parser = args.setup_argparse()
+        test_args = parser.parse_args(args=["update-ips"])
+        assert test_args.func(test_args) == 1
+
+        rows = mock_db_for_test.execute("select current_ip4 from subdomains").fetchall()
+        assert [x["current_ip4"] for x in rows] == ["127.0.0.2", self.IP_ADDRESS, "127.0.0.2"]
+        assert mock_db_for_test.execute("select * from update_state").fetchone() is None
+        pending = mock_db_for_test.execute("select * from pending_updates").fetchall()
+        assert [(x["domain_record_id"], x["attempts"]) for x in pending] == [
+            (self.DOMAIN_RECORD_IDS[2], 1)
+        ]
+
+
+class TestFailureIsolation:
+    """A records that fail are retried, then queued, without stopping the run."""
+
+    DOMAIN_RECORD_IDS = (10_001, 10_002)
+    IP_ADDRESS = "127.0.0.1"
+
+    @pytest.fixture(autouse=True)
+    def managed_subdomains(
+        self,
+        added_top_domain: str,
+        mocker: MockerFixture,
+    ) -> None:
+        """Manage two subdomains, both stale remotely."""
+        mocker.patch.object(
+            subdomains.do_api, "create_a_record", autospec=True
+        ).side_effect = self.DOMAIN_RECORD_IDS
+        mocker.patch.object(
+            subdomains.do_api, "get_a_record_by_name", autospec=True
+        ).return_value = []
+        mocker.patch.object(subdomains, "get_ip", autospec=True).return_value = self.IP_ADDRESS
+        for subdomain in ("@", "www"):
+            subdomains.manage_subdomain(subdomain, added_top_domain)
+
+        mocker.patch.object(subdomains.do_api, "get_a_records", autospec=True).return_value = [
+            {"id": domain_record_id, "type": "A", "name": "www", "data": "127.0.0.2"}
+            for domain_record_id in self.DOMAIN_RECORD_IDS
+        ]
+        self.mocked_sleep = mocker.patch.object(subdomains.time, "sleep", autospec=True)
+
+    @staticmethod
+    def server_error() -> requests.HTTPError:
+        """An HTTP 503 error, which is worth retrying."""
+        response = requests.Response()
+        response.status_code = 503
+        return requests.HTTPError("503 Server Error", response=response)
+
+    def run_update_ips(self, *extra_args: str) -> int:
+        """Run do_ddns update-ips, returning its exit status."""
+        parser = args.setup_argparse()
+        test_args = parser.parse_args(args=["update-ips", *extra_args])
+        return test_args.func(test_args)
+
+    def test_transient_error_retried(
+        self,
+        mock_db_for_test: Connection,
+        mocker: MockerFixture,
+    ) -> None:
+        """A transient API error is retried with backoff, and the update succeeds."""
+        mocked_update_a_record = mocker.patch.object(
+            subdomains.do_api, "update_a_record", autospec=True
+        )
+        mocked_update_a_record.side_effect = [requests.ConnectionError(), None, None]
+
+        assert self.run_update_ips() == 0
+
+        assert mocked_update_a_record.call_count == 3  # noqa: PLR2004
+        self.mocked_sleep.assert_called_once()
+        assert 0 <= self.mocked_sleep.call_args.args[0] <= subdomains.RETRY_BASE_DELAY
+        assert mock_db_for_test.execute("select * from pending_updates").fetchone() is None
+        assert mock_db_for_test.execute("select * from update_state").fetchone() is not None
+
+    def test_failure_isolated(
+        self,
+        mock_db_for_test: Connection,
+        mocker: MockerFixture,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """An A record that keeps failing is queued; the other A record is still updated."""
+        mocked_update_a_record = mocker.patch.object(
+            subdomains.do_api, "update_a_record", autospec=True
+        )
+
+        def update_a_record(domain_record_id: int, **_: str) -> None:
+            if domain_record_id == self.DOMAIN_RECORD_IDS[0]:
+                raise self.server_error()
+
+        mocked_update_a_record.side_effect = update_a_record
+
+        assert self.run_update_ips() == 1
+
+        assert mocked_update_a_record.call_count == subdomains.UPDATE_ATTEMPTS + 1
+        assert (
+            mocked_update_a_record.call_args_list[-1].kwargs["domain_record_id"]
+            == (self.DOMAIN_RECORD_IDS[1])
+        )
+        pending = mock_db_for_test.execute("select * from pending_updates").fetchone()
+        assert pending["domain_record_id"] == self.DOMAIN_RECORD_IDS[0]
+        assert pending["last_error"] == "503 Server Error"
+        assert "1 of 2 A records could not be updated" in capsys.readouterr().out
+
+    def test_domain_listing_failure(
+        self,
+        mock_db_for_test: Connection,
+        mocker: MockerFixture,
+    ) -> None:
+        """When a domain can't be listed, all of its A records are queued."""
+        subdomains.do_api.get_a_records.side_effect = requests.HTTPError("403 Forbidden")  # type: ignore[attr-defined]
+        mocked_update_a_record = mocker.patch.object(
+            subdomains.do_api, "update_a_record", autospec=True
+        )
+
+        assert self.run_update_ips() == 1
+
+        mocked_update_a_record.assert_not_called()
+        self.mocked_sleep.assert_not_called()
+        pending = mock_db_for_test.execute("select domain_record_id from pending_updates")
+        assert [x["domain_record_id"] for x in pending] == list(self.DOMAIN_RECORD_IDS)
+
+    def test_pending_retried_first(
+        self,
+        mock_db_for_test: Connection,
+        mocker: MockerFixture,
+    ) -> None:
+        """Queued A records are retried first on the next run, even if the IP is unchanged."""
+        mocked_update_a_record = mocker.patch.object(
+            subdomains.do_api, "update_a_record", autospec=True
+        )
+        mocked_update_a_record.side_effect = [None] + [self.server_error()] * 3
+        assert self.run_update_ips() == 1
+
+        mocked_update_a_record.reset_mock()
+        mocked_update_a_record.side_effect = None
+        assert self.run_update_ips("--force") == 0
+
+        assert [x.kwargs["domain_record_id"] for x in mocked_update_a_record.call_args_list] == [
+            self.DOMAIN_RECORD_IDS[1],
+            self.DOMAIN_RECORD_IDS[0],
+        ]
+        assert mock_db_for_test.execute("select * from pending_updates").fetchone() is None
+
+    def test_pending_attempts_counted(
+        self,
+        mock_db_for_test: Connection,
+        mocker: MockerFixture,
+    ) -> None:
+        """Each failed run increments the attempts of a queued A record."""
+        mocker.patch.object(
+            subdomains.do_api, "update_a_record", autospec=True
+        ).side_effect = requests.HTTPError("422 Unprocessable Entity")
+
+        self.run_update_ips()
+        self.run_update_ips()
+
+        pending = mock_db_for_test.execute("select attempts from pending_updates").fetchall()
+        assert [x["attempts"] for x in pending] == [2, 2]
+
+    def test_un_managed_pending_dropped(
+        self,
+        added_top_domain: str,
+        mock_db_for_test: Connection,
+        mocker: MockerFixture,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """A queued A record un-managed since no longer keeps runs from skipping the API."""
+        mocked_update_a_record = mocker.patch.object(
+            subdomains.do_api, "update_a_record", autospec=True
+        )
+
+        def update_a_record(domain_record_id: int, **_: str) -> None:
+            if domain_record_id == self.DOMAIN_RECORD_IDS[0]:
+                raise self.server_error()
+
+        mocked_update_a_record.side_effect = update_a_record
+        assert self.run_update_ips() == 1
+
+        subdomains.un_manage_subdomain("@", added_top_domain)
+        assert mock_db_for_test.execute("select * from pending_updates").fetchone() is None
+        # The failed run left the A records unverified.
+        assert self.run_update_ips() == 0
+        subdomains.do_api.get_a_records.reset_mock()  # type: ignore[attr-defined]
+        mocked_update_a_record.reset_mock()
+        capsys.readouterr()
+
+        assert self.run_update_ips() == 0
+
+        subdomains.do_api.get_a_records.assert_not_called()  # type: ignore[attr-defined]
+        mocked_update_a_record.assert_not_called()
+        assert "No updates necessary (IP unchanged)" in capsys.readouterr().out
+
+    def test_un_managed_domain_pending_dropped(
+        self,
+        added_top_domain: str,
+        mock_db_for_test: Connection,
+    ) -> None:
+        """Un-managing a domain drops the queued retries of its A records."""
+        subdomains.do_api.get_a_records.side_effect = requests.HTTPError("403 Forbidden")  # type: ignore[attr-defined]
+        assert self.run_update_ips() == 1
+
+        domains.un_manage_domain(added_top_domain)
+
+        assert mock_db_for_test.execute("select * from pending_updates").fetchone() is None
@@ -0,0 +1,360 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the do_ddns daemon."""
+
+import os
+import signal
+import sqlite3
+import threading
+import time
+from argparse import Namespace
+from collections.abc import Generator
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import args, daemon
+from digital_ocean_dynamic_dns.testing.fake_netlink import FakeNetlink
+
+# Fixtures all tests in this module will use.
+pytestmark = pytest.mark.usefixtures("mock_db_for_test")
+
+
+def send_sigterm(*_: object) -> None:
+    """Deliver SIGTERM to this process, as a service manager would."""
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+@pytest.fixture
+def mocked_update(mocker: MockerFixture) -> MagicMock:
+    """Mock the update-ips pipeline, and don't wait between checks."""
+    mocker.patch.object(daemon, "_next_delay", autospec=True).return_value = 0
+    mocker.patch.object(daemon.do_api, "save_rate_limit_budget", autospec=True)
+    return mocker.patch.object(daemon.subdomains, "update_all_managed_subdomains", autospec=True)
+
+
+def run_daemon(*extra_args: str) -> int:
+    """Run do_ddns daemon, returning its exit status."""
+    parser = args.setup_argparse()
+    test_args = parser.parse_args(args=["daemon", *extra_args])
+    return test_args.func(test_args)
+
+
+class TestRunDaemon:
+    """Tests for the daemon loop."""
+
+    def test_stops_on_sigterm(
+        self,
+        mocked_update: MagicMock,
+    ) -> None:
+        """The daemon checks until SIGTERM, then exits cleanly and restores the handler."""
+        expected_checks = 3
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        mocked_update.side_effect = lambda _: (
+            send_sigterm() if mocked_update.call_count == expected_checks else None
+        )
+
+        assert run_daemon("--concurrency", "4", "--verify-interval", "60") == 0
+
+        assert mocked_update.call_count == expected_checks
+        mocked_update.assert_called_with(
+            Namespace(
+                force=False,
+                concurrency=4,
+                verify_interval=60,
+                ip_quorum=1,
+                timings=False,
+                metrics_file=None,
+            )
+        )
+        assert daemon.do_api.save_rate_limit_budget.call_count == expected_checks  # type: ignore[attr-defined]
+        assert signal.getsignal(signal.SIGTERM) is previous_handler
+
+    @pytest.mark.parametrize(
+        "error",
+        [
+            pytest.param(requests.ConnectionError("resolver unreachable"), id="request"),
+            pytest.param(daemon.NoIPResolverServerError("no resolver"), id="no-resolver"),
+        ],
+    )
+    def test_failed_check_retried(
+        self,
+        mocked_update: MagicMock,
+        error: Exception,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """A failed check is logged, and the daemon keeps checking."""
+
+        def update(_: Namespace) -> None:
+            if mocked_update.call_count == 1:
+                raise error
+            send_sigterm()
+
+        mocked_update.side_effect = update
+
+        assert run_daemon() == 0
+
+        assert mocked_update.call_count == 2  # noqa: PLR2004
+        assert f"check failed: {error}" in capsys.readouterr().out
+
+    @pytest.mark.parametrize(
+        "error",
+        [
+            pytest.param(sqlite3.OperationalError("database is locked"), id="database-locked"),
+            pytest.param(OSError(13, "Permission denied"), id="os-error"),
+        ],
+    )
+    def test_unexpected_error_retried(
+        self,
+        mocked_update: MagicMock,
+        error: Exception,
+        capsys: pytest.CaptureFixture[str],
+        caplog: pytest.LogCaptureFixture,
+    ) -> None:
+        """Any other error is logged with its traceback, and the daemon keeps checking."""
+
+        def update(_: Namespace) -> None:
+            if mocked_update.call_count == 1:
+                raise error
+            send_sigterm()
+
+        mocked_update.side_effect = update
+
+        assert run_daemon() == 0
+
+        assert mocked_update.call_count == 2  # noqa: PLR2004
+        assert "check failed unexpectedly" in capsys.readouterr().out
+        [record] = [record for record in caplog.records if record.exc_info]
+        assert record.exc_info is not None
+        assert record.exc_info[1] is error
+
+    def test_budget_save_error(self, mocked_update: MagicMock) -> None:
+        """An error saving the rate limit budget doesn't stop the daemon either."""
+        daemon.do_api.save_rate_limit_budget.side_effect = sqlite3.OperationalError(  # type: ignore[attr-defined]
+            "database is locked"
+        )
+        mocked_update.side_effect = lambda _: (
+            send_sigterm() if mocked_update.call_count == 2 else 0  # noqa: PLR2004
+        )
+
+        assert run_daemon() == 0
+
+        assert mocked_update.call_count == 2  # noqa: PLR2004
+
+    def test_interrupt_stops(
+        self,
+        mocked_update: MagicMock,
+    ) -> None:
+        """KeyboardInterrupt propagates, and the handler is restored."""
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        mocked_update.side_effect = KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            run_daemon()
+
+        assert signal.getsignal(signal.SIGTERM) is previous_handler
+
+
+class TestAdaptive:
+    """Tests for the daemon's --adaptive intervals."""
+
+    def test_interval_from_schedule(
+        self,
+        mocked_update: MagicMock,
+        mocker: MockerFixture,
+    ) -> None:
+        """Each check's outcome is passed to the schedule, whose interval is waited."""
+        outcomes = iter([0, 1])
+
+        def update(_: Namespace) -> int:
+            if mocked_update.call_count == 3:  # noqa: PLR2004
+                send_sigterm()
+                return 0
+            return next(outcomes)
+
+        mocked_update.side_effect = update
+        next_check = mocker.patch.object(daemon.schedule, "next_check", autospec=True)
+        next_check.return_value = daemon.schedule.Decision(0, 120, "IP stable for 20m")
+
+        assert run_daemon("--adaptive", "--min-interval", "30", "--max-interval", "600") == 0
+
+        assert [call.kwargs["last_check_ok"] for call in next_check.call_args_list] == [
+            True,
+            False,
+            True,
+        ]
+        assert next_check.call_args.kwargs == {
+            "last_check_ok": True,
+            "min_interval": 30,
+            "max_interval": 600,
+            "default_interval": daemon.DEFAULT_INTERVAL,
+        }
+        assert [call.args for call in daemon._next_delay.call_args_list] == [  # type: ignore[attr-defined]  # noqa: SLF001
+            (120, daemon.DEFAULT_JITTER, (30, 600))
+        ] * 3
+
+    def test_failed_check_saved(self, mocked_update: MagicMock) -> None:
+        """A failed check schedules the next one after the minimum interval."""
+
+        def update(_: Namespace) -> None:
+            send_sigterm()
+            raise requests.ConnectionError
+
+        mocked_update.side_effect = update
+
+        assert run_daemon("--adaptive", "--min-interval", "45") == 0
+
+        decision = daemon.schedule.last_decision(daemon.get_connection())
+        assert decision is not None
+        assert (decision.interval, decision.reason) == (45, "the last check failed")
+
+    def test_schedule_error(
+        self,
+        mocked_update: MagicMock,
+        mocker: MockerFixture,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """An error deciding the next check is logged; it comes after the minimum interval."""
+        mocked_update.side_effect = lambda _: (
+            send_sigterm() if mocked_update.call_count == 2 else 0  # noqa: PLR2004
+        )
+        mocker.patch.object(
+            daemon.schedule,
+            "next_check",
+            autospec=True,
+            side_effect=sqlite3.OperationalError("database is locked"),
+        )
+
+        assert run_daemon("--adaptive", "--min-interval", "45") == 0
+
+        assert mocked_update.call_count == 2  # noqa: PLR2004
+        assert daemon._next_delay.call_args.args[0] == 45  # type: ignore[attr-defined]  # noqa: PLR2004, SLF001
+        assert "can't decide the next check" in capsys.readouterr().out
+
+    def test_invalid_bounds(
+        self,
+        mocked_update: MagicMock,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """--min-interval can't be longer than --max-interval."""
+        assert run_daemon("--adaptive", "--min-interval", "600", "--max-interval", "60") == 1
+
+        mocked_update.assert_not_called()
+        assert (
+            "--min-interval (600s) is longer than --max-interval (60s)" in capsys.readouterr().out
+        )
+
+
+class TestWatchNetlink:
+    """Tests for the daemon's --watch-netlink."""
+
+    @pytest.fixture
+    def fake_netlink(self, mocker: MockerFixture) -> Generator[FakeNetlink, None, None]:
+        """Stand in for the netlink socket."""
+        with FakeNetlink() as fake:
+            mocker.patch.object(
+                daemon.netlink, "open_socket", autospec=True, return_value=fake.socket
+            )
+            yield fake
+
+    def test_address_change_checks_now(
+        self,
+        mocked_update: MagicMock,
+        fake_netlink: FakeNetlink,
+    ) -> None:
+        """An address change cuts the wait short."""
+        daemon._next_delay.return_value = 600  # type: ignore[attr-defined]  # noqa: SLF001
+
+        def update(_: Namespace) -> int:
+            if mocked_update.call_count == 1:
+                fake_netlink.add_address("203.0.113.5")
+            else:
+                send_sigterm()
+            return 0
+
+        mocked_update.side_effect = update
+        started = time.monotonic()
+
+        assert run_daemon("--watch-netlink") == 0
+
+        assert mocked_update.call_count == 2  # noqa: PLR2004
+        assert time.monotonic() - started < 60  # noqa: PLR2004
+
+    @pytest.mark.usefixtures("fake_netlink")
+    def test_signal_stops_wait(
+        self,
+        mocked_update: MagicMock,
+    ) -> None:
+        """SIGTERM stops the daemon while it waits on the socket."""
+        daemon._next_delay.return_value = 600  # type: ignore[attr-defined]  # noqa: SLF001
+        mocked_update.return_value = 0
+        timer = threading.Timer(0.2, send_sigterm)
+        timer.start()
+        started = time.monotonic()
+
+        assert run_daemon("--watch-netlink") == 0
+
+        timer.join()
+        assert mocked_update.call_count == 1
+        assert time.monotonic() - started < 60  # noqa: PLR2004
+
+    def test_not_supported(
+        self,
+        mocked_update: MagicMock,
+        mocker: MockerFixture,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """Without netlink the daemon warns, and checks on the interval."""
+        mocker.patch.object(
+            daemon.netlink,
+            "open_socket",
+            autospec=True,
+            side_effect=OSError("netlink is only supported on Linux"),
+        )
+        mocked_update.side_effect = send_sigterm
+
+        assert run_daemon("--watch-netlink") == 0
+
+        assert "can't watch for address changes" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    ("interval", "jitter"),
+    [(300, 30), (10, 0), (5, 60)],
+)
+def test_next_delay(interval: int, jitter: int) -> None:
+    """The delay is within `jitter` seconds of `interval`, and never negative."""
+    for _ in range(100):
+        delay = daemon._next_delay(interval, jitter)  # noqa: SLF001
+        assert max(interval - jitter, 0) <= delay <= interval + jitter
+
+
+def test_next_delay_bounds() -> None:
+    """Jitter doesn't take the delay past its bounds."""
+    for _ in range(100):
+        assert 60 <= daemon._next_delay(60, 30, (60, 90)) <= 90  # noqa: PLR2004, SLF001
+        assert daemon._next_delay(90, 30, (60, 90)) <= 90  # noqa: PLR2004, SLF001
+
+
+@pytest.mark.parametrize("interval", ["0", "-5", "soon"])
+def test_invalid_interval(interval: str) -> None:
+    """--interval must be a positive number of seconds."""
+    parser = args.setup_argparse()
+    with pytest.raises(SystemExit):
+        parser.parse_args(args=["daemon", "--interval", interval])
+
+
+def test_defaults() -> None:
+    """The daemon's defaults match update-ips where they overlap."""
+    parser = args.setup_argparse()
+    daemon_args = parser.parse_args(args=["daemon"])
+    update_args = parser.parse_args(args=["update-ips"])
+
+    assert daemon_args.interval == daemon.DEFAULT_INTERVAL
+    assert daemon_args.jitter == daemon.DEFAULT_JITTER
+    assert daemon_args.concurrency == update_args.concurrency
+    assert daemon_args.verify_interval == update_args.verify_interval
+    assert daemon_args.ip_quorum == update_args.ip_quorum
@@ -0,0 +1,302 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the database module."""
+
+import multiprocessing
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from sqlite3 import Connection
+from unittest.mock import MagicMock, patch
+
+import pytest
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import database
+
+
+def test_connection_shared(mock_db_for_test: Connection, temp_database_path: Path) -> None:
+    """Every caller gets the same connection, to the configured database."""
+    assert database.get_connection() is mock_db_for_test
+    assert database.get_connection() is database.get_connection()
+    assert mock_db_for_test.execute("PRAGMA database_list").fetchone()["file"] == str(
+        temp_database_path
+    )
+
+
+def test_schema_initialized_once(mocker: MockerFixture) -> None:
+    """The schema is set up when the connection is first opened, not on every use."""
+    spy_connect_database = mocker.spy(database, "connect_database")
+    database.get_connection.cache_clear()
+
+    for _ in range(3):
+        database.get_connection()
+
+    spy_connect_database.assert_called_once()
+
+
+def test_foreign_keys_enforced(mock_db_for_test: Connection) -> None:
+    """References between tables are enforced, e.g. a queued retry needs its A record."""
+    assert mock_db_for_test.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    with pytest.raises(sqlite3.IntegrityError, match="FOREIGN KEY"), mock_db_for_test:
+        mock_db_for_test.execute(
+            "INSERT INTO pending_updates VALUES (1, 1, 'error', 0, 0)",
+        )
+
+
+class TestMigrations:
+    """Databases are migrated to the current schema in place."""
+
+    @staticmethod
+    def create_legacy_database(database_path: Path) -> None:
+        """Create an unversioned database, as written before migrations existed."""
+        conn = sqlite3.connect(database_path)
+        with conn:
+            conn.execute(
+                "CREATE TABLE domains (id integer PRIMARY KEY, name text NOT NULL UNIQUE, "
+                "cataloged text NOT NULL, managed integer default 1, "
+                "last_managed text default 'N/A')"
+            )
+            conn.execute(
+                "CREATE TABLE subdomains (domain_record_id integer PRIMARY KEY, "
+                "main_id integer NOT NULL REFERENCES domains (id) ON DELETE RESTRICT, "
+                "name text NOT NULL, current_ip4 text NOT NULL, current_ip6 text NULL, "
+                "cataloged text NOT NULL, managed integer default 1, "
+                "last_checked text default 'N/A', last_updated text default 'N/A')"
+            )
+            conn.execute(
+                "INSERT INTO domains (name, cataloged) values ('example.com', '2024-03-01 12:30')"
+            )
+            conn.execute(
+                "INSERT INTO subdomains (domain_record_id, main_id, name, current_ip4, cataloged,"
+                "  last_checked, last_updated) "
+                "values (10001, 1, 'www', '127.0.0.1', '2024-03-01 12:30', '02-03-2024 08:15',"
+                "  'N/A')"
+            )
+        conn.close()
+
+    def test_legacy_database_migrated(self, tmp_path: Path) -> None:
+        """Text timestamps in either legacy format become epoch seconds; 'N/A' becomes NULL."""
+        database_path = tmp_path / "legacy.db"
+        self.create_legacy_database(database_path)
+
+        conn = database.connect_database(database_path)
+
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(database.MIGRATIONS)
+        domain = conn.execute("SELECT * FROM domains").fetchone()
+        assert domain["cataloged"] == time.mktime((2024, 3, 1, 12, 30, 0, 0, 0, -1))
+        assert domain["last_managed"] is None
+        assert domain["managed"] == 1
+        subdomain = conn.execute("SELECT * FROM subdomains").fetchone()
+        assert subdomain["cataloged"] == domain["cataloged"]
+        assert subdomain["last_checked"] == time.mktime((2024, 3, 2, 8, 15, 0, 0, 0, -1))
+        assert subdomain["last_updated"] is None
+        assert subdomain["name"] == "www"
+        # Tables added since are created too.
+        assert conn.execute("SELECT COUNT(*) FROM pending_updates").fetchone()[0] == 0
+
+    def test_reopen_is_noop(self, tmp_path: Path) -> None:
+        """An up to date database is left alone."""
+        database_path = tmp_path / "ddns.db"
+        database.connect_database(database_path).close()
+        spy_migrations = [MagicMock(wraps=migration) for migration in database.MIGRATIONS]
+
+        with patch.object(database, "MIGRATIONS", spy_migrations):
+            database.connect_database(database_path)
+
+        for spy_migration in spy_migrations:
+            spy_migration.assert_not_called()
+
+    def test_failed_migration_rolled_back(self, tmp_path: Path) -> None:
+        """A migration that fails leaves the database at the previous version."""
+        database_path = tmp_path / "legacy.db"
+        self.create_legacy_database(database_path)
+
+        def broken_migration(conn: sqlite3.Connection) -> None:
+            conn.execute("DROP TABLE domains")
+            raise sqlite3.OperationalError
+
+        with (
+            patch.object(database, "MIGRATIONS", [*database.MIGRATIONS, broken_migration]),
+            pytest.raises(sqlite3.OperationalError),
+        ):
+            database.connect_database(database_path)
+
+        conn = database.connect_database(database_path)
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(database.MIGRATIONS)
+        assert conn.execute("SELECT COUNT(*) FROM domains").fetchone()[0] == 1
+
+    def test_newer_database_rejected(self, tmp_path: Path) -> None:
+        """A database from a newer do_ddns isn't touched."""
+        database_path = tmp_path / "ddns.db"
+        conn = sqlite3.connect(database_path)
+        conn.execute(f"PRAGMA user_version = {len(database.MIGRATIONS) + 1}")
+        conn.close()
+
+        with pytest.raises(RuntimeError, match=r"Upgrade do_ddns"):
+            database.connect_database(database_path)
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            pytest.param(
+                "SELECT count(*) FROM subdomains WHERE main_id = ? AND name = ? and managed = 1",
+                id="manage",
+            ),
+            pytest.param(
+                "SELECT domain_record_id FROM subdomains WHERE main_id = ? AND name = ?",
+                id="un-manage",
+            ),
+            pytest.param(
+                "SELECT domain_record_id FROM subdomains WHERE managed = 1",
+                id="update-ips",
+            ),
+        ],
+    )
+    def test_lookups_indexed(self, mock_db_for_test: sqlite3.Connection, query: str) -> None:
+        """Subdomain lookups use an index instead of scanning the table."""
+        params = (1, "www")[: query.count("?")]
+        plan = " ".join(
+            row["detail"] for row in mock_db_for_test.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        )
+        assert "USING INDEX subdomains_" in plan or "USING COVERING INDEX subdomains_" in plan
+
+
+class TestConcurrentAccess:
+    """Several connections, or processes, share the database safely."""
+
+    def test_configured_for_concurrency(self, mock_db_for_test: sqlite3.Connection) -> None:
+        """The database is in WAL mode, and connections wait for each other's locks."""
+        assert mock_db_for_test.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert mock_db_for_test.execute("PRAGMA busy_timeout").fetchone()[0] == (
+            database.BUSY_TIMEOUT * 1000
+        )
+        read_only_conn = database.get_read_only_connection()
+        assert read_only_conn.execute("PRAGMA busy_timeout").fetchone()[0] == (
+            database.BUSY_TIMEOUT * 1000
+        )
+
+    def test_read_only_connection(self, mock_db_for_test: sqlite3.Connection) -> None:
+        """The read-only connection sees committed writes, and can't write itself."""
+        read_only_conn = database.get_read_only_connection()
+        assert database.get_read_only_connection() is read_only_conn
+        with mock_db_for_test:
+            insert_domain(mock_db_for_test, "example.com")
+
+        assert read_only_conn.execute("SELECT name FROM domains").fetchone()["name"] == (
+            "example.com"
+        )
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            read_only_conn.execute("DELETE FROM domains")
+
+    @pytest.mark.parametrize("legacy", [False, True], ids=["missing", "legacy"])
+    def test_read_only_connection_prepares_database(self, tmp_path: Path, *, legacy: bool) -> None:
+        """A missing or outdated database is created or migrated before it's opened read-only."""
+        database_path = tmp_path / "readonly.db"
+        if legacy:
+            TestMigrations.create_legacy_database(database_path)
+
+        conn = database.connect_database(database_path, read_only=True)
+
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(database.MIGRATIONS)
+        assert conn.execute("SELECT COUNT(*) FROM domains").fetchone()[0] == int(legacy)
+
+    def test_readers_not_blocked_by_writer(self, mock_db_for_test: sqlite3.Connection) -> None:
+        """A reader doesn't wait for a write in progress; it sees the last commit."""
+        with mock_db_for_test:
+            insert_domain(mock_db_for_test, "example.com")
+        read_only_conn = database.get_read_only_connection()
+        read_only_conn.execute("PRAGMA busy_timeout = 0")
+
+        with mock_db_for_test:
+            insert_domain(mock_db_for_test, "example.org")
+            # The write transaction is still open.
+            assert read_only_conn.execute("SELECT COUNT(*) FROM domains").fetchone()[0] == 1
+
+        assert read_only_conn.execute("SELECT COUNT(*) FROM domains").fetchone()[0] == 2  # noqa: PLR2004
+
+    def test_processes_hammering_database(self, temp_database_path: Path) -> None:
+        """Writer and reader processes run side by side without 'database is locked' errors."""
+        writers, readers, writes = 4, 2, 50
+        # spawn: each worker opens its own connections, as separate do_ddns processes would.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=writers + readers,
+            mp_context=context,
+            initializer=set_start_barrier,
+            initargs=(context.Barrier(writers + readers, timeout=60),),
+        ) as executor:
+            write_futures = [
+                executor.submit(write_domains, temp_database_path, writer, writes)
+                for writer in range(writers)
+            ]
+            read_futures = [
+                executor.submit(read_domains, temp_database_path, writers * writes)
+                for _ in range(readers)
+            ]
+            for future in [*write_futures, *read_futures]:
+                future.result()
+
+        conn = database.connect_database(temp_database_path)
+        assert conn.execute("SELECT COUNT(*) FROM domains").fetchone()[0] == writers * writes
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+
+# Lets the worker processes start hammering the database together.
+_start_barrier: threading.Barrier | None = None
+
+
+def set_start_barrier(barrier: threading.Barrier) -> None:
+    """Process pool initializer: share the start barrier with this worker."""
+    global _start_barrier  # noqa: PLW0603
+    _start_barrier = barrier
+
+
+def wait_for_start() -> None:
+    """Wait until every worker process is ready."""
+    if _start_barrier is not None:
+        _start_barrier.wait()
+
+
+def insert_domain(conn: sqlite3.Connection, name: str) -> None:
+    """Insert a managed domain."""
+    conn.execute("INSERT INTO domains (name, cataloged) values (?, ?)", (name, int(time.time())))
+
+
+def write_domains(database_path: Path, writer: int, writes: int) -> None:
+    """Insert `writes` domains, one transaction each, through a fresh connection."""
+    conn = database.connect_database(database_path)
+    wait_for_start()
+    for i in range(writes):
+        with conn:
+            insert_domain(conn, f"writer-{writer}-{i}.example.com")
+            # Hold the write lock a little, so other writers have to wait for it.
+            time.sleep(0.001)
+    conn.close()
+
+
+def read_domains(database_path: Path, expected: int) -> None:
+    """Count the domains through a read-only connection until all writes are seen."""
+    conn = database.connect_database(database_path, read_only=True)
+    wait_for_start()
+    deadline = time.monotonic() + 30
+    seen = 0
+    while seen < expected:
+        assert time.monotonic() < deadline, f"only {seen} of {expected} writes were committed"
+        count = conn.execute("SELECT COUNT(*) FROM domains").fetchone()[0]
+        assert count >= seen, "a reader saw a committed write disappear"
+        seen = count
+        time.sleep(0.001)
+    conn.close()
+
+
+@pytest.mark.parametrize(
+    ("timestamp", "expected"),
+    [(None, "N/A"), (0, time.strftime("%Y-%m-%d %H:%M", time.localtime(0)))],
+)
+def test_format_timestamp(timestamp: int | None, expected: str) -> None:
+    """Epoch timestamps are shown in local time."""
+    assert database.format_timestamp(timestamp) == expected
@@ -0,0 +1,104 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the do_ddns CLI entry point."""
+
+import subprocess
+import sys
+
+import pytest
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import args, ddns, do_api, logs, subdomains
+
+
+def test_run_dispatches_and_saves_rate_limit_budget(mocker: MockerFixture) -> None:
+    """The subcommand handler runs, then the API rate limit budget is saved."""
+    mocked_show_log = mocker.patch.object(logs, "show_log", autospec=True)
+    mocked_show_log.return_value = None
+    mocked_save_budget = mocker.patch.object(do_api, "save_rate_limit_budget", autospec=True)
+    mocker.patch.object(sys, "argv", ["do_ddns", "logs"])
+
+    ddns.run()
+
+    mocked_show_log.assert_called_once()
+    mocked_save_budget.assert_called_once_with()
+
+
+def test_run_saves_rate_limit_budget_on_error(mocker: MockerFixture) -> None:
+    """The API rate limit budget is saved even when the handler fails."""
+    mocker.patch.object(logs, "show_log", autospec=True).side_effect = RuntimeError
+    mocked_save_budget = mocker.patch.object(do_api, "save_rate_limit_budget", autospec=True)
+    mocker.patch.object(sys, "argv", ["do_ddns", "logs"])
+
+    with pytest.raises(RuntimeError):
+        ddns.run()
+
+    mocked_save_budget.assert_called_once_with()
+
+
+def test_run_exits_with_handler_status(mocker: MockerFixture) -> None:
+    """A non-zero status returned by the handler becomes the exit status."""
+    mocker.patch.object(logs, "show_log", autospec=True).return_value = 1
+    mocked_save_budget = mocker.patch.object(do_api, "save_rate_limit_budget", autospec=True)
+    mocker.patch.object(sys, "argv", ["do_ddns", "logs"])
+
+    with pytest.raises(SystemExit) as exc_info:
+        ddns.run()
+
+    assert exc_info.value.code == 1
+    mocked_save_budget.assert_called_once_with()
+
+
+def test_startup_imports_no_subcommand_modules() -> None:
+    """Parsing the command line doesn't import requests, rich or open the database."""
+    code = (
+        "import sys\n"
+        "from digital_ocean_dynamic_dns import ddns\n"
+        "ddns.setup_argparse().parse_args(['update-ips'])\n"
+        "print(' '.join(sys.modules))\n"
+    )
+    completed = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    modules = set(completed.stdout.split())
+    assert "digital_ocean_dynamic_dns.ddns" in modules
+    assert not modules.intersection(
+        {
+            "requests",
+            "rich",
+            "sqlite3",
+            "importlib.metadata",
+            "digital_ocean_dynamic_dns.subdomains",
+            "digital_ocean_dynamic_dns.database",
+        }
+    )
+
+
+def test_handler_imported_when_run(mocker: MockerFixture) -> None:
+    """The handler is looked up when the subcommand runs, so it can be patched."""
+    mocked_update = mocker.patch.object(subdomains, "update_all_managed_subdomains", autospec=True)
+    parser = args.setup_argparse()
+    test_args = parser.parse_args(args=["update-ips"])
+
+    test_args.func(test_args)
+
+    mocked_update.assert_called_once_with(test_args)
+    assert test_args.func.__qualname__ == "subdomains.update_all_managed_subdomains"
+
+
+def test_no_profiling_by_default(mocker: MockerFixture) -> None:
+    """Without the profiling options, the profiling module isn't imported."""
+    mocker.patch.object(logs, "show_log", autospec=True).return_value = None
+    mocker.patch.object(do_api, "save_rate_limit_budget", autospec=True)
+    mocker.patch.object(sys, "argv", ["do_ddns", "logs"])
+    mocker.patch.dict(sys.modules)
+    sys.modules.pop("digital_ocean_dynamic_dns.profiling", None)
+
+    ddns.run()
+
+    assert "digital_ocean_dynamic_dns.profiling" not in sys.modules
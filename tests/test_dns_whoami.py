@@ -0,0 +1,186 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the public IP lookup over DNS."""
+
+import socket
+from collections.abc import Generator
+
+import pytest
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import dns_whoami
+from digital_ocean_dynamic_dns.dns_whoami import DNSQueryError, WhoamiQuery
+from digital_ocean_dynamic_dns.testing.fake_dns import FakeDNSServer
+
+
+@pytest.fixture
+def fake_dns(mocker: MockerFixture) -> Generator[FakeDNSServer, None, None]:
+    """A local DNS server answering whoami queries, and short retransmit timeouts."""
+    mocker.patch.object(dns_whoami, "QUERY_TIMEOUT", 0.05)
+    with FakeDNSServer(public_ip="203.0.113.5") as fake:
+        yield fake
+
+
+@pytest.mark.parametrize(
+    ("url", "expected"),
+    [
+        pytest.param(
+            "dns://resolver1.opendns.com/myip.opendns.com",
+            WhoamiQuery("resolver1.opendns.com", 53, "myip.opendns.com", dns_whoami.TYPE_A),
+            id="opendns",
+        ),
+        pytest.param(
+            "dns://ns1.google.com/o-o.myaddr.l.google.com?type=txt",
+            WhoamiQuery("ns1.google.com", 53, "o-o.myaddr.l.google.com", dns_whoami.TYPE_TXT),
+            id="google",
+        ),
+        pytest.param(
+            "dns://127.0.0.1:5353/whoami.example.",
+            WhoamiQuery("127.0.0.1", 5353, "whoami.example.", dns_whoami.TYPE_A),
+            id="port",
+        ),
+    ],
+)
+def test_parse_dns_url(url: str, expected: WhoamiQuery) -> None:
+    """The server, port, name and record type are taken from the URL."""
+    assert dns_whoami.parse_dns_url(url) == expected
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://api.ipify.org",
+        "dns://resolver1.opendns.com",
+        "dns:///myip.opendns.com",
+        "dns://resolver1.opendns.com/myip.opendns.com?type=AAAA",
+        "dns://resolver1.opendns.com:port/myip.opendns.com",
+    ],
+)
+def test_invalid_dns_url(url: str) -> None:
+    """Anything but dns://SERVER[:PORT]/NAME[?type=A|TXT] is rejected."""
+    with pytest.raises(ValueError, match=r"dns://SERVER|Port"):
+        dns_whoami.parse_dns_url(url)
+
+
+@pytest.mark.parametrize("name", ["my..example", "x" * 64 + ".example", "é.example"])
+def test_invalid_name(name: str) -> None:
+    """Names with empty, long or non-ASCII labels can't be queried."""
+    with pytest.raises(ValueError):  # noqa: PT011
+        dns_whoami.encode_query(1, name, dns_whoami.TYPE_A)
+
+
+def test_a_record(fake_dns: FakeDNSServer) -> None:
+    """The address in the A record answered is our public IP."""
+    assert dns_whoami.query_public_ip(fake_dns.url("myip.opendns.com")) == "203.0.113.5"
+    assert fake_dns.queries == [("myip.opendns.com", dns_whoami.TYPE_A)]
+
+
+def test_txt_record(fake_dns: FakeDNSServer) -> None:
+    """The first TXT string that is an IPv4 address is our public IP."""
+    fake_dns.txt_prefix = ["edns0-client-subnet 198.51.100.0/24"]
+
+    url = fake_dns.url("o-o.myaddr.l.google.com", "TXT")
+    assert dns_whoami.query_public_ip(url) == "203.0.113.5"
+    assert fake_dns.queries == [("o-o.myaddr.l.google.com", dns_whoami.TYPE_TXT)]
+
+
+def test_no_address(fake_dns: FakeDNSServer) -> None:
+    """An answer without an IPv4 address is an error."""
+    fake_dns.public_ip = "not an address"
+
+    with pytest.raises(DNSQueryError, match="no IPv4 address"):
+        dns_whoami.query_public_ip(fake_dns.url(record_type="TXT"))
+
+
+def test_retransmit(fake_dns: FakeDNSServer) -> None:
+    """A query left unanswered is sent again."""
+    fake_dns.drop = 2
+
+    assert dns_whoami.query_public_ip(fake_dns.url()) == "203.0.113.5"
+    assert len(fake_dns.queries) == dns_whoami.QUERY_ATTEMPTS
+
+
+def test_no_answer(fake_dns: FakeDNSServer) -> None:
+    """The lookup fails once every attempt went unanswered."""
+    fake_dns.drop = dns_whoami.QUERY_ATTEMPTS
+
+    with pytest.raises(DNSQueryError, match=r"no answer from 127\.0\.0\.1 after 3 attempts"):
+        dns_whoami.query_public_ip(fake_dns.url())
+
+
+@pytest.mark.parametrize(
+    ("rcode", "truncated", "error"),
+    [
+        pytest.param(3, False, "DNS error NXDOMAIN", id="nxdomain"),
+        pytest.param(5, False, "DNS error REFUSED", id="refused"),
+        pytest.param(0, True, "truncated DNS answer", id="truncated"),
+    ],
+)
+def test_error_answer(
+    fake_dns: FakeDNSServer,
+    rcode: int,
+    *,
+    truncated: bool,
+    error: str,
+) -> None:
+    """Error codes and truncated answers are errors, not retried."""
+    fake_dns.rcode = rcode
+    fake_dns.truncated = truncated
+
+    with pytest.raises(DNSQueryError, match=error):
+        dns_whoami.query_public_ip(fake_dns.url())
+    assert len(fake_dns.queries) == 1
+
+
+def test_server_not_listening() -> None:
+    """A closed port is reported at once, rather than waited on."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as closed:
+        closed.bind(("127.0.0.1", 0))
+        port = closed.getsockname()[1]
+
+    with pytest.raises(DNSQueryError, match=r"DNS query to 127\.0\.0\.1 failed"):
+        dns_whoami.query_public_ip(f"dns://127.0.0.1:{port}/myip.opendns.com")
+
+
+def test_unknown_server(mocker: MockerFixture) -> None:
+    """A DNS server whose name doesn't resolve is an error."""
+    mocker.patch.object(
+        dns_whoami.socket,
+        "getaddrinfo",
+        autospec=True,
+        side_effect=socket.gaierror(socket.EAI_NONAME, "Name or service not known"),
+    )
+
+    with pytest.raises(DNSQueryError, match="can't look up the DNS server"):
+        dns_whoami.query_public_ip("dns://resolver.invalid/myip.opendns.com")
+
+
+@pytest.mark.parametrize(
+    ("message", "error"),
+    [
+        pytest.param(b"\0\1", "malformed DNS answer", id="short-header"),
+        pytest.param(
+            dns_whoami.encode_query(1, "myip.opendns.com", dns_whoami.TYPE_A),
+            "not a DNS answer",
+            id="query",
+        ),
+        pytest.param(
+            dns_whoami.HEADER.pack(1, dns_whoami.FLAG_RESPONSE, 1, 0, 0, 0) + b"\4myip",
+            "truncated DNS answer",
+            id="truncated-name",
+        ),
+        pytest.param(
+            dns_whoami.HEADER.pack(1, dns_whoami.FLAG_RESPONSE, 0, 1, 0, 0)
+            + b"\0"
+            + dns_whoami.RECORD.pack(dns_whoami.TYPE_A, dns_whoami.CLASS_IN, 0, 4)
+            + b"\1\2",
+            "truncated DNS answer",
+            id="truncated-data",
+        ),
+    ],
+)
+def test_malformed_answer(message: bytes, error: str) -> None:
+    """Malformed answers are errors."""
+    with pytest.raises(DNSQueryError, match=error):
+        dns_whoami.decode_answer(message, dns_whoami.TYPE_A)
@@ -0,0 +1,172 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the fake Digital Ocean API server, and do_ddns driven through it."""
+
+import time
+from collections.abc import Generator
+from http import HTTPStatus
+
+import pytest
+import requests
+
+from digital_ocean_dynamic_dns import args, domains, subdomains
+from digital_ocean_dynamic_dns.do_api import DigitalOceanClient
+from digital_ocean_dynamic_dns.testing.fake_do import FakeDigitalOcean
+
+AUTH = {"Authorization": "Bearer sentinel-api-key"}
+
+
+@pytest.fixture
+def client(fake: FakeDigitalOcean) -> Generator[DigitalOceanClient, None, None]:
+    """Return a client talking to the fake API."""
+    client = DigitalOceanClient("sentinel-api-key", per_page=2, base_url=fake.url)
+    yield client
+    client.close()
+
+
+class TestEndpoints:
+    """The fake answers like the real API."""
+
+    def test_paginated_listing(self, fake: FakeDigitalOcean) -> None:
+        """Listings are paginated with links.pages and meta.total."""
+        response = requests.get(
+            f"{fake.url}/domains/example.com/records",
+            params={"per_page": 2},
+            headers=AUTH,
+            timeout=5,
+        )
+
+        response_data = response.json()
+        assert [record["name"] for record in response_data["domain_records"]] == ["@", "www"]
+        assert response_data["meta"] == {"total": 3}
+        assert response_data["links"]["pages"]["last"].endswith("page=2&per_page=2")
+
+    def test_client_lists_every_page(
+        self, fake: FakeDigitalOcean, client: DigitalOceanClient
+    ) -> None:
+        """The client walks every page of a listing."""
+        a_records = list(client.get_a_records("example.com"))
+
+        assert [record["name"] for record in a_records] == ["@", "www", "blog"]
+        assert fake.request_counts == {"GET /v2/domains/{domain}/records": 2}
+
+    @pytest.mark.parametrize(("subdomain", "expected"), [("www", ["www"]), ("@", ["@"])])
+    def test_filter_by_name(
+        self, client: DigitalOceanClient, subdomain: str, expected: list[str]
+    ) -> None:
+        """A records are filtered by their fully qualified name."""
+        a_records = client.get_a_record_by_name(subdomain, "example.com")
+
+        assert [record["name"] for record in a_records] == expected
+
+    def test_patch(self, fake: FakeDigitalOcean, client: DigitalOceanClient) -> None:
+        """PATCH updates the A record in place."""
+        domain_record_id = fake.a_records("example.com")[1]["id"]
+
+        updated = client.update_a_record(domain_record_id, "example.com", "203.0.113.9")
+
+        assert updated["data"] == "203.0.113.9"
+        assert client.get_a_record(domain_record_id, "example.com")["data"] == "203.0.113.9"
+
+    def test_post(self, fake: FakeDigitalOcean, client: DigitalOceanClient) -> None:
+        """POST creates an A record with a new id."""
+        domain_record_id = client.create_a_record("mail", "example.com", "203.0.113.9")
+
+        assert {"id": domain_record_id, "name": "mail", "data": "203.0.113.9"}.items() <= (
+            fake.a_records("example.com")[-1].items()
+        )
+
+    def test_not_found(self, client: DigitalOceanClient) -> None:
+        """Unknown domains and A records are answered with HTTP 404."""
+        with pytest.raises(requests.HTTPError, match="404"):
+            client.verify_domain_is_registered("nivin.tech")
+        with pytest.raises(requests.HTTPError, match="404"):
+            client.update_a_record("999", "example.com", "203.0.113.9")
+
+    def test_unauthenticated(self, fake: FakeDigitalOcean) -> None:
+        """Requests without a bearer token are answered with HTTP 401."""
+        response = requests.get(f"{fake.url}/domains", timeout=5)
+
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    def test_ip(self, fake: FakeDigitalOcean) -> None:
+        """The /ip endpoint answers like an IP resolver, and isn't an API request."""
+        assert requests.get(fake.ip_url, timeout=5).text == fake.public_ip
+        assert fake.api_requests == 0
+
+
+class TestInjectedTrouble:
+    """Latency, rate limiting and failures can be configured or injected."""
+
+    def test_latency(self, fake: FakeDigitalOcean, client: DigitalOceanClient) -> None:
+        """Every API request takes at least `latency` seconds."""
+        fake.latency = 0.05
+        started = time.perf_counter()
+
+        client.verify_domain_is_registered("example.com")
+
+        assert time.perf_counter() - started >= fake.latency
+
+    def test_rate_limit(self, fake: FakeDigitalOcean) -> None:
+        """Past the rate limit, requests get HTTP 429 until the window ends."""
+        fake.rate_limit = 2
+        fake.rate_limit_window = 60
+
+        responses = [requests.get(f"{fake.url}/domains", headers=AUTH, timeout=5) for _ in range(3)]
+
+        assert [response.status_code for response in responses] == [200, 200, 429]
+        assert responses[0].headers["ratelimit-remaining"] == "1"
+        assert responses[2].headers["ratelimit-limit"] == "2"
+        assert 0 < int(responses[2].headers["Retry-After"]) <= 60  # noqa: PLR2004
+
+    def test_rate_limited_request_retried(
+        self, fake: FakeDigitalOcean, client: DigitalOceanClient
+    ) -> None:
+        """The client retries a request once the Retry-After delay passes."""
+        fake.fail_next(HTTPStatus.TOO_MANY_REQUESTS, retry_after=0)
+
+        client.verify_domain_is_registered("example.com")
+
+        assert fake.request_counts["GET /v2/domains/{domain}"] == 2  # noqa: PLR2004
+
+    def test_fail_next(self, fake: FakeDigitalOcean, client: DigitalOceanClient) -> None:
+        """Injected failures answer the next requests, whatever they ask for."""
+        fake.fail_next(HTTPStatus.SERVICE_UNAVAILABLE, count=2)
+
+        for _ in range(2):
+            with pytest.raises(requests.HTTPError, match="503"):
+                client.verify_domain_is_registered("example.com")
+        client.verify_domain_is_registered("example.com")
+
+    def test_error_rate(self, fake: FakeDigitalOcean, client: DigitalOceanClient) -> None:
+        """A fraction of the requests fail with HTTP 500."""
+        fake.error_rate = 1.0
+
+        with pytest.raises(requests.HTTPError, match="500"):
+            client.verify_domain_is_registered("example.com")
+
+
+@pytest.mark.usefixtures("cli_on_fake")
+def test_manage_and_update_ips(fake: FakeDigitalOcean) -> None:
+    """Import a domain's A records, list them, and point them at a new IP, end to end."""
+    parser = args.setup_argparse()
+    domains.manage_domain("example.com")
+    domains.manage_all_existing_a_records("example.com")
+    assert {record["data"] for record in fake.a_records("example.com")} == {fake.public_ip}
+
+    fake.public_ip = "203.0.113.9"
+    test_args = parser.parse_args(["update-ips", "--verify-interval", "0"])
+    fake.request_counts.clear()
+
+    assert test_args.func(test_args) == 0
+
+    assert {record["data"] for record in fake.a_records("example.com")} == {"203.0.113.9"}
+    # One listing of the domain, then one PATCH per A record.
+    assert fake.request_counts == {
+        "GET /ip": 1,
+        "GET /v2/domains/{domain}/records": 1,
+        "PATCH /v2/domains/{domain}/records/{id}": 3,
+    }
+    subdomains.list_sub_domains("example.com")
+    assert fake.api_requests == 4  # noqa: PLR2004
@@ -0,0 +1,183 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the history of the public IP address."""
+
+from datetime import UTC, datetime
+from sqlite3 import Connection
+
+import pytest
+
+from digital_ocean_dynamic_dns import args, domains, history
+from digital_ocean_dynamic_dns.testing.fake_do import FakeDigitalOcean
+
+# 2024-05-01 00:00 UTC.
+DAY_ONE = int(datetime(2024, 5, 1, tzinfo=UTC).timestamp())
+HOUR = 3600
+
+
+def observe(conn: Connection, ip4: str, observed_at: int, *, propagated: bool = True) -> None:
+    """Append an observation of `ip4` that updated no A records."""
+    with conn:
+        history.record_observation(
+            conn,
+            ip4,
+            observed_at,
+            records_updated=0 if propagated else 1,
+            records_failed=0 if propagated else 1,
+            propagated=propagated,
+        )
+
+
+def rows(conn: Connection) -> list[tuple]:
+    """Return the (ip4, first_seen, last_seen, observations, propagated_at) of each row."""
+    return [
+        tuple(row)
+        for row in conn.execute(
+            "SELECT ip4, first_seen, last_seen, observations, propagated_at FROM ip_history "
+            "ORDER BY first_seen"
+        )
+    ]
+
+
+def run_history(*argv: str) -> int:
+    """Run do_ddns history with `argv`, returning its exit status."""
+    test_args = args.setup_argparse().parse_args(["history", *argv])
+    return test_args.func(test_args)
+
+
+def test_compact(mock_db_for_test: Connection) -> None:
+    """Runs of identical observations older than `keep` collapse; newer ones are left alone."""
+    conn = mock_db_for_test
+    observe(conn, "198.51.100.1", DAY_ONE, propagated=False)
+    observe(conn, "198.51.100.1", DAY_ONE + HOUR)
+    observe(conn, "198.51.100.1", DAY_ONE + 2 * HOUR)
+    observe(conn, "203.0.113.7", DAY_ONE + 3 * HOUR)
+    observe(conn, "198.51.100.1", DAY_ONE + 4 * HOUR)
+    observe(conn, "198.51.100.1", DAY_ONE + 5 * HOUR)
+    observe(conn, "198.51.100.1", DAY_ONE + 6 * HOUR)
+
+    with conn:
+        assert history.compact(conn, 2 * HOUR, DAY_ONE + 7 * HOUR) == (5, 3)
+
+    assert rows(conn) == [
+        ("198.51.100.1", DAY_ONE, DAY_ONE + 2 * HOUR, 3, DAY_ONE + HOUR),
+        ("203.0.113.7", DAY_ONE + 3 * HOUR, DAY_ONE + 3 * HOUR, 1, DAY_ONE + 3 * HOUR),
+        ("198.51.100.1", DAY_ONE + 4 * HOUR, DAY_ONE + 4 * HOUR, 1, DAY_ONE + 4 * HOUR),
+        ("198.51.100.1", DAY_ONE + 5 * HOUR, DAY_ONE + 5 * HOUR, 1, DAY_ONE + 5 * HOUR),
+        ("198.51.100.1", DAY_ONE + 6 * HOUR, DAY_ONE + 6 * HOUR, 1, DAY_ONE + 6 * HOUR),
+    ]
+
+    # Compacting again only merges the observations that have aged since.
+    with conn:
+        assert history.compact(conn, 0, DAY_ONE + 7 * HOUR) == (5, 3)
+    assert rows(conn)[2] == (
+        "198.51.100.1",
+        DAY_ONE + 4 * HOUR,
+        DAY_ONE + 6 * HOUR,
+        3,
+        DAY_ONE + 4 * HOUR,
+    )
+
+
+@pytest.mark.usefixtures("cli_on_fake")
+def test_update_ips_observes_ip(fake: FakeDigitalOcean, mock_db_for_test: Connection) -> None:
+    """Each update-ips run appends its public IP, whether or not it had to update anything."""
+    domains.manage_domain("example.com")
+    domains.manage_all_existing_a_records("example.com")
+    update_args = args.setup_argparse().parse_args(["update-ips"])
+
+    fake.public_ip = "203.0.113.9"
+    assert update_args.func(update_args) == 0
+    # Verified recently: no API calls, but still observed.
+    assert update_args.func(update_args) == 0
+
+    observations = mock_db_for_test.execute(
+        "SELECT ip4, records_updated, records_failed, propagated_at IS NOT NULL FROM ip_history "
+        "ORDER BY id"
+    ).fetchall()
+    assert [tuple(row) for row in observations] == [
+        ("203.0.113.9", 3, 0, 1),
+        ("203.0.113.9", 0, 0, 1),
+    ]
+
+
+def test_show_history(
+    mock_db_for_test: Connection,
+    capsys: pytest.CaptureFixture[str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Runs of identical observations show as one row, with how long each change went unseen."""
+    monkeypatch.setenv("COLUMNS", "200")
+    conn = mock_db_for_test
+    observe(conn, "198.51.100.1", DAY_ONE)
+    observe(conn, "198.51.100.1", DAY_ONE + HOUR)
+    observe(conn, "203.0.113.7", DAY_ONE + 2 * HOUR - 60, propagated=False)
+    observe(conn, "203.0.113.7", DAY_ONE + 2 * HOUR)
+    observe(conn, "198.51.100.1", DAY_ONE + 4 * HOUR)
+
+    assert run_history() == 0
+
+    output = capsys.readouterr().out
+    lines = [line for line in output.splitlines() if "│" in line and "." in line]
+    assert len(lines) == 3  # noqa: PLR2004
+    # 203.0.113.7: first seen 59 minutes after 198.51.100.1 was last seen, and propagated a
+    # minute after that.
+    assert "59m" in lines[1]
+    assert "1m" in lines[1]
+    assert "2 IP address changes, 2h apart on median." in " ".join(output.split())
+
+    since = datetime.fromtimestamp(DAY_ONE + 3 * HOUR, UTC).isoformat()
+    assert run_history("--since", since) == 0
+    output = capsys.readouterr().out
+    assert "203.0.113.7" not in output
+    # The change is measured from the observation before the range.
+    assert "2h" in output
+
+    until = datetime.fromtimestamp(DAY_ONE - HOUR, UTC).isoformat()
+    assert run_history("--until", until) == 0
+    assert "No public IP addresses observed" in capsys.readouterr().out
+
+
+def test_compact_command(mock_db_for_test: Connection, capsys: pytest.CaptureFixture[str]) -> None:
+    """With --compact --keep 0, history collapses every run of identical observations."""
+    observe(mock_db_for_test, "198.51.100.1", DAY_ONE)
+    observe(mock_db_for_test, "198.51.100.1", DAY_ONE + HOUR)
+
+    assert run_history("--compact", "--keep", "0") == 0
+
+    assert "Compacted 2 rows of observations into 1." in capsys.readouterr().out
+    assert rows(mock_db_for_test) == [("198.51.100.1", DAY_ONE, DAY_ONE + HOUR, 2, DAY_ONE)]
+
+
+@pytest.mark.parametrize(
+    ("query", "index"),
+    [
+        pytest.param(
+            "SELECT * FROM ip_history WHERE last_seen >= 1 AND first_seen <= 2 "
+            "ORDER BY first_seen, id",
+            "ip_history_",
+            id="history",
+        ),
+        pytest.param(
+            "SELECT * FROM ip_history WHERE last_seen < 1 ORDER BY first_seen, id",
+            "ip_history_",
+            id="compact",
+        ),
+    ],
+)
+def test_queries_indexed(mock_db_for_test: Connection, query: str, index: str) -> None:
+    """The time range queries use an index instead of scanning the table."""
+    plan = " ".join(
+        row["detail"] for row in mock_db_for_test.execute(f"EXPLAIN QUERY PLAN {query}")
+    )
+    assert f"USING INDEX {index}" in plan
+
+
+@pytest.mark.parametrize(
+    ("seconds", "expected"),
+    [(None, "N/A"), (0, "0s"), (59, "59s"), (3600, "1h"), (90061, "1d 1h"), (125, "2m 5s")],
+)
+def test_format_duration(seconds: int | None, expected: str) -> None:
+    """Durations show their two largest units."""
+    assert history.format_duration(seconds) == expected
@@ -3,9 +3,11 @@
 
 """Tests for the show-info command output."""
 
+from sqlite3 import Connection
+
 import pytest
 
-from digital_ocean_dynamic_dns import args
+from digital_ocean_dynamic_dns import args, schedule
 
 
 class TestShowInfo:
@@ -31,3 +33,30 @@ class TestShowInfo:
         assert "do_ddns - an open-source dynamic DNS solution for DigitalOcean." in capd_output
         assert "API key" in capd_output
         # note... not testing all fields here intentionally.
+
+
+def test_schedule(
+    mock_db_for_test: Connection,
+    capsys: pytest.CaptureFixture[str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """show-info shows the daemon's last decision, or else the interval it would pick."""
+    monkeypatch.setenv("COLUMNS", "200")
+    test_args = args.setup_argparse().parse_args(["show-info"])
+
+    test_args.func(test_args)
+    output = capsys.readouterr().out
+    assert "Suggested check interval" in output
+    assert "5m (no IP history yet)" in output
+
+    schedule.next_check(
+        mock_db_for_test,
+        last_check_ok=False,
+        min_interval=90,
+        max_interval=600,
+        default_interval=300,
+    )
+    test_args.func(test_args)
+    output = capsys.readouterr().out
+    assert "Next daemon check" in output
+    assert "1m 30s after the last (the last check failed)" in output
@@ -3,14 +3,16 @@
 
 """Tests for functions in the ip module."""
 
+import threading
+from collections.abc import Generator
 from sqlite3 import Connection
 
 import pytest
-import requests
 from pytest_mock import MockerFixture
 from responses import RequestsMock
 
 from digital_ocean_dynamic_dns import args, ip
+from digital_ocean_dynamic_dns.testing.fake_dns import FakeDNSServer
 
 # Fixtures all tests in this module will use.
 pytestmark = pytest.mark.usefixtures("mock_db_for_test")
@@ -97,7 +99,7 @@ class TestGetIP:
         )
 
         # Test & Validate
-        with pytest.raises(requests.exceptions.HTTPError):
+        with pytest.raises(ip.IPResolutionError, match=r"500 Server Error"):
             _ = ip.get_ip()
 
     def test_return_public_ip(
@@ -124,6 +126,280 @@ class TestGetIP:
         assert found_ip == expected_ip
 
 
+class TestMultipleResolvers:
+    """get_ip races several IP resolvers."""
+
+    SERVERS = (
+        "https://a.iplookup.example.com",
+        "https://b.iplookup.example.com",
+        "https://c.iplookup.example.com",
+    )
+
+    @pytest.fixture(autouse=True)
+    def configured_servers(self) -> None:
+        """Configure all of SERVERS, in order."""
+        ip.config_ip_server(ipserver=self.SERVERS[0], ip_type="4")
+        for server in self.SERVERS[1:]:
+            ip.add_ip_server(server, "4")
+
+    @staticmethod
+    def stats(mock_db_for_test: Connection) -> dict[str, tuple[int, int, int]]:
+        """Return (successes, failures, consecutive_failures) of each resolver."""
+        rows = mock_db_for_test.execute("select * from ip_resolver_stats").fetchall()
+        return {
+            row["url"]: (row["successes"], row["failures"], row["consecutive_failures"])
+            for row in rows
+        }
+
+    def test_failed_resolver_skipped(
+        self,
+        mocked_responses: RequestsMock,
+        mock_db_for_test: Connection,
+    ) -> None:
+        """When a resolver fails, the next one is asked at once, and the failure is counted."""
+        mocked_responses.get(url=self.SERVERS[0], status=503)
+        mocked_responses.get(url=self.SERVERS[1], body="127.0.0.1\n")
+
+        assert ip.get_ip() == "127.0.0.1"
+
+        assert self.stats(mock_db_for_test) == {
+            self.SERVERS[0]: (0, 1, 1),
+            self.SERVERS[1]: (1, 0, 0),
+        }
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            pytest.param("<html>rate limited</html>", id="garbage"),
+            pytest.param("::1", id="ipv6"),
+            pytest.param("", id="empty"),
+        ],
+    )
+    def test_invalid_answer_rejected(
+        self,
+        mocked_responses: RequestsMock,
+        mock_db_for_test: Connection,
+        body: str,
+    ) -> None:
+        """An answer that isn't an IPv4 address is never returned."""
+        mocked_responses.get(url=self.SERVERS[0], body=body)
+        mocked_responses.get(url=self.SERVERS[1], body="127.0.0.1")
+
+        assert ip.get_ip() == "127.0.0.1"
+        assert self.stats(mock_db_for_test)[self.SERVERS[0]] == (0, 1, 1)
+
+    def test_all_resolvers_fail(
+        self,
+        mocked_responses: RequestsMock,
+    ) -> None:
+        """IPResolutionError names every resolver that failed."""
+        for server in self.SERVERS:
+            mocked_responses.get(url=server, status=500)
+
+        with pytest.raises(ip.IPResolutionError) as exc_info:
+            ip.get_ip()
+
+        assert all(server in str(exc_info.value) for server in self.SERVERS)
+
+    def test_slow_resolver_hedged(
+        self,
+        mocker: MockerFixture,
+    ) -> None:
+        """A resolver that doesn't answer within HEDGE_DELAY doesn't hold up the lookup.
+
+        Nor the exit of the process: it is asked on a daemon thread, which isn't joined.
+        """
+        mocker.patch.object(ip, "HEDGE_DELAY", 0.01)
+        release = threading.Event()
+        slow_threads = []
+
+        def query_ip_server(server: str) -> tuple[str, float]:
+            if server == self.SERVERS[0]:
+                slow_threads.append(threading.current_thread())
+                release.wait(timeout=5)
+                return "127.0.0.9", 5000.0
+            return "127.0.0.1", 10.0
+
+        mocker.patch.object(ip, "_query_ip_server", autospec=True).side_effect = query_ip_server
+        try:
+            assert ip.get_ip() == "127.0.0.1"
+            [slow_thread] = slow_threads
+            assert slow_thread.is_alive()
+            assert slow_thread.daemon
+        finally:
+            release.set()
+
+    @pytest.mark.parametrize(
+        ("answers", "expected_ip"),
+        [
+            pytest.param(["127.0.0.1", "127.0.0.1", "127.0.0.2"], "127.0.0.1", id="agree"),
+            pytest.param(["127.0.0.2", "127.0.0.1", "127.0.0.1"], "127.0.0.1", id="outvoted"),
+        ],
+    )
+    def test_quorum(
+        self,
+        mocked_responses: RequestsMock,
+        answers: list[str],
+        expected_ip: str,
+    ) -> None:
+        """With a quorum, the answer of the first `quorum` agreeing resolvers is returned."""
+        for server, answer in zip(self.SERVERS, answers, strict=True):
+            mocked_responses.get(url=server, body=answer)
+        mocked_responses.assert_all_requests_are_fired = False
+
+        assert ip.get_ip(quorum=2) == expected_ip
+
+    def test_quorum_not_reached(
+        self,
+        mocked_responses: RequestsMock,
+    ) -> None:
+        """IPResolutionError when the resolvers disagree."""
+        for server, answer in zip(
+            self.SERVERS, ["127.0.0.1", "127.0.0.2", "127.0.0.3"], strict=True
+        ):
+            mocked_responses.get(url=server, body=answer)
+
+        with pytest.raises(ip.IPResolutionError, match=r"127\.0\.0\.3"):
+            ip.get_ip(quorum=2)
+
+    def test_fastest_healthy_resolver_first(
+        self,
+        mocked_responses: RequestsMock,
+        mock_db_for_test: Connection,
+    ) -> None:
+        """Resolvers are ranked by latency; resolvers whose last request failed go last."""
+        with mock_db_for_test:
+            mock_db_for_test.executemany(
+                "insert into ip_resolver_stats values (?, ?, ?, ?, ?, NULL, 0)",
+                [
+                    (self.SERVERS[0], 5, 1, 1, 10.0),
+                    (self.SERVERS[1], 5, 0, 0, 200.0),
+                    (self.SERVERS[2], 5, 0, 0, 50.0),
+                ],
+            )
+        assert ip._ranked_ip_servers() == [  # noqa: SLF001
+            self.SERVERS[2],
+            self.SERVERS[1],
+            self.SERVERS[0],
+        ]
+
+        mocked_responses.get(url=self.SERVERS[2], body="127.0.0.1")
+        assert ip.get_ip() == "127.0.0.1"
+
+        latency = mock_db_for_test.execute(
+            "select latency_ms from ip_resolver_stats where url = ?", (self.SERVERS[2],)
+        ).fetchone()["latency_ms"]
+        assert latency < 50.0  # noqa: PLR2004
+
+    def test_remove_resolver(
+        self,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """Removed resolvers are no longer asked, and their counters are dropped."""
+        parser = args.setup_argparse()
+        test_args = parser.parse_args(
+            args=["ip-resolver-config", "--remove-url", self.SERVERS[0], "--remove-url", "nope"]
+        )
+        test_args.func(test_args)
+
+        assert ip._ranked_ip_servers() == list(self.SERVERS[1:])  # noqa: SLF001
+        out = capsys.readouterr().out
+        assert "nope) is not configured" in out
+        assert f"IP v4 resolver  : {self.SERVERS[0]}" not in out
+        assert f"IP v4 resolver  : {self.SERVERS[1]}" in out
+
+    def test_primary_replaced(
+        self,
+        mock_db_for_test: Connection,
+    ) -> None:
+        """Setting --url to an additional resolver makes it the primary, without duplicates."""
+        ip.config_ip_server(ipserver=self.SERVERS[2], ip_type="4")
+
+        rows = mock_db_for_test.execute("select id, URL from ipservers order by id").fetchall()
+        assert [(row["id"], row["URL"]) for row in rows] == [
+            (1, self.SERVERS[2]),
+            (2, self.SERVERS[1]),
+        ]
+
+    def test_add_ipv6_not_supported(self) -> None:
+        """ipv6 resolvers can't be added."""
+        with pytest.raises(ip.IPv6NotSupportedError):
+            ip.add_ip_server("https://v6.iplookup.example.com", "6")
+
+    def test_view_shows_stats(
+        self,
+        mocked_responses: RequestsMock,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """Each resolver is listed with its counters once it has been asked."""
+        mocked_responses.get(url=self.SERVERS[0], body="127.0.0.1")
+        ip.get_ip()
+
+        parser = args.setup_argparse()
+        test_args = parser.parse_args(args=["ip-resolver-config"])
+        test_args.func(test_args)
+
+        out = capsys.readouterr().out
+        assert "1 ok, 0 failed" in out
+        assert f"IP v4 resolver  : {self.SERVERS[2]}\n" in out
+
+
+class TestDNSResolver:
+    """get_ip asks dns:// resolvers for a whoami name."""
+
+    @pytest.fixture
+    def fake_dns(self, mocker: MockerFixture) -> Generator[FakeDNSServer, None, None]:
+        """A local DNS server answering whoami queries, and short retransmit timeouts."""
+        mocker.patch.object(ip.dns_whoami, "QUERY_TIMEOUT", 0.05)
+        with FakeDNSServer(public_ip="203.0.113.5") as fake:
+            yield fake
+
+    def test_dns_resolver(
+        self,
+        fake_dns: FakeDNSServer,
+        mock_db_for_test: Connection,
+    ) -> None:
+        """The address answered over DNS is our public IP, and the resolver's latency counted."""
+        url = fake_dns.url("o-o.myaddr.l.google.com", "TXT")
+        ip.config_ip_server(ipserver=url, ip_type="4")
+
+        assert ip.get_ip() == "203.0.113.5"
+
+        row = mock_db_for_test.execute("select * from ip_resolver_stats").fetchone()
+        assert (row["url"], row["successes"], row["failures"]) == (url, 1, 0)
+        assert row["latency_ms"] is not None
+
+    def test_failover_to_http(
+        self,
+        fake_dns: FakeDNSServer,
+        mocked_responses: RequestsMock,
+    ) -> None:
+        """A DNS resolver that doesn't answer counts as failed, like an HTTP one."""
+        fake_dns.drop = ip.dns_whoami.QUERY_ATTEMPTS
+        ip.config_ip_server(ipserver=fake_dns.url(), ip_type="4")
+        ip.add_ip_server("https://iplookup.example.com", "4")
+        mocked_responses.get(url="https://iplookup.example.com", body="127.0.0.1")
+
+        assert ip.get_ip() == "127.0.0.1"
+
+    @pytest.mark.parametrize("option", ["--url", "--add-url"])
+    def test_malformed_url_rejected(
+        self,
+        option: str,
+        mock_db_for_test: Connection,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """A dns:// URL without a name to query isn't configured."""
+        parser = args.setup_argparse()
+        test_args = parser.parse_args(["ip-resolver-config", option, "dns://resolver1.opendns.com"])
+
+        with pytest.raises(ValueError, match="expected dns://SERVER"):
+            test_args.func(test_args)
+
+        assert "Error:" in capsys.readouterr().out
+        assert mock_db_for_test.execute("select count(*) from ipservers").fetchone()[0] == 0
+
+
 class TestViewUpdateIPServer:
     """function: view_or_update_ip_server with no config params set (view only)."""
 
@@ -0,0 +1,314 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the JSON lines log file and the logs command."""
+
+import gzip
+import json
+import logging
+import sys
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import args, constants, domains, events, logs
+from digital_ocean_dynamic_dns.testing.fake_do import FakeDigitalOcean
+
+
+def entry(ts: str, message: str, **fields: object) -> str:
+    """Return a line of the log file, as events.JSONLinesFormatter writes it."""
+    return json.dumps({"ts": ts, "level": "INFO", "logger": "test", "message": message, **fields})
+
+
+LOG_LINES = [
+    "2024-04-30 12:00 - Info : a line from before the log was JSON",
+    entry("2024-05-01T10:00:00.000+00:00", "updated www", domain="example.com", record_id=1),
+    entry("2024-05-01T11:00:00.000+00:00", "updated blog", domain="example.org", record_id=2),
+    entry("2024-05-01T12:00:00.000+00:00", "No updates necessary"),
+    entry("2024-05-01T13:00:00.000+00:00", "updated @", domain="Example.com", record_id=3),
+]
+
+
+@pytest.fixture
+def logfile(mocker: MockerFixture, tmp_path: Path) -> Path:
+    """Point do_ddns at a log file holding LOG_LINES."""
+    path = tmp_path / "do_ddns.log"
+    path.write_text("\n".join(LOG_LINES) + "\n")
+    mocker.patch.object(constants, "logfile", path)
+    return path
+
+
+@pytest.fixture
+def rotated_logfile(mocker: MockerFixture, tmp_path: Path) -> Path:
+    """Point do_ddns at LOG_LINES, rotated twice: 2 lines per gzipped file, and 1 left."""
+    path = tmp_path / "do_ddns.log"
+    for name, lines in (
+        ("do_ddns.log.2.gz", LOG_LINES[:2]),
+        ("do_ddns.log.1.gz", LOG_LINES[2:4]),
+    ):
+        with gzip.open(tmp_path / name, "wt") as rotated:
+            rotated.write("\n".join(lines) + "\n")
+    path.write_text(LOG_LINES[4] + "\n")
+    # Not a rotated log file.
+    (tmp_path / "do_ddns.log.old").write_text("ignored\n")
+    mocker.patch.object(constants, "logfile", path)
+    return path
+
+
+def show_log(*argv: str) -> None:
+    """Run do_ddns logs with `argv`."""
+    test_args = args.setup_argparse().parse_args(["logs", *argv])
+    test_args.func(test_args)
+
+
+@pytest.mark.usefixtures("logfile")
+def test_show_all(capsys: pytest.CaptureFixture[str]) -> None:
+    """Without options, every entry's message is printed, and older lines as they are."""
+    show_log()
+
+    assert capsys.readouterr().out.splitlines() == [
+        LOG_LINES[0],
+        "updated www",
+        "updated blog",
+        "No updates necessary",
+        "updated @",
+    ]
+
+
+@pytest.mark.usefixtures("logfile")
+def test_filters(capsys: pytest.CaptureFixture[str]) -> None:
+    """--since and --domain only print the matching entries, ignoring the domain's case."""
+    show_log("--since", "2024-05-01T10:30+00:00", "--domain", "EXAMPLE.com")
+
+    assert capsys.readouterr().out.splitlines() == ["updated @"]
+
+
+@pytest.mark.usefixtures("logfile")
+def test_tail(mocker: MockerFixture, capsys: pytest.CaptureFixture[str]) -> None:
+    """--tail prints the last matching entries in order, read backwards in blocks."""
+    mocker.patch.object(logs, "READ_BLOCK_SIZE", 7)
+
+    show_log("--tail", "2", "--domain", "example.com")
+    assert capsys.readouterr().out.splitlines() == ["updated www", "updated @"]
+
+    show_log("--tail", "10", "--json")
+    assert capsys.readouterr().out.splitlines() == LOG_LINES
+
+
+@pytest.mark.usefixtures("logfile")
+def test_tail_stops_before_since(mocker: MockerFixture, capsys: pytest.CaptureFixture[str]) -> None:
+    """--tail with --since stops reading at the first entry that is too old."""
+    parse = mocker.spy(logs._EntryFilter, "parse")  # noqa: SLF001
+
+    show_log("--tail", "10", "--since", "2024-05-01T11:30+00:00")
+
+    assert capsys.readouterr().out.splitlines() == ["No updates necessary", "updated @"]
+    assert parse.call_count == 3  # noqa: PLR2004
+
+
+def test_follow(mocker: MockerFixture, logfile: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    """--follow prints the entries appended after the tail, whole lines at a time."""
+    new_entry = entry("2024-05-01T14:00:00.000+00:00", "updated shop", domain="example.com")
+
+    # Each poll appends part of the entry; the third one is interrupted.
+    parts = iter([new_entry[:10], new_entry[10:] + "\n"])
+
+    def append(_: float) -> None:
+        part = next(parts, None)
+        if part is None:
+            raise KeyboardInterrupt
+        with logfile.open("a") as log_file:
+            log_file.write(part)
+
+    mocker.patch.object(logs.time, "sleep", side_effect=append)
+
+    show_log("--tail", "1", "--follow", "--domain", "example.com")
+
+    assert capsys.readouterr().out.splitlines() == ["updated @", "updated shop"]
+
+
+def test_since_time() -> None:
+    """--since takes a duration ago, or an ISO 8601 date or time."""
+    assert args.since_time("2024-05-01T12:00+02:00") == datetime(2024, 5, 1, 10, tzinfo=UTC)
+    ago = datetime.now(UTC) - args.since_time("2h")
+    assert 7199 < ago.total_seconds() < 7300  # noqa: PLR2004
+    with pytest.raises(args.argparse.ArgumentTypeError):
+        args.since_time("yesterday")
+
+
+def test_formatter() -> None:
+    """Log records become JSON objects, with their event fields and exception."""
+    record = logging.LogRecord("test", logging.ERROR, __file__, 1, "A record %s failed", (1,), None)
+    record.created = datetime(2024, 5, 1, 12, tzinfo=UTC).timestamp()
+    record.event = {"domain": "example.com", "record_id": 1, "level": "ignored"}
+    try:
+        raise ValueError("boom")  # noqa: EM101, TRY301
+    except ValueError:
+        record.exc_info = sys.exc_info()
+
+    logged = json.loads(events.JSONLinesFormatter().format(record))
+
+    assert logged["ts"] == "2024-05-01T12:00:00.000+00:00"
+    assert logged["level"] == "ERROR"
+    assert logged["message"] == "A record 1 failed"
+    assert (logged["domain"], logged["record_id"]) == ("example.com", 1)
+    assert "ValueError: boom" in logged["exc"]
+
+
+def test_update_events(cli_on_fake: FakeDigitalOcean, caplog: pytest.LogCaptureFixture) -> None:
+    """update-ips logs an event for each A record it updates."""
+    domains.manage_domain("example.com")
+    domains.manage_all_existing_a_records("example.com")
+    # manage pointed the A records at the fake's default public IP, 203.0.113.7.
+    cli_on_fake.public_ip = "203.0.113.9"
+    test_args = args.setup_argparse().parse_args(["update-ips"])
+
+    with caplog.at_level(logging.INFO):
+        assert test_args.func(test_args) == 0
+
+    logged = [record.event for record in caplog.records if hasattr(record, "event")]
+    assert len(logged) == 3  # noqa: PLR2004
+    assert {event["domain"] for event in logged} == {"example.com"}
+    assert {(event["old_ip"], event["new_ip"]) for event in logged} == {
+        ("203.0.113.7", "203.0.113.9")
+    }
+    assert {event["outcome"] for event in logged} == {"updated"}
+
+
+@pytest.mark.usefixtures("rotated_logfile")
+def test_show_rotated(capsys: pytest.CaptureFixture[str]) -> None:
+    """The rotated log files are printed first, the oldest first."""
+    show_log("--json")
+
+    assert capsys.readouterr().out.splitlines() == LOG_LINES
+
+
+def test_since_skips_older_rotated_files(
+    mocker: MockerFixture, rotated_logfile: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """--since only reads the rotated log files that may hold entries since then."""
+    opened = mocker.spy(logs, "_open_log_file")
+
+    show_log("--since", "2024-05-01T11:30+00:00")
+
+    assert capsys.readouterr().out.splitlines() == ["No updates necessary", "updated @"]
+    assert rotated_logfile.with_name("do_ddns.log.2.gz") not in {
+        call.args[0] for call in opened.call_args_list
+    }
+
+
+@pytest.mark.usefixtures("rotated_logfile")
+def test_tail_rotated(mocker: MockerFixture, capsys: pytest.CaptureFixture[str]) -> None:
+    """--tail reads the rotated log files, the newest first, until it has enough entries."""
+    opened = mocker.spy(logs, "_open_log_file")
+
+    show_log("--tail", "3")
+    assert capsys.readouterr().out.splitlines() == [
+        "updated blog",
+        "No updates necessary",
+        "updated @",
+    ]
+    assert [call.args[0].name for call in opened.call_args_list] == ["do_ddns.log.1.gz"]
+
+    show_log("--tail", "2", "--domain", "example.com")
+    assert capsys.readouterr().out.splitlines() == ["updated www", "updated @"]
+
+
+def test_follow_rotation(
+    mocker: MockerFixture, logfile: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """--follow carries on with the new log file once the log file is rotated."""
+    new_entry = entry("2024-05-01T14:00:00.000+00:00", "updated shop")
+    rotations = iter([logfile])
+
+    def rotate(_: float) -> None:
+        path = next(rotations, None)
+        if path is None:
+            raise KeyboardInterrupt
+        with path.open("a") as log_file:
+            log_file.write(entry("2024-05-01T13:30:00.000+00:00", "before rotating") + "\n")
+        path.rename(path.with_name("do_ddns.log.1"))
+        path.write_text(new_entry + "\n")
+
+    mocker.patch.object(logs.time, "sleep", side_effect=rotate)
+
+    show_log("--tail", "1", "--follow")
+
+    assert capsys.readouterr().out.splitlines() == [
+        "updated @",
+        "before rotating",
+        "updated shop",
+    ]
+
+
+def make_record(message: str, created: float) -> logging.LogRecord:
+    """Return an INFO log record of `message`, logged at `created`."""
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, message, (), None)
+    record.created = created
+    return record
+
+
+def test_rotate_by_size(tmp_path: Path) -> None:
+    """The log file is gzipped once it is too large, keeping the newest rotated files."""
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    path = log_dir / "do_ddns.log"
+    handler = events.LogFileHandler(path, max_bytes=100, max_age=0, backup_count=2)
+    now = time.time()
+    for n in range(5):
+        handler.emit(make_record(f"{n}" * 60, now))
+    handler.close()
+
+    assert sorted(child.name for child in log_dir.iterdir()) == [
+        "do_ddns.log",
+        "do_ddns.log.1.gz",
+        "do_ddns.log.2.gz",
+    ]
+    assert path.read_text() == "4" * 60 + "\n"
+    with gzip.open(log_dir / "do_ddns.log.1.gz", "rt") as rotated:
+        assert rotated.read() == "3" * 60 + "\n"
+
+
+def test_rotate_by_age(tmp_path: Path) -> None:
+    """The log file is rotated once its first entry is too old, even from an earlier run."""
+    path = tmp_path / "do_ddns.log"
+    path.write_text(entry("2024-05-01T10:00:00.000+00:00", "first") + "\n")
+    first = datetime(2024, 5, 1, 10, tzinfo=UTC).timestamp()
+    handler = events.LogFileHandler(path, max_bytes=0, max_age=3600, backup_count=5)
+
+    handler.emit(make_record("within the hour", first + 3599))
+    assert not (tmp_path / "do_ddns.log.1.gz").exists()
+
+    handler.emit(make_record("an hour later", first + 3600))
+    handler.close()
+
+    assert (tmp_path / "do_ddns.log.1.gz").exists()
+    assert path.read_text() == "an hour later\n"
+    assert handler.started_at > first + 3600
+
+
+def test_configure_logging(
+    mocker: MockerFixture, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Records go through a queue to the log file, as JSON lines, and are flushed at exit."""
+    root = logging.getLogger()
+    mocker.patch.object(root, "handlers", [])
+    mocker.patch.object(root, "level", logging.WARNING)
+    mocked_atexit = mocker.patch.object(events.atexit, "register", autospec=True)
+    monkeypatch.setenv("DO_DDNS_LOG_BACKUPS", "two")
+    path = tmp_path / "do_ddns.log"
+
+    events.configure_logging(path)
+    queue_handler = root.handlers[0]
+    try:
+        logging.getLogger("test").info("queued", extra={"event": {"domain": "example.com"}})
+    finally:
+        stop_listener = mocked_atexit.call_args.args[0]
+        stop_listener()
+        queue_handler.close()
+
+    logged = json.loads(path.read_text())
+    assert (logged["message"], logged["domain"]) == ("queued", "example.com")
@@ -35,7 +35,7 @@ class TestMartialManage:
         mocked_manage_domain.assert_called_once_with(expected_domain)
 
         # Validate
-        mocked_list_sub_domains.assert_called_once_with(expected_domain)
+        mocked_list_sub_domains.assert_called_once_with(expected_domain, refresh=False)
 
     def test_manage_entire_domain(
         self,
@@ -114,7 +114,7 @@ class TestMartialUnManage:
         manage.martial_un_manage(test_args)
 
         # Validate
-        mocked_list_sub_domains.assert_called_once_with(expected_domain)
+        mocked_list_sub_domains.assert_called_once_with(expected_domain, refresh=False)
 
     def test_un_manage_entire_domain(
         self,
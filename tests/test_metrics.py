@@ -0,0 +1,113 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the Prometheus textfile export of update-ips runs."""
+
+from collections.abc import Generator
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import args, domains, metrics, timings
+from digital_ocean_dynamic_dns.testing.fake_do import FakeDigitalOcean
+
+NEW_IP = "203.0.113.9"
+
+
+@pytest.fixture
+def managed_example_com(cli_on_fake: FakeDigitalOcean) -> Generator[None, None, None]:
+    """Manage the A records of example.com, then point the host at a new IP."""
+    fake = cli_on_fake
+    domains.manage_domain("example.com")
+    domains.manage_all_existing_a_records("example.com")
+    fake.public_ip = NEW_IP
+    timings.get_timings.cache_clear()
+    yield
+    timings.get_timings.cache_clear()
+
+
+def update_ips(*argv: str) -> int:
+    """Run do_ddns update-ips with `argv`, returning its exit status."""
+    test_args = args.setup_argparse().parse_args(["update-ips", *argv])
+    return test_args.func(test_args)
+
+
+@pytest.mark.usefixtures("managed_example_com")
+def test_metrics_written(tmp_path: Path, fake: FakeDigitalOcean) -> None:
+    """A successful run's metrics replace the file, leaving no temporary file behind."""
+    textfile_dir = tmp_path / "textfile_collector"
+    textfile_dir.mkdir()
+    metrics_file = textfile_dir / "do_ddns.prom"
+    metrics_file.write_text("stale\n")
+
+    assert update_ips("--metrics-file", str(metrics_file)) == 0
+
+    lines = metrics_file.read_text().splitlines()
+    assert "stale" not in lines
+    assert "# TYPE do_ddns_run_duration_seconds gauge" in lines
+    assert "do_ddns_run_success 1" in lines
+    assert 'do_ddns_a_records{outcome="checked"} 3' in lines
+    assert 'do_ddns_a_records{outcome="updated"} 3' in lines
+    assert 'do_ddns_a_records{outcome="failed"} 0' in lines
+    assert (
+        'do_ddns_api_requests{endpoint="PATCH /domains/{domain}/records/{id}",status="200"} 3'
+        in lines
+    )
+    assert (
+        'do_ddns_api_request_duration_seconds_count{endpoint="GET /domains/{domain}/records"} 1'
+        in lines
+    )
+    assert f'do_ddns_current_ip_info{{ip="{NEW_IP}"}} 1' in lines
+    assert f'do_ddns_ip_resolver_consecutive_failures{{url="{fake.ip_url}"}} 0' in lines
+    assert any(line.startswith("do_ddns_last_success_timestamp_seconds ") for line in lines)
+    assert [path.name for path in textfile_dir.iterdir()] == ["do_ddns.prom"]
+
+
+@pytest.mark.usefixtures("managed_example_com")
+def test_failed_run(tmp_path: Path, fake: FakeDigitalOcean) -> None:
+    """A run that failed to check the A records says so, with the status the API answered."""
+    metrics_file = tmp_path / "do_ddns.prom"
+    # Fails listing the A records of example.com.
+    fake.fail_next(HTTPStatus.UNPROCESSABLE_ENTITY)
+
+    assert update_ips("--metrics-file", str(metrics_file)) == 1
+
+    lines = metrics_file.read_text().splitlines()
+    assert "do_ddns_run_success 0" in lines
+    assert 'do_ddns_a_records{outcome="failed"} 3' in lines
+    assert 'do_ddns_api_requests{endpoint="GET /domains/{domain}/records",status="422"} 1' in lines
+    assert not any(line.startswith("do_ddns_last_success_timestamp_seconds") for line in lines)
+
+
+@pytest.mark.usefixtures("managed_example_com")
+def test_unwritable_metrics_file(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    """A metrics file that can't be written is reported without failing the run."""
+    assert update_ips("--metrics-file", str(tmp_path / "missing" / "do_ddns.prom")) == 0
+
+    assert "could not write metrics" in capsys.readouterr().out
+
+
+def test_label_values_escaped() -> None:
+    """Backslashes, quotes and newlines in label values are escaped."""
+    assert metrics._escape('a\\b"c\nd') == 'a\\\\b\\"c\\nd'  # noqa: SLF001
+
+
+@pytest.mark.usefixtures("managed_example_com")
+def test_metrics_error_keeps_status(
+    tmp_path: Path, mocker: MockerFixture, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Any error exporting the metrics is a warning: the A records were updated regardless."""
+    metrics_file = tmp_path / "do_ddns.prom"
+    mocker.patch.object(
+        metrics,
+        "render_metrics",
+        autospec=True,
+        side_effect=PermissionError(13, "Permission denied"),
+    )
+
+    assert update_ips("--metrics-file", str(metrics_file)) == 0
+
+    assert "could not record the run" in capsys.readouterr().out
+    assert not metrics_file.exists()
@@ -0,0 +1,161 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the local mirror of the remote zone state."""
+
+from sqlite3 import Connection
+from unittest.mock import MagicMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import args, domains, mirror, subdomains
+
+# Fixtures all tests in this module will use.
+pytestmark = pytest.mark.usefixtures("mock_db_for_test", "mocked_responses")
+
+A_RECORDS = [
+    {"id": 1, "type": "A", "name": "@", "data": "127.0.0.1", "ttl": 1800},
+    {"id": 2, "type": "A", "name": "support", "data": "127.0.0.2", "ttl": 3600},
+]
+
+
+@pytest.fixture
+def mocked_get_a_records(mocker: MockerFixture) -> MagicMock:
+    """Mock listing a domain's A records."""
+    mocked_get_a_records = mocker.patch.object(mirror.do_api, "get_a_records", autospec=True)
+    mocked_get_a_records.return_value = A_RECORDS
+    return mocked_get_a_records
+
+
+@pytest.fixture
+def mocked_get_all_domains(mocker: MockerFixture) -> MagicMock:
+    """Mock listing the account's domains."""
+    mocked_get_all_domains = mocker.patch.object(mirror.do_api, "get_all_domains", autospec=True)
+    mocked_get_all_domains.return_value = [
+        {"name": "example.com", "ttl": 1800, "zone_file": "lorem ipsum"},
+        {"name": "nivin.tech", "ttl": 1800, "zone_file": "lorem ipsum"},
+    ]
+    return mocked_get_all_domains
+
+
+class TestGetARecords:
+    """A records are read from the mirror once they have been fetched."""
+
+    def test_fetched_once(self, mocked_get_a_records: MagicMock) -> None:
+        """The first listing goes remote; later ones are served from the mirror."""
+        fetched, fetched_at = mirror.get_a_records("example.com")
+        mirrored, mirrored_at = mirror.get_a_records("example.com")
+
+        mocked_get_a_records.assert_called_once_with("example.com")
+        assert fetched == A_RECORDS
+        assert mirrored == A_RECORDS
+        assert mirrored_at == fetched_at
+
+    def test_refresh(self, mocked_get_a_records: MagicMock) -> None:
+        """refresh=True always goes remote, and updates the mirror."""
+        mirror.get_a_records("example.com")
+        mocked_get_a_records.return_value = A_RECORDS[:1]
+
+        assert mirror.get_a_records("example.com", refresh=True)[0] == A_RECORDS[:1]
+        assert mirror.get_a_records("example.com")[0] == A_RECORDS[:1]
+        assert mocked_get_a_records.call_count == 2  # noqa: PLR2004
+
+    def test_empty_listing_mirrored(self, mocked_get_a_records: MagicMock) -> None:
+        """A domain without A records isn't mistaken for one that was never fetched."""
+        mocked_get_a_records.return_value = []
+
+        for _ in range(2):
+            assert mirror.get_a_records("example.com")[0] == []
+
+        mocked_get_a_records.assert_called_once_with("example.com")
+
+    def test_domains_mirrored_separately(self, mocked_get_a_records: MagicMock) -> None:
+        """Each domain has its own mirrored listing."""
+        mocked_get_a_records.side_effect = lambda domain: (
+            A_RECORDS if domain == "example.com" else [{**A_RECORDS[0], "id": 3}]
+        )
+        mirror.get_a_records("example.com")
+        mirror.get_a_records("nivin.tech")
+        nivin_tech = mirror.get_a_records("nivin.tech")[0]
+
+        assert mocked_get_a_records.call_count == 2  # noqa: PLR2004
+        assert [record["id"] for record in nivin_tech] == [3]
+
+
+def test_get_domains(mocked_get_all_domains: MagicMock) -> None:
+    """The account's domains are fetched once, then served from the mirror."""
+    fetched = mirror.get_domains()[0]
+    mirrored = mirror.get_domains()[0]
+
+    mocked_get_all_domains.assert_called_once_with()
+    assert [domain["name"] for domain in fetched] == ["example.com", "nivin.tech"]
+    assert mirrored == [{"name": "example.com", "ttl": 1800}, {"name": "nivin.tech", "ttl": 1800}]
+
+
+def test_sync(
+    mock_db_for_test: Connection,
+    mocked_get_all_domains: MagicMock,
+    mocked_get_a_records: MagicMock,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """do_ddns sync refreshes the domains, and the A records of the managed domains only."""
+    with mock_db_for_test:
+        mock_db_for_test.execute(
+            "INSERT INTO domains(name, cataloged) values ('example.com', 0), ('nivin.tech', 0)"
+        )
+        mock_db_for_test.execute("UPDATE domains SET managed = 0 WHERE name = 'nivin.tech'")
+    parser = args.setup_argparse()
+    test_args = parser.parse_args(["sync"])
+
+    assert test_args.func(test_args) == 0
+
+    mocked_get_all_domains.assert_called_once_with()
+    mocked_get_a_records.assert_called_once_with("example.com")
+    assert "Synced 2 domains, and 2 A records of 1 managed domains" in capsys.readouterr().out
+
+    # Listings are now served from the mirror.
+    mirror.get_domains()
+    mirror.get_a_records("example.com")
+    mocked_get_all_domains.assert_called_once_with()
+    mocked_get_a_records.assert_called_once_with("example.com")
+
+
+@pytest.mark.parametrize("refresh", [False, True])
+def test_list_sub_domains(
+    mocked_get_a_records: MagicMock,
+    capsys: pytest.CaptureFixture[str],
+    *,
+    refresh: bool,
+) -> None:
+    """The --list of manage and un-manage reads the mirror, unless --refresh is given."""
+    parser = args.setup_argparse()
+    subdomains.list_sub_domains("example.com")
+    test_args = parser.parse_args(
+        ["un-manage", "example.com", "--list", *(["--refresh"] if refresh else [])]
+    )
+
+    test_args.func(test_args)
+
+    assert mocked_get_a_records.call_count == 1 + refresh
+    output = capsys.readouterr().out
+    assert "support" in output
+    assert "Use --refresh to fetch them again." in output
+
+
+@pytest.mark.parametrize("refresh", [False, True])
+def test_show_all_domains(
+    mocked_get_all_domains: MagicMock,
+    capsys: pytest.CaptureFixture[str],
+    *,
+    refresh: bool,
+) -> None:
+    """show-info domains reads the mirror, unless --refresh is given."""
+    parser = args.setup_argparse()
+    mirror.get_domains()
+    test_args = parser.parse_args(["show-info", "domains", *(["--refresh"] if refresh else [])])
+
+    domains.show_all_domains(test_args)
+
+    assert mocked_get_all_domains.call_count == 1 + refresh
+    assert "Name : nivin.tech" in capsys.readouterr().out
@@ -0,0 +1,175 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for watching the host's addresses through netlink."""
+
+import errno
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import time
+from ipaddress import IPv4Address
+
+import pytest
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import netlink
+from digital_ocean_dynamic_dns.netlink import AddressChange
+from digital_ocean_dynamic_dns.testing.fake_netlink import (
+    FakeNetlink,
+    address_message,
+    netlink_message,
+    rtattr,
+)
+
+NLMSG_DONE = 3
+RT_SCOPE_LINK = 253
+
+
+class TestParseAddressChanges:
+    """Tests for parsing the messages of the kernel."""
+
+    def test_added_and_removed(self) -> None:
+        """Each global IPv4 address added or removed in a batch is a change."""
+        data = (
+            address_message("203.0.113.5", added=False)
+            + address_message("198.51.100.7", label=None, interface_index=3)
+            + netlink_message(NLMSG_DONE, b"\0\0\0\0")
+        )
+
+        assert netlink.parse_address_changes(data) == [
+            AddressChange(added=False, interface_index=2, address="203.0.113.5", label="eth0"),
+            AddressChange(added=True, interface_index=3, address="198.51.100.7", label=None),
+        ]
+
+    def test_point_to_point(self) -> None:
+        """IFA_LOCAL is the host's address; IFA_ADDRESS the peer's on a point-to-point link."""
+        payload = (
+            netlink.IFADDRMSG.pack(socket.AF_INET, 32, 0, netlink.RT_SCOPE_UNIVERSE, 4)
+            + rtattr(netlink.IFA_ADDRESS, IPv4Address("192.0.2.1").packed)
+            + rtattr(netlink.IFA_LOCAL, IPv4Address("203.0.113.5").packed)
+            + rtattr(netlink.IFA_LABEL, b"ppp0\0")
+        )
+
+        assert netlink.parse_address_changes(netlink_message(netlink.RTM_NEWADDR, payload)) == [
+            AddressChange(added=True, interface_index=4, address="203.0.113.5", label="ppp0")
+        ]
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            pytest.param(address_message("169.254.1.1", scope=RT_SCOPE_LINK), id="link-local"),
+            pytest.param(
+                netlink_message(
+                    netlink.RTM_NEWADDR,
+                    netlink.IFADDRMSG.pack(socket.AF_INET6, 64, 0, 0, 2)
+                    + rtattr(netlink.IFA_ADDRESS, b"\x20\x01\x0d\xb8" + b"\0" * 12),
+                ),
+                id="ipv6",
+            ),
+            pytest.param(netlink_message(NLMSG_DONE, b"\0\0\0\0"), id="other-message"),
+            pytest.param(netlink_message(netlink.RTM_NEWADDR, b"\x02\x18"), id="short-payload"),
+            pytest.param(address_message("203.0.113.5")[:10], id="truncated"),
+            pytest.param(
+                netlink.NLMSG_HEADER.pack(4, netlink.RTM_NEWADDR, 0, 0, 0), id="bad-length"
+            ),
+        ],
+    )
+    def test_skipped(self, data: bytes) -> None:
+        """Other messages, scopes and families, and malformed messages, aren't changes."""
+        assert netlink.parse_address_changes(data) == []
+
+
+class TestWaitForChanges:
+    """Tests for waiting on the socket."""
+
+    def test_change(self) -> None:
+        """A change ends the wait at once, with the rest of its burst."""
+        with FakeNetlink() as fake:
+            fake.remove_address("203.0.113.5")
+            fake.add_address("198.51.100.7")
+
+            started = time.monotonic()
+            changes = netlink.wait_for_changes(fake.socket, 30)
+
+        assert time.monotonic() - started < 10  # noqa: PLR2004
+        assert changes is not None
+        assert [(change.added, change.address) for change in changes] == [
+            (False, "203.0.113.5"),
+            (True, "198.51.100.7"),
+        ]
+
+    def test_timeout(self) -> None:
+        """Changes to other addresses don't end the wait."""
+        with FakeNetlink() as fake:
+            fake.send(address_message("169.254.1.1", scope=RT_SCOPE_LINK))
+
+            assert netlink.wait_for_changes(fake.socket, 0.2) is None
+
+    def test_wake(self) -> None:
+        """The wake socket ends the wait early, and is drained."""
+        wake, wake_writer = socket.socketpair()
+        with FakeNetlink() as fake, wake, wake_writer:
+            wake_writer.send(b"\0")
+
+            started = time.monotonic()
+            assert netlink.wait_for_changes(fake.socket, 30, wake=wake) is None
+            assert time.monotonic() - started < 10  # noqa: PLR2004
+            assert netlink.wait_for_changes(fake.socket, 0.1, wake=wake) is None
+
+    def test_dropped_messages(self, mocker: MockerFixture) -> None:
+        """Messages dropped by the kernel may have been changes: the wait ends."""
+        with FakeNetlink() as fake:
+            fake.send(b"dropped")
+            recv = fake.socket.recv
+
+            def overflow(*_: object) -> bytes:
+                recv(netlink.RECV_SIZE)
+                raise OSError(errno.ENOBUFS, os.strerror(errno.ENOBUFS))
+
+            mocker.patch.object(netlink.socket.socket, "recv", autospec=True, side_effect=overflow)
+
+            assert netlink.wait_for_changes(fake.socket, 30) == []
+
+
+def test_not_supported(mocker: MockerFixture) -> None:
+    """Hosts without netlink raise OSError."""
+    mocker.patch.object(netlink, "socket", spec=["AF_INET"])
+
+    with pytest.raises(OSError, match="only supported on Linux"):
+        netlink.open_socket()
+
+
+def _add_address_in_namespace(results: multiprocessing.Queue) -> None:
+    """In a new network namespace, watch for an address added to the loopback interface."""
+    try:
+        os.unshare(os.CLONE_NEWNET)
+        with netlink.open_socket() as sock:
+            add_address = ["ip", "addr", "add", "203.0.113.5/32", "dev", "lo"]
+            subprocess.run(add_address, check=True, capture_output=True)  # noqa: S603
+            results.put(netlink.wait_for_changes(sock, 5))
+    except (OSError, subprocess.CalledProcessError) as e:
+        results.put(e)
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "unshare") or shutil.which("ip") is None,
+    reason="needs Linux network namespaces and iproute2",
+)
+def test_network_namespace() -> None:
+    """The kernel's own messages are parsed, in a network namespace of their own."""
+    # Spawned rather than forked: the test process runs other threads, e.g. the log writer.
+    context = multiprocessing.get_context("spawn")
+    results: multiprocessing.Queue = context.Queue()
+    child = context.Process(target=_add_address_in_namespace, args=(results,))
+    child.start()
+    result = results.get(timeout=30)
+    child.join()
+    if isinstance(result, (OSError, subprocess.CalledProcessError)):
+        pytest.skip(f"can't create a network namespace: {result}")
+
+    assert result == [
+        AddressChange(added=True, interface_index=1, address="203.0.113.5", label="lo")
+    ]
@@ -0,0 +1,118 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for do_ddns's global profiling options."""
+
+import json
+import pstats
+import sys
+from collections.abc import Generator
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import ddns, do_api, domains, logs, timings
+from digital_ocean_dynamic_dns.testing.fake_do import FakeDigitalOcean
+
+
+@pytest.fixture(autouse=True)
+def fresh_timings() -> Generator[None, None, None]:
+    """Start each test without the samples of earlier tests."""
+    timings.get_timings.cache_clear()
+    yield
+    timings.get_timings.cache_clear()
+
+
+def run_do_ddns(mocker: MockerFixture, *argv: str) -> None:
+    """Run do_ddns with `argv` as its command line."""
+    mocker.patch.object(do_api, "save_rate_limit_budget", autospec=True)
+    mocker.patch.object(sys, "argv", ["do_ddns", *argv])
+    ddns.run()
+
+
+def test_profile(mocker: MockerFixture, tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    """--profile saves a profile of the subcommand and prints its top functions to stderr."""
+    mocked_show_log = mocker.patch.object(logs, "show_log", autospec=True, return_value=None)
+    profile_path = tmp_path / "logs.prof"
+
+    run_do_ddns(mocker, "--profile", str(profile_path), "--top", "5", "logs")
+
+    mocked_show_log.assert_called_once()
+    assert pstats.Stats(str(profile_path)).total_calls > 0
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "cumulative" in captured.err
+    assert f"Profile saved to {profile_path}" in captured.err
+
+
+def test_trace_malloc(mocker: MockerFixture, capsys: pytest.CaptureFixture[str]) -> None:
+    """--trace-malloc prints the peak and the top allocation sites, even when the run fails."""
+    held = []
+
+    def allocate(_: object) -> None:
+        held.append(bytearray(1024 * 1024))
+        raise RuntimeError
+
+    mocker.patch.object(logs, "show_log", autospec=True, side_effect=allocate)
+
+    with pytest.raises(RuntimeError):
+        run_do_ddns(mocker, "--trace-malloc", "--top", "3", "logs")
+
+    err = capsys.readouterr().err
+    assert "KiB peak" in err
+    assert "Top 3 allocation sites:" in err
+    assert "#3: " in err
+    assert "#4: " not in err
+    assert "test_profiling.py" in err
+
+
+def test_trace_events(mocker: MockerFixture, cli_on_fake: FakeDigitalOcean, tmp_path: Path) -> None:
+    """--trace-events saves the subcommand and the operations it timed as a Chrome trace."""
+    domains.manage_domain("example.com")
+    domains.manage_all_existing_a_records("example.com")
+    cli_on_fake.public_ip = "203.0.113.9"
+    trace_path = tmp_path / "update-ips.json"
+
+    run_do_ddns(mocker, "--trace-events", str(trace_path), "update-ips")
+
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    names = [span["name"] for span in spans]
+    assert names.count("api PATCH /domains/{domain}/records/{id}") == 3  # noqa: PLR2004
+    assert "ip.get_ip" in names
+    command = next(span for span in spans if span["name"] == "do_ddns update-ips")
+    assert command["cat"] == "do_ddns"
+    assert all(
+        command["ts"] <= span["ts"] and span["ts"] + span["dur"] <= command["ts"] + command["dur"]
+        for span in spans
+    )
+    thread_names = {event["args"]["name"] for event in events if event["ph"] == "M"}
+    assert "MainThread" in thread_names
+    assert not timings.get_timings().stop_tracing()
+
+
+def test_trace_events_unwritable(
+    mocker: MockerFixture, tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """A trace that can't be written is reported without failing the run."""
+    mocker.patch.object(logs, "show_log", autospec=True, return_value=None)
+
+    run_do_ddns(mocker, "--trace-events", str(tmp_path / "missing" / "trace.json"), "logs")
+
+    assert "could not write the trace" in capsys.readouterr().err
+
+
+def test_spans_outlive_clear() -> None:
+    """Clearing the timings for a new run keeps the spans traced so far."""
+    run_timings = timings.Timings()
+    with run_timings.measure("untraced"):
+        pass
+    run_timings.start_tracing()
+    with run_timings.measure("first run"):
+        pass
+    run_timings.clear()
+    with run_timings.measure("second run"):
+        pass
+
+    assert [span.operation for span in run_timings.stop_tracing()] == ["first run", "second run"]
@@ -0,0 +1,166 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the Digital Ocean API rate limiter."""
+
+from email.utils import formatdate
+from sqlite3 import Connection
+
+import pytest
+
+from digital_ocean_dynamic_dns import ratelimit
+
+# Fixtures all tests in this module will use.
+pytestmark = pytest.mark.usefixtures("mock_db_for_test")
+
+
+class FakeClock:
+    """A controllable clock; sleeping advances it instantly."""
+
+    def __init__(self, now: float = 1_700_000_000.0) -> None:
+        """Start the clock at `now`."""
+        self.now = now
+        self.sleeps: list[float] = []
+
+    def time(self) -> float:
+        """Return the current fake time."""
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        """Record the sleep and advance the clock."""
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    """Provide a fake clock for the rate limiter."""
+    return FakeClock()
+
+
+class TestTokenBucket:
+    """Token bucket accounting."""
+
+    def test_refill_is_capped(self) -> None:
+        """Tokens accrue evenly over the window, never beyond capacity."""
+        expected_capacity = 60
+        bucket = ratelimit.TokenBucket(
+            capacity=expected_capacity, window=60, tokens=0, updated_at=0
+        )
+
+        bucket.refill(30)
+        assert bucket.tokens == pytest.approx(30)
+
+        bucket.refill(1_000)
+        assert bucket.tokens == expected_capacity
+
+    def test_reserve_returns_wait_once_empty(self) -> None:
+        """Once the bucket is empty, each reservation waits for one more token."""
+        bucket = ratelimit.TokenBucket(capacity=60, window=60, tokens=1, updated_at=0)
+
+        assert bucket.reserve(0) == 0
+        assert bucket.reserve(0) == pytest.approx(1)
+        assert bucket.reserve(0) == pytest.approx(2)
+
+
+class TestRateLimiter:
+    """Pacing of requests by the rate limiter."""
+
+    def test_no_wait_within_budget(self, clock: FakeClock) -> None:
+        """Requests within budget are sent immediately."""
+        limiter = ratelimit.RateLimiter(clock=clock.time, sleep=clock.sleep)
+
+        for _ in range(ratelimit.MINUTE_LIMIT):
+            limiter.acquire()
+
+        assert clock.sleeps == []
+
+    def test_paced_once_minute_budget_spent(self, clock: FakeClock) -> None:
+        """Requests beyond the per-minute budget are spread over the window."""
+        limiter = ratelimit.RateLimiter(clock=clock.time, sleep=clock.sleep)
+
+        for _ in range(ratelimit.MINUTE_LIMIT + 1):
+            limiter.acquire()
+
+        assert clock.sleeps == [pytest.approx(60 / ratelimit.MINUTE_LIMIT)]
+
+    def test_paced_by_ratelimit_headers(self, clock: FakeClock) -> None:
+        """The hourly budget follows the ratelimit-remaining header."""
+        limiter = ratelimit.RateLimiter(clock=clock.time, sleep=clock.sleep)
+
+        limiter.update({"ratelimit-limit": "5000", "ratelimit-remaining": "0"})
+        limiter.acquire()
+
+        assert clock.sleeps == [pytest.approx(3600 / 5000)]
+
+    def test_missing_headers_ignored(self, clock: FakeClock) -> None:
+        """Responses without ratelimit headers leave the budget unchanged."""
+        limiter = ratelimit.RateLimiter(clock=clock.time, sleep=clock.sleep)
+
+        limiter.update({})
+
+        assert limiter.buckets["hourly"].tokens == ratelimit.HOURLY_LIMIT
+
+
+class TestRetryDelay:
+    """Delay before retrying a rate limited request."""
+
+    def test_retry_after_seconds(self, clock: FakeClock) -> None:
+        """Retry-After given as delta-seconds."""
+        limiter = ratelimit.RateLimiter(clock=clock.time, sleep=clock.sleep)
+        expected_delay = 7
+        assert limiter.retry_delay({"Retry-After": str(expected_delay)}) == expected_delay
+
+    def test_retry_after_http_date(self, clock: FakeClock) -> None:
+        """Retry-After given as an HTTP-date."""
+        limiter = ratelimit.RateLimiter(clock=clock.time, sleep=clock.sleep)
+        retry_after = formatdate(clock.now + 30, usegmt=True)
+        assert limiter.retry_delay({"Retry-After": retry_after}) == pytest.approx(30)
+
+    def test_ratelimit_reset(self, clock: FakeClock) -> None:
+        """Fall back to ratelimit-reset when there is no Retry-After."""
+        limiter = ratelimit.RateLimiter(clock=clock.time, sleep=clock.sleep)
+        assert limiter.retry_delay({"ratelimit-reset": str(clock.now + 12)}) == pytest.approx(12)
+
+    def test_no_indication(self, clock: FakeClock) -> None:
+        """No retry without an indication of when to retry."""
+        limiter = ratelimit.RateLimiter(clock=clock.time, sleep=clock.sleep)
+        assert limiter.retry_delay({}) is None
+
+    @pytest.mark.parametrize(
+        ("headers", "expected"),
+        [
+            pytest.param({"Retry-After": "soon"}, None, id="retry-after"),
+            pytest.param({"ratelimit-reset": "soon"}, None, id="ratelimit-reset"),
+            pytest.param(
+                {"Retry-After": "soon", "ratelimit-reset": "1700000012"}, 12, id="fall-back"
+            ),
+        ],
+    )
+    def test_malformed_headers(
+        self, clock: FakeClock, headers: dict[str, str], expected: float | None
+    ) -> None:
+        """Malformed headers are ignored rather than raised on."""
+        limiter = ratelimit.RateLimiter(clock=clock.time, sleep=clock.sleep)
+        assert limiter.retry_delay(headers) == expected
+
+
+def test_budget_persisted(mock_db_for_test: Connection, clock: FakeClock) -> None:
+    """The budget saved by one invocation is restored by the next."""
+    limiter = ratelimit.RateLimiter(clock=clock.time, sleep=clock.sleep)
+    limiter.update({"ratelimit-limit": "5000", "ratelimit-remaining": "42"})
+
+    ratelimit.save_rate_limiter(mock_db_for_test, limiter)
+    # Saving twice updates rather than duplicates the saved buckets.
+    ratelimit.save_rate_limiter(mock_db_for_test, limiter)
+
+    restored = ratelimit.load_rate_limiter(mock_db_for_test)
+    assert restored.buckets == limiter.buckets
+    assert restored.buckets["hourly"].tokens == 42  # noqa: PLR2004
+
+
+def test_fresh_budget_without_saved_state(mock_db_for_test: Connection) -> None:
+    """With nothing saved yet, the budget starts full."""
+    restored = ratelimit.load_rate_limiter(mock_db_for_test)
+    assert restored.buckets["hourly"].tokens == ratelimit.HOURLY_LIMIT
+    assert restored.buckets["minute"].tokens == ratelimit.MINUTE_LIMIT
@@ -0,0 +1,136 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the adaptive polling schedule."""
+
+from datetime import UTC, datetime
+from sqlite3 import Connection
+
+import pytest
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import history, schedule
+
+# 2024-05-01 00:00 UTC.
+DAY_ONE = int(datetime(2024, 5, 1, tzinfo=UTC).timestamp())
+HOUR = 3600
+DAY = 24 * HOUR
+
+BOUNDS = {"min_interval": 60, "max_interval": HOUR, "default_interval": 300}
+
+
+def observe(conn: Connection, ip4: str, observed_at: int) -> None:
+    """Append an observation of `ip4`."""
+    with conn:
+        history.record_observation(
+            conn, ip4, observed_at, records_updated=0, records_failed=0, propagated=True
+        )
+
+
+@pytest.mark.parametrize(
+    ("stable_since", "change_gaps", "expected_interval", "expected_reason"),
+    [
+        pytest.param(None, [], 300, "no IP history yet", id="no-history"),
+        pytest.param(
+            DAY_ONE - 5 * 60,
+            [],
+            60,
+            "IP stable for 5m; at the minimum interval",
+            id="just-changed",
+        ),
+        pytest.param(DAY_ONE - 5 * HOUR, [], 30 * 60, "IP stable for 5h", id="stable"),
+        pytest.param(
+            DAY_ONE - 30 * DAY,
+            [],
+            HOUR,
+            "IP stable for 30d; at the maximum interval",
+            id="long-stable",
+        ),
+        pytest.param(
+            DAY_ONE - 5 * HOUR,
+            [10 * HOUR, 5 * HOUR, 3 * HOUR],
+            15 * 60,
+            "IP stable for 5h; changes every 5h on median",
+            id="frequent-changes",
+        ),
+        pytest.param(
+            DAY_ONE - 5 * HOUR,
+            [7 * DAY, 7 * DAY],
+            30 * 60,
+            "IP stable for 5h; changes every 7d on median",
+            id="rare-changes",
+        ),
+        pytest.param(DAY_ONE - 5 * HOUR, [HOUR], 30 * 60, "IP stable for 5h", id="one-gap"),
+    ],
+)
+def test_decide(
+    stable_since: int | None,
+    change_gaps: list[int],
+    expected_interval: int,
+    expected_reason: str,
+) -> None:
+    """The interval grows while the IP is stable, within the change rate and the bounds."""
+    decision = schedule.decide(
+        DAY_ONE, last_check_ok=True, stable_since=stable_since, change_gaps=change_gaps, **BOUNDS
+    )
+
+    assert decision == schedule.Decision(DAY_ONE, expected_interval, expected_reason)
+    assert decision.next_check_at == DAY_ONE + expected_interval
+
+
+def test_decide_after_failure() -> None:
+    """A failed check is retried after the minimum interval, however stable the IP."""
+    decision = schedule.decide(
+        DAY_ONE, last_check_ok=False, stable_since=DAY_ONE - 30 * DAY, change_gaps=[], **BOUNDS
+    )
+
+    assert decision == schedule.Decision(DAY_ONE, 60, "the last check failed")
+
+
+def test_plan_from_history(mock_db_for_test: Connection) -> None:
+    """Changes are found between rows of different IPs, compacted or not."""
+    conn = mock_db_for_test
+    now = DAY_ONE + 40 * HOUR
+    # The first change is older than the window, so only 20h and 10h gaps count.
+    observe(conn, "192.0.2.1", DAY_ONE - 100 * DAY)
+    observe(conn, "198.51.100.1", DAY_ONE - 99 * DAY)
+    observe(conn, "198.51.100.1", DAY_ONE)
+    observe(conn, "203.0.113.7", DAY_ONE + 5 * HOUR)
+    observe(conn, "203.0.113.7", DAY_ONE + 10 * HOUR)
+    observe(conn, "198.51.100.1", DAY_ONE + 25 * HOUR)
+    observe(conn, "192.0.2.1", DAY_ONE + 35 * HOUR)
+    observe(conn, "192.0.2.1", DAY_ONE + 39 * HOUR)
+
+    decision = schedule.plan(conn, now, last_check_ok=True, **BOUNDS)
+
+    # Stable for 5h: 30m, but changes every 15h on median: 45m.
+    assert decision == schedule.Decision(
+        now, 30 * 60, "IP stable for 5h; changes every 15h on median"
+    )
+
+
+def test_plan_without_changes(mock_db_for_test: Connection) -> None:
+    """Without a change, the IP is stable since it was first observed."""
+    conn = mock_db_for_test
+    observe(conn, "198.51.100.1", DAY_ONE)
+    observe(conn, "198.51.100.1", DAY_ONE + 2 * HOUR)
+
+    decision = schedule.plan(conn, DAY_ONE + 3 * HOUR, last_check_ok=True, **BOUNDS)
+
+    assert decision.interval == 18 * 60
+    assert decision.reason == "IP stable for 3h"
+
+
+def test_next_check_saved(mock_db_for_test: Connection, mocker: MockerFixture) -> None:
+    """Each decision replaces the last one saved."""
+    conn = mock_db_for_test
+    mocker.patch.object(schedule.time, "time", return_value=DAY_ONE)
+    assert schedule.last_decision(conn) is None
+
+    schedule.next_check(conn, last_check_ok=False, **BOUNDS)
+    observe(conn, "198.51.100.1", DAY_ONE - 5 * HOUR)
+    decision = schedule.next_check(conn, last_check_ok=True, **BOUNDS)
+
+    assert schedule.last_decision(conn) == decision
+    assert decision == schedule.Decision(DAY_ONE, 30 * 60, "IP stable for 5h")
+    assert conn.execute("SELECT count(*) FROM schedule_state").fetchone()[0] == 1
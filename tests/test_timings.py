@@ -0,0 +1,129 @@
+# SPDX-FileCopyrightText: © 2023 Tyler Nivin
+# SPDX-License-Identifier: MIT
+
+"""Tests for the per-operation timings of update-ips."""
+
+import sqlite3
+from collections.abc import Generator
+from sqlite3 import Connection
+
+import pytest
+from pytest_mock import MockerFixture
+
+from digital_ocean_dynamic_dns import args, domains, subdomains, timings
+from digital_ocean_dynamic_dns.testing.fake_do import FakeDigitalOcean
+
+
+@pytest.fixture(autouse=True)
+def fresh_timings() -> Generator[None, None, None]:
+    """Start each test without the samples of earlier tests."""
+    timings.get_timings.cache_clear()
+    yield
+    timings.get_timings.cache_clear()
+
+
+def test_percentile() -> None:
+    """Percentiles are nearest-rank: always one of the samples."""
+    samples = [float(n) for n in range(1, 21)]
+
+    assert timings.percentile(samples, 0.5) == 10.0  # noqa: PLR2004
+    assert timings.percentile(samples, 0.95) == 19.0  # noqa: PLR2004
+    assert timings.percentile([3.0], 0.95) == 3.0  # noqa: PLR2004
+
+
+def test_stats(mocker: MockerFixture) -> None:
+    """Samples are summarized per operation, the most time consuming first."""
+    run_timings = timings.Timings()
+    for seconds in (0.3, 0.1, 0.2):
+        run_timings.record("api GET /domains", seconds)
+    mocker.patch.object(timings.time, "perf_counter", side_effect=[10.0, 11.5])
+    with run_timings.measure("ip.get_ip"):
+        pass
+
+    assert run_timings.stats() == [
+        timings.OperationStats("ip.get_ip", 1, 1.5, 1.5, 1.5, 1.5),
+        timings.OperationStats("api GET /domains", 3, pytest.approx(0.6), 0.2, 0.3, 0.3),
+    ]
+
+
+def test_timed_failure() -> None:
+    """A call that raises is timed too."""
+
+    @timings.timed("db.write")
+    def write() -> None:
+        msg = "database is locked"
+        raise RuntimeError(msg)
+
+    with pytest.raises(RuntimeError):
+        write()
+
+    assert [op.operation for op in timings.get_timings().stats()] == ["db.write"]
+
+
+@pytest.mark.usefixtures("cli_on_fake")
+def test_update_ips_run_saved(
+    fake: FakeDigitalOcean,
+    mock_db_for_test: Connection,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """Each update-ips run, and its timings per operation, are appended to the runs table."""
+    domains.manage_domain("example.com")
+    domains.manage_all_existing_a_records("example.com")
+    fake.public_ip = "203.0.113.9"
+    parser = args.setup_argparse()
+    test_args = parser.parse_args(["update-ips", "--timings"])
+
+    assert test_args.func(test_args) == 0
+
+    run = mock_db_for_test.execute("SELECT * FROM runs").fetchone()
+    assert (run["command"], run["exit_status"]) == ("update-ips", 0)
+    operations = {
+        row["operation"]: row["count"]
+        for row in mock_db_for_test.execute(
+            "SELECT * FROM run_timings WHERE run_id = ?", (run["id"],)
+        )
+    }
+    assert operations == {
+        "db.load_managed_a_records": 1,
+        "ip.get_ip": 1,
+        "db.record_ip_server_results": 1,
+        "api GET /domains/{domain}/records": 1,
+        "api PATCH /domains/{domain}/records/{id}": 3,
+        "db.record_update_run": 1,
+    }
+    output = capsys.readouterr().out
+    assert "Timings" in output
+    assert "api PATCH" in output
+
+
+def test_failed_run_saved(
+    mock_db_for_test: Connection,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """A run that stops on an error is saved without an exit status; no table by default."""
+    parser = args.setup_argparse()
+    test_args = parser.parse_args(["update-ips"])
+
+    with pytest.raises(subdomains.NoManagedSubdomainsError):
+        test_args.func(test_args)
+
+    runs = mock_db_for_test.execute("SELECT command, exit_status FROM runs").fetchall()
+    assert [tuple(run) for run in runs] == [("update-ips", None)]
+    assert "Timings" not in capsys.readouterr().out
+
+
+@pytest.mark.usefixtures("mock_db_for_test")
+def test_save_error_keeps_error(mocker: MockerFixture, capsys: pytest.CaptureFixture[str]) -> None:
+    """An error saving the run is a warning; the run's own error still propagates."""
+    mocker.patch.object(
+        subdomains,
+        "save_run",
+        autospec=True,
+        side_effect=sqlite3.OperationalError("database is locked"),
+    )
+    test_args = args.setup_argparse().parse_args(["update-ips"])
+
+    with pytest.raises(subdomains.NoManagedSubdomainsError):
+        test_args.func(test_args)
+
+    assert "could not record the run: database is locked" in capsys.readouterr().out